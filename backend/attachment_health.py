@@ -0,0 +1,192 @@
+"""
+Product attachment health report.
+=================================
+``GET /api/admin/products/attachment-health`` flags active products that will
+fail (or misbehave) at fulfillment because of their file attachments. It used
+to run one ``db.files.count_documents`` per active product (up to 2000) plus a
+linear scan of ``PRODUCTS`` per product to find its in-code metadata.
+
+The report is now two queries: the active products, and ONE aggregation over
+``db.files.attachments`` grouping the distinct attached files by product
+``target_id``. The two are joined in memory (a file attached to a product by
+both id and sku counts once), with a prebuilt SKU -> ``PRODUCTS`` map.
+
+Incremental mode (``report(incremental=True)``) reuses this worker's previous
+report:
+  * nothing changed (same ``file_attachments`` and ``product_catalog``
+    versions, see ``cache_versions``)  -> returned as-is, no queries;
+  * only products changed -> only products whose ``updated_at`` moved since
+    the last run are re-fetched and re-checked;
+  * attachments changed, or the last full report is older than
+    ``ATTACHMENT_HEALTH_MAX_AGE_SECONDS`` (writes by CLI scripts don't bump
+    versions) -> full report (a detach can't be traced back to the products
+    it affected).
+
+Settings (env):
+  - ATTACHMENT_HEALTH_MAX_AGE_SECONDS (default 300)
+  - ATTACHMENT_HEALTH_CLOCK_SKEW_SECONDS (default 5): how far before the last
+    run incremental mode looks for product writes (clock skew across workers)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+import attachment_index
+import cache_versions
+import product_catalog
+from database import db
+
+ATTACHMENT_HEALTH_MAX_AGE_SECONDS = float(os.environ.get("ATTACHMENT_HEALTH_MAX_AGE_SECONDS", "300"))
+ATTACHMENT_HEALTH_CLOCK_SKEW_SECONDS = float(os.environ.get("ATTACHMENT_HEALTH_CLOCK_SKEW_SECONDS", "5"))
+
+MAX_PRODUCTS = 2000
+_PRODUCT_PROJECTION = {"_id": 0, "id": 1, "sku": 1, "name": 1, "type": 1, "status": 1}
+
+_lock = asyncio.Lock()
+_code_by_sku: Optional[Dict[str, dict]] = None
+# Last report built by this worker: product id/sku -> item, plus what it saw.
+_items: Dict[str, dict] = {}
+_versions: Optional[tuple] = None
+_built_at: Optional[datetime] = None
+_full_at: Optional[datetime] = None
+
+
+def _code_meta(sku: str) -> dict:
+    """In-code ``PRODUCTS`` entry for ``sku`` (first one wins, as before)."""
+    global _code_by_sku
+    if _code_by_sku is None:
+        from payment_routes import PRODUCTS
+        index: Dict[str, dict] = {}
+        for v in PRODUCTS.values():
+            if v.get("sku"):
+                index.setdefault(v["sku"], v)
+        _code_by_sku = index
+    return _code_by_sku.get(sku, {}) if sku else {}
+
+
+async def attached_files(target_ids: Optional[Iterable[str]] = None) -> Dict[str, Set]:
+    """``target_id -> {file _id, ...}`` for non-deleted files attached to
+    products, in one aggregation. ``target_ids`` narrows it to those targets."""
+    match = {"attachments.target_type": "product"}
+    if target_ids is not None:
+        match["attachments.target_id"] = {"$in": [t for t in target_ids if t]}
+    pipeline = [
+        {"$match": {"is_deleted": {"$ne": True}, **match}},
+        {"$project": {"attachments.target_type": 1, "attachments.target_id": 1}},
+        {"$unwind": "$attachments"},
+        {"$match": match},
+        {"$group": {"_id": "$attachments.target_id", "files": {"$addToSet": "$_id"}}},
+    ]
+    by_target: Dict[str, Set] = {}
+    async for row in db.files.aggregate(pipeline):
+        by_target[row["_id"]] = set(row.get("files") or [])
+    return by_target
+
+
+def classify(product: dict, by_target: Dict[str, Set]) -> dict:
+    """Health item for one product.
+
+    Rules surfaced:
+      - Digital products MUST have at least one attachment to be deliverable.
+      - Physical products MUST NOT have a digital file (it would be ignored).
+      - Products flagged ``no_digital_fulfillment`` (in code) are exempt from
+        the digital rule entirely.
+    """
+    sku = product.get("sku") or ""
+    # NOTE: the attach endpoint writes ``target_id`` (see admin_files_routes.py
+    # attach_file) with either the product id or its sku.
+    files = set()
+    for target in (product.get("id"), sku):
+        if target:
+            files |= by_target.get(target, set())
+    attachments_count = len(files)
+    no_digital = bool(_code_meta(sku).get("no_digital_fulfillment"))
+
+    item = {
+        "sku": sku,
+        "name": product.get("name"),
+        "type": product.get("type"),
+        "attachments_count": attachments_count,
+        "no_digital_fulfillment": no_digital,
+    }
+    if no_digital:
+        item["status"] = "ok_no_digital"
+    elif product.get("type") == "physical":
+        item["status"] = "warn_physical_has_files" if attachments_count > 0 else "ok_physical"
+    else:
+        item["status"] = "missing_file_attachment" if attachments_count == 0 else "ok"
+    return item
+
+
+def _key(product: dict) -> str:
+    return product.get("id") or product.get("sku") or ""
+
+
+async def _versions_now() -> tuple:
+    return (
+        await cache_versions.current(attachment_index.CACHE_NAME),
+        await cache_versions.current(product_catalog.CACHE_NAME),
+    )
+
+
+async def _full() -> Dict[str, dict]:
+    products = await db.products.find({"status": "active"}, _PRODUCT_PROJECTION).to_list(MAX_PRODUCTS)
+    by_target = await attached_files()
+    return {_key(p): classify(p, by_target) for p in products}
+
+
+async def _recheck(since: datetime) -> int:
+    """Re-fetch products written since ``since`` and update ``_items`` in
+    place. Returns how many were rechecked."""
+    since -= timedelta(seconds=ATTACHMENT_HEALTH_CLOCK_SKEW_SECONDS)
+    # updated_at is a datetime on some write paths and an ISO string on others.
+    touched = await db.products.find(
+        {"$or": [{"updated_at": {"$gte": since}}, {"updated_at": {"$gte": since.isoformat()}}]},
+        _PRODUCT_PROJECTION,
+    ).to_list(MAX_PRODUCTS)
+    active = [p for p in touched if p.get("status") == "active"]
+    by_target = await attached_files(t for p in active for t in (p.get("id"), p.get("sku"))) if active else {}
+    for p in touched:
+        if p.get("status") == "active":
+            _items[_key(p)] = classify(p, by_target)
+        else:
+            _items.pop(_key(p), None)
+    return len(touched)
+
+
+async def report(incremental: bool = False) -> dict:
+    """Build the attachment health report (see module docstring)."""
+    global _items, _versions, _built_at, _full_at
+    async with _lock:
+        started = datetime.now(timezone.utc)
+        # Read versions BEFORE the data so a concurrent write isn't lost.
+        try:
+            versions = await _versions_now()
+        except Exception:
+            versions = None
+        if (not incremental or versions is None or _versions is None or versions[0] != _versions[0]
+                or (started - _full_at).total_seconds() > ATTACHMENT_HEALTH_MAX_AGE_SECONDS):
+            _items = await _full()
+            rechecked = len(_items)
+            incremental = False
+            _full_at = started
+        elif versions != _versions:
+            rechecked = await _recheck(_built_at)
+        else:
+            rechecked = 0
+        _versions, _built_at = versions, started
+        health: List[dict] = list(_items.values())
+
+    return {
+        "items": health,
+        "total": len(health),
+        "needs_files_count": sum(1 for i in health if i["status"] == "missing_file_attachment"),
+        "needs_files_skus": [i["sku"] for i in health if i["status"] == "missing_file_attachment"],
+        "physical_with_files_skus": [i["sku"] for i in health if i["status"] == "warn_physical_has_files"],
+        "incremental": incremental,
+        "rechecked": rechecked,
+        "generated_at": started.isoformat(),
+    }
@@ -0,0 +1,93 @@
+"""
+In-process index of product file attachments.
+=============================================
+Fulfillment asks "which file is attached to product X (or any of its
+aliases)?" for every cart item — previously one or more
+``db.files.find_one({"attachments": {"$elemMatch": ...}})`` round trips per
+item, so a 20-item bundle order fanned out into dozens of queries.
+
+This module loads every active product attachment with ONE query into a
+``target_id -> [file, ...]`` map (newest first, matching the old
+``sort=[("created_at", -1)]``) and answers lookups from memory. It is rebuilt
+when an admin attaches/detaches/replaces/deletes a file (``invalidate()``,
+propagated to other workers via ``cache_versions``).
+
+Backed by a multikey index on ``attachments.target_type/target_id`` so the
+load (and any remaining ad-hoc attachment queries) never scans db.files.
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from cache_versions import VersionGate, bump_quietly
+from database import db
+
+CACHE_NAME = "file_attachments"
+
+_FILE_FIELDS = ("id", "storage_path", "original_filename", "content_type", "etag", "created_at")
+
+_gate = VersionGate(CACHE_NAME)
+_lock = asyncio.Lock()
+_by_target: Dict[str, List[dict]] = {}
+
+
+def _created_key(value) -> tuple:
+    """Sort key mirroring Mongo's BSON ordering for ``created_at``
+    (missing < string < date)."""
+    if isinstance(value, datetime):
+        return (2, value.timestamp(), "")
+    if isinstance(value, str):
+        return (1, 0.0, value)
+    return (0, 0.0, "")
+
+
+async def ensure_loaded() -> None:
+    """Load (or reload, if another worker invalidated it) the index."""
+    global _by_target
+    if not await _gate.is_stale():
+        return
+    async with _lock:
+        if not await _gate.is_stale():
+            return
+        version = await _gate.read_version()
+        index: Dict[str, List[dict]] = {}
+        projection = {"_id": 0, **{f: 1 for f in _FILE_FIELDS},
+                      "attachments.target_type": 1, "attachments.target_id": 1}
+        async for f in db.files.find({"is_deleted": False, "attachments.target_type": "product"}, projection):
+            entry = {k: f.get(k) for k in _FILE_FIELDS}
+            targets = {a.get("target_id") for a in f.get("attachments") or []
+                       if a.get("target_type") == "product" and a.get("target_id")}
+            for target_id in targets:
+                index.setdefault(target_id, []).append(entry)
+        for files in index.values():
+            files.sort(key=lambda e: _created_key(e.get("created_at")), reverse=True)
+        _by_target = index
+        _gate.loaded(version)
+
+
+def has_attachment(target_ids: Iterable[str]) -> bool:
+    """True iff any of ``target_ids`` has an active attached file."""
+    return any(t in _by_target for t in target_ids if t)
+
+
+def files_for(target_id: str) -> List[dict]:
+    """Active files attached to ``target_id``, newest first."""
+    return _by_target.get(target_id, [])
+
+
+def latest_file(target_ids: Iterable[str]) -> Optional[dict]:
+    """Newest active file attached to any of ``target_ids``."""
+    best = None
+    for t in target_ids:
+        files = _by_target.get(t) if t else None
+        if files and (best is None or _created_key(files[0].get("created_at")) > _created_key(best.get("created_at"))):
+            best = files[0]
+    return best
+
+
+async def invalidate() -> None:
+    """Call after any write to db.files attachments / is_deleted / storage_path."""
+    _gate.invalidate_local()
+    await bump_quietly(CACHE_NAME, "AttachmentIndex", _gate.max_age)
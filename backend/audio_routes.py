@@ -11,16 +11,10 @@ from typing import Optional, List
 from datetime import datetime, timezone
 import secrets
 import string
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
-
 router = APIRouter(prefix="/api/audio", tags=["audio"])
 
 # MongoDB connection
-MONGO_URL = os.environ.get("MONGO_URL")
-DB_NAME = os.environ["DB_NAME"]
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+from database import db  # noqa: E402 — shared pool
 
 # Audio content mapping - which series has which audio lessons
 AUDIO_CONTENT = {
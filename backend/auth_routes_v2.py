@@ -11,7 +11,6 @@ Soul Food Authentication Routes - Enhanced with Google OAuth, 2FA & Rewards
 from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr, validator
-from motor.motor_asyncio import AsyncIOMotorClient
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
@@ -33,8 +32,7 @@ from security import (
     check_reset_rate_limit, record_reset_request,
     create_reset_token, verify_reset_token, mark_token_used,
     update_last_activity, check_session_timeout, get_session_timeout_for_role,
-    check_account_disabled, log_audit_event, AuditEventType,
-    ensure_security_indexes
+    check_account_disabled, log_audit_event, AuditEventType
 )
 
 load_dotenv()
@@ -52,9 +50,10 @@ PASSWORD_EXPIRY_DAYS = 120
 SESSION_TIMEOUT_MINUTES = 60  # Default session timeout
 
 # Database
-MONGO_URL = os.getenv('MONGO_URL')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ['DB_NAME']]
+from database import db  # noqa: E402 — shared pool
+import lc_keys  # noqa: E402
+import principal  # noqa: E402
+import dashboard_stats  # noqa: E402
 
 # Email service (Resend)
 RESEND_API_KEY = os.getenv("RESEND_API_KEY")
@@ -280,6 +279,7 @@ async def google_auth_callback(data: GoogleAuthCallback, response: Response):
                 }
             )
             user_id = existing_user["id"]
+            await principal.invalidate(user_id)
             role = existing_user.get("role", "member")
             access_level = existing_user.get("access_level", "free")
             user_name = existing_user.get("name", name)
@@ -310,6 +310,7 @@ async def google_auth_callback(data: GoogleAuthCallback, response: Response):
                 "subscription_status": "none"
             }
             await db.users.insert_one(new_user)
+            await dashboard_stats.user_created()
             role = "member"
             access_level = "free"
             user_name = name
@@ -366,19 +367,21 @@ async def google_auth_callback(data: GoogleAuthCallback, response: Response):
 
 @router.get("/me")
 async def get_current_user(request: Request):
-    """Get current authenticated user from session cookie or Authorization header"""
+    """Get current authenticated user from session cookie or Authorization header.
+    Answers are cached per token (see principal.cached_session)."""
     
-    # Try cookie first
-    session_token = request.cookies.get("session_token")
-    
-    # Fallback to Authorization header
-    if not session_token:
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            session_token = auth_header.split(" ")[1]
+    # Cookie first, then Authorization header
+    session_token = principal.session_token(request)
     
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
+
+    cached = await principal.cached_session(session_token)
+    if cached:
+        me, error = cached
+        if error:
+            raise HTTPException(status_code=401, detail=error)
+        return me
     
     # Check session in database
     session = await db.user_sessions.find_one(
@@ -392,8 +395,8 @@ async def get_current_user(request: Request):
             payload = jwt.decode(session_token, SECRET_KEY, algorithms=[ALGORITHM])
             user_id = payload.get("sub")
             user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0, "password_history": 0})
-            if user:
-                return {
+            if user and not user.get("disabled"):
+                me = {
                     "id": user["id"],
                     "email": user.get("email"),
                     "name": user.get("name"),
@@ -403,8 +406,15 @@ async def get_current_user(request: Request):
                     "tfa_enabled": user.get("tfa_enabled", False),
                     "email_verified": bool(user.get("email_verified", False)),
                 }
+                exp = payload.get("exp")
+                await principal.cache_session(
+                    session_token, me,
+                    expires_at=datetime.fromtimestamp(exp, tz=timezone.utc) if exp else None,
+                )
+                return me
         except JWTError:
             pass
+        await principal.cache_session(session_token, error="Invalid session")
         raise HTTPException(status_code=401, detail="Invalid session")
     
     # Check expiry
@@ -415,6 +425,7 @@ async def get_current_user(request: Request):
         if expires_at.tzinfo is None:
             expires_at = expires_at.replace(tzinfo=timezone.utc)
         if expires_at < datetime.now(timezone.utc):
+            await principal.cache_session(session_token, error="Session expired")
             raise HTTPException(status_code=401, detail="Session expired")
     
     # Get user
@@ -425,8 +436,11 @@ async def get_current_user(request: Request):
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if user.get("disabled"):
+        await principal.cache_session(session_token, error="Account disabled")
+        raise HTTPException(status_code=401, detail="Account disabled")
     
-    return {
+    me = {
         "id": user["id"],
         "email": user.get("email"),
         "name": user.get("name"),
@@ -439,6 +453,8 @@ async def get_current_user(request: Request):
         "subscription_status": user.get("subscription_status", "none"),
         "email_verified": bool(user.get("email_verified", False)),
     }
+    await principal.cache_session(session_token, me, expires_at=expires_at)
+    return me
 
 @router.post("/logout")
 async def logout(request: Request, response: Response):
@@ -447,6 +463,7 @@ async def logout(request: Request, response: Response):
     
     if session_token:
         await db.user_sessions.delete_one({"session_token": session_token})
+        await principal.evict_session(session_token)
     
     response.delete_cookie(key="session_token", path="/")
     
@@ -499,6 +516,7 @@ async def verify_email(token: str):
         },
          "$unset": {"email_verification_token": ""}}
     )
+    await principal.invalidate(user["id"])
 
     return {
         "success": True,
@@ -512,25 +530,16 @@ class ResendVerificationRequest(BaseModel):
 
 
 @router.post("/resend-verification")
-async def resend_verification(payload: ResendVerificationRequest, request: Request):
+async def resend_verification(
+    payload: ResendVerificationRequest,
+    request: Request,
+    current: Optional[dict] = Depends(principal.optional_principal),
+):
     """Resend the email verification link. Accepts either an authenticated
     request (looks up current user) or an unauthenticated request with an
     email in the body. Rate-limited at 1 send per 60s per user."""
-    target_email = None
-
     # Try authenticated user first
-    auth_header = request.headers.get("Authorization")
-    if auth_header and auth_header.startswith("Bearer "):
-        try:
-            token = auth_header.split(" ", 1)[1]
-            decoded = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            current_uid = decoded.get("sub")
-            if current_uid:
-                u = await db.users.find_one({"id": current_uid}, {"_id": 0})
-                if u:
-                    target_email = u.get("email")
-        except JWTError:
-            pass
+    target_email = current.get("email") if current else None
 
     if not target_email and payload.email:
         target_email = str(payload.email).lower()
@@ -592,24 +601,9 @@ async def resend_verification(payload: ResendVerificationRequest, request: Reque
 # =============================================================================
 
 @router.post("/2fa/setup")
-async def setup_2fa(setup: TwoFactorSetup, request: Request):
+async def setup_2fa(setup: TwoFactorSetup, request: Request, user: dict = Depends(principal.require_principal)):
     """Setup 2FA for user - mandatory for instructors/admins"""
-    
-    # Get current user
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    token = auth_header.split(" ")[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_id = user["id"]
     
     if setup.method == "email":
         # Generate and send code
@@ -681,16 +675,7 @@ async def verify_2fa(verify: TwoFactorVerify, request: Request):
     """Verify 2FA code and enable 2FA for user"""
     
     # Get user from token or provided user_id
-    user_id = verify.user_id
-    if not user_id:
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.split(" ")[1]
-            try:
-                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-                user_id = payload.get("sub")
-            except JWTError:
-                pass
+    user_id = verify.user_id or (principal.claims(request) or {}).get("sub")
     
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID required")
@@ -722,6 +707,7 @@ async def verify_2fa(verify: TwoFactorVerify, request: Request):
             {"id": user_id},
             {"$set": {"tfa_enabled": True, "tfa_method": "email"}}
         )
+        await principal.invalidate(user_id)
         
         # Get updated user data and generate new token
         user = await db.users.find_one({"id": user_id}, {"_id": 0, "hashed_password": 0, "totp_secret": 0})
@@ -757,6 +743,7 @@ async def verify_2fa(verify: TwoFactorVerify, request: Request):
                     "totp_secret": pending["totp_secret"]
                 }}
             )
+            await principal.invalidate(user_id)
             
             # Clean up pending
             await db.tfa_pending.delete_one({"user_id": user_id})
@@ -783,23 +770,9 @@ async def verify_2fa(verify: TwoFactorVerify, request: Request):
     raise HTTPException(status_code=400, detail="Invalid verification code")
 
 @router.post("/2fa/send-code")
-async def send_2fa_code(request: Request):
+async def send_2fa_code(request: Request, user: dict = Depends(principal.require_principal)):
     """Send 2FA code for login verification"""
-    
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    token = auth_header.split(" ")[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_id = user["id"]
     
     # Generate and send code
     code = generate_2fa_code()
@@ -856,31 +829,18 @@ async def resend_2fa_code(data: TwoFactorResend):
 # =============================================================================
 
 @router.get("/rewards/balance")
-async def get_rewards_balance(request: Request):
+async def get_rewards_balance(request: Request, current: dict = Depends(principal.require_principal)):
     """Get user's rewards points balance — dynamically calculated from purchase history"""
+    user_id = current["id"]
+    # Points aren't part of the cached principal — read just them.
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "rewards_points": 1}) or {}
     
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    token = auth_header.split(" ")[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        user_email = payload.get("email")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "rewards_points": 1, "email": 1, "name": 1})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    email = user_email or user.get("email")
+    email = (principal.claims(request) or {}).get("email") or current.get("email")
     
     # Calculate points from purchase history (1 point per $10 spent)
     query = {"payment_status": "paid"}
     if email:
-        query["$or"] = [{"user_id": user_id}, {"customer_email": email}]
+        query["$or"] = [{"user_id": user_id}, lc_keys.match("customer_email", email)]
     else:
         query["user_id"] = user_id
     
@@ -904,6 +864,8 @@ async def get_rewards_balance(request: Request):
         {"id": user_id},
         {"$set": {"rewards_points": points, "rewards_total_earned": earned_points, "rewards_total_spent_tracked": total_spent}}
     )
+    if points != user.get("rewards_points"):
+        await principal.invalidate(user_id)
     
     # Calculate available rewards
     available_rewards = []
@@ -924,21 +886,10 @@ async def get_rewards_balance(request: Request):
     }
 
 @router.post("/rewards/redeem")
-async def redeem_rewards(points_to_redeem: int, request: Request):
+async def redeem_rewards(points_to_redeem: int, request: Request, current: dict = Depends(principal.require_principal)):
     """Redeem rewards points for discount"""
-    
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    token = auth_header.split(" ")[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user_id = current["id"]
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "rewards_points": 1})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -974,6 +925,7 @@ async def redeem_rewards(points_to_redeem: int, request: Request):
         {"id": user_id},
         {"$inc": {"rewards_points": -points_to_redeem}}
     )
+    await principal.invalidate(user_id)
     
     # Log redemption
     await db.rewards_history.insert_one({
@@ -994,20 +946,9 @@ async def redeem_rewards(points_to_redeem: int, request: Request):
     }
 
 @router.get("/rewards/history")
-async def get_rewards_history(request: Request):
+async def get_rewards_history(request: Request, user: dict = Depends(principal.require_principal)):
     """Get user's rewards points history"""
-    
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    token = auth_header.split(" ")[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
+    user_id = user["id"]
     history = await db.rewards_history.find(
         {"user_id": user_id},
         {"_id": 0}
@@ -1076,6 +1017,7 @@ async def register(user_data: UserRegister):
     }
 
     await db.users.insert_one(user)
+    await dashboard_stats.user_created()
 
     # Send verification email (non-blocking — log on failure, don't break signup)
     try:
@@ -1309,6 +1251,7 @@ async def award_rewards_points(user_id: str, amount_spent: float, order_id: str)
             {"id": user_id},
             {"$inc": {"rewards_points": points_earned}}
         )
+        await principal.invalidate(user_id)
         
         # Record regular points earned
         base_points = points_earned - first_purchase_bonus
@@ -1432,6 +1375,7 @@ async def reset_password(req: ResetPasswordRequest):
         "$push": {"password_history": {"$each": [hashed], "$slice": -5}}
         }
     )
+    await principal.invalidate(user_id)
 
     # Consume the token so it can't be replayed (single-use guarantee)
     await mark_token_used(req.token)
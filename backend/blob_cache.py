@@ -0,0 +1,205 @@
+"""
+Local on-disk LRU cache in front of Emergent Object Storage.
+
+A handful of deliverables (full workbooks, holiday bundles, snack packs) make
+up most paid downloads. Caching their bytes on local disk cuts both latency
+and storage egress; cache hits are served straight from the file.
+
+  - Entries are keyed by ``storage_path`` + ``etag`` — a replaced file gets a
+    new key, so stale bytes are never served.
+  - Writes are atomic: bytes land in a temp file in the cache dir and are
+    ``os.replace``-d into place only after the full body arrived.
+  - LRU is tracked with file mtimes (touched on every hit), so several uvicorn
+    workers can share one directory without a shared in-memory index.
+  - The byte budget is enforced after each insert by evicting the least
+    recently used entries; the same pass sweeps ``.part`` temp files a
+    crashed worker left behind.
+  - Writer file I/O and directory scans run in a worker thread, so streaming
+    a download through the cache never blocks the event loop.
+
+Disabled when ``BLOB_CACHE_MAX_BYTES=0``. Every function is best-effort and
+never raises — a cache failure just means the request goes to storage.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from typing import Optional
+
+import anyio
+
+logger = logging.getLogger(__name__)
+
+BLOB_CACHE_DIR = os.environ.get("BLOB_CACHE_DIR", "/tmp/soul-food-blob-cache")
+BLOB_CACHE_MAX_BYTES = int(os.environ.get("BLOB_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Don't let a single huge upload (video master, zip) flush the whole cache.
+BLOB_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("BLOB_CACHE_MAX_ENTRY_BYTES", str(BLOB_CACHE_MAX_BYTES // 4)))
+
+# A .part file untouched this long belongs to a writer that died mid-download.
+BLOB_CACHE_PART_MAX_AGE_SECONDS = int(os.environ.get("BLOB_CACHE_PART_MAX_AGE_SECONDS", "3600"))
+
+_SUFFIX = ".blob"
+_PART_SUFFIX = ".part"
+
+
+def enabled() -> bool:
+    return BLOB_CACHE_MAX_BYTES > 0
+
+
+def _path_prefix(storage_path: str) -> str:
+    return hashlib.sha256(storage_path.encode()).hexdigest()[:32]
+
+
+def _entry_path(storage_path: str, etag: Optional[str]) -> str:
+    tag = hashlib.sha256((etag or "").encode()).hexdigest()[:16]
+    return os.path.join(BLOB_CACHE_DIR, f"{_path_prefix(storage_path)}-{tag}{_SUFFIX}")
+
+
+def lookup(storage_path: str, etag: Optional[str]) -> Optional[str]:
+    """Return the local file path on a hit (and mark it recently used)."""
+    if not enabled() or not storage_path:
+        return None
+    path = _entry_path(storage_path, etag)
+    try:
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+
+def invalidate(storage_path: str) -> int:
+    """Drop every cached version of ``storage_path``. Returns entries removed."""
+    if not storage_path or not os.path.isdir(BLOB_CACHE_DIR):
+        return 0
+    prefix = _path_prefix(storage_path) + "-"
+    removed = 0
+    try:
+        for entry in os.scandir(BLOB_CACHE_DIR):
+            if entry.name.startswith(prefix) and entry.name.endswith(_SUFFIX):
+                try:
+                    os.unlink(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+    except OSError as e:
+        logger.warning("blob cache invalidate failed for %s: %s", storage_path, e)
+    return removed
+
+
+def _evict_to_budget() -> None:
+    stale_before = time.time() - BLOB_CACHE_PART_MAX_AGE_SECONDS
+    stats = []
+    try:
+        for e in os.scandir(BLOB_CACHE_DIR):
+            st = e.stat()
+            if e.name.endswith(_SUFFIX):
+                stats.append((st.st_mtime, st.st_size, e.path))
+            elif e.name.endswith(_PART_SUFFIX) and st.st_mtime < stale_before:
+                try:
+                    os.unlink(e.path)
+                except OSError:
+                    pass
+    except OSError as e:
+        logger.warning("blob cache scan failed: %s", e)
+        return
+    total = sum(size for _, size, _ in stats)
+    for _, size, path in sorted(stats):
+        if total <= BLOB_CACHE_MAX_BYTES:
+            break
+        try:
+            os.unlink(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def stats() -> dict:
+    """Entry count + bytes used (admin diagnostics)."""
+    count = used = 0
+    if os.path.isdir(BLOB_CACHE_DIR):
+        for e in os.scandir(BLOB_CACHE_DIR):
+            if e.name.endswith(_SUFFIX):
+                count += 1
+                used += e.stat().st_size
+    return {"enabled": enabled(), "dir": BLOB_CACHE_DIR, "entries": count,
+            "bytes_used": used, "max_bytes": BLOB_CACHE_MAX_BYTES}
+
+
+class CacheWriter:
+    """Collects a streamed body into a temp file; ``commit()`` publishes it
+    atomically, ``abort()`` discards it. Gives up silently past the entry cap.
+    The async methods do their file I/O in a worker thread."""
+
+    def __init__(self, storage_path: str, etag: Optional[str]):
+        self.final_path = _entry_path(storage_path, etag)
+        self.size = 0
+        self._fh = None
+
+    def _open(self) -> None:
+        try:
+            os.makedirs(BLOB_CACHE_DIR, exist_ok=True)
+            fd, self._tmp = tempfile.mkstemp(dir=BLOB_CACHE_DIR, suffix=_PART_SUFFIX)
+            self._fh = os.fdopen(fd, "wb")
+        except OSError as e:
+            logger.warning("blob cache disabled for this download: %s", e)
+
+    def _write(self, chunk: bytes) -> None:
+        if self._fh is None:
+            return
+        self.size += len(chunk)
+        if self.size > BLOB_CACHE_MAX_ENTRY_BYTES:
+            self._abort()
+            return
+        try:
+            self._fh.write(chunk)
+        except OSError:
+            self._abort()
+
+    def _commit(self) -> None:
+        if self._fh is None:
+            return
+        try:
+            self._fh.close()
+            self._fh = None
+            os.replace(self._tmp, self.final_path)
+        except OSError as e:
+            logger.warning("blob cache commit failed: %s", e)
+            self._abort()
+            return
+        _evict_to_budget()
+
+    def _abort(self) -> None:
+        if self._fh is not None:
+            try:
+                self._fh.close()
+            except OSError:
+                pass
+            self._fh = None
+        try:
+            os.unlink(self._tmp)
+        except (OSError, AttributeError):
+            pass
+
+    async def write(self, chunk: bytes) -> None:
+        if self._fh is not None:
+            await anyio.to_thread.run_sync(self._write, chunk)
+
+    async def commit(self) -> None:
+        await anyio.to_thread.run_sync(self._commit)
+
+    async def abort(self) -> None:
+        await anyio.to_thread.run_sync(self._abort)
+
+
+async def open_writer(storage_path: str, etag: Optional[str], content_length: Optional[int]) -> Optional[CacheWriter]:
+    """Start caching a full-body download, or None if it shouldn't be cached."""
+    if not enabled() or not storage_path:
+        return None
+    if content_length is not None and content_length > BLOB_CACHE_MAX_ENTRY_BYTES:
+        return None
+    writer = CacheWriter(storage_path, etag)
+    await anyio.to_thread.run_sync(writer._open)
+    return writer
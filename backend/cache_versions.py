@@ -0,0 +1,141 @@
+"""
+Cross-worker invalidation stamps for process-local caches.
+==========================================================
+Several hot paths keep an in-memory copy of slowly-changing data (attachment
+index, question bank, catalog). Each uvicorn worker has its own copy, so an
+admin write handled by one worker must reach the others. Writers ``bump()`` a
+counter in ``db.cache_versions``; readers hold a ``VersionGate`` that polls
+the counter at most every ``check_interval`` seconds and reports the cache
+stale when it moved (or when ``max_age`` passed, as a safety net for writes
+made by CLI scripts that don't bump).
+
+Caches keyed by something finer (a user id) can ``bump(name, key)``: the
+counter document keeps the last ``KEY_HISTORY`` bumped keys, and
+``VersionGate.stale_keys()`` returns just the keys bumped since this worker
+last looked, so one user's change doesn't flush everyone's entries.
+
+Invalidate paths use ``bump_quietly()``, which logs a failed bump instead of
+raising.
+"""
+from __future__ import annotations
+
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument
+
+from database import db
+
+# Bumped keys remembered per counter; a worker further behind drops everything.
+KEY_HISTORY = 256
+
+
+async def bump(name: str, key: Optional[str] = None) -> int:
+    """Invalidate ``name`` in every worker — only ``key``'s entries when
+    given, the whole cache otherwise. Returns the new version."""
+    doc = await db.cache_versions.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc)},
+         "$push": {"keys": {"$each": [key], "$slice": -KEY_HISTORY}}},
+        projection={"version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return int(doc.get("version", 0))
+
+
+async def bump_quietly(name: str, tag: str, fallback_seconds: float, key: Optional[str] = None) -> Optional[int]:
+    """``bump()`` for invalidate paths, which have already dropped their own
+    copy: a failed bump is logged, not raised — other workers catch up within
+    ``fallback_seconds`` (their ``max_age`` / TTL). Returns the new version,
+    None on failure."""
+    try:
+        return await bump(name, key)
+    except Exception as e:
+        print(f"[{tag}] version bump failed (other workers refresh within {fallback_seconds:.0f}s): {e}")
+        return None
+
+
+async def current(name: str) -> int:
+    doc = await db.cache_versions.find_one({"_id": name}, {"version": 1})
+    return int((doc or {}).get("version", 0))
+
+
+async def history(name: str) -> Tuple[int, List[Optional[str]]]:
+    """The version and the keys of the most recent bumps (the last entry is
+    the bump that produced the version; None means "everything")."""
+    doc = await db.cache_versions.find_one({"_id": name}, {"version": 1, "keys": 1})
+    return int((doc or {}).get("version", 0)), list((doc or {}).get("keys") or [])
+
+
+class VersionGate:
+    """Decides when a process-local cache must be rebuilt."""
+
+    def __init__(self, name: str, check_interval: float = 5.0, max_age: float = 300.0):
+        self.name = name
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.version: Optional[int] = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def invalidate_local(self) -> None:
+        self.version = None
+
+    async def is_stale(self) -> bool:
+        """True if the cache was never loaded, is older than ``max_age``, or
+        the shared version moved. Hits Mongo at most once per interval."""
+        now = time.monotonic()
+        if self.version is None or now - self._loaded_at > self.max_age:
+            return True
+        if now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        try:
+            return await current(self.name) != self.version
+        except Exception:
+            return False  # keep serving the cached copy if Mongo hiccups
+
+    async def stale_keys(self) -> Optional[Set[str]]:
+        """For keyed caches: the keys bumped since the cache was loaded (empty
+        when nothing moved), or None when the whole cache must be dropped —
+        never loaded, older than ``max_age``, a whole-cache bump, or more
+        bumps missed than the history keeps. Hits Mongo at most once per
+        interval; the gate advances past the keys it returns."""
+        now = time.monotonic()
+        if self.version is None or now - self._loaded_at > self.max_age:
+            return None
+        if now - self._checked_at < self.check_interval:
+            return set()
+        self._checked_at = now
+        try:
+            version, keys = await history(self.name)
+        except Exception:
+            return set()  # keep serving the cached copy if Mongo hiccups
+        missed = version - self.version
+        if missed == 0:
+            return set()
+        if missed < 0 or missed > len(keys) or None in keys[-missed:]:
+            return None
+        self.version = version
+        return set(keys[-missed:])
+
+    async def read_version(self) -> int:
+        """The shared version, read BEFORE reading the source data so a
+        concurrent bump isn't lost. Pass it to ``loaded()`` once the cache is
+        built — never mark the gate fresh ahead of a load that may fail."""
+        try:
+            return await current(self.name)
+        except Exception:
+            return 0
+
+    def loaded(self, version: int) -> None:
+        """Record that the cache was just built from ``version``."""
+        self.version = version
+        self._loaded_at = self._checked_at = time.monotonic()
+
+    async def mark_loaded(self) -> None:
+        """``loaded(await read_version())``, for caches that are simply
+        dropped (nothing to load that could fail)."""
+        self.loaded(await self.read_version())
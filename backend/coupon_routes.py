@@ -7,29 +7,19 @@ Coupon Routes - Refactored to use MongoDB
 - Gift certificate discount codes handled separately
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel, Field
-from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Optional, List
 from datetime import datetime, timezone
-from jose import JWTError, jwt
-import os
 import re
 import secrets
 
 router = APIRouter(prefix="/api/coupons", tags=["coupons"])
 
 # Database connection
-MONGO_URL = os.getenv('MONGO_URL')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ['DB_NAME']]
-
-# JWT Settings
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "soul-food-secret-key-change-in-production-2024")
-ALGORITHM = "HS256"
-
-security = HTTPBearer(auto_error=False)
+from database import db  # noqa: E402 — shared pool
+import lc_keys  # noqa: E402
+import principal  # noqa: E402
 
 
 def _code_match(code: str) -> dict:
@@ -197,27 +187,24 @@ async def seed_coupons_if_empty():
                 "created_at": now.isoformat(),
                 "updated_at": now.isoformat()
             }
-            await db.coupons.insert_one(coupon_doc)
+            await db.coupons.insert_one(lc_keys.with_lc("coupons", coupon_doc))
         print(f"✅ Seeded {len(DEFAULT_COUPONS)} default coupons to MongoDB")
         return True
     return False
 
-async def get_current_admin(
-    authorization: HTTPAuthorizationCredentials = Depends(security)
-):
+async def get_current_admin(request: Request):
     """Verify JWT and ensure user has admin access"""
-    if not authorization:
+    if principal.bearer_token(request) is None:
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    try:
-        payload = jwt.decode(authorization.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        role = payload.get("role", "")
-        admin_roles = ["admin", "owner", "instructor_tester", "beta_tester"]
-        if role not in admin_roles:
-            raise HTTPException(status_code=403, detail="Admin access required")
-        return payload
-    except JWTError:
+    payload = principal.claims(request)
+    if payload is None:
         raise HTTPException(status_code=401, detail="Invalid token")
+    role = payload.get("role", "")
+    admin_roles = ["admin", "owner", "instructor_tester", "beta_tester"]
+    if role not in admin_roles:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return payload
 
 # =============================================================================
 # Public Endpoints
@@ -228,7 +215,7 @@ async def _validate_redemption_code_as_coupon(input_code: str, request) -> Optio
     coupons. Returns a CouponValidateResponse if the code matches a redemption
     code, else None to let the caller continue with its existing fallthrough."""
     rc = await db.redemption_codes.find_one(
-        {"code": _code_match(input_code),
+        {**lc_keys.match("code", input_code),
          "code_type": {"$in": ["demo", "test"]}},
         {"_id": 0}
     )
@@ -369,7 +356,7 @@ async def validate_coupon(request: CouponValidateRequest):
     
     # SECOND: Check MongoDB coupons collection (case-insensitive, exact match)
     coupon = await db.coupons.find_one({
-        "code": {"$regex": "^" + re.escape(input_code) + "$", "$options": "i"},
+        **lc_keys.match("code", input_code),
         "active": True
     })
     
@@ -512,7 +499,7 @@ async def record_coupon_use(code: str, order_id: Optional[str] = None):
     """Record that a coupon was used (increment usage counter)"""
     
     result = await db.coupons.update_one(
-        {"code": _code_match(code)},
+        lc_keys.match("code", code),
         {
             "$inc": {"times_used": 1},
             "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
@@ -523,7 +510,7 @@ async def record_coupon_use(code: str, order_id: Optional[str] = None):
         # Coupon might not exist in coupons collection — try redemption_codes
         # (DEMOSOFU* / BETADOLLAR* live there)
         rc_result = await db.redemption_codes.update_one(
-            {"code": _code_match(code),
+            {**lc_keys.match("code", code),
              "code_type": {"$in": ["demo", "test"]}},
             {
                 "$inc": {"uses_used": 1},
@@ -595,7 +582,7 @@ async def get_coupon_details(code: str, admin = Depends(get_current_admin)):
     """Get details for a specific coupon (admin only)"""
     
     coupon = await db.coupons.find_one(
-        {"code": _code_match(code)},
+        lc_keys.match("code", code),
         {"_id": 0}
     )
     
@@ -615,9 +602,7 @@ async def create_coupon(coupon: CouponCreate, admin = Depends(get_current_admin)
     """Create a new coupon (admin only)"""
     
     # Check if coupon already exists
-    existing = await db.coupons.find_one({
-        "code": _code_match(coupon.code)
-    })
+    existing = await db.coupons.find_one(lc_keys.match("code", coupon.code))
     
     if existing:
         raise HTTPException(status_code=400, detail="Coupon code already exists")
@@ -634,7 +619,7 @@ async def create_coupon(coupon: CouponCreate, admin = Depends(get_current_admin)
     # and prevents the tz-naive datetime comparison bug in validate_coupon.
     coupon_doc = _normalize_coupon_for_storage(coupon_doc)
 
-    await db.coupons.insert_one(coupon_doc)
+    await db.coupons.insert_one(lc_keys.with_lc("coupons", coupon_doc))
     
     return {"message": "Coupon created successfully", "code": coupon.code}
 
@@ -653,7 +638,7 @@ async def update_coupon(code: str, update: CouponUpdate, admin = Depends(get_cur
     update_fields = _normalize_coupon_for_storage(update_fields)
 
     result = await db.coupons.update_one(
-        {"code": _code_match(code)},
+        lc_keys.match("code", code),
         {"$set": update_fields}
     )
     
@@ -667,7 +652,7 @@ async def delete_coupon(code: str, admin = Depends(get_current_admin)):
     """Delete a coupon (admin only) - actually just deactivates it"""
     
     result = await db.coupons.update_one(
-        {"code": _code_match(code)},
+        lc_keys.match("code", code),
         {"$set": {"active": False, "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
     
@@ -693,7 +678,7 @@ async def toggle_coupon_active(code: str, req: CouponToggleRequest, admin = Depe
     """Enable or disable a coupon by code (admin only). Reversible — never deletes."""
 
     result = await db.coupons.update_one(
-        {"code": _code_match(code)},
+        lc_keys.match("code", code),
         {"$set": {"active": req.active, "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
 
@@ -781,9 +766,8 @@ async def harden_test_coupons():
 
     disabled = []
     for code in DISABLED_TEST_COUPON_CODES:
-        escaped = re.escape(code)
         result = await db.coupons.update_one(
-            {"code": {"$regex": "^" + escaped + "$", "$options": "i"}},
+            lc_keys.match("code", code),
             {"$set": {
                 "active": False,
                 "hidden": True,
@@ -796,9 +780,9 @@ async def harden_test_coupons():
             disabled.append(code)
 
     # Ensure internal test coupon exists, hidden, low cap, $1 override
-    existing = await db.coupons.find_one({"code": INTERNAL_TEST_COUPON_CODE})
+    existing = await db.coupons.find_one(lc_keys.match("code", INTERNAL_TEST_COUPON_CODE))
     if not existing:
-        await db.coupons.insert_one({
+        await db.coupons.insert_one(lc_keys.with_lc("coupons", {
             "code": INTERNAL_TEST_COUPON_CODE,
             "discount_percent": 0,
             "discount_type": "fixed_cart",
@@ -812,12 +796,12 @@ async def harden_test_coupons():
             "conditions": "Internal-only live Stripe test coupon — overrides cart to $1.00",
             "created_at": now_iso,
             "updated_at": now_iso,
-        })
+        }))
         internal_created = True
     else:
         # Make sure it stays hidden + active + capped
         await db.coupons.update_one(
-            {"code": INTERNAL_TEST_COUPON_CODE},
+            lc_keys.match("code", INTERNAL_TEST_COUPON_CODE),
             {"$set": {
                 "active": True,
                 "hidden": True,
@@ -871,7 +855,7 @@ async def sync_bulk_volume_coupons():
     updated = []
     for c in canonical:
         result = await db.coupons.update_one(
-            {"code": _code_match(c["code"])},
+            lc_keys.match("code", c["code"]),
             {"$set": {
                 "discount_percent": c["discount_percent"],
                 "min_quantity": c["min_quantity"],
@@ -0,0 +1,192 @@
+"""
+Admin dashboard counters.
+=========================
+``GET /api/admin/dashboard`` used to run seven ``count_documents`` calls and
+stream every paid ``payment_transactions`` document to sum revenue in Python,
+each time an admin opened the dashboard.
+
+The counters now live in one ``db.dashboard_stats`` document
+(``_id: "admin_dashboard"``), kept current with atomic ``$inc`` at the write
+sites:
+
+  * ``user_created`` / ``users_removed``   — account signup, admin invite, merge
+  * ``lessons_created`` / ``lesson_status_changed`` — content create/edit/status
+  * ``products_created``                   — admin create / seed from catalog
+  * ``order_created``                      — payment_transactions inserts
+  * ``payment_status_changed``             — transitions into / out of ``paid``
+
+Increments never create the document: until the first ``reconcile()`` there
+is nothing to increment, and ``read()`` reconciles on demand. ``reconcile()``
+recomputes every counter from the source collections (one aggregation for
+revenue), records any drift, and runs on a schedule (``run_reconciler``,
+started with the app) to repair writes made outside these hooks (CLI scripts,
+direct DB edits, an increment lost to a crash).
+
+Revenue is counted in integer cents so increments don't accumulate float
+error.
+
+Settings (env):
+  - DASHBOARD_STATS_RECONCILE_SECONDS (default 3600)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from database import db
+
+DASHBOARD_STATS_RECONCILE_SECONDS = float(os.environ.get("DASHBOARD_STATS_RECONCILE_SECONDS", "3600"))
+
+STATS_ID = "admin_dashboard"
+PAID = "paid"
+# Lesson statuses the dashboard breaks out.
+LESSON_STATUSES = ("published", "draft")
+COUNTERS = ("users", "lessons", "orders", "products", "revenue_cents",
+            *(f"lessons_{s}" for s in LESSON_STATUSES))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _cents(amount) -> int:
+    try:
+        return int(round(float(amount or 0) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+
+async def _inc(fields: Dict[str, int]) -> None:
+    fields = {k: v for k, v in fields.items() if v}
+    if not fields:
+        return
+    try:
+        await db.dashboard_stats.update_one(
+            {"_id": STATS_ID}, {"$inc": fields, "$set": {"updated_at": _now()}}
+        )
+    except Exception as e:
+        print(f"[DashboardStats] counter update failed (reconcile will repair): {e}")
+
+
+def _lesson_key(status: Optional[str]) -> Optional[str]:
+    return f"lessons_{status}" if status in LESSON_STATUSES else None
+
+
+async def user_created(n: int = 1) -> None:
+    await _inc({"users": n})
+
+
+async def users_removed(n: int) -> None:
+    await _inc({"users": -n})
+
+
+async def lessons_created(statuses: Iterable[Optional[str]]) -> None:
+    """Call after inserting lessons, with each new lesson's status."""
+    fields: Dict[str, int] = {"lessons": 0}
+    for status in statuses:
+        fields["lessons"] += 1
+        key = _lesson_key(status)
+        if key:
+            fields[key] = fields.get(key, 0) + 1
+    await _inc(fields)
+
+
+async def lesson_status_changed(old: Optional[str], new: Optional[str]) -> None:
+    if old == new:
+        return
+    fields: Dict[str, int] = {}
+    for key, delta in ((_lesson_key(old), -1), (_lesson_key(new), 1)):
+        if key:
+            fields[key] = fields.get(key, 0) + delta
+    await _inc(fields)
+
+
+async def products_created(n: int = 1) -> None:
+    await _inc({"products": n})
+
+
+async def order_created(tx: dict) -> None:
+    """Call after inserting a payment_transactions document."""
+    paid = tx.get("payment_status") == PAID
+    await _inc({"orders": 1, "revenue_cents": _cents(tx.get("total_amount")) if paid else 0})
+
+
+async def payment_status_changed(old: Optional[str], new: Optional[str], total_amount) -> None:
+    """Call after a payment_transactions document's payment_status changed
+    (only when this write actually changed it, e.g. ``modified_count``)."""
+    if (old == PAID) == (new == PAID):
+        return
+    cents = _cents(total_amount)
+    await _inc({"revenue_cents": cents if new == PAID else -cents})
+
+
+async def _source_counts() -> Dict[str, int]:
+    counts = {
+        "users": await db.users.count_documents({}),
+        "lessons": await db.lessons.count_documents({}),
+        "orders": await db.payment_transactions.count_documents({}),
+        "products": await db.products.count_documents({}),
+    }
+    for status in LESSON_STATUSES:
+        counts[f"lessons_{status}"] = await db.lessons.count_documents({"status": status})
+    revenue = 0.0
+    async for row in db.payment_transactions.aggregate([
+        {"$match": {"payment_status": PAID}},
+        {"$group": {"_id": None, "total": {"$sum": {"$convert": {
+            "input": "$total_amount", "to": "double", "onError": 0, "onNull": 0,
+        }}}}},
+    ]):
+        revenue = float(row.get("total") or 0)
+    counts["revenue_cents"] = _cents(revenue)
+    return counts
+
+
+async def reconcile() -> dict:
+    """Recompute every counter from the source collections and store them.
+    Returns the counters and how far the stored ones had drifted."""
+    counts = await _source_counts()
+    previous = await db.dashboard_stats.find_one({"_id": STATS_ID})
+    drift = {}
+    if previous:
+        drift = {k: counts[k] - int(previous.get(k) or 0) for k in COUNTERS
+                 if counts[k] != int(previous.get(k) or 0)}
+        if drift:
+            print(f"[DashboardStats] reconcile corrected drift: {drift}")
+    now = _now()
+    await db.dashboard_stats.update_one(
+        {"_id": STATS_ID},
+        {"$set": {**counts, "reconciled_at": now, "updated_at": now, "last_drift": drift}},
+        upsert=True,
+    )
+    return {"counters": counts, "drift": drift, "reconciled_at": now.isoformat()}
+
+
+async def read() -> dict:
+    """The dashboard counters (one document read; reconciles first if the
+    rollup was never built)."""
+    doc = await db.dashboard_stats.find_one({"_id": STATS_ID})
+    if not doc or not doc.get("reconciled_at"):
+        await reconcile()
+        doc = await db.dashboard_stats.find_one({"_id": STATS_ID}) or {}
+    return {k: int(doc.get(k) or 0) for k in COUNTERS}
+
+
+async def run_reconciler(interval: float = DASHBOARD_STATS_RECONCILE_SECONDS) -> None:
+    """Reconcile the counters every ``interval`` seconds (app startup task).
+    Skips a round if another worker reconciled within the interval."""
+    print(f"[DashboardStats] reconciler started (every {interval:.0f}s)")
+    while True:
+        try:
+            doc = await db.dashboard_stats.find_one({"_id": STATS_ID}, {"reconciled_at": 1})
+            last = (doc or {}).get("reconciled_at")
+            if last is not None and last.tzinfo is None:
+                last = last.replace(tzinfo=timezone.utc)
+            if last is None or (_now() - last).total_seconds() >= interval * 0.9:
+                await reconcile()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[DashboardStats] reconcile error: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,80 @@
+"""
+Shared MongoDB client.
+======================
+One ``AsyncIOMotorClient`` (one connection pool) per worker process. Every
+backend module imports ``db`` from here instead of constructing its own
+client — N per-module clients meant N pools and N× the sockets against the
+Mongo connection limit whenever uvicorn workers are scaled out.
+
+Pool sizing, timeouts and read preference are configured via env:
+  - MONGO_MAX_POOL_SIZE (default 50), MONGO_MIN_POOL_SIZE (default 0)
+  - MONGO_CONNECT_TIMEOUT_MS (default 10000)
+  - MONGO_SERVER_SELECTION_TIMEOUT_MS (default 10000)
+  - MONGO_SOCKET_TIMEOUT_MS (default 0 = no timeout)
+  - MONGO_READ_PREFERENCE (default "primary"; e.g. "primaryPreferred")
+
+The client is created at import (Motor connects lazily on first use);
+``connect_db`` / ``close_db`` are wired to app startup/shutdown in server.py.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+load_dotenv(Path(__file__).parent / ".env")
+
+logger = logging.getLogger(__name__)
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ["DB_NAME"]
+
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "0"))
+MONGO_READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "primary")
+
+
+def create_client(url: str = MONGO_URL) -> AsyncIOMotorClient:
+    """Build a Motor client with the configured pool + timeouts. Only the
+    shared ``client`` below should be used by request handlers; this is
+    exposed for CLI scripts that run in their own process."""
+    return AsyncIOMotorClient(
+        url,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS or None,
+        readPreference=MONGO_READ_PREFERENCE,
+    )
+
+
+client: AsyncIOMotorClient = create_client()
+db: AsyncIOMotorDatabase = client[DB_NAME]
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    """FastAPI dependency / accessor for the shared database handle."""
+    return db
+
+
+async def connect_db() -> None:
+    """Startup hook: fail fast in the logs if Mongo is unreachable. Non-fatal —
+    Motor keeps retrying server selection on each operation."""
+    try:
+        await client.admin.command("ping")
+        logger.info("MongoDB connected (db=%s, maxPoolSize=%d, readPreference=%s)",
+                    DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_READ_PREFERENCE)
+    except Exception as e:
+        logger.warning("MongoDB ping failed at startup: %s", e)
+
+
+def close_db() -> None:
+    """Shutdown hook: close the shared pool."""
+    client.close()
@@ -14,15 +14,14 @@ from typing import Optional, Tuple, Dict, List
 import hashlib
 import secrets
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
+from pymongo.errors import BulkWriteError
 
 load_dotenv()
 
 # Database connection
-MONGO_URL = os.getenv('MONGO_URL')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ['DB_NAME']]
+from database import db  # noqa: E402 — shared pool
+import entitlements  # noqa: E402
 
 # =============================================================================
 # DOWNLOAD PROTECTION CONSTANTS
@@ -32,6 +31,7 @@ DOWNLOAD_LINK_EXPIRY_HOURS = 72  # Links expire after 72 hours
 MAX_DOWNLOADS_PER_ORDER = 3  # Max times each file can be downloaded
 RESEND_LINK_RATE_LIMIT = 3  # Max resend requests per hour
 RESEND_RATE_WINDOW_HOURS = 1
+RESUME_WINDOW_MINUTES = 30  # An interrupted download may resume free for this long
 
 # =============================================================================
 # SECURE TOKEN GENERATION
@@ -51,7 +51,7 @@ def hash_token(token: str) -> str:
 # DOWNLOAD LINK MANAGEMENT
 # =============================================================================
 
-async def create_download_link(
+def _download_link_record(
     order_id: str,
     user_id: str,
     user_email: str,
@@ -59,17 +59,14 @@ async def create_download_link(
     product_name: str,
     file_path: str,
     payment_verified: bool = False
-) -> Tuple[str, datetime]:
-    """
-    Create a secure, tokenized download link for a purchased product.
-    
-    Returns: (download_token, expires_at)
-    """
+) -> Tuple[Dict, str, datetime]:
+    """Build a download_links document. Returns (record, raw_token, expires_at)."""
     # Generate secure token
     raw_token = generate_download_token()
     token_hash = hash_token(raw_token)
     
-    expires_at = datetime.now(timezone.utc) + timedelta(hours=DOWNLOAD_LINK_EXPIRY_HOURS)
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(hours=DOWNLOAD_LINK_EXPIRY_HOURS)
     
     # Store download record - include token for API retrieval
     download_record = {
@@ -86,10 +83,30 @@ async def create_download_link(
         "download_count": 0,
         "max_downloads": MAX_DOWNLOADS_PER_ORDER,
         "payment_verified": payment_verified,
-        "created_at": datetime.now(timezone.utc),
+        "created_at": now,
         "downloads": [],  # Track each download attempt
         "revoked": False
     }
+    return download_record, raw_token, expires_at
+
+
+async def create_download_link(
+    order_id: str,
+    user_id: str,
+    user_email: str,
+    product_id: str,
+    product_name: str,
+    file_path: str,
+    payment_verified: bool = False
+) -> Tuple[str, datetime]:
+    """
+    Create a secure, tokenized download link for a purchased product.
+    
+    Returns: (download_token, expires_at)
+    """
+    download_record, raw_token, expires_at = _download_link_record(
+        order_id, user_id, user_email, product_id, product_name, file_path, payment_verified
+    )
     
     await db.download_links.insert_one(download_record)
     
@@ -105,10 +122,68 @@ async def create_download_link(
     return raw_token, expires_at
 
 
-async def verify_download_token(token: str) -> Tuple[bool, Optional[Dict], str]:
+async def create_download_links(
+    order_id: str,
+    user_id: str,
+    user_email: str,
+    products: List[Dict],
+    payment_verified: bool = False
+) -> List[Tuple[Optional[str], Optional[datetime], Optional[str]]]:
+    """
+    Bulk create_download_link for one order: one insert_many for the links
+    and one for their audit events.
+    
+    ``products`` are dicts with product_id, product_name and file_path.
+    Returns one (download_token, expires_at, error) per product, in order;
+    error is None when the link was stored.
+    """
+    if not products:
+        return []
+    built = [
+        _download_link_record(
+            order_id, user_id, user_email,
+            p["product_id"], p["product_name"], p["file_path"], payment_verified
+        )
+        for p in products
+    ]
+    errors: Dict[int, str] = {}
+    try:
+        await db.download_links.insert_many([record for record, _, _ in built], ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            errors[err["index"]] = err.get("errmsg", "write error")
+    except Exception as e:
+        errors = {i: str(e) for i in range(len(built))}
+    
+    stored = [i for i in range(len(built)) if i not in errors]
+    if stored:
+        # The links are stored; a failed audit write must not report them as failed.
+        try:
+            await log_download_events([
+                _download_event(
+                    "download_link_created", order_id, user_id, built[i][0]["product_id"],
+                    {"expires_at": built[i][2].isoformat()}
+                )
+                for i in stored
+            ])
+        except Exception as e:
+            print(f"[Download Audit] ERROR: could not log {len(stored)} link events for order {order_id}: {e}")
+    
+    return [
+        (None, None, errors[i]) if i in errors else (raw_token, expires_at, None)
+        for i, (_, raw_token, expires_at) in enumerate(built)
+    ]
+
+
+async def verify_download_token(token: str, resume_from: int = 0) -> Tuple[bool, Optional[Dict], str]:
     """
     Verify a download token and check all restrictions.
     
+    ``resume_from`` is the start of the request's Range (0 without one). A
+    request that can resume the token's interrupted download (``can_resume``)
+    is admitted even when the download limit is used up — the interrupted
+    download was already counted.
+    
     Returns: (is_valid, download_record, error_message)
     """
     token_hash = hash_token(token)
@@ -139,7 +214,7 @@ async def verify_download_token(token: str) -> Tuple[bool, Optional[Dict], str]:
         return False, None, "This download link has expired. Please request a new one."
     
     # Check download count
-    if record["download_count"] >= record["max_downloads"]:
+    if record["download_count"] >= record["max_downloads"] and not can_resume(record, resume_from):
         return False, None, f"Maximum downloads ({record['max_downloads']}) reached. Please contact support if you need additional access."
     
     # Check payment verification
@@ -199,6 +274,48 @@ async def record_download(token: str, ip_address: str, user_agent: str = "") ->
     return False
 
 
+def can_resume(record: dict, start: int) -> bool:
+    """True if a Range request from ``start`` continues the record's last
+    interrupted download: at or before where it stopped (the client may have
+    received less than was sent), within RESUME_WINDOW_MINUTES."""
+    offset = record.get("resume_offset")
+    until = record.get("resume_until")
+    if start <= 0 or offset is None or until is None or start > offset:
+        return False
+    if until.tzinfo is None:
+        until = until.replace(tzinfo=timezone.utc)
+    return until > datetime.now(timezone.utc)
+
+
+async def remember_resume_point(token: str, offset: int):
+    """Note where an interrupted download stopped (bytes sent), so a Range
+    request from at most that offset can continue it without counting again."""
+    await db.download_links.update_one(
+        {"token_hash": hash_token(token)},
+        {"$set": {
+            "resume_offset": offset,
+            "resume_until": datetime.now(timezone.utc) + timedelta(minutes=RESUME_WINDOW_MINUTES),
+        }}
+    )
+
+
+async def claim_resume(token: str, offset: int) -> bool:
+    """True if a Range request starting at ``offset`` continues this token's
+    last interrupted download (see ``can_resume``). Consumes the resume
+    point, so it can be used only once."""
+    if offset <= 0:
+        return False
+    result = await db.download_links.update_one(
+        {
+            "token_hash": hash_token(token),
+            "resume_offset": {"$gte": offset},
+            "resume_until": {"$gt": datetime.now(timezone.utc)},
+        },
+        {"$unset": {"resume_offset": "", "resume_until": ""}}
+    )
+    return result.modified_count > 0
+
+
 async def get_remaining_downloads(token: str) -> int:
     """Get the number of remaining downloads for a token"""
     token_hash = hash_token(token)
@@ -377,15 +494,14 @@ async def verify_stripe_payment(payment_intent_id: str) -> bool:
 # DOWNLOAD AUDIT LOGGING
 # =============================================================================
 
-async def log_download_event(
+def _download_event(
     event_type: str,
     order_id: str = None,
     user_id: str = None,
     product_id: str = None,
     details: Dict = None
-):
-    """Log download-related events for audit trail"""
-    event = {
+) -> Dict:
+    return {
         "id": secrets.token_hex(16),
         "event_type": event_type,
         "order_id": order_id,
@@ -394,11 +510,31 @@ async def log_download_event(
         "details": details or {},
         "timestamp": datetime.now(timezone.utc)
     }
+
+
+async def log_download_event(
+    event_type: str,
+    order_id: str = None,
+    user_id: str = None,
+    product_id: str = None,
+    details: Dict = None
+):
+    """Log download-related events for audit trail"""
+    event = _download_event(event_type, order_id, user_id, product_id, details)
     
     await db.download_audit_logs.insert_one(event)
     print(f"[Download Audit] {event_type} | Order: {order_id} | Product: {product_id}")
 
 
+async def log_download_events(events: List[Dict]):
+    """Write several audit events (built with _download_event) in one insert."""
+    if not events:
+        return
+    await db.download_audit_logs.insert_many(events, ordered=False)
+    first = events[0]
+    print(f"[Download Audit] {first['event_type']} x{len(events)} | Order: {first['order_id']}")
+
+
 # =============================================================================
 # ADMIN FUNCTIONS
 # =============================================================================
@@ -466,6 +602,7 @@ async def set_links_revoked(order_ids: list, revoked: bool, reason: str = "") ->
     if not revoked:
         update["expires_at"] = datetime.now(timezone.utc) + timedelta(hours=DOWNLOAD_LINK_EXPIRY_HOURS)
     result = await db.download_links.update_many({"order_id": {"$in": ids}}, {"$set": update})
+    await entitlements.invalidate_library()
     await log_download_event(
         event_type="download_links_revoked_admin" if revoked else "download_links_restored_admin",
         order_id=ids[0],
@@ -538,26 +675,3 @@ async def get_order_download_status(order_id: str, user_email: str) -> List[Dict
         })
     
     return result
-
-
-# =============================================================================
-# DATABASE INDEXES
-# =============================================================================
-
-async def ensure_download_indexes():
-    """Create necessary indexes for download collections"""
-    # Download links
-    await db.download_links.create_index("token_hash", unique=True)
-    await db.download_links.create_index("order_id")
-    await db.download_links.create_index("user_email")
-    await db.download_links.create_index("expires_at")
-    
-    # Download link requests (for rate limiting) - TTL index
-    await db.download_link_requests.create_index("requested_at", expireAfterSeconds=3600)
-    await db.download_link_requests.create_index([("user_email", 1), ("order_id", 1)])
-    
-    # Download audit logs
-    await db.download_audit_logs.create_index("timestamp")
-    await db.download_audit_logs.create_index("order_id")
-    
-    print("[Download Protection] Database indexes created")
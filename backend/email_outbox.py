@@ -0,0 +1,211 @@
+"""
+Durable email outbox.
+=====================
+Every transactional email used to be sent inline: ``send_email`` awaited
+Resend's HTTP API inside the request (checkout status polls, the Stripe
+webhook, admin resends, invites), so a slow provider stalled the request and
+a failed send was simply lost.
+
+``email_service.send_email`` now only *enqueues* the rendered message in
+``db.email_outbox``. A background worker (``run_worker``, started with the
+app) claims due messages in batches, sends them with Resend's batch endpoint
+(``resend.Batch.send``, up to 100 per call; a lone message goes through
+``resend.Emails.send``) and retries failures with exponential backoff. After
+``MAX_ATTEMPTS`` a message is parked as ``dead``.
+
+* ``dedup_key`` — at most one message per key (e.g. one receipt per order
+  per recipient). Enqueueing an existing key is a no-op, unless the earlier
+  message died, in which case it is revived.
+* ``track`` — where to record the outcome: ``{"collection", "filter",
+  "flag", "error_field"}``. On delivery ``flag`` and ``<flag>_at`` are set
+  on that document; on each failure ``error_field`` gets the error.
+
+Claims are leases: if a worker dies mid-send, its ``sending`` messages
+become claimable again after ``LEASE_SECONDS``, so several app workers can
+run the loop side by side. The backoff, poll loop and stats are shared with
+``stripe_events`` (``work_queue``).
+
+Settings (env):
+  - EMAIL_OUTBOX_BATCH_SIZE (default 50, max 100)
+  - EMAIL_OUTBOX_POLL_SECONDS (default 5)
+  - EMAIL_OUTBOX_MAX_ATTEMPTS (default 8)
+  - EMAIL_OUTBOX_BACKOFF_SECONDS (default 30; doubles per attempt, capped at 1h)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import uuid
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+import work_queue
+from database import db
+
+PENDING, SENDING, SENT, DEAD = "pending", "sending", "sent", "dead"
+
+BATCH_SIZE = min(int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", "50")), 100)
+POLL_SECONDS = float(os.environ.get("EMAIL_OUTBOX_POLL_SECONDS", "5"))
+MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+BACKOFF_SECONDS = float(os.environ.get("EMAIL_OUTBOX_BACKOFF_SECONDS", "30"))
+MAX_BACKOFF_SECONDS = 3600.0
+LEASE_SECONDS = 300
+
+_WORKER_ID = uuid.uuid4().hex
+_wakeup = asyncio.Event()
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Delay before retry number ``attempts`` (1-based)."""
+    return work_queue.backoff_seconds(attempts, BACKOFF_SECONDS, MAX_BACKOFF_SECONDS)
+
+
+def track_flag(collection: str, filter: dict, flag: str, error_field: Optional[str] = None) -> dict:
+    """``track`` spec: set ``flag`` on the ``filter`` document once delivered."""
+    return {"collection": collection, "filter": filter, "flag": flag, "error_field": error_field}
+
+
+async def enqueue(params: dict, dedup_key: Optional[str] = None, track: Optional[dict] = None) -> dict:
+    """Queue a Resend ``params`` dict for delivery. Returns immediately."""
+    now = work_queue.now()
+    doc = {
+        "id": uuid.uuid4().hex,
+        "params": params,
+        "to": params.get("to"),
+        "subject": params.get("subject"),
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+        "updated_at": now,
+    }
+    if dedup_key:
+        doc["dedup_key"] = dedup_key
+    if track:
+        doc["track"] = track
+    try:
+        await db.email_outbox.insert_one(doc)
+    except DuplicateKeyError:
+        revived = await db.email_outbox.find_one_and_update(
+            {"dedup_key": dedup_key, "status": DEAD},
+            {"$set": {"status": PENDING, "attempts": 0, "next_attempt_at": now, "params": params,
+                      "track": track, "updated_at": now},
+             "$unset": {"last_error": ""}},
+            projection={"_id": 0, "id": 1},
+        )
+        if revived:
+            _wakeup.set()
+            return {"success": True, "queued": True, "outbox_id": revived.get("id"), "to": params.get("to")}
+        existing = await db.email_outbox.find_one({"dedup_key": dedup_key}, {"_id": 0, "id": 1, "status": 1})
+        return {"success": True, "queued": False, "duplicate": True,
+                "outbox_id": (existing or {}).get("id"), "status": (existing or {}).get("status"),
+                "to": params.get("to")}
+    _wakeup.set()
+    return {"success": True, "queued": True, "outbox_id": doc["id"], "to": params.get("to")}
+
+
+async def claim_batch(limit: int = BATCH_SIZE, worker_id: str = _WORKER_ID) -> List[dict]:
+    """Lease up to ``limit`` due messages (oldest first) to ``worker_id``."""
+    now = work_queue.now()
+    due = {"$or": [
+        {"status": PENDING, "next_attempt_at": {"$lte": now}},
+        {"status": SENDING, "lease_until": {"$lt": now}},
+    ]}
+    ids = [d["_id"] async for d in db.email_outbox.find(due, {"_id": 1}).sort("next_attempt_at", 1).limit(limit)]
+    if not ids:
+        return []
+    await db.email_outbox.update_many(
+        {"$and": [{"_id": {"$in": ids}}, due]},
+        {"$set": {"status": SENDING, "claimed_by": worker_id,
+                  "lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+    )
+    return await db.email_outbox.find(
+        {"_id": {"$in": ids}, "status": SENDING, "claimed_by": worker_id}
+    ).to_list(limit)
+
+
+def _batch_send(params: List[dict]) -> List[Optional[str]]:
+    import resend
+
+    resp = resend.Batch.send(params)
+    data = (resp or {}).get("data") or []
+    ids = [(d or {}).get("id") for d in data]
+    return ids + [None] * (len(params) - len(ids))
+
+
+async def _deliver(docs: List[dict]) -> List[Tuple[dict, Optional[str], Optional[str]]]:
+    """Send ``docs``; returns ``(doc, email_id, error)`` per message."""
+    import resend
+    import email_service  # sets resend.api_key
+
+    if not email_service.RESEND_API_KEY:
+        return [(d, None, "RESEND_API_KEY not configured") for d in docs]
+    if len(docs) > 1:
+        try:
+            ids = await asyncio.to_thread(_batch_send, [d["params"] for d in docs])
+            return [(d, email_id, None) for d, email_id in zip(docs, ids)]
+        except Exception as e:
+            # One bad address rejects the whole batch — isolate it.
+            print(f"[EmailOutbox] batch of {len(docs)} failed, sending individually: {e}")
+    results = []
+    for d in docs:
+        try:
+            sent = await asyncio.to_thread(resend.Emails.send, d["params"])
+            results.append((d, (sent or {}).get("id"), None))
+        except Exception as e:
+            results.append((d, None, str(e)[:300]))
+    return results
+
+
+async def _record(doc: dict, email_id: Optional[str], error: Optional[str]) -> None:
+    now = work_queue.now()
+    target = doc.get("track") or {}
+    release = {"lease_until": "", "claimed_by": ""}
+    attempts = doc.get("attempts", 0) + 1
+    if error is None:
+        await db.email_outbox.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"status": SENT, "sent_at": now, "email_id": email_id, "attempts": attempts,
+                      "updated_at": now},
+             "$unset": {**release, "last_error": ""}},
+        )
+        if target.get("flag"):
+            await db[target["collection"]].update_one(
+                target["filter"],
+                {"$set": {target["flag"]: True, f"{target['flag']}_at": now.isoformat()}},
+            )
+        return
+    dead = attempts >= MAX_ATTEMPTS
+    await db.email_outbox.update_one(
+        {"_id": doc["_id"]},
+        {"$set": {"status": DEAD if dead else PENDING, "attempts": attempts, "last_error": error,
+                  "next_attempt_at": now + timedelta(seconds=backoff_seconds(attempts)), "updated_at": now},
+         "$unset": release},
+    )
+    if target.get("error_field"):
+        await db[target["collection"]].update_one(target["filter"], {"$set": {target["error_field"]: error}})
+    print(f"[EmailOutbox] send failed ({attempts}/{MAX_ATTEMPTS}{', giving up' if dead else ''}) "
+          f"{doc.get('subject')!r} -> {doc.get('to')}: {error}")
+
+
+async def process_once(limit: int = BATCH_SIZE) -> int:
+    """Claim and deliver one batch. Returns the number of messages handled."""
+    docs = await claim_batch(limit)
+    if not docs:
+        return 0
+    for doc, email_id, error in await _deliver(docs):
+        await _record(doc, email_id, error)
+    return len(docs)
+
+
+async def run_worker(poll_seconds: float = POLL_SECONDS) -> None:
+    """Deliver queued email forever (app startup task)."""
+    print(f"[EmailOutbox] worker {_WORKER_ID[:8]} started (batch={BATCH_SIZE}, poll={poll_seconds}s)")
+    await work_queue.poll_loop("EmailOutbox", process_once, _wakeup, poll_seconds)
+
+
+async def stats() -> dict:
+    """Message counts by status, plus the oldest pending message's age."""
+    return await work_queue.status_stats(db.email_outbox, (PENDING, SENDING, SENT, DEAD), PENDING, "created_at")
@@ -1,7 +1,12 @@
 """
 Soul Food Email Service
 =======================
-Transactional email handling using Resend API.
+Transactional email handling using Resend API. Messages are rendered here
+and handed to the durable outbox (``email_outbox``); a background worker
+delivers them, so callers never wait on Resend.
+
+Message bodies are ``email_templates.Fragment``s compiled at import; values
+are HTML-escaped when rendered (see email_templates).
 
 Email Configuration (kingdom-soul.com):
 - From: noreply@kingdom-soul.com
@@ -10,13 +15,14 @@ Email Configuration (kingdom-soul.com):
 """
 
 import os
-import asyncio
 import logging
 import resend
 from datetime import datetime
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
 
+from email_templates import Fragment, escape
+
 load_dotenv()
 
 # Configure logging
@@ -63,9 +69,7 @@ EMAIL_FOOTER = f"""
 # BASE EMAIL TEMPLATE
 # =============================================================================
 
-def get_base_template(content: str, preheader: str = "") -> str:
-    """Wrap content in base email template with inline styles"""
-    return f"""
+_BASE_LAYOUT = Fragment("base", """
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -76,7 +80,7 @@ def get_base_template(content: str, preheader: str = "") -> str:
 <body style="margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; background-color: #f3f4f6;">
     <!-- Preheader text (hidden but shows in email preview) -->
     <div style="display: none; max-height: 0; overflow: hidden;">{preheader}</div>
-    
+
     <table role="presentation" width="100%" cellspacing="0" cellpadding="0" style="background-color: #f3f4f6;">
         <tr>
             <td align="center" style="padding: 40px 20px;">
@@ -91,8 +95,8 @@ def get_base_template(content: str, preheader: str = "") -> str:
                     <!-- Content -->
                     <tr>
                         <td style="padding: 40px;">
-                            {content}
-                            {EMAIL_FOOTER}
+                            {content_html}
+                            {footer_html}
                         </td>
                     </tr>
                 </table>
@@ -101,13 +105,26 @@ def get_base_template(content: str, preheader: str = "") -> str:
     </table>
 </body>
 </html>
-"""
+""")
+
+
+def get_base_template(content: str, preheader: str = "") -> str:
+    """Wrap content in base email template with inline styles.
+
+    ``content`` is HTML the caller built and is inserted as-is; ``preheader``
+    is text and is escaped."""
+    return _BASE_LAYOUT.render(content_html=content, preheader=preheader, footer_html=EMAIL_FOOTER)
 
 
 # =============================================================================
 # EMAIL TEMPLATES
 # =============================================================================
 
+_TAG_ONLINE = Fragment("receipt_tag_online", ' <span style="color:#0891b2;font-weight:600;">— {note}</span>')
+_TAG_PHYSICAL = Fragment("receipt_tag_physical", ' <span style="color:#b45309;font-weight:600;">— 📦 {note}</span>')
+_TAG_PENDING = Fragment("receipt_tag_pending", ' <span style="color:#b45309;font-weight:600;">— Pending · {note}</span>')
+
+
 def _fulfillment_tag(d: Dict) -> str:
     """Inline status tag for a receipt deliverable line (dynamic, non-stale)."""
     status = d.get("status")
@@ -115,266 +132,298 @@ def _fulfillment_tag(d: Dict) -> str:
     if status in ("deliverable", None, "") or not note:
         return ""
     if status == "online":
-        return f' <span style="color:#0891b2;font-weight:600;">— {note}</span>'
+        return _TAG_ONLINE.render(note=note)
     if status == "physical":
-        return f' <span style="color:#b45309;font-weight:600;">— 📦 {note}</span>'
-    return f' <span style="color:#b45309;font-weight:600;">— Pending · {note}</span>'
-
-
-def get_order_confirmation_template(
-    order_id: str,
-    items: List[Dict],
-    total: float,
-    is_free_order: bool = False,
-    coupon_code: str = None,
-    download_links: List[Dict] = None,
-    customer_name: str = "Valued Customer",
-    audio_codes: List[Dict] = None,
-    recipient_email: str = None,
-    gifted_by_email: str = None,
-    is_buyer_receipt_only: bool = False,
-    is_recipient_access: bool = False,
-) -> str:
-    """Generate order confirmation email HTML"""
-
-    # Build items list (with bundle expansion + expected-delivery hints)
-    try:
-        from payment_routes import expand_items_for_receipt
-        expanded = expand_items_for_receipt(items)
-    except Exception:
-        expanded = []
-
-    items_html = ""
-    for idx, item in enumerate(items):
-        price = item.get('price', 0) or item.get('salePrice', 0)
-        qty = item.get('quantity', 1)
-        # Sub-deliverables for this row (bundle expansion or single)
-        sub_html = ""
-        # Small Group Bundle: render the customer's selected mix explicitly so
-        # fulfillment and the buyer both see exactly what was chosen.
-        if item.get('isSmallGroupBundle') and item.get('bundle_contents'):
-            sub_html = (
-                '<ul style="margin: 8px 0 0 18px; padding: 0; color: #047857; font-size: 13px;">'
-                '<li>1 × Instructor Edition</li>'
-                f'<li>{item.get("bundle_contents")}</li>'
-                '</ul>'
-            )
-        row = expanded[idx] if idx < len(expanded) else None
-        if not sub_html and row and (row.get("is_bundle") or len(row.get("deliverables", [])) > 1):
-            sub_html = '<ul style="margin: 8px 0 0 18px; padding: 0; color: #4b5563; font-size: 13px;">'
-            for d in row.get("deliverables", []):
-                sub_html += f'<li>{d.get("label","")}{_fulfillment_tag(d)}</li>'
-            sub_html += '</ul>'
-        elif not sub_html and row and row.get("deliverables") and row["deliverables"][0].get("status") not in ("deliverable", None, ""):
-            d = row["deliverables"][0]
-            note = d.get("expected_by", "")
-            if note:
-                st = d.get("status")
-                color = "#0891b2" if st == "online" else "#b45309"
-                prefix = "Pending — " if st == "pending" else ("📦 " if st == "physical" else "")
-                sub_html = (
-                    f'<div style="margin-top:6px;color:{color};font-size:13px;font-weight:600;">'
-                    f'{prefix}{note}</div>'
-                )
-        items_html += f"""
+        return _TAG_PHYSICAL.render(note=note)
+    return _TAG_PENDING.render(note=note)
+
+
+_RECEIPT_BUNDLE_MIX = Fragment(
+    "receipt_bundle_mix",
+    '<ul style="margin: 8px 0 0 18px; padding: 0; color: #047857; font-size: 13px;">'
+    '<li>1 × Instructor Edition</li>'
+    '<li>{bundle_contents}</li>'
+    '</ul>',
+)
+_RECEIPT_DELIVERABLES_OPEN = ('<ul style="margin: 8px 0 0 18px; padding: 0; color: #4b5563; font-size: 13px;">')
+_RECEIPT_DELIVERABLE = Fragment("receipt_deliverable", '<li>{label}{tag_html}</li>')
+_RECEIPT_NOTE = Fragment(
+    "receipt_note",
+    '<div style="margin-top:6px;color:{color};font-size:13px;font-weight:600;">'
+    '{prefix}{note}</div>',
+)
+_RECEIPT_ITEM = Fragment("receipt_item", """
         <tr>
             <td style="padding: 12px 0; border-bottom: 1px solid #e5e7eb;">
-                <strong style="color: #1f2937;">{item.get('name', 'Product')}</strong>
+                <strong style="color: #1f2937;">{name}</strong>
                 <div style="color: #6b7280; font-size: 14px;">Qty: {qty}</div>
                 {sub_html}
             </td>
             <td style="padding: 12px 0; border-bottom: 1px solid #e5e7eb; text-align: right; color: #1f2937;">
-                ${price * qty:.2f}
+                ${line_total:.2f}
             </td>
         </tr>
-        """
-    
-    # Build download links section if available
-    downloads_html = ""
-    if download_links and len(download_links) > 0:
-        downloads_html = """
+        """)
+_RECEIPT_DOWNLOADS_OPEN = """
         <div style="margin-top: 30px; padding: 20px; background-color: #ecfdf5; border-radius: 8px; border-left: 4px solid #10b981;">
             <h3 style="margin: 0 0 15px 0; color: #065f46; font-size: 18px;">📥 Your Downloads Are Ready!</h3>
             <p style="margin: 0 0 15px 0; color: #047857; font-size: 14px;">Click the buttons below to download your files. Downloads are limited to 3 per file and expire in 72 hours.</p>
         """
-        for link in download_links:
-            token = link.get('token', '')
-            product_name = link.get('product_name', 'Download')
-            downloads_html += f"""
-            <a href="{SITE_URL}/api/downloads/file/{token}" 
+_RECEIPT_DOWNLOAD = Fragment("receipt_download", """
+            <a href="{site_url}/api/downloads/file/{token}"
                style="display: inline-block; margin: 5px 5px 5px 0; padding: 10px 20px; background-color: #10b981; color: #ffffff; text-decoration: none; border-radius: 6px; font-weight: 600; font-size: 14px;">
                 ⬇️ {product_name}
             </a>
-            """
-        downloads_html += "</div>"
-    
-    # Build audio codes section if available (for physical book purchases)
-    audio_codes_html = ""
-    if audio_codes and len(audio_codes) > 0:
-        audio_codes_html = """
+            """)
+_RECEIPT_AUDIO_OPEN = """
         <div style="margin-top: 30px; padding: 20px; background-color: #faf5ff; border-radius: 8px; border-left: 4px solid #8b5cf6;">
             <h3 style="margin: 0 0 15px 0; color: #6b21a8; font-size: 18px;">🎧 Bonus: Audio Access Included!</h3>
             <p style="margin: 0 0 15px 0; color: #7c3aed; font-size: 14px;">Your physical book purchase includes free audio teachings! Use the code(s) below to unlock your audio content:</p>
         """
-        for code_info in audio_codes:
-            code = code_info.get('code', '')
-            series_name = code_info.get('series_name', 'Audio Series')
-            audio_codes_html += f"""
+_RECEIPT_AUDIO_CODE = Fragment("receipt_audio_code", """
             <div style="margin: 10px 0; padding: 15px; background-color: #ffffff; border: 2px dashed #8b5cf6; border-radius: 8px; text-align: center;">
                 <p style="margin: 0 0 5px 0; color: #6b7280; font-size: 12px; text-transform: uppercase;">{series_name}</p>
                 <p style="margin: 0; color: #1f2937; font-size: 24px; font-weight: bold; font-family: monospace; letter-spacing: 2px;">{code}</p>
             </div>
-            """
-        audio_codes_html += f"""
+            """)
+_RECEIPT_AUDIO_CLOSE = Fragment("receipt_audio_close", """
             <p style="margin: 15px 0 0 0; color: #7c3aed; font-size: 14px;">
-                <strong>How to redeem:</strong> Visit <a href="{SITE_URL}/multimedia" style="color: #6366f1; font-weight: 600;">our multimedia page</a> and enter your code to unlock your audio lessons!
+                <strong>How to redeem:</strong> Visit <a href="{site_url}/multimedia" style="color: #6366f1; font-weight: 600;">our multimedia page</a> and enter your code to unlock your audio lessons!
             </p>
         </div>
-        """
-    
-    # Coupon badge
-    coupon_html = ""
-    if coupon_code:
-        coupon_html = f"""
+        """)
+_RECEIPT_COUPON = Fragment("receipt_coupon", """
         <div style="margin-bottom: 20px; padding: 10px 15px; background-color: #fef3c7; border-radius: 6px; display: inline-block;">
             <span style="color: #92400e; font-weight: 600;">🎉 Coupon Applied: {coupon_code}</span>
         </div>
-        """
-    
-    # Gift / recipient attribution banner (if applicable)
-    attribution_html = ""
-    if is_buyer_receipt_only and recipient_email:
-        attribution_html = f"""
+        """)
+_RECEIPT_SENT_TO = Fragment("receipt_sent_to", """
         <div style="margin: 0 0 24px 0; padding: 16px 18px; background-color: #f3e8ff; border-left: 4px solid #7c3aed; border-radius: 6px;">
             <p style="margin: 0 0 6px 0; color: #5b21b6; font-size: 14px; font-weight: 700; text-transform: uppercase; letter-spacing: 0.5px;">You sent this order to:</p>
             <p style="margin: 0; color: #1f2937; font-size: 17px; font-weight: 600;">{recipient_email}</p>
             <p style="margin: 8px 0 0 0; color: #6b21a8; font-size: 13px;">Digital access has been emailed directly to them. This message is your receipt only — it does not contain download links.</p>
         </div>
-        """
-    elif is_recipient_access and gifted_by_email:
-        attribution_html = f"""
+        """)
+_RECEIPT_GIFT_FROM = Fragment("receipt_gift_from", """
         <div style="margin: 0 0 24px 0; padding: 16px 18px; background-color: #ecfeff; border-left: 4px solid #0891b2; border-radius: 6px;">
             <p style="margin: 0 0 6px 0; color: #155e75; font-size: 14px; font-weight: 700; text-transform: uppercase; letter-spacing: 0.5px;">A gift from {gifted_by_email}</p>
             <p style="margin: 0; color: #1f2937; font-size: 15px;">Soul Food digital access is now ready for you below.</p>
             <p style="margin: 8px 0 0 0; color: #075985; font-size: 13px;">If you do not see this email later, check your spam or junk folder.</p>
         </div>
-        """
-
-    # Summary block — hide pricing/total when this is a recipient-access email
-    summary_block = ""
-    if is_recipient_access:
-        summary_block = f"""
+        """)
+_RECEIPT_ACCESS_SUMMARY = Fragment("receipt_access_summary", """
     <h3 style="margin: 30px 0 15px 0; color: #1f2937; font-size: 18px;">Your Soul Food Access Includes</h3>
     <table role="presentation" width="100%" cellspacing="0" cellpadding="0">
         {items_html}
     </table>
-    """
-    else:
-        summary_block = f"""
+    """)
+_RECEIPT_ORDER_SUMMARY = Fragment("receipt_order_summary", """
     <div style="margin: 25px 0; padding: 15px; background-color: #f9fafb; border-radius: 8px;">
         <p style="margin: 0; color: #6b7280; font-size: 14px;">Order ID</p>
         <p style="margin: 5px 0 0 0; color: #1f2937; font-size: 18px; font-weight: bold;">{order_id}</p>
     </div>
-    
+
     <h3 style="margin: 30px 0 15px 0; color: #1f2937; font-size: 18px;">Order Summary</h3>
-    
+
     <table role="presentation" width="100%" cellspacing="0" cellpadding="0">
         {items_html}
         <tr>
             <td style="padding: 15px 0; font-weight: bold; color: #1f2937; font-size: 18px;">Total</td>
             <td style="padding: 15px 0; text-align: right; font-weight: bold; color: #6366f1; font-size: 18px;">
-                {"$0.00 (FREE)" if is_free_order else f"${total:.2f}"}
+                {total_label}
             </td>
         </tr>
     </table>
-    """
-
-    content = f"""
+    """)
+_ORDER_CONFIRMATION = Fragment("order_confirmation", """
     <h2 style="margin: 0 0 20px 0; color: #1f2937; font-size: 24px;">
-        {"🎁 Free Order Confirmed!" if is_free_order else ("🎁 You've Been Sent Soul Food!" if is_recipient_access else "✅ Order Confirmed!")}
+        {heading}
     </h2>
-    
+
     <p style="margin: 0 0 20px 0; color: #4b5563; font-size: 16px; line-height: 1.6;">
-        Hi {customer_name or "there"},<br><br>
-        {"Someone gifted you Soul Food digital access. Get started below!" if is_recipient_access else ("Thank you for your order! " + ("Your promotional access has been activated." if is_free_order else "We're processing your order now."))}
+        Hi {customer_name},<br><br>
+        {intro}
     </p>
-    
+
     {attribution_html}
-    
+
     {coupon_html}
-    
-    {summary_block}
-    
+
+    {summary_html}
+
     {downloads_html}
-    
+
     {audio_codes_html}
-    
+
     <div style="margin-top: 30px; padding: 24px; background-color: #ffffff; border-radius: 10px; border: 2px solid #4338ca; text-align: center;">
         <h3 style="margin: 0 0 10px 0; color: #1f2937; font-size: 18px; font-weight: 700;">Save Your Purchase to Your Account</h3>
         <p style="margin: 0 0 6px 0; color: #374151; font-size: 14px;">Create a free account and redeem your order to access content anytime from <strong>My Library</strong>.</p>
         <p style="margin: 0 0 18px 0; color: #4b5563; font-size: 13px;">Your order number: <strong style="font-family: monospace; font-size: 15px; color: #111827;">{order_id}</strong></p>
-        <a href="{SITE_URL}/redeem?code={order_id}"
+        <a href="{site_url}/redeem?code={order_id}"
            style="display: inline-block; padding: 16px 36px; background-color: #4338ca; background-image: linear-gradient(135deg, #4338ca 0%, #3730a3 100%); color: #ffffff !important; text-decoration: none; border-radius: 8px; font-weight: 700; font-size: 16px; letter-spacing: 0.3px; border: 2px solid #312e81; box-shadow: 0 2px 6px rgba(67,56,202,0.35);">
             Redeem Your Purchase &rarr;
         </a>
     </div>
 
     <div style="margin-top: 15px; text-align: center;">
-        <a href="{SITE_URL}/order-success?order={order_id}" 
+        <a href="{site_url}/order-success?order={order_id}"
            style="display: inline-block; padding: 14px 30px; background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%); color: #ffffff; text-decoration: none; border-radius: 8px; font-weight: 600; font-size: 16px;">
             View Your Order
         </a>
     </div>
-    """
-    
-    preheader = f"Order {order_id} confirmed! " + ("Your downloads are ready." if download_links else "Thank you for your purchase.")
-    return get_base_template(content, preheader)
+    """)
+
+
+def _receipt_sub_html(item: Dict, row: Optional[Dict]) -> str:
+    """Deliverable lines under one receipt row (bundle mix / expansion / note)."""
+    # Small Group Bundle: render the customer's selected mix explicitly so
+    # fulfillment and the buyer both see exactly what was chosen.
+    if item.get('isSmallGroupBundle') and item.get('bundle_contents'):
+        return _RECEIPT_BUNDLE_MIX.render(bundle_contents=item.get("bundle_contents"))
+    if row and (row.get("is_bundle") or len(row.get("deliverables", [])) > 1):
+        return "".join([
+            _RECEIPT_DELIVERABLES_OPEN,
+            *(_RECEIPT_DELIVERABLE.render(label=d.get("label", ""), tag_html=_fulfillment_tag(d))
+              for d in row.get("deliverables", [])),
+            '</ul>',
+        ])
+    if row and row.get("deliverables") and row["deliverables"][0].get("status") not in ("deliverable", None, ""):
+        d = row["deliverables"][0]
+        note = d.get("expected_by", "")
+        if note:
+            st = d.get("status")
+            color = "#0891b2" if st == "online" else "#b45309"
+            prefix = "Pending — " if st == "pending" else ("📦 " if st == "physical" else "")
+            return _RECEIPT_NOTE.render(color=color, prefix=prefix, note=note)
+    return ""
 
 
-def get_download_delivery_template(
+def get_order_confirmation_template(
     order_id: str,
-    download_links: List[Dict],
-    customer_name: str = "Valued Customer"
+    items: List[Dict],
+    total: float,
+    is_free_order: bool = False,
+    coupon_code: str = None,
+    download_links: List[Dict] = None,
+    customer_name: str = "Valued Customer",
+    audio_codes: List[Dict] = None,
+    recipient_email: str = None,
+    gifted_by_email: str = None,
+    is_buyer_receipt_only: bool = False,
+    is_recipient_access: bool = False,
 ) -> str:
-    """Generate download link delivery email HTML"""
-    
+    """Generate order confirmation email HTML"""
+
+    # Build items list (with bundle expansion + expected-delivery hints)
+    try:
+        from payment_routes import expand_items_for_receipt
+        expanded = expand_items_for_receipt(items)
+    except Exception:
+        expanded = []
+
+    rows = []
+    for idx, item in enumerate(items):
+        price = item.get('price', 0) or item.get('salePrice', 0)
+        qty = item.get('quantity', 1)
+        row = expanded[idx] if idx < len(expanded) else None
+        rows.append(_RECEIPT_ITEM.render(
+            name=item.get('name', 'Product'),
+            qty=qty,
+            sub_html=_receipt_sub_html(item, row),
+            line_total=price * qty,
+        ))
+    items_html = "".join(rows)
+
+    # Build download links section if available
     downloads_html = ""
-    for link in download_links:
-        token = link.get('token', '')
-        product_name = link.get('product_name', 'Download')
-        expires_at = link.get('expires_at', '')
-        downloads_html += f"""
+    if download_links and len(download_links) > 0:
+        downloads_html = "".join([
+            _RECEIPT_DOWNLOADS_OPEN,
+            *(_RECEIPT_DOWNLOAD.render(site_url=SITE_URL, token=link.get('token', ''),
+                                       product_name=link.get('product_name', 'Download'))
+              for link in download_links),
+            "</div>",
+        ])
+
+    # Build audio codes section if available (for physical book purchases)
+    audio_codes_html = ""
+    if audio_codes and len(audio_codes) > 0:
+        audio_codes_html = "".join([
+            _RECEIPT_AUDIO_OPEN,
+            *(_RECEIPT_AUDIO_CODE.render(series_name=code_info.get('series_name', 'Audio Series'),
+                                         code=code_info.get('code', ''))
+              for code_info in audio_codes),
+            _RECEIPT_AUDIO_CLOSE.render(site_url=SITE_URL),
+        ])
+
+    # Coupon badge
+    coupon_html = _RECEIPT_COUPON.render(coupon_code=coupon_code) if coupon_code else ""
+
+    # Gift / recipient attribution banner (if applicable)
+    attribution_html = ""
+    if is_buyer_receipt_only and recipient_email:
+        attribution_html = _RECEIPT_SENT_TO.render(recipient_email=recipient_email)
+    elif is_recipient_access and gifted_by_email:
+        attribution_html = _RECEIPT_GIFT_FROM.render(gifted_by_email=gifted_by_email)
+
+    # Summary block — hide pricing/total when this is a recipient-access email
+    if is_recipient_access:
+        summary_block = _RECEIPT_ACCESS_SUMMARY.render(items_html=items_html)
+    else:
+        summary_block = _RECEIPT_ORDER_SUMMARY.render(
+            order_id=order_id,
+            items_html=items_html,
+            total_label="$0.00 (FREE)" if is_free_order else f"${total:.2f}",
+        )
+
+    content = _ORDER_CONFIRMATION.render(
+        heading="🎁 Free Order Confirmed!" if is_free_order else ("🎁 You've Been Sent Soul Food!" if is_recipient_access else "✅ Order Confirmed!"),
+        customer_name=customer_name or "there",
+        intro="Someone gifted you Soul Food digital access. Get started below!" if is_recipient_access else ("Thank you for your order! " + ("Your promotional access has been activated." if is_free_order else "We're processing your order now.")),
+        attribution_html=attribution_html,
+        coupon_html=coupon_html,
+        summary_html=summary_block,
+        downloads_html=downloads_html,
+        audio_codes_html=audio_codes_html,
+        order_id=order_id,
+        site_url=SITE_URL,
+    )
+
+    preheader = f"Order {order_id} confirmed! " + ("Your downloads are ready." if download_links else "Thank you for your purchase.")
+    return get_base_template(content, preheader)
+
+
+_DOWNLOAD_CARD = Fragment("download_card", """
         <div style="margin-bottom: 15px; padding: 15px; background-color: #f9fafb; border-radius: 8px; border-left: 4px solid #6366f1;">
             <strong style="color: #1f2937;">{product_name}</strong>
-            <p style="margin: 8px 0; color: #6b7280; font-size: 14px;">Expires: {expires_at[:10] if expires_at else '72 hours'}</p>
-            <a href="{SITE_URL}/api/downloads/file/{token}" 
+            <p style="margin: 8px 0; color: #6b7280; font-size: 14px;">Expires: {expires}</p>
+            <a href="{site_url}/api/downloads/file/{token}"
                style="display: inline-block; padding: 10px 20px; background-color: #6366f1; color: #ffffff; text-decoration: none; border-radius: 6px; font-weight: 600; font-size: 14px;">
                 ⬇️ Download PDF
             </a>
         </div>
-        """
-    
-    content = f"""
+        """)
+_DOWNLOAD_DELIVERY = Fragment("download_delivery", """
     <h2 style="margin: 0 0 20px 0; color: #1f2937; font-size: 24px;">📥 Your Downloads Are Ready!</h2>
-    
+
     <p style="margin: 0 0 20px 0; color: #4b5563; font-size: 16px; line-height: 1.6;">
         Hi {customer_name},<br><br>
         Your digital content is ready to download. Click the buttons below to get your files.
     </p>
-    
+
     <div style="margin: 25px 0; padding: 15px; background-color: #fef3c7; border-radius: 8px;">
         <p style="margin: 0; color: #92400e; font-size: 14px;">
             <strong>⚠️ Important:</strong> Download links expire in 72 hours and are limited to 3 downloads per file.
         </p>
     </div>
-    
+
     <h3 style="margin: 30px 0 15px 0; color: #1f2937; font-size: 18px;">Your Downloads</h3>
-    
+
     {downloads_html}
-    
+
     <div style="margin-top: 25px; padding: 15px; background-color: #faf5ff; border-radius: 8px; border: 1px dashed #8b5cf6; text-align: center;">
         <p style="margin: 0 0 8px 0; color: #6b21a8; font-size: 14px; font-weight: 600;">Want permanent access? Save to your account!</p>
-        <a href="{SITE_URL}/redeem?code={order_id}" 
+        <a href="{site_url}/redeem?code={order_id}"
            style="color: #7c3aed; font-weight: 600; text-decoration: underline; font-size: 14px;">
             Redeem order {order_id} &rarr;
         </a>
@@ -383,23 +432,40 @@ def get_download_delivery_template(
     <p style="margin: 20px 0 0 0; color: #6b7280; font-size: 14px;">
         Order ID: <strong>{order_id}</strong>
     </p>
-    """
-    
-    return get_base_template(content, f"Your downloads for order {order_id} are ready!")
+    """)
 
 
-def get_contact_form_template(
-    name: str,
-    email: str,
-    topic: str,
-    message: str,
-    page_url: str = None
+def get_download_delivery_template(
+    order_id: str,
+    download_links: List[Dict],
+    customer_name: str = "Valued Customer"
 ) -> str:
-    """Generate contact form submission email for support team"""
-    
-    content = f"""
+    """Generate download link delivery email HTML"""
+    downloads_html = "".join(
+        _DOWNLOAD_CARD.render(
+            product_name=link.get('product_name', 'Download'),
+            expires=(link.get('expires_at') or '')[:10] or '72 hours',
+            site_url=SITE_URL,
+            token=link.get('token', ''),
+        )
+        for link in download_links
+    )
+    content = _DOWNLOAD_DELIVERY.render(
+        customer_name=customer_name,
+        downloads_html=downloads_html,
+        site_url=SITE_URL,
+        order_id=order_id,
+    )
+    return get_base_template(content, f"Your downloads for order {order_id} are ready!")
+
+
+_CONTACT_PAGE_ROW = Fragment(
+    "contact_page_row",
+    '<tr><td style="padding: 8px 0; color: #6b7280;">Page URL:</td><td style="padding: 8px 0; color: #1f2937;">{page_url}</td></tr>',
+)
+_CONTACT_FORM = Fragment("contact_form", """
     <h2 style="margin: 0 0 20px 0; color: #1f2937; font-size: 24px;">📬 New Contact Form Submission</h2>
-    
+
     <div style="margin: 20px 0; padding: 20px; background-color: #f9fafb; border-radius: 8px;">
         <table role="presentation" width="100%" cellspacing="0" cellpadding="0">
             <tr>
@@ -416,45 +482,60 @@ def get_contact_form_template(
             </tr>
             <tr>
                 <td style="padding: 8px 0; color: #6b7280;">Submitted:</td>
-                <td style="padding: 8px 0; color: #1f2937;">{datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}</td>
+                <td style="padding: 8px 0; color: #1f2937;">{submitted}</td>
             </tr>
-            {f'<tr><td style="padding: 8px 0; color: #6b7280;">Page URL:</td><td style="padding: 8px 0; color: #1f2937;">{page_url}</td></tr>' if page_url else ''}
+            {page_url_row_html}
         </table>
     </div>
-    
+
     <h3 style="margin: 25px 0 15px 0; color: #1f2937; font-size: 18px;">Message</h3>
     <div style="padding: 20px; background-color: #ffffff; border: 1px solid #e5e7eb; border-radius: 8px;">
         <p style="margin: 0; color: #4b5563; font-size: 15px; line-height: 1.7; white-space: pre-wrap;">{message}</p>
     </div>
-    
+
     <div style="margin-top: 25px;">
-        <a href="mailto:{email}?subject=Re: {topic} - Soul Food Support" 
+        <a href="mailto:{email}?subject=Re: {topic} - Soul Food Support"
            style="display: inline-block; padding: 12px 25px; background-color: #6366f1; color: #ffffff; text-decoration: none; border-radius: 6px; font-weight: 600;">
             Reply to {name}
         </a>
     </div>
-    """
-    
-    return get_base_template(content, f"New contact from {name}: {topic}")
+    """)
 
 
-def get_bulk_order_notification_template(
-    quantity: int,
-    product_name: str,
-    customer_email: str,
-    selections: Dict,
-    bundle_type: str = None,
-    total_price: float = None
+def get_contact_form_template(
+    name: str,
+    email: str,
+    topic: str,
+    message: str,
+    page_url: str = None
 ) -> str:
-    """Generate bulk order notification email for support team"""
-    
-    content = f"""
+    """Generate contact form submission email for support team"""
+    content = _CONTACT_FORM.render(
+        name=name,
+        email=email,
+        topic=topic,
+        message=message,
+        submitted=datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC'),
+        page_url_row_html=_CONTACT_PAGE_ROW.render(page_url=page_url) if page_url else "",
+    )
+    return get_base_template(content, f"New contact from {name}: {topic}")
+
+
+_BULK_BUNDLE_ROW = Fragment(
+    "bulk_bundle_row",
+    '<tr><td style="padding: 8px 0; color: #6b7280;">Bundle Type:</td><td style="padding: 8px 0; color: #1f2937;">{bundle_type}</td></tr>',
+)
+_BULK_TOTAL_ROW = Fragment(
+    "bulk_total_row",
+    '<tr><td style="padding: 8px 0; color: #6b7280;">Estimated Total:</td><td style="padding: 8px 0; color: #10b981; font-weight: 600;">${total_price:.2f}</td></tr>',
+)
+_BULK_ORDER = Fragment("bulk_order", """
     <h2 style="margin: 0 0 20px 0; color: #1f2937; font-size: 24px;">📦 Large Bulk Order Alert!</h2>
-    
+
     <div style="margin: 20px 0; padding: 15px; background-color: #fef3c7; border-radius: 8px; border-left: 4px solid #f59e0b;">
         <p style="margin: 0; color: #92400e; font-weight: 600;">⚠️ This order requires manual review and processing</p>
     </div>
-    
+
     <div style="margin: 20px 0; padding: 20px; background-color: #f9fafb; border-radius: 8px;">
         <h3 style="margin: 0 0 15px 0; color: #1f2937; font-size: 18px;">Order Details</h3>
         <table role="presentation" width="100%" cellspacing="0" cellpadding="0">
@@ -466,121 +547,119 @@ def get_bulk_order_notification_template(
                 <td style="padding: 8px 0; color: #6b7280;">Product:</td>
                 <td style="padding: 8px 0; color: #1f2937;">{product_name}</td>
             </tr>
-            {f'<tr><td style="padding: 8px 0; color: #6b7280;">Bundle Type:</td><td style="padding: 8px 0; color: #1f2937;">{bundle_type}</td></tr>' if bundle_type else ''}
+            {bundle_row_html}
             <tr>
                 <td style="padding: 8px 0; color: #6b7280;">Customer Email:</td>
                 <td style="padding: 8px 0;"><a href="mailto:{customer_email}" style="color: #6366f1;">{customer_email}</a></td>
             </tr>
-            {f'<tr><td style="padding: 8px 0; color: #6b7280;">Estimated Total:</td><td style="padding: 8px 0; color: #10b981; font-weight: 600;">${total_price:.2f}</td></tr>' if total_price else ''}
+            {total_row_html}
         </table>
     </div>
-    
+
     <h3 style="margin: 25px 0 15px 0; color: #1f2937; font-size: 18px;">Selections</h3>
     <div style="padding: 20px; background-color: #ffffff; border: 1px solid #e5e7eb; border-radius: 8px;">
         <table role="presentation" width="100%" cellspacing="0" cellpadding="0">
             <tr>
                 <td style="padding: 8px 0; color: #6b7280;">Mealtime:</td>
-                <td style="padding: 8px 0; color: #1f2937;">{selections.get('mealtime', 'N/A')}</td>
+                <td style="padding: 8px 0; color: #1f2937;">{mealtime}</td>
             </tr>
             <tr>
                 <td style="padding: 8px 0; color: #6b7280;">Edition:</td>
-                <td style="padding: 8px 0; color: #1f2937;">{selections.get('edition', 'N/A')}</td>
+                <td style="padding: 8px 0; color: #1f2937;">{edition}</td>
             </tr>
             <tr>
                 <td style="padding: 8px 0; color: #6b7280;">Medium:</td>
-                <td style="padding: 8px 0; color: #1f2937;">{selections.get('medium', 'N/A')}</td>
+                <td style="padding: 8px 0; color: #1f2937;">{medium}</td>
             </tr>
         </table>
     </div>
-    
+
     <div style="margin-top: 25px;">
-        <a href="mailto:{customer_email}?subject=Your Soul Food Bulk Order" 
+        <a href="mailto:{customer_email}?subject=Your Soul Food Bulk Order"
            style="display: inline-block; padding: 12px 25px; background-color: #6366f1; color: #ffffff; text-decoration: none; border-radius: 6px; font-weight: 600;">
             Contact Customer
         </a>
     </div>
-    
+
     <p style="margin: 25px 0 0 0; color: #6b7280; font-size: 14px;">
-        Submitted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}
+        Submitted: {submitted}
     </p>
-    """
-    
-    return get_base_template(content, f"🚨 Bulk Order: {quantity} items from {customer_email}")
+    """)
 
 
-def get_preorder_confirmation_template(
-    order_id: str,
-    items: List[Dict],
-    total: float,
-    delivery_month: str,
-    courtesy_links: List[Dict] = None,
-    customer_name: str = "Valued Customer",
-    coupon_code: str = None
+def get_bulk_order_notification_template(
+    quantity: int,
+    product_name: str,
+    customer_email: str,
+    selections: Dict,
+    bundle_type: str = None,
+    total_price: float = None
 ) -> str:
-    """Generate preorder confirmation email with courtesy digital access"""
-    
-    items_html = ""
-    for item in items:
-        price = item.get('price', 0) or item.get('salePrice', 0)
-        qty = item.get('quantity', 1)
-        items_html += f"""
+    """Generate bulk order notification email for support team"""
+    content = _BULK_ORDER.render(
+        quantity=quantity,
+        product_name=product_name,
+        bundle_row_html=_BULK_BUNDLE_ROW.render(bundle_type=bundle_type) if bundle_type else "",
+        customer_email=customer_email,
+        total_row_html=_BULK_TOTAL_ROW.render(total_price=total_price) if total_price else "",
+        mealtime=selections.get('mealtime', 'N/A'),
+        edition=selections.get('edition', 'N/A'),
+        medium=selections.get('medium', 'N/A'),
+        submitted=datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC'),
+    )
+    return get_base_template(content, f"🚨 Bulk Order: {quantity} items from {customer_email}")
+
+
+_PREORDER_ITEM = Fragment("preorder_item", """
         <tr>
             <td style="padding: 12px 0; border-bottom: 1px solid #e5e7eb;">
-                <strong style="color: #1f2937;">{item.get('name', 'Product')}</strong>
+                <strong style="color: #1f2937;">{name}</strong>
                 <div style="color: #6b7280; font-size: 14px;">Qty: {qty}</div>
             </td>
             <td style="padding: 12px 0; border-bottom: 1px solid #e5e7eb; text-align: right; color: #1f2937;">
-                ${price * qty:.2f}
+                ${line_total:.2f}
             </td>
         </tr>
-        """
-    
-    courtesy_html = ""
-    if courtesy_links and len(courtesy_links) > 0:
-        courtesy_html = """
+        """)
+_PREORDER_COURTESY_OPEN = """
         <div style="margin-top: 25px; padding: 20px; background-color: #eff6ff; border-radius: 8px; border-left: 4px solid #3b82f6;">
             <h3 style="margin: 0 0 10px 0; color: #1e40af; font-size: 18px;">🎁 Your Complimentary Digital Access</h3>
             <p style="margin: 0 0 15px 0; color: #1d4ed8; font-size: 14px;">While your physical book is being prepared, enjoy 2 months of complimentary digital access:</p>
         """
-        for link in courtesy_links:
-            token = link.get('token', '')
-            product_name = link.get('product_name', 'Content')
-            courtesy_html += f"""
-            <a href="{SITE_URL}/api/downloads/file/{token}" 
+_PREORDER_COURTESY_LINK = Fragment("preorder_courtesy_link", """
+            <a href="{site_url}/api/downloads/file/{token}"
                style="display: inline-block; margin: 5px 5px 5px 0; padding: 10px 20px; background-color: #3b82f6; color: #ffffff; text-decoration: none; border-radius: 6px; font-weight: 600; font-size: 14px;">
                 📖 {product_name}
             </a>
-            """
-        courtesy_html += "</div>"
-    
-    coupon_html = ""
-    if coupon_code:
-        coupon_html = f'<div style="margin-bottom: 20px; padding: 10px 15px; background-color: #fef3c7; border-radius: 6px; display: inline-block;"><span style="color: #92400e; font-weight: 600;">🎉 Coupon Applied: {coupon_code}</span></div>'
-    
-    content = f"""
+            """)
+_PREORDER_COUPON = Fragment(
+    "preorder_coupon",
+    '<div style="margin-bottom: 20px; padding: 10px 15px; background-color: #fef3c7; border-radius: 6px; display: inline-block;"><span style="color: #92400e; font-weight: 600;">🎉 Coupon Applied: {coupon_code}</span></div>',
+)
+_PREORDER_CONFIRMATION = Fragment("preorder_confirmation", """
     <h2 style="margin: 0 0 20px 0; color: #1f2937; font-size: 24px;">📦 Pre-Order Confirmed!</h2>
-    
+
     <p style="margin: 0 0 20px 0; color: #4b5563; font-size: 16px; line-height: 1.6;">
         Hi {customer_name},<br><br>
         Thank you for your pre-order! Your purchase has been confirmed.
     </p>
-    
+
     {coupon_html}
-    
+
     <div style="margin: 20px 0; padding: 20px; background-color: #fefce8; border-radius: 8px; border: 1px solid #fde68a;">
         <h3 style="margin: 0 0 8px 0; color: #92400e; font-size: 16px;">📅 Estimated Delivery: {delivery_month}</h3>
         <p style="margin: 0; color: #a16207; font-size: 14px;">
             While your physical book is being prepared, you will receive 2 months of complimentary digital access.
         </p>
     </div>
-    
+
     {courtesy_html}
-    
+
     <div style="margin: 25px 0; padding: 15px; background-color: #f9fafb; border-radius: 8px;">
         <p style="margin: 0; color: #6b7280; font-size: 14px;">Order ID</p>
         <p style="margin: 5px 0 0 0; color: #1f2937; font-size: 18px; font-weight: bold;">{order_id}</p>
     </div>
-    
+
     <h3 style="margin: 30px 0 15px 0; color: #1f2937; font-size: 18px;">Order Summary</h3>
     <table role="presentation" width="100%" cellspacing="0" cellpadding="0">
         {items_html}
@@ -589,43 +668,76 @@ def get_preorder_confirmation_template(
             <td style="padding: 15px 0; text-align: right; font-weight: bold; color: #6366f1; font-size: 18px;">${total:.2f}</td>
         </tr>
     </table>
-    
+
     <div style="margin-top: 30px; padding: 20px; background-color: #faf5ff; border-radius: 8px; text-align: center;">
         <p style="margin: 0 0 8px 0; color: #6b21a8; font-weight: bold; font-size: 16px;">Start now. Grow with us. Full releases coming soon.</p>
-        <a href="{SITE_URL}/my-library" 
+        <a href="{site_url}/my-library"
            style="display: inline-block; margin-top: 8px; padding: 14px 30px; background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%); color: #ffffff; text-decoration: none; border-radius: 8px; font-weight: 600; font-size: 16px;">
             Go to My Library
         </a>
     </div>
-    """
-    
-    return get_base_template(content, f"Pre-order confirmed! #{order_id} — Estimated delivery: {delivery_month}")
+    """)
 
 
-def get_game_pass_template(
+def get_preorder_confirmation_template(
     order_id: str,
-    pass_type: str,
-    customer_name: str = "Valued Customer"
+    items: List[Dict],
+    total: float,
+    delivery_month: str,
+    courtesy_links: List[Dict] = None,
+    customer_name: str = "Valued Customer",
+    coupon_code: str = None
 ) -> str:
-    """Generate game pass access delivery email"""
-    
-    content = f"""
+    """Generate preorder confirmation email with courtesy digital access"""
+    items_html = "".join(
+        _PREORDER_ITEM.render(
+            name=item.get('name', 'Product'),
+            qty=item.get('quantity', 1),
+            line_total=(item.get('price', 0) or item.get('salePrice', 0)) * item.get('quantity', 1),
+        )
+        for item in items
+    )
+
+    courtesy_html = ""
+    if courtesy_links and len(courtesy_links) > 0:
+        courtesy_html = "".join([
+            _PREORDER_COURTESY_OPEN,
+            *(_PREORDER_COURTESY_LINK.render(site_url=SITE_URL, token=link.get('token', ''),
+                                             product_name=link.get('product_name', 'Content'))
+              for link in courtesy_links),
+            "</div>",
+        ])
+
+    content = _PREORDER_CONFIRMATION.render(
+        customer_name=customer_name,
+        coupon_html=_PREORDER_COUPON.render(coupon_code=coupon_code) if coupon_code else "",
+        delivery_month=delivery_month,
+        courtesy_html=courtesy_html,
+        order_id=order_id,
+        items_html=items_html,
+        total=total,
+        site_url=SITE_URL,
+    )
+    return get_base_template(content, f"Pre-order confirmed! #{order_id} — Estimated delivery: {delivery_month}")
+
+
+_GAME_PASS = Fragment("game_pass", """
     <h2 style="margin: 0 0 20px 0; color: #1f2937; font-size: 24px;">🎮 Game On! Your Pass Is Ready</h2>
-    
+
     <p style="margin: 0 0 20px 0; color: #4b5563; font-size: 16px; line-height: 1.6;">
         Hi {customer_name},<br><br>
         Your {pass_type} Game Pass has been activated! Here's how to get started:
     </p>
-    
+
     <div style="margin: 25px 0; padding: 25px; background: linear-gradient(135deg, #faf5ff 0%, #ede9fe 100%); border-radius: 12px; text-align: center; border: 2px solid #c4b5fd;">
         <p style="margin: 0 0 15px 0; color: #7c3aed; font-size: 20px; font-weight: bold;">Your Game Pass</p>
         <p style="margin: 0 0 15px 0; color: #6b7280; font-size: 14px;">{pass_type} Access — Holiday + Break*fast Content</p>
-        <a href="{SITE_URL}/my-library" 
+        <a href="{site_url}/my-library"
            style="display: inline-block; padding: 14px 35px; background: linear-gradient(135deg, #7c3aed 0%, #6d28d9 100%); color: #ffffff; text-decoration: none; border-radius: 8px; font-weight: bold; font-size: 16px;">
             🎮 Start Playing
         </a>
     </div>
-    
+
     <h3 style="margin: 30px 0 15px 0; color: #1f2937; font-size: 18px;">How to Play</h3>
     <ol style="color: #4b5563; line-height: 2; font-size: 15px;">
         <li>Click "Start Playing" above or visit your My Library</li>
@@ -633,33 +745,31 @@ def get_game_pass_template(
         <li>Choose your content (Holiday or Break*fast lessons)</li>
         <li>Play solo or with your study group!</li>
     </ol>
-    
+
     <div style="margin-top: 25px; padding: 15px; background-color: #fef3c7; border-radius: 8px;">
         <p style="margin: 0; color: #92400e; font-size: 13px;">
-            <strong>Note:</strong> Game content includes Holiday series and Art of Through. 
+            <strong>Note:</strong> Game content includes Holiday series and Art of Through.
             Session limits apply per your pass type.
         </p>
     </div>
-    
+
     <div style="margin: 25px 0; padding: 15px; background-color: #f9fafb; border-radius: 8px;">
         <p style="margin: 0; color: #6b7280; font-size: 14px;">Order ID: <strong>{order_id}</strong></p>
     </div>
-    """
-    
-    return get_base_template(content, f"Your {pass_type} Game Pass is ready! Order #{order_id}")
+    """)
 
 
-# =============================================================================
-# EMAIL SENDING FUNCTIONS
-# =============================================================================
+def get_game_pass_template(
+    order_id: str,
+    pass_type: str,
+    customer_name: str = "Valued Customer"
+) -> str:
+    """Generate game pass access delivery email"""
+    content = _GAME_PASS.render(customer_name=customer_name, pass_type=pass_type, site_url=SITE_URL, order_id=order_id)
+    return get_base_template(content, f"Your {pass_type} Game Pass is ready! Order #{order_id}")
 
-async def send_email_verification(to_email: str, name: str, token: str) -> Dict:
-    """Send a single-link email verification message."""
-    site = SITE_URL.rstrip("/")
-    verify_url = f"{site}/verify-email?token={token}"
-    subject = "Verify your Soul Food email to start shopping"
 
-    content = f"""
+_EMAIL_VERIFICATION = Fragment("email_verification", """
     <h2 style="margin:0 0 18px 0;color:#1f2937;font-size:24px;">Welcome, {name}!</h2>
     <p style="margin:0 0 18px 0;color:#374151;font-size:16px;line-height:1.6;">
         Thanks for creating your Soul Food account. To unlock checkout and access your
@@ -684,19 +794,17 @@ async def send_email_verification(to_email: str, name: str, token: str) -> Dict:
     <p style="margin:24px 0 0 0;color:#9ca3af;font-size:12px;">
         Didn&rsquo;t create an account? You can safely ignore this email.
     </p>
-    """
-    preheader = "Confirm your email to unlock checkout and your library."
-    html = get_base_template(content, preheader)
-    return await send_email(to_email, subject, html)
+    """)
 
 
-async def send_admin_invite(to_email: str, name: str, role: str, invite_url: str, invited_by: str = "") -> Dict:
-    """Send an admin/staff invitation with a secure set-your-password link."""
-    role_label = {"admin": "Administrator", "instructor": "Instructor"}.get(role, role.title())
-    subject = f"You've been invited to the Soul Food {role_label} console"
-    by_line = f" by {invited_by}" if invited_by else ""
-    content = f"""
-    <h2 style="margin:0 0 18px 0;color:#1f2937;font-size:24px;">You're invited, {name or 'there'}!</h2>
+def get_email_verification_template(name: str, verify_url: str) -> str:
+    """Generate the single-link email verification message"""
+    content = _EMAIL_VERIFICATION.render(name=name, verify_url=verify_url)
+    return get_base_template(content, "Confirm your email to unlock checkout and your library.")
+
+
+_ADMIN_INVITE = Fragment("admin_invite", """
+    <h2 style="margin:0 0 18px 0;color:#1f2937;font-size:24px;">You're invited, {name}!</h2>
     <p style="margin:0 0 18px 0;color:#374151;font-size:16px;line-height:1.6;">
         You've been invited{by_line} to join the Soul Food back office as a
         <strong>{role_label}</strong>. Set your password below to activate your
@@ -721,23 +829,56 @@ async def send_admin_invite(to_email: str, name: str, role: str, invite_url: str
     <p style="margin:24px 0 0 0;color:#9ca3af;font-size:12px;">
         Weren&rsquo;t expecting this? You can safely ignore this email.
     </p>
-    """
-    preheader = f"Set your password to activate your Soul Food {role_label} account."
-    html = get_base_template(content, preheader)
+    """)
+
+
+def get_admin_invite_template(name: str, role_label: str, invite_url: str, invited_by: str = "") -> str:
+    """Generate an admin/staff invitation with a set-your-password link"""
+    content = _ADMIN_INVITE.render(
+        name=name or 'there',
+        by_line=f" by {invited_by}" if invited_by else "",
+        role_label=role_label,
+        invite_url=invite_url,
+    )
+    return get_base_template(content, f"Set your password to activate your Soul Food {role_label} account.")
+
+
+# =============================================================================
+# EMAIL SENDING FUNCTIONS
+# =============================================================================
+
+async def send_email_verification(to_email: str, name: str, token: str) -> Dict:
+    """Send a single-link email verification message."""
+    site = SITE_URL.rstrip("/")
+    verify_url = f"{site}/verify-email?token={token}"
+    subject = "Verify your Soul Food email to start shopping"
+    html = get_email_verification_template(name, verify_url)
     return await send_email(to_email, subject, html)
 
 
+async def send_admin_invite(to_email: str, name: str, role: str, invite_url: str, invited_by: str = "") -> Dict:
+    """Send an admin/staff invitation with a secure set-your-password link."""
+    role_label = {"admin": "Administrator", "instructor": "Instructor"}.get(role, role.title())
+    subject = f"You've been invited to the Soul Food {role_label} console"
+    html = get_admin_invite_template(name, role_label, invite_url, invited_by)
+    return await send_email(to_email, subject, html)
+
 
 async def send_email(
     to: str,
     subject: str,
     html: str,
-    reply_to: str = None
+    reply_to: str = None,
+    dedup_key: str = None,
+    track: Dict = None,
 ) -> Dict:
     """
-    Send an email using Resend API.
-    Non-blocking async implementation.
+    Queue an email for delivery through the outbox (see email_outbox).
+    Returns once the message is stored; ``dedup_key`` suppresses repeats and
+    ``track`` records the delivery outcome on another document.
     """
+    import email_outbox
+
     if not RESEND_API_KEY:
         logger.warning(f"Email not sent (no API key): {subject} -> {to}")
         return {"success": False, "error": "RESEND_API_KEY not configured"}
@@ -751,102 +892,139 @@ async def send_email(
     }
     
     try:
-        # Run sync SDK in thread to keep FastAPI non-blocking
-        result = await asyncio.to_thread(resend.Emails.send, params)
-        logger.info(f"Email sent successfully: {subject} -> {to}")
-        return {"success": True, "email_id": result.get("id"), "to": to}
+        result = await email_outbox.enqueue(params, dedup_key=dedup_key, track=track)
+        logger.info(f"Email queued: {subject} -> {to}")
+        return result
     except Exception as e:
-        logger.error(f"Failed to send email: {str(e)}")
+        logger.error(f"Failed to queue email: {str(e)}")
         return {"success": False, "error": str(e)}
 
 
+_SHIPPING_TRACKING = Fragment(
+    "shipping_tracking",
+    '<p style="margin:8px 0;color:#334155;">Tracking number: <strong>{tracking_number}</strong>{via}</p>',
+)
+_SHIPPING_ON_ITS_WAY = Fragment("shipping_on_its_way", "Good news — your order <strong>{order_number}</strong> is on its way.")
+_SHIPPING = Fragment("shipping", """
+    <div style="font-family:Arial,sans-serif;max-width:560px;margin:0 auto;">
+      <h2 style="color:#7c3aed;">Your Soul Food order has shipped! 📦</h2>
+      <p style="color:#334155;">{intro_html}</p>
+      {track_html}
+      <p style="color:#64748b;font-size:13px;margin-top:20px;">Questions? Reply to this email or contact {support_email}.</p>
+    </div>
+    """)
+
+
 async def send_shipping_notification(to_email: str, order_number: str, tracking_number: str = "", carrier: str = "", is_gift_recipient: bool = False, gifted_by: str = "") -> Dict:
     """Shipping notification for physical orders (buyer and/or gift recipient)."""
     track_html = ""
     if tracking_number:
-        track_html = f'<p style="margin:8px 0;color:#334155;">Tracking number: <strong>{tracking_number}</strong>{(" via " + carrier) if carrier else ""}</p>'
+        track_html = _SHIPPING_TRACKING.render(tracking_number=tracking_number, via=(" via " + carrier) if carrier else "")
     if is_gift_recipient:
-        intro = f"A gift{(' from ' + gifted_by) if gifted_by else ''} is on its way to you! 🎁"
+        intro = escape(f"A gift{(' from ' + gifted_by) if gifted_by else ''} is on its way to you! 🎁")
     else:
-        intro = f"Good news — your order <strong>{order_number}</strong> is on its way."
-    html = f"""
-    <div style="font-family:Arial,sans-serif;max-width:560px;margin:0 auto;">
-      <h2 style="color:#7c3aed;">Your Soul Food order has shipped! 📦</h2>
-      <p style="color:#334155;">{intro}</p>
-      {track_html}
-      <p style="color:#64748b;font-size:13px;margin-top:20px;">Questions? Reply to this email or contact {SUPPORT_EMAIL}.</p>
-    </div>
-    """
+        intro = _SHIPPING_ON_ITS_WAY.render(order_number=order_number)
+    html = _SHIPPING.render(intro_html=intro, track_html=track_html, support_email=SUPPORT_EMAIL)
     return await send_email(to_email, f"Your order {order_number} has shipped", html)
 
 
+_DELIVERED_ORDER = Fragment("delivered_order", "Your order <strong>{order_number}</strong> has been delivered. We hope you love it! 🎉")
+_DELIVERED = Fragment("delivered", """
+    <h2 style="margin:0 0 16px 0;color:#1f2937;font-size:22px;">Delivered ✅</h2>
+    <p style="margin:0 0 16px 0;color:#374151;font-size:16px;line-height:1.6;">{msg_html}</p>
+    <p style="margin:16px 0 0 0;color:#6b7280;font-size:13px;">Something not right? Reply to this email or contact {support_email} and we'll make it right.</p>
+    """)
+
+
 async def send_delivery_confirmation(to_email: str, order_number: str, is_gift_recipient: bool = False, gifted_by: str = "") -> Dict:
     """Delivery confirmation for physical orders (buyer and/or gift recipient)."""
     if is_gift_recipient:
-        msg = f"Your gift{(' from ' + gifted_by) if gifted_by else ''} has been delivered — enjoy! 🎉"
+        msg = escape(f"Your gift{(' from ' + gifted_by) if gifted_by else ''} has been delivered — enjoy! 🎉")
     else:
-        msg = f"Your order <strong>{order_number}</strong> has been delivered. We hope you love it! 🎉"
-    content = f"""
-    <h2 style="margin:0 0 16px 0;color:#1f2937;font-size:22px;">Delivered ✅</h2>
-    <p style="margin:0 0 16px 0;color:#374151;font-size:16px;line-height:1.6;">{msg}</p>
-    <p style="margin:16px 0 0 0;color:#6b7280;font-size:13px;">Something not right? Reply to this email or contact {SUPPORT_EMAIL} and we'll make it right.</p>
-    """
+        msg = _DELIVERED_ORDER.render(order_number=order_number)
+    content = _DELIVERED.render(msg_html=msg, support_email=SUPPORT_EMAIL)
     html = get_base_template(content, f"Your Soul Food order {order_number} was delivered.")
     return await send_email(to_email, f"Your order {order_number} has been delivered", html)
 
 
-async def send_gift_accessed_to_buyer(buyer_email: str, buyer_name: str, recipient_email: str, order_number: str, item_names: str = "") -> Dict:
-    """Courtesy note to the BUYER when their gift recipient first accesses their digital copies."""
-    items_line = f"<p style='margin:0 0 16px 0;color:#6b7280;font-size:14px;'>{item_names}</p>" if item_names else ""
-    content = f"""
+_ITEMS_LINE = Fragment("items_line", "<p style='margin:0 0 16px 0;color:#6b7280;font-size:14px;'>{item_names}</p>")
+_GIFT_ACCESSED = Fragment("gift_accessed", """
     <div style="text-align:center;font-size:40px;margin-bottom:8px;">🎁</div>
     <h2 style="margin:0 0 16px 0;color:#1f2937;font-size:22px;text-align:center;">Your gift was opened!</h2>
     <p style="margin:0 0 16px 0;color:#374151;font-size:16px;line-height:1.6;">
-        Great news, {buyer_name or 'friend'} — <strong>{recipient_email}</strong> has just accessed the
+        Great news, {buyer_name} — <strong>{recipient_email}</strong> has just accessed the
         Soul Food gift you sent (order <strong>{order_number}</strong>). Thank you for sharing the table.
     </p>
-    {items_line}
-    <p style="margin:16px 0 0 0;color:#6b7280;font-size:13px;">Questions? Contact {SUPPORT_EMAIL}.</p>
-    """
+    {items_line_html}
+    <p style="margin:16px 0 0 0;color:#6b7280;font-size:13px;">Questions? Contact {support_email}.</p>
+    """)
+
+
+async def send_gift_accessed_to_buyer(buyer_email: str, buyer_name: str, recipient_email: str, order_number: str, item_names: str = "") -> Dict:
+    """Courtesy note to the BUYER when their gift recipient first accesses their digital copies."""
+    content = _GIFT_ACCESSED.render(
+        buyer_name=buyer_name or 'friend',
+        recipient_email=recipient_email,
+        order_number=order_number,
+        items_line_html=_ITEMS_LINE.render(item_names=item_names) if item_names else "",
+        support_email=SUPPORT_EMAIL,
+    )
     html = get_base_template(content, f"{recipient_email} accessed the gift you sent.")
     return await send_email(buyer_email, f"🎁 {recipient_email} opened your gift · #{order_number}", html)
 
 
+_DOWNLOAD_REMINDER = Fragment("download_reminder", """
+    <h2 style="margin:0 0 16px 0;color:#1f2937;font-size:22px;">{headline}</h2>
+    <p style="margin:0 0 12px 0;color:#374151;font-size:16px;line-height:1.6;">Hi {name}, {body}</p>
+    {items_line_html}
+    <div style="margin:24px 0;text-align:center;">
+        <a href="{lookup_url}" style="display:inline-block;padding:14px 32px;background-color:#c2410c;color:#ffffff !important;text-decoration:none;border-radius:8px;font-weight:700;">Get my downloads &rarr;</a>
+        <p style="margin:12px 0 0 0;color:#6b7280;font-size:13px;">Use order <strong>{order_number}</strong> and this email address.</p>
+    </div>
+    <p style="margin:8px 0 0 0;color:#9ca3af;font-size:12px;">Need help? Contact {support_email}.</p>
+    """)
+
+
 async def send_digital_download_reminder(to_email: str, name: str, order_number: str, item_names: str = "", is_gift_recipient: bool = False, gifted_by: str = "") -> Dict:
     """Day-7 nudge to download digital copies not yet retrieved (recipient for gifts, buyer for self)."""
-    lookup_url = f"{SITE_URL}/orders/lookup"
     if is_gift_recipient:
         headline = "You have a Soul Food gift waiting 🎁"
         body = f"You were sent Soul Food digital content{(' by ' + gifted_by) if gifted_by else ''}, but it looks like you haven't downloaded it yet."
     else:
         headline = "Your Soul Food downloads are waiting 📥"
         body = "We noticed you haven't downloaded your digital copies yet — they're ready whenever you are."
-    items_line = f"<p style='margin:0 0 16px 0;color:#6b7280;font-size:14px;'>{item_names}</p>" if item_names else ""
-    content = f"""
-    <h2 style="margin:0 0 16px 0;color:#1f2937;font-size:22px;">{headline}</h2>
-    <p style="margin:0 0 12px 0;color:#374151;font-size:16px;line-height:1.6;">Hi {name or 'there'}, {body}</p>
-    {items_line}
-    <div style="margin:24px 0;text-align:center;">
-        <a href="{lookup_url}" style="display:inline-block;padding:14px 32px;background-color:#c2410c;color:#ffffff !important;text-decoration:none;border-radius:8px;font-weight:700;">Get my downloads &rarr;</a>
-        <p style="margin:12px 0 0 0;color:#6b7280;font-size:13px;">Use order <strong>{order_number}</strong> and this email address.</p>
-    </div>
-    <p style="margin:8px 0 0 0;color:#9ca3af;font-size:12px;">Need help? Contact {SUPPORT_EMAIL}.</p>
-    """
+    content = _DOWNLOAD_REMINDER.render(
+        headline=headline,
+        name=name or 'there',
+        body=body,
+        items_line_html=_ITEMS_LINE.render(item_names=item_names) if item_names else "",
+        lookup_url=f"{SITE_URL}/orders/lookup",
+        order_number=order_number,
+        support_email=SUPPORT_EMAIL,
+    )
     html = get_base_template(content, "Your Soul Food digital copies are ready to download.")
     return await send_email(to_email, f"Reminder: your Soul Food downloads are ready · #{order_number}", html)
 
 
-async def send_buyer_gift_unclaimed_notice(buyer_email: str, buyer_name: str, recipient_email: str, order_number: str) -> Dict:
-    """Day-7 note to the BUYER when their gift recipient hasn't claimed yet (we've nudged the recipient)."""
-    content = f"""
+_GIFT_UNCLAIMED = Fragment("gift_unclaimed", """
     <h2 style="margin:0 0 16px 0;color:#1f2937;font-size:22px;">A quick heads-up on your gift 🎁</h2>
     <p style="margin:0 0 16px 0;color:#374151;font-size:16px;line-height:1.6;">
-        Hi {buyer_name or 'friend'}, the Soul Food gift you sent to <strong>{recipient_email}</strong>
+        Hi {buyer_name}, the Soul Food gift you sent to <strong>{recipient_email}</strong>
         (order <strong>{order_number}</strong>) hasn't been opened yet. We've just sent them a friendly
         reminder with their access link — no action needed from you.
     </p>
-    <p style="margin:16px 0 0 0;color:#6b7280;font-size:13px;">Want to reach them directly, or have questions? Contact {SUPPORT_EMAIL}.</p>
-    """
+    <p style="margin:16px 0 0 0;color:#6b7280;font-size:13px;">Want to reach them directly, or have questions? Contact {support_email}.</p>
+    """)
+
+
+async def send_buyer_gift_unclaimed_notice(buyer_email: str, buyer_name: str, recipient_email: str, order_number: str) -> Dict:
+    """Day-7 note to the BUYER when their gift recipient hasn't claimed yet (we've nudged the recipient)."""
+    content = _GIFT_UNCLAIMED.render(
+        buyer_name=buyer_name or 'friend',
+        recipient_email=recipient_email,
+        order_number=order_number,
+        support_email=SUPPORT_EMAIL,
+    )
     html = get_base_template(content, f"{recipient_email} hasn't opened your gift yet — we've nudged them.")
     return await send_email(buyer_email, f"Your gift to {recipient_email} is still waiting · #{order_number}", html)
 
@@ -866,6 +1044,8 @@ async def send_order_confirmation(
     gifted_by_email: str = None,
     is_buyer_receipt_only: bool = False,
     is_recipient_access: bool = False,
+    dedup_key: str = None,
+    track: Dict = None,
 ) -> Dict:
     """Send order confirmation email.
 
@@ -898,7 +1078,7 @@ async def send_order_confirmation(
         is_buyer_receipt_only=is_buyer_receipt_only,
         is_recipient_access=is_recipient_access,
     )
-    return await send_email(to_email, subject, html)
+    return await send_email(to_email, subject, html, dedup_key=dedup_key, track=track)
 
 
 async def send_download_links(
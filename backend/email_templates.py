@@ -0,0 +1,110 @@
+"""
+Compiled email templates.
+=========================
+The email builders in ``email_service`` used to assemble every message with
+nested f-strings: conditional rows were built as inline f-strings and every
+value — customer names, contact-form messages, coupon codes — went into the
+HTML unescaped.
+
+A ``Fragment`` is an HTML snippet with ``{field}`` placeholders (the same
+syntax as the f-strings it replaces, including format specs such as
+``{total:.2f}``). When the module defining it is imported, it is parsed and
+compiled into a function that is a single f-string over its literal chunks,
+so rendering costs what the hand-written f-string did plus escaping:
+
+* ``{name}`` values are HTML-escaped (quotes included, so they are safe
+  inside attributes); numbers are passed through so format specs apply.
+* ``{name_html}`` values are inserted verbatim. They must be markup: another
+  fragment's output, a constant, or ``escape()``d text.
+
+Escaped text is memoized, since names, product titles and URLs repeat across
+a bulk send. Fragments are registered by name (``get`` / ``names``) so
+``scripts/bench_email_templates.py`` can time every template.
+
+Settings (env):
+  - EMAIL_TEMPLATE_ESCAPE_CACHE_SIZE (default 4096)
+"""
+from __future__ import annotations
+
+import html
+import numbers
+import os
+from functools import lru_cache
+from string import Formatter
+from typing import Callable, Dict, FrozenSet, List, Tuple
+
+ESCAPE_CACHE_SIZE = int(os.environ.get("EMAIL_TEMPLATE_ESCAPE_CACHE_SIZE", "4096"))
+
+_formatter = Formatter()
+_registry: Dict[str, "Fragment"] = {}
+
+
+@lru_cache(maxsize=ESCAPE_CACHE_SIZE)
+def _escape_text(text: str) -> str:
+    return html.escape(text)
+
+
+def escape(value) -> object:
+    """``value`` ready for a ``{name}`` placeholder: escaped text, or a
+    number as-is (so format specs still apply)."""
+    cls = type(value)
+    if cls is str:
+        return _escape_text(value)
+    if cls is int or cls is float or (isinstance(value, numbers.Number) and cls is not bool):
+        return value
+    return html.escape(str(value))
+
+
+def _compile(name: str, literals: List[str], placeholders: List[Tuple[str, str]]) -> Callable[..., str]:
+    """Generate ``render(*, field, ...)`` — one f-string over the literal
+    chunks (bound as constants) and the fields, with the common case (a
+    ``str`` value) escaped inline through the memo."""
+    namespace = {"_e": escape, "_x": _escape_text, "_str": str}
+    parts = []
+    for i, literal in enumerate(literals):
+        if literal:
+            namespace[f"_c{i}"] = literal
+            parts.append(f"{{_c{i}}}")
+        if i < len(placeholders):
+            field, spec = placeholders[i]
+            value = field if field.endswith("_html") else f"(_x({field}) if {field}.__class__ is _str else _e({field}))"
+            parts.append(f"{{{value}:{spec}}}" if spec else f"{{{value}}}")
+    args = ", ".join(dict.fromkeys(f for f, _ in placeholders))
+    func = f"render_{name}"
+    code = f"def {func}({'*, ' + args if args else ''}):\n    return f\"{''.join(parts)}\"\n"
+    exec(compile(code, f"<email template {name}>", "exec"), namespace)
+    return namespace[func]
+
+
+class Fragment:
+    """An HTML snippet with ``{field}`` placeholders, compiled once.
+
+    ``render(**fields)`` takes exactly the template's fields as keywords."""
+
+    __slots__ = ("name", "fields", "render")
+
+    def __init__(self, name: str, source: str):
+        if not name.isidentifier():
+            raise ValueError(f"email template name {name!r} must be an identifier")
+        literals = [""]
+        placeholders: List[Tuple[str, str]] = []
+        for literal, field, spec, conversion in _formatter.parse(source):
+            literals[-1] += literal
+            if field is None:
+                continue
+            if not field.isidentifier() or field.startswith("_") or conversion or any(c in (spec or "") for c in "{}\"'"):
+                raise ValueError(f"email template {name!r}: unsupported placeholder {{{field}}}")
+            placeholders.append((field, spec or ""))
+            literals.append("")
+        self.name = name
+        self.fields: FrozenSet[str] = frozenset(f for f, _ in placeholders)
+        self.render: Callable[..., str] = _compile(name, literals, placeholders)
+        _registry[name] = self
+
+
+def get(name: str) -> Fragment:
+    return _registry[name]
+
+
+def names() -> List[str]:
+    return sorted(_registry)
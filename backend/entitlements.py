@@ -0,0 +1,325 @@
+"""
+Materialized per-user entitlements.
+===================================
+What a user owns used to be recomputed from scratch on every request — trivia
+regex-scanned ``payment_transactions`` by email, the nibble viewer walked every
+paid order expanding bundles, and My Library re-queried orders + transactions
+with a broad ``$or``.
+
+``db.user_entitlements`` holds one document per user (``_id`` = user id):
+
+  * ``series`` / ``editions`` / ``has_audio`` / ``has_instructor`` — trivia
+    gating. Trivia has always unlocked on ``payment_status`` "paid" or
+    "completed" (legacy imports and redeemed codes use "completed"), so both
+    count here; everything else requires "paid".
+  * ``owned_product_ids`` — every product id owned, after bundle expansion,
+    across all of the user's orders
+  * ``orders`` — refs to the active Library orders (with their expanded
+    product ids), newest ``_ORDERS_PER_SOURCE`` per source
+
+It is rebuilt for the affected users whenever an order changes ownership
+state — payment, refund, revoke/grant, archive/tag, gift claim and code
+redemption call ``refresh_for_order`` / ``refresh_user``. Reads go through
+``get_for_user`` (one keyed ``find_one``); a missing, outdated-schema or
+older-than-``ENTITLEMENT_MAX_AGE_SECONDS`` document is recomputed on the spot,
+which also covers writes made outside the app (CLI scripts, manual DB edits).
+
+My Library responses built from these documents are cached per worker
+(payment_routes) behind the ``LIBRARY_CACHE`` stamp in ``cache_versions``;
+``refresh_for_order`` and download-link revokes bump it via
+``invalidate_library``.
+
+Full rebuild: ``python3 -m scripts.rebuild_entitlements``.
+"""
+from __future__ import annotations
+
+import os
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+
+import cache_versions
+import lc_keys
+from database import db
+
+SCHEMA_VERSION = 3
+ENTITLEMENT_MAX_AGE_SECONDS = int(os.environ.get("ENTITLEMENT_MAX_AGE_SECONDS", "86400"))
+LIBRARY_CACHE = "my_library"
+
+# Per-source cap on Library order refs (matches the previous query limits).
+# Ownership flags and owned_product_ids are computed over every order.
+_ORDERS_PER_SOURCE = 100
+
+# payment_status values that unlock trivia (Library access needs "paid")
+TRIVIA_PAID_STATUSES = ("paid", "completed")
+
+# refund_status values that strip Library access
+LIBRARY_BLOCKING_REFUND = {"refunded", "partial_refund", "partially_refunded", "chargeback"}
+# status values that strip Library access
+LIBRARY_BLOCKING_STATUS = {"refunded", "cancelled", "canceled", "revoked", "expired", "failed"}
+
+
+def is_active_entitlement_txn(txn: dict, user_id: str, user_email: str,
+                              paid_statuses: Iterable[str] = ("paid",)) -> bool:
+    """True when this transaction grants the given user usable, owned content.
+
+    Rules:
+      - Must be paid (``payment_status`` in ``paid_statuses``).
+      - Excludes refunded / partially-refunded / chargeback (refund_status),
+        cancelled / revoked / expired / failed (status) and orders whose
+        entitlement was revoked by an admin (entitlement_status).
+      - Excludes admin hygiene records (is_archived or tag == 'test').
+      - Gift ownership: a 'gift' purchase belongs ONLY to the recipient
+        (digital_recipient_email). The buyer gets a receipt, not access — so a
+        gift bought for someone else never appears in the buyer's Library. (If
+        the buyer also bought a copy for themselves, that's a separate self
+        transaction and shows normally.)
+    """
+    if txn.get("payment_status") not in paid_statuses:
+        return False
+    if txn.get("is_archived"):
+        return False
+    if (txn.get("tag") or "").strip().lower() == "test":
+        return False
+    if (txn.get("refund_status") or "").strip().lower() in LIBRARY_BLOCKING_REFUND:
+        return False
+    if (txn.get("status") or "").strip().lower() in LIBRARY_BLOCKING_STATUS:
+        return False
+    if (txn.get("entitlement_status") or "").strip().lower() == "revoked":
+        return False
+
+    ue = (user_email or "").strip().lower()
+    recipient = (txn.get("digital_recipient_email") or "").strip().lower()
+    buyer_email = (txn.get("customer_email") or "").strip().lower()
+    is_buyer = bool(user_id) and user_id in (txn.get("user_id"), txn.get("claimed_by_user_id"))
+    is_buyer = is_buyer or bool(ue and buyer_email == ue)
+    is_recipient = bool(recipient) and recipient == ue
+    purchase_type = (txn.get("purchase_type") or "self").strip().lower()
+
+    if purchase_type == "gift":
+        # Only the recipient owns a gift (buyer == recipient edge case still works).
+        return is_recipient
+    # Self purchase — buyer owns it. (Also honor recipient match for safety.)
+    return bool(is_buyer or is_recipient)
+
+
+def classify_product(name: str) -> dict:
+    """Parse a product name/id into series + edition."""
+    nl = name.lower()
+    series = set()
+    edition = None
+
+    if any(k in nl for k in ["holiday", "4c", "covenant", "cradle", "cross", "comforter"]):
+        series.add("holiday_4c")
+    if any(k in nl for k in ["break*fast", "breakfast", "bkft", "nibble", "snack"]):
+        series.add("breakfast")
+    if "bundle" in nl:
+        series.add("holiday_4c")
+        series.add("breakfast")
+    if "game pass" in nl or "game night" in nl or "mix-up" in nl or "grinch" in nl:
+        series.add("holiday_4c")
+        series.add("breakfast")
+
+    if any(k in nl for k in ["adult", "- ae", "(ae)", " ae "]):
+        edition = "adult"
+    elif any(k in nl for k in ["youth", "- ye", "(ye)", " ye "]):
+        edition = "youth"
+
+    return {"series": series, "edition": edition}
+
+
+def expand_product_ids(items: list) -> set:
+    """Given the items array on a paid order, return the full set of effective
+    product_ids the buyer owns — including bundle expansions."""
+    try:
+        from payment_routes import BUNDLE_EXPANSIONS
+    except Exception:
+        BUNDLE_EXPANSIONS = {}
+    owned: set = set()
+    for it in items or []:
+        pid = it.get("product_id") or it.get("id") or it.get("uniqueKey")
+        if not pid:
+            continue
+        owned.add(pid)
+        # Expand if bundle
+        if pid in BUNDLE_EXPANSIONS:
+            for sub in BUNDLE_EXPANSIONS[pid]:
+                owned.add(sub)
+    return owned
+
+
+def _ownership_query(user_id: str, user_email: Optional[str]) -> dict:
+    """Broad candidate fetch — anything where the user is buyer, claimant or
+    gift recipient. ``is_active_entitlement_txn`` enforces the real rules."""
+    or_clauses: List[dict] = [{"user_id": user_id}, {"claimed_by_user_id": user_id}]
+    if user_email:
+        or_clauses.extend(lc_keys.match_any(("customer_email", "digital_recipient_email"), user_email))
+    return {"payment_status": {"$in": list(TRIVIA_PAID_STATUSES)}, "$or": or_clauses}
+
+
+async def compute(user_id: str, user_email: Optional[str]) -> dict:
+    """Build the entitlement document for one user from the source collections."""
+    query = _ownership_query(user_id, user_email)
+
+    series: set = set()
+    editions: set = set()
+    has_audio = False
+    has_instructor = False
+    owned: set = set()
+    refs: List[dict] = []
+
+    for source in ("orders", "payment_transactions"):
+        source_refs = 0
+        # Not capped: a user's oldest orders still count toward ownership.
+        async for doc in db[source].find(query, {"_id": 0}).sort("created_at", -1):
+            library = is_active_entitlement_txn(doc, user_id, user_email)
+            if not library and not is_active_entitlement_txn(doc, user_id, user_email, TRIVIA_PAID_STATUSES):
+                continue
+            items = doc.get("items") or []
+            for item in items:
+                name = item.get("name", "") or item.get("product_id", "")
+                classified = classify_product(name)
+                series.update(classified["series"])
+                if classified["edition"]:
+                    editions.add(classified["edition"])
+                nl = name.lower()
+                if "full workbook" in nl or "subscription" in nl or "all access" in nl:
+                    has_audio = True
+                if "instructor" in nl or "ie " in nl or " ie" in nl:
+                    has_instructor = True
+            if not library:
+                continue
+            order_owned = expand_product_ids(items)
+            owned |= order_owned
+            if source_refs >= _ORDERS_PER_SOURCE:
+                continue
+            source_refs += 1
+            ref = {"source": source, "order_number": doc.get("order_number"),
+                   "created_at": doc.get("created_at"), "product_ids": sorted(order_owned)}
+            if source == "orders":
+                ref["order_id"] = doc.get("order_id")
+            else:
+                ref["session_id"] = doc.get("session_id")
+            refs.append(ref)
+
+    # Redeemed submitted_codes with status=processed
+    codes = await db.submitted_codes.find(
+        {"user_id": user_id, "status": "processed"},
+        {"_id": 0, "code": 1},
+    ).to_list(50)
+    for code_doc in codes:
+        c = classify_product(code_doc.get("code", ""))
+        series.update(c["series"])
+        if c["edition"]:
+            editions.add(c["edition"])
+
+    return {
+        "_id": user_id,
+        "user_id": user_id,
+        "email": (user_email or "").strip().lower() or None,
+        "schema_version": SCHEMA_VERSION,
+        "computed_at": datetime.now(timezone.utc),
+        "series": sorted(series),
+        "editions": sorted(editions),
+        "has_audio": has_audio,
+        "has_instructor": has_instructor,
+        "owned_product_ids": sorted(owned),
+        "orders": refs,
+    }
+
+
+async def refresh_user(user_id: str, user_email: Optional[str] = None) -> dict:
+    """Recompute and store one user's entitlements. Returns the new document."""
+    if user_email is None:
+        user = await db.users.find_one({"id": user_id}, {"_id": 0, "email": 1})
+        user_email = (user or {}).get("email")
+    doc = await compute(user_id, user_email)
+    await db.user_entitlements.replace_one({"_id": user_id}, doc, upsert=True)
+    return doc
+
+
+def _is_fresh(doc: Optional[dict]) -> bool:
+    if not doc or doc.get("schema_version") != SCHEMA_VERSION:
+        return False
+    computed_at = doc.get("computed_at")
+    if not isinstance(computed_at, datetime):
+        return False
+    if computed_at.tzinfo is None:
+        computed_at = computed_at.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - computed_at).total_seconds() < ENTITLEMENT_MAX_AGE_SECONDS
+
+
+async def get_for_user(user_id: str, user_email: Optional[str] = None) -> dict:
+    """Keyed read of a user's entitlements, materializing them on first use."""
+    doc = await db.user_entitlements.find_one({"_id": user_id})
+    if _is_fresh(doc):
+        return doc
+    return await refresh_user(user_id, user_email)
+
+
+async def _users_for_emails(emails: Iterable[str]) -> List[dict]:
+    variants = set()
+    for e in emails:
+        e = (e or "").strip()
+        if e:
+            variants.update((e, e.lower()))
+    if not variants:
+        return []
+    return await db.users.find({"email": {"$in": sorted(variants)}}, {"_id": 0, "id": 1, "email": 1}).to_list(50)
+
+
+async def invalidate_library() -> None:
+    """Drop cached My Library responses in every worker. Never raises."""
+    try:
+        await cache_versions.bump(LIBRARY_CACHE)
+    except Exception as e:
+        print(f"[Entitlements] library cache bump failed: {e}")
+
+
+async def refresh_for_order(order_ref: str) -> int:
+    """Refresh every user whose ownership an order can affect (buyer,
+    claimant, gift recipient). ``order_ref`` may be an order_number, order_id
+    or session_id. Never raises — the max-age check is the safety net.
+    Returns the number of users refreshed."""
+    if not order_ref:
+        return 0
+    try:
+        q = {"$or": [{"order_number": order_ref}, {"order_id": order_ref}, {"session_id": order_ref}]}
+        projection = {"_id": 0, "user_id": 1, "claimed_by_user_id": 1,
+                      "customer_email": 1, "digital_recipient_email": 1}
+        docs = await db.orders.find(q, projection).to_list(10)
+        docs += await db.payment_transactions.find(q, projection).to_list(10)
+
+        users = {}
+        for u in await _users_for_emails(
+            e for d in docs for e in (d.get("customer_email"), d.get("digital_recipient_email"))
+        ):
+            users[u["id"]] = u.get("email")
+        for d in docs:
+            for uid in (d.get("user_id"), d.get("claimed_by_user_id")):
+                if uid and uid not in users:
+                    users[uid] = None
+        for uid, email in users.items():
+            await refresh_user(uid, email)
+        return len(users)
+    except Exception as e:
+        print(f"[Entitlements] refresh for order {order_ref} failed: {e}")
+        return 0
+    finally:
+        await invalidate_library()
+
+
+async def rebuild_all() -> dict:
+    """Recompute entitlements for every user. Used by the rebuild script."""
+    rebuilt = 0
+    failed = 0
+    async for user in db.users.find({}, {"_id": 0, "id": 1, "email": 1}):
+        if not user.get("id"):
+            continue
+        try:
+            await refresh_user(user["id"], user.get("email"))
+            rebuilt += 1
+        except Exception as e:
+            failed += 1
+            print(f"[Entitlements] rebuild failed for {user['id']}: {e}")
+    return {"rebuilt": rebuilt, "failed": failed}
+
@@ -0,0 +1,227 @@
+"""
+Order fulfillment engine.
+=========================
+Five entry points in payment_routes used to carry their own copy of the
+resolve → verify → create-link → record sequence (checkout status poll,
+Stripe webhook worker, free orders, admin generate-downloads, refulfill),
+each looping item by item with one ``download_links`` insert plus one audit
+insert per file, and nothing measuring where the time went.
+
+They all drive a ``FulfillmentRun`` now. Its stages are explicit and timed:
+
+  resolve   every item → file entries, concurrently (attachment-first,
+            POD-aware; ``resolve_item_to_file_entries_async``)
+  verify    all of the order's entries under ONE verification budget
+            (``_verified_entries_for_fulfillment``), or only a path lookup
+            for callers that never verified (``verify=False``). Callers
+            with their own file mappings (admin grant / retry) start here
+            with ``link_entries``
+  links     every verified entry's download link in one ``insert_many``,
+            their audit events in another; library cache invalidated once
+  record    the order's fulfillment fields on ``payment_transactions``
+  grants    audio access + game-pass entitlements
+  email     the caller's own messages, timed with ``run.stage("email")``
+
+``finish()`` logs the timings, stores them on the transaction
+(``fulfillment_timings_ms``) and adds them to a rolling window per entry
+point; ``timings_summary()`` (GET /api/admin/system/fulfillment-timings)
+reports count / p50 / p95 / max per stage.
+
+Settings (env):
+  - FULFILLMENT_TIMINGS_WINDOW (default 200 runs kept per entry point)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from database import db
+
+FULFILLMENT_TIMINGS_WINDOW = int(os.environ.get("FULFILLMENT_TIMINGS_WINDOW", "200"))
+
+STAGES = ("resolve", "verify", "links", "record", "grants", "email")
+# Failure fields persisted on the transaction (Admin Orders + frontend read them).
+FAILURE_FIELDS = ("file_key", "product_id", "name", "pdf_path", "reason", "error")
+NO_EMAIL = "no-email@placeholder.com"
+
+# caller -> recent runs' timings (ms per stage, plus "total")
+_window: Dict[str, Deque[Dict[str, float]]] = {}
+
+
+class FulfillmentRun:
+    """One order's fulfillment. Use the stages in order; each is optional."""
+
+    def __init__(self, order_id: str, *, user_id: str, user_email: str, caller: str):
+        self.order_id = order_id
+        self.user_id = user_id
+        self.user_email = user_email or NO_EMAIL
+        self.caller = caller
+        self.links: List[dict] = []        # {product_id, name, token, expires_at, pdf_path}
+        self.failures: List[dict] = []     # {...entry, pdf_path, reason[, error]}
+        self.unresolved: List[dict] = []   # items with no downloadable file
+        self.timings: Dict[str, float] = {}
+        self._filter: Optional[dict] = None
+        self._started = time.perf_counter()
+
+    @asynccontextmanager
+    async def stage(self, name: str) -> AsyncIterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+    async def create_links(self, items: List[dict], *, verify: bool = True) -> List[dict]:
+        """resolve → verify → links for ``items``. Returns the links created."""
+        from payment_routes import resolve_item_to_file_entries_async
+
+        async with self.stage("resolve"):
+            resolved = await asyncio.gather(*(resolve_item_to_file_entries_async(i) for i in items))
+        entries: List[dict] = []
+        for item, found in zip(items, resolved):
+            if found:
+                entries.extend(found)
+            else:
+                raw_id = item.get("normalized_product_id") or item.get("product_id") or item.get("id") or item.get("uniqueKey", "")
+                print(f"[{self.caller}] No downloadable file for: {item.get('name', raw_id)} (raw_id={raw_id})")
+                self.unresolved.append(item)
+        return await self.link_entries(entries, verify=verify)
+
+    async def link_entries(self, entries: List[dict], *, verify: bool = True) -> List[dict]:
+        """verify → links for resolved file entries (``product_id``, ``name``,
+        ``file_key``). With ``verify=False`` an entry's own ``pdf_path`` is
+        used as-is; entries without one get a path lookup."""
+        from download_protection import create_download_links
+        from payment_routes import (
+            _invalidate_library_cache,
+            _verified_entries_for_fulfillment,
+            get_pdf_path_async,
+        )
+
+        async with self.stage("verify"):
+            if verify:
+                ok, failures = await _verified_entries_for_fulfillment(entries, caller=self.caller)
+            else:
+                async def _path(entry: dict) -> Optional[str]:
+                    if entry.get("pdf_path"):
+                        return entry["pdf_path"]
+                    return await get_pdf_path_async(entry["file_key"]) or await get_pdf_path_async(entry["product_id"])
+                paths = await asyncio.gather(*(_path(e) for e in entries))
+                ok = [{**e, "pdf_path": p} for e, p in zip(entries, paths) if p]
+                failures = [{**e, "pdf_path": None, "reason": "no_path"} for e, p in zip(entries, paths) if not p]
+        self.failures.extend(failures)
+
+        async with self.stage("links"):
+            results = await create_download_links(
+                order_id=self.order_id,
+                user_id=self.user_id,
+                user_email=self.user_email,
+                products=[
+                    {"product_id": e["file_key"], "product_name": e["name"], "file_path": e["pdf_path"]}
+                    for e in ok
+                ],
+                payment_verified=True,
+            )
+            created = []
+            for entry, (token, expires_at, error) in zip(ok, results):
+                if error:
+                    print(f"[{self.caller}] ERROR: Creating download link for {entry['name']}: {error}")
+                    self.failures.append({**entry, "reason": "link_creation_error", "error": error})
+                    continue
+                created.append({
+                    "product_id": entry["file_key"],
+                    "name": entry["name"],
+                    "token": token,
+                    "expires_at": expires_at,
+                    "pdf_path": entry["pdf_path"],
+                })
+            if created:
+                await _invalidate_library_cache()
+            self.links.extend(created)
+
+        print(f"[{self.caller}] Fulfillment {self.order_id}: {len(self.links)} download links created; "
+              f"{len(self.failures)} verification/link failures")
+        return created
+
+    def transaction_fields(self) -> dict:
+        """The fulfillment outcome as payment_transactions fields. Status goes
+        to ``fulfilled`` ONLY if at least one verified link was created."""
+        fields = {
+            "download_links_generated": bool(self.links),
+            "downloads_count": len(self.links),
+            "fulfillment_verification_failures": [
+                {k: v for k, v in f.items() if k in FAILURE_FIELDS} for f in self.failures
+            ],
+        }
+        if self.links:
+            fields["status"] = "fulfilled"
+        else:
+            # No verified deliverable → keep status as-is (typically 'paid') and
+            # record that fulfillment is pending verification.
+            fields["fulfillment_status"] = "pending_verification"
+        return fields
+
+    async def record(self, query: dict, extra: Optional[dict] = None) -> None:
+        """Persist ``transaction_fields()`` (plus ``extra``) on the matching transaction."""
+        self._filter = query
+        async with self.stage("record"):
+            await db.payment_transactions.update_one(
+                query, {"$set": {**self.transaction_fields(), **(extra or {})}}
+            )
+
+    async def grant(self, items: List[dict], *, email: str, user_id: str) -> None:
+        """Audio access (Holiday/4C series) and game-pass entitlements."""
+        from payment_routes import _grant_audio_access_for_items, _grant_game_pass_for_items
+
+        async with self.stage("grants"):
+            await _grant_audio_access_for_items(items, email)
+            try:
+                await _grant_game_pass_for_items(
+                    items=items, user_id=user_id, customer_email=email, order_number=self.order_id,
+                )
+            except Exception as e:
+                print(f"[{self.caller}] Error granting game pass: {e}")
+
+    async def finish(self) -> Dict[str, float]:
+        """Log and keep this run's timings (ms). Call once, after the last stage."""
+        self.timings["total"] = (time.perf_counter() - self._started) * 1000
+        timings = {k: round(v, 1) for k, v in self.timings.items()}
+        runs = _window.setdefault(self.caller, deque(maxlen=FULFILLMENT_TIMINGS_WINDOW))
+        runs.append(timings)
+        print(f"[Fulfillment] {self.caller} {self.order_id} timings(ms): "
+              + " ".join(f"{k}={v:.0f}" for k, v in timings.items()))
+        if self._filter is not None:
+            try:
+                await db.payment_transactions.update_one(
+                    self._filter, {"$set": {"fulfillment_timings_ms": timings}}
+                )
+            except Exception as e:
+                print(f"[Fulfillment] Could not store timings for {self.order_id}: {e}")
+        return timings
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def timings_summary() -> dict:
+    """Per entry point: run count and count / p50 / p95 / max (ms) per stage
+    over this process's recent runs."""
+    summary = {}
+    for caller, runs in _window.items():
+        stages = {}
+        for name in (*STAGES, "total"):
+            values = sorted(r[name] for r in runs if name in r)
+            if values:
+                stages[name] = {
+                    "count": len(values),
+                    "p50": _percentile(values, 0.5),
+                    "p95": _percentile(values, 0.95),
+                    "max": values[-1],
+                }
+        summary[caller] = {"runs": len(runs), "stages_ms": stages}
+    return summary
@@ -13,17 +13,13 @@ Tier Structure:
 
 from datetime import datetime, timezone, timedelta
 from typing import Optional, Dict, Tuple, List
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
 from dotenv import load_dotenv
 import secrets
 
 load_dotenv()
 
 # Database connection
-MONGO_URL = os.getenv('MONGO_URL')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ['DB_NAME']]
+from database import db  # noqa: E402 — shared pool
 
 
 def ensure_utc_datetime(dt) -> Optional[datetime]:
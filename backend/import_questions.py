@@ -114,12 +114,9 @@ async def import_trivia_mixup(db):
         result = await db.trivia_mixup_questions.insert_many(unique_questions)
         print(f"  ✅ Inserted {len(result.inserted_ids)} Trivia Mix-up questions")
         
-        # Create indexes
-        await db.trivia_mixup_questions.create_index("id", unique=True)
-        await db.trivia_mixup_questions.create_index("quarter")
-        await db.trivia_mixup_questions.create_index("theme")
-        await db.trivia_mixup_questions.create_index("difficulty")
-        await db.trivia_mixup_questions.create_index("category")
+        # Create indexes (declared in index_registry)
+        from index_registry import apply
+        await apply(["trivia_mixup_questions"], database=db)
         print("  ✅ Indexes created")
     
     return len(unique_questions)
@@ -139,11 +136,9 @@ async def import_tricky_testaments(db):
         result = await db.tricky_testaments_questions.insert_many(unique_questions)
         print(f"  ✅ Inserted {len(result.inserted_ids)} Tricky Testaments questions")
         
-        # Create indexes
-        await db.tricky_testaments_questions.create_index("id", unique=True)
-        await db.tricky_testaments_questions.create_index("category")
-        await db.tricky_testaments_questions.create_index("difficulty")
-        await db.tricky_testaments_questions.create_index("audience")
+        # Create indexes (declared in index_registry)
+        from index_registry import apply
+        await apply(["tricky_testaments_questions"], database=db)
         print("  ✅ Indexes created")
     
     return len(unique_questions)
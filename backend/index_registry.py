@@ -0,0 +1,289 @@
+"""
+Declarative MongoDB index registry.
+===================================
+Every index the backend relies on is declared here, in one place, and applied
+idempotently at startup (``apply``, run as a background task so boot never
+waits on a build). Index creation used to be scattered across modules, and
+some helpers (download links, security collections) were never called at all,
+so hot lookups such as ``payment_transactions.session_id`` had no index.
+
+Feature modules own the *shape* of their keys and the registry derives from
+them: keyset sorts from ``pagination.KEYSET_FIELDS``, normalized keys from
+``lc_keys``.
+
+``drift_report`` compares declared vs actual indexes (missing, option
+conflicts, undeclared extras) and summarizes slow query shapes recorded by the
+database profiler, when it is enabled. Exposed as
+``GET /api/admin/system/indexes`` and ``python -m scripts.index_report``.
+"""
+from __future__ import annotations
+
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import db
+from lc_keys import LC_FIELDS, LOWERCASE_FIELDS, lc_field
+from pagination import KEYSET_FIELDS, sort_spec
+
+# Options that make two indexes on the same keys different.
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _ix(keys, **options) -> dict:
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    return {"keys": [tuple(k) for k in keys], "options": options}
+
+
+INDEXES: Dict[str, List[dict]] = {
+    "payment_transactions": [
+        _ix("session_id"),
+        _ix("order_number"),
+        _ix("user_id"),
+        _ix("claimed_by_user_id"),
+        _ix("search_keys"),
+        _ix("created_at"),
+    ],
+    "orders": [
+        _ix("order_number"),
+        _ix("order_id"),
+        _ix("session_id"),
+        _ix("user_id"),
+    ],
+    "download_links": [
+        _ix("token_hash", unique=True, partialFilterExpression={"token_hash": {"$type": "string"}}),
+        _ix("order_id"),
+        _ix("user_id"),
+        _ix("expires_at"),
+    ],
+    "download_link_requests": [
+        _ix("requested_at", expireAfterSeconds=3600),
+        _ix([("user_email", 1), ("order_id", 1)]),
+    ],
+    "stripe_events": [
+        _ix([("status", 1), ("next_attempt_at", 1)]),
+        _ix("session_id"),
+    ],
+    "stripe_event_locks": [
+        _ix("lease_until", expireAfterSeconds=0),
+    ],
+    "email_outbox": [
+        _ix("dedup_key", unique=True, partialFilterExpression={"dedup_key": {"$type": "string"}}),
+        _ix([("status", 1), ("next_attempt_at", 1)]),
+    ],
+    "download_audit_logs": [
+        _ix("timestamp"),
+        _ix("order_id"),
+    ],
+    "files": [
+        _ix([("attachments.target_type", 1), ("attachments.target_id", 1), ("is_deleted", 1)]),
+        _ix("storage_path"),
+    ],
+    "products": [
+        _ix("updated_at"),
+    ],
+    "users": [
+        _ix("id"),
+        _ix("email"),
+        _ix("created_at"),
+    ],
+    "gaming_sessions": [
+        _ix([("user_id", 1), ("date", 1)]),
+        _ix([("user_id", 1), ("status", 1)]),
+        _ix("session_id"),
+    ],
+    "gaming_passes": [
+        _ix([("user_id", 1), ("pass_type", 1)]),
+    ],
+    "redemption_codes": [
+        _ix("code"),
+    ],
+    "login_attempts": [
+        _ix("timestamp", expireAfterSeconds=86400),
+        _ix("identifier"),
+        _ix("ip_address"),
+    ],
+    "lockouts": [
+        _ix("locked_until", expireAfterSeconds=0),
+        _ix("identifier"),
+    ],
+    "password_reset_requests": [
+        _ix("timestamp", expireAfterSeconds=3600),
+    ],
+    "password_reset_tokens": [
+        _ix("expires_at", expireAfterSeconds=0),
+        _ix("token_hash"),
+    ],
+    "audit_logs": [
+        _ix("timestamp"),
+        _ix("event_type"),
+        _ix("user_id"),
+    ],
+    "trivia_questions": [
+        _ix("character"),
+        _ix("game_type"),
+        _ix("age_group"),
+        _ix("difficulty"),
+        _ix([("character", 1), ("game_type", 1)]),
+    ],
+    "word_studies": [
+        _ix("character"),
+    ],
+    "trivia_mixup_questions": [
+        _ix("id", unique=True),
+        _ix("quarter"),
+        _ix("theme"),
+        _ix("difficulty"),
+        _ix("category"),
+    ],
+    "tricky_testaments_questions": [
+        _ix("id", unique=True),
+        _ix("category"),
+        _ix("difficulty"),
+        _ix("audience"),
+    ],
+}
+
+for _name, _field in KEYSET_FIELDS.items():
+    INDEXES.setdefault(_name, []).append(_ix(sort_spec(_field)))
+for _name, _fields in LC_FIELDS.items():
+    INDEXES.setdefault(_name, []).extend(_ix(lc_field(f)) for f in _fields)
+for _name, _fields in LOWERCASE_FIELDS.items():
+    INDEXES.setdefault(_name, []).extend(_ix(f) for f in _fields)
+
+
+def _key_sig(keys) -> Tuple[Tuple[str, object], ...]:
+    return tuple((k, v) for k, v in keys)
+
+
+def _options_of(info: dict) -> dict:
+    return {k: info[k] for k in _COMPARED_OPTIONS if k in info}
+
+
+def plan(collection: str, existing: dict) -> dict:
+    """Compare the declared indexes of ``collection`` with ``existing``
+    (``index_information()`` output)."""
+    actual = {_key_sig(info["key"]): (name, _options_of(info)) for name, info in existing.items()}
+    missing, conflicts = [], []
+    declared_sigs = set()
+    for spec in INDEXES.get(collection, []):
+        sig = _key_sig(spec["keys"])
+        declared_sigs.add(sig)
+        if sig not in actual:
+            missing.append(spec)
+        elif actual[sig][1] != spec["options"]:
+            conflicts.append({"keys": spec["keys"], "declared": spec["options"],
+                              "actual": actual[sig][1], "name": actual[sig][0]})
+    undeclared = [name for sig, (name, _) in actual.items()
+                  if sig not in declared_sigs and name != "_id_"]
+    return {"missing": missing, "conflicts": conflicts, "undeclared": sorted(undeclared)}
+
+
+def _targets(collections: Optional[Iterable[str]]) -> List[str]:
+    return list(collections) if collections else list(INDEXES)
+
+
+async def apply(collections: Optional[Iterable[str]] = None, database=None) -> dict:
+    """Create every missing declared index. Never drops or rebuilds: an index
+    whose options conflict is reported and left alone."""
+    database = db if database is None else database
+    created, conflicts, failed = 0, [], []
+    for name in _targets(collections):
+        try:
+            p = plan(name, await database[name].index_information())
+        except Exception as e:
+            failed.append({"collection": name, "error": str(e)})
+            continue
+        conflicts.extend({"collection": name, **c} for c in p["conflicts"])
+        for spec in p["missing"]:
+            try:
+                await database[name].create_index(spec["keys"], background=True, **spec["options"])
+                created += 1
+            except Exception as e:
+                failed.append({"collection": name, "keys": spec["keys"], "error": str(e)})
+    summary = {"created": created, "conflicts": conflicts, "failed": failed}
+    print(f"[IndexRegistry] created={created} conflicts={len(conflicts)} failed={len(failed)}")
+    return summary
+
+
+def apply_sync(database, collections: Iterable[str]) -> int:
+    """``apply`` for synchronous pymongo callers (seed scripts)."""
+    created = 0
+    for name in collections:
+        for spec in plan(name, database[name].index_information())["missing"]:
+            database[name].create_index(spec["keys"], background=True, **spec["options"])
+            created += 1
+    return created
+
+
+def query_shape(value):
+    """Replace literal values in a filter with 1, keeping field names and
+    operators, so queries that differ only in values group together."""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in sorted(value.items())}
+    if isinstance(value, list):
+        return [query_shape(value[0])] if value else []
+    return 1
+
+
+def _profiled_filter(command: dict):
+    if "filter" in command:
+        return command["filter"]
+    if "q" in command:
+        return command["q"]
+    for stage in command.get("pipeline") or []:
+        if "$match" in stage:
+            return stage["$match"]
+    return {}
+
+
+async def _slow_query_shapes(slow_ms: int, limit: int, database) -> dict:
+    status = await database.command({"profile": -1})
+    level = status.get("was", 0)
+    shapes: Dict[tuple, dict] = {}
+    cursor = database["system.profile"].find(
+        {"millis": {"$gte": slow_ms}, "ns": {"$not": {"$regex": r"\.system\."}}},
+        {"ns": 1, "op": 1, "command": 1, "millis": 1, "planSummary": 1, "docsExamined": 1, "nreturned": 1},
+    ).sort("ts", -1).limit(limit)
+    async for doc in cursor:
+        command = doc.get("command") or {}
+        shape = json.dumps(query_shape(_profiled_filter(command)), sort_keys=True)
+        sort = json.dumps(query_shape(command.get("sort") or {}), sort_keys=True)
+        key = (doc.get("ns"), doc.get("op"), shape, sort, doc.get("planSummary"))
+        entry = shapes.setdefault(key, {
+            "ns": key[0], "op": key[1], "filter": shape, "sort": sort, "plan": key[4],
+            "collscan": "COLLSCAN" in (key[4] or ""), "count": 0, "total_ms": 0, "max_ms": 0,
+            "docs_examined": 0, "returned": 0,
+        })
+        entry["count"] += 1
+        entry["total_ms"] += doc.get("millis", 0)
+        entry["max_ms"] = max(entry["max_ms"], doc.get("millis", 0))
+        entry["docs_examined"] += doc.get("docsExamined", 0)
+        entry["returned"] += doc.get("nreturned", 0)
+    ranked = sorted(shapes.values(), key=lambda e: (not e["collscan"], -e["total_ms"]))
+    return {"level": level, "slowms": status.get("slowms"), "slow_shapes": ranked[:50]}
+
+
+async def drift_report(slow_ms: int = 100, profile_limit: int = 1000, database=None) -> dict:
+    """Declared vs actual indexes for every registered collection, plus the
+    slowest query shapes from ``system.profile`` (COLLSCANs first)."""
+    database = db if database is None else database
+    collections = {}
+    for name in INDEXES:
+        try:
+            p = plan(name, await database[name].index_information())
+        except Exception as e:
+            collections[name] = {"error": str(e)}
+            continue
+        if p["missing"] or p["conflicts"] or p["undeclared"]:
+            collections[name] = p
+    try:
+        profiler = await _slow_query_shapes(slow_ms, profile_limit, database)
+    except Exception as e:
+        profiler = {"error": str(e)}
+    return {
+        "declared": sum(len(v) for v in INDEXES.values()),
+        "in_sync": not any("error" in c or c["missing"] or c["conflicts"] for c in collections.values()),
+        "drift": collections,
+        "profiler": profiler,
+    }
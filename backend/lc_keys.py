@@ -0,0 +1,146 @@
+"""
+Case-normalized lookup keys.
+============================
+Emails and coupon codes are typed with arbitrary casing, so lookups used
+anchored case-insensitive regexes (``{"$regex": "^x$", "$options": "i"}``).
+Mongo cannot serve a case-insensitive regex from a normal index: every
+entitlement, order-history and coupon lookup scanned its collection.
+
+Each such field now has a lowercased ``<field>_lc`` twin, written whenever
+the document is created (``with_lc``) and indexed (see ``index_registry``).
+Lookups go through ``match`` / ``match_any`` and become index seeks.
+
+``download_links.user_email`` is already defined as lowercase (see
+``download_protection.create_download_link``), so it is normalized in place
+instead of getting a twin.
+
+Existing documents are migrated once per database at boot
+(``ensure_backfilled``, recorded in ``db.migrations``), or on demand with
+``python -m scripts.backfill_lc_keys``. It is idempotent. Until this process
+has seen the migration recorded, ``match`` also accepts the raw field
+(anchored case-insensitive regex), so documents the backfill hasn't reached
+yet are still found.
+"""
+from __future__ import annotations
+
+import re
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import db
+
+MIGRATION_ID = "lc_keys_v1"
+
+# Set once the backfill is known to be complete for this database.
+_backfilled = False
+
+# collection -> fields that get a lowercased ``<field>_lc`` twin
+LC_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "payment_transactions": ("customer_email", "digital_recipient_email"),
+    "orders": ("customer_email", "digital_recipient_email"),
+    "coupons": ("code",),
+    "redemption_codes": ("code",),
+}
+
+# collection -> fields stored lowercase in place
+LOWERCASE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "download_links": ("user_email",),
+}
+
+
+def lc(value) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    return value or None
+
+
+def lc_field(field: str) -> str:
+    return f"{field}_lc"
+
+
+def with_lc(collection: str, doc: dict) -> dict:
+    """Add ``<field>_lc`` for every normalized field present in ``doc`` (an
+    insert document or a ``$set`` body). Mutates and returns ``doc``."""
+    for field in LC_FIELDS.get(collection, ()):
+        if field in doc:
+            doc[lc_field(field)] = lc(doc[field])
+    return doc
+
+
+def match(field: str, value) -> dict:
+    """Index-seek equivalent of a case-insensitive exact match on ``field``
+    (plus the raw-field regex while the backfill hasn't been confirmed)."""
+    key = lc(value)
+    if _backfilled or key is None:
+        return {lc_field(field): key}
+    return {"$or": [
+        {lc_field(field): key},
+        {field: {"$regex": f"^{re.escape(value.strip())}$", "$options": "i"}},
+    ]}
+
+
+def match_any(fields: Iterable[str], value) -> List[dict]:
+    """``$or`` clauses matching ``value`` against any of ``fields``."""
+    return [match(f, value) for f in fields]
+
+
+async def backfill_collection(name: str, batch_size: int = 500) -> int:
+    """Write missing / stale ``_lc`` twins (and lowercase in-place fields)
+    for one collection. Returns the number of documents updated."""
+    from pymongo import UpdateOne
+
+    twins = LC_FIELDS.get(name, ())
+    in_place = LOWERCASE_FIELDS.get(name, ())
+    fields = {f: 1 for f in twins + in_place}
+    for f in twins:
+        fields[lc_field(f)] = 1
+    query = {"$or": [{f: {"$type": "string"}} for f in twins + in_place]}
+
+    ops, done = [], 0
+    async for doc in db[name].find(query, fields):
+        update = {}
+        for f in twins:
+            if isinstance(doc.get(f), str) and doc.get(lc_field(f)) != lc(doc[f]):
+                update[lc_field(f)] = lc(doc[f])
+        for f in in_place:
+            if isinstance(doc.get(f), str) and doc[f] != doc[f].strip().lower():
+                update[f] = doc[f].strip().lower()
+        if not update:
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+        if len(ops) >= batch_size:
+            await db[name].bulk_write(ops, ordered=False)
+            done, ops = done + len(ops), []
+    if ops:
+        await db[name].bulk_write(ops, ordered=False)
+        done += len(ops)
+    return done
+
+
+async def backfill_all(batch_size: int = 500) -> Dict[str, int]:
+    return {name: await backfill_collection(name, batch_size)
+            for name in list(LC_FIELDS) + list(LOWERCASE_FIELDS)}
+
+
+async def ensure_backfilled() -> Optional[Dict[str, int]]:
+    """Run the backfill once per database (boot hook). Writers keep the keys
+    current afterwards, so later boots skip it. ``match`` switches to the
+    plain ``_lc`` seek once this returns successfully."""
+    global _backfilled
+    try:
+        if await db.migrations.find_one({"_id": MIGRATION_ID}, {"_id": 1}):
+            _backfilled = True
+            return None
+        counts = await backfill_all()
+        await db.migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"done_at": datetime.now(timezone.utc), "updated": counts}},
+            upsert=True,
+        )
+    except Exception as e:
+        print(f"[LcKeys] backfill failed (will retry next boot): {e}")
+        return None
+    _backfilled = True
+    print(f"[LcKeys] backfill complete: {counts}")
+    return counts
@@ -0,0 +1,91 @@
+"""
+Indexed admin order search.
+===========================
+Admin order search used an unanchored, case-insensitive ``$regex`` over
+``order_number`` / ``customer_email`` / ``customer_name``. Mongo can't use an
+index for that, so every keystroke collection-scanned payment_transactions.
+
+Each transaction now carries ``search_keys``: lowercased order number (and
+its ``-`` segments), session id, email, and name plus name tokens. A search
+string is split into lowercase tokens and every token must prefix-match some
+key. Anchored, case-sensitive prefix regexes become index range scans on the
+multikey ``search_keys`` index, so this covers:
+  * exact / prefix order-number hits    ``SF-2026-AB12``, ``ab12``
+  * email prefix                        ``jane.d``, ``jane.doe@exa``
+  * name tokens, any order              ``doe jan``
+
+Keys are written when a transaction is created (``with_search_keys``) and
+recomputed by writes that change a keyed field (``search_keys`` over the
+merged document, alongside the ``$set``); older
+documents are filled in by ``scripts/backfill_order_search.py``. Until then,
+documents *without* keys are still matched by the old regex — that branch only
+visits un-backfilled documents (``$exists: false`` on the same index).
+"""
+from __future__ import annotations
+
+import re
+from typing import List, Optional
+
+from database import db
+
+_TOKEN_SPLIT = re.compile(r"[\s,;]+")
+_NAME_SPLIT = re.compile(r"[^\w@.+'-]+")
+
+
+def search_keys(doc: dict) -> List[str]:
+    keys = []
+    order_number = (doc.get("order_number") or "").strip().lower()
+    if order_number:
+        keys.append(order_number)
+        keys.extend(p for p in order_number.split("-") if p)
+    session_id = (doc.get("session_id") or "").strip().lower()
+    if session_id:
+        keys.append(session_id)
+    email = (doc.get("customer_email") or "").strip().lower()
+    if email:
+        keys.append(email)
+    name = (doc.get("customer_name") or "").strip().lower()
+    if name:
+        keys.append(name)
+        keys.extend(t for t in _NAME_SPLIT.split(name) if t)
+    return list(dict.fromkeys(keys))
+
+
+def with_search_keys(doc: dict) -> dict:
+    """Set ``doc["search_keys"]`` in place (call before insert) and return it."""
+    doc["search_keys"] = search_keys(doc)
+    return doc
+
+
+def search_filter(text: str) -> Optional[dict]:
+    """Mongo filter matching transactions for an admin search string."""
+    tokens = [t for t in _TOKEN_SPLIT.split((text or "").strip().lower()) if t]
+    if not tokens:
+        return None
+    prefix = [{"search_keys": {"$regex": "^" + re.escape(t)}} for t in tokens]
+    legacy_re = {"$regex": re.escape(text.strip()), "$options": "i"}
+    return {"$or": [
+        prefix[0] if len(prefix) == 1 else {"$and": prefix},
+        {"search_keys": {"$exists": False}, "$or": [
+            {"order_number": legacy_re},
+            {"customer_email": legacy_re},
+            {"customer_name": legacy_re},
+        ]},
+    ]}
+
+
+async def backfill(batch_size: int = 500) -> int:
+    """Add search_keys to every transaction that lacks them. Returns count."""
+    from pymongo import UpdateOne
+
+    fields = {"_id": 1, "order_number": 1, "session_id": 1, "customer_email": 1, "customer_name": 1}
+    ops, done = [], 0
+    async for doc in db.payment_transactions.find({"search_keys": {"$exists": False}}, fields):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"search_keys": search_keys(doc)}}))
+        if len(ops) >= batch_size:
+            await db.payment_transactions.bulk_write(ops, ordered=False)
+            done, ops = done + len(ops), []
+    if ops:
+        await db.payment_transactions.bulk_write(ops, ordered=False)
+        done += len(ops)
+    return done
@@ -0,0 +1,137 @@
+"""
+Keyset (cursor) pagination for admin list endpoints.
+====================================================
+``.skip((page-1)*limit)`` makes Mongo walk and discard every earlier row, so
+deep pages get linearly slower, and the ``count_documents`` that came with
+each page was a second scan of the whole match.
+
+A keyset page instead continues from the last row returned: results are
+ordered by ``(<sort field> desc, _id desc)`` and the opaque ``next_cursor``
+encodes that pair, so page N costs the same as page 1 on the compound
+``(<field>, _id)`` index declared in ``index_registry``.
+
+``created_at`` holds BSON dates on new documents and ISO strings on some
+legacy ones. Mongo's ``$lt`` only compares within one BSON type, so the
+"after" clause explicitly continues into the lower-sorting types
+(date → string → null/missing) to walk mixed collections without gaps.
+
+Counts are optional (``with_total=false`` skips them); an unfiltered count
+uses the collection-metadata estimate instead of a scan.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+# collection -> keyset sort field
+KEYSET_FIELDS = {
+    "lessons": "created_at",
+    "media": "created_at",
+    "payment_transactions": "created_at",
+    "users": "created_at",
+    "admin_audit_logs": "timestamp",
+}
+
+
+def sort_spec(field: str) -> list:
+    return [(field, -1), ("_id", -1)]
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return ["d", value.isoformat()]
+    if isinstance(value, ObjectId):
+        return ["o", str(value)]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return ["j", value]
+    return ["j", str(value)]
+
+
+def _decode_value(tagged):
+    kind, value = tagged
+    if kind == "d":
+        return datetime.fromisoformat(value)
+    if kind == "o":
+        return ObjectId(value)
+    return value
+
+
+def encode_cursor(doc: dict, field: str) -> str:
+    """Opaque cursor pointing just past ``doc``."""
+    raw = json.dumps([_encode_value(doc.get(field)), _encode_value(doc.get("_id"))], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[object, object]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        value, oid = json.loads(raw)
+        return _decode_value(value), _decode_value(oid)
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_clause(field: str, value, oid) -> dict:
+    """Rows that sort strictly after ``(value, oid)`` in ``sort_spec(field)``."""
+    ors = [{field: value, "_id": {"$lt": oid}}]
+    if value is not None:
+        ors.append({field: {"$lt": value}})
+        if isinstance(value, datetime):
+            ors.append({field: {"$type": "string"}})
+        ors.append({field: None})
+    return {"$or": ors}
+
+
+def keyset_query(query: dict, field: str, cursor: Optional[str]) -> dict:
+    if not cursor:
+        return query
+    after = after_clause(field, *decode_cursor(cursor))
+    return {"$and": [query, after]} if query else after
+
+
+async def fetch_page(
+    collection,
+    query: dict,
+    field: str,
+    projection: Optional[dict] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of ``collection`` newest-first, plus the cursor for the next
+    page (``None`` on the last page). ``skip`` is only honoured without a
+    cursor, for legacy ``page=`` callers."""
+    proj = {k: v for k, v in (projection or {}).items() if k != "_id"}
+    find = collection.find(keyset_query(query, field, cursor), proj or None).sort(sort_spec(field))
+    if skip and not cursor:
+        find = find.skip(skip)
+    docs = await find.limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1], field) if len(docs) > limit else None
+    docs = docs[:limit]
+    for d in docs:
+        d.pop("_id", None)
+    return docs, next_cursor
+
+
+async def count(collection, query: dict, with_total: bool = True) -> Optional[int]:
+    if not with_total:
+        return None
+    if not query:
+        return await collection.estimated_document_count()
+    return await collection.count_documents(query)
+
+
+def page_meta(total: Optional[int], page: int, limit: int, next_cursor: Optional[str]) -> dict:
+    return {
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "pages": max(1, (total + limit - 1) // limit) if total is not None else None,
+        "next_cursor": next_cursor,
+    }
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Optional, List
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import time
 from dotenv import load_dotenv
 from emergentintegrations.payments.stripe.checkout import (
     StripeCheckout,
@@ -12,6 +13,7 @@ from emergentintegrations.payments.stripe.checkout import (
     CheckoutSessionRequest
 )
 from datetime import datetime, timedelta, timezone
+import json
 import logging
 from price_catalog import catalog_price as _pc_catalog_price, is_dynamic_allowed as _pc_is_dynamic_allowed
 
@@ -27,9 +29,16 @@ PRICING_FAIL_CLOSED = os.environ.get('PRICING_FAIL_CLOSED', 'false').lower() ==
 router = APIRouter(prefix="/api/payments", tags=["payments"])
 
 # Database connection
-MONGO_URL = os.getenv('MONGO_URL')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ['DB_NAME']]
+from database import db  # noqa: E402 — shared pool
+import attachment_index  # noqa: E402
+import cache_versions  # noqa: E402
+import order_search  # noqa: E402
+import lc_keys  # noqa: E402
+import principal  # noqa: E402
+import product_catalog  # noqa: E402
+import dashboard_stats  # noqa: E402
+import stripe_events  # noqa: E402
+import fulfillment  # noqa: E402
 
 # PDF files directory
 PDF_DIR = "/app/backend/content/downloads"
@@ -334,25 +343,81 @@ PRODUCT_FILES = {
     "workbooks-holiday-ie-digital-instructor-ipdf": "holiday-ie-full.pdf",
 }
 
+# Alias groups: every PRODUCT_FILES key that maps to the same filename is an
+# alias of the others. Built once — PRODUCT_FILES is static.
+_PRODUCT_FILE_ALIASES: Dict[str, frozenset] = {}
+for _pf_key, _pf_name in PRODUCT_FILES.items():
+    _PRODUCT_FILE_ALIASES.setdefault(_pf_name, set()).add(_pf_key)
+_PRODUCT_FILE_ALIASES = {k: frozenset(v) for k, v in _PRODUCT_FILE_ALIASES.items()}
+
 import re as _re
+from functools import lru_cache
+
+# normalize_product_id / resolve_display_name_to_product_id are pure functions
+# of their input over static tables, and run for every item on the library,
+# fulfillment, refulfill and receipt paths — memoize them (bounded).
+PRODUCT_ID_MEMO_SIZE = int(os.environ.get('PRODUCT_ID_MEMO_SIZE', '4096'))
+
+# Display-noise patterns, applied in order (later ones rely on earlier removals).
+_DISPLAY_NOISE_PATTERNS = tuple(_re.compile(p, _re.IGNORECASE) for p in (
+    # Discount parentheticals: (99% off), (15% off), (20% Off), ($3 Off)
+    r'\(\d+%\s*off\)',
+    r'\(\$\d+(\.\d+)?\s*off[^)]*\)',
+    # Pre-order tags
+    r'\[PRE-?ORDER\]',
+    # Ship notes in parens: (Ships May-Jun 2026)
+    r'\(Ships[^)]+\)',
+    # "— $3 Off (Pre-Order)" or "- $3 Off" style suffixes (both em-dash and regular dash)
+    r'[\u2014\u2013—–-]\s*\$\d+(\.\d+)?\s*Off[^)]*(\(Pre-?Order\))?',
+    # Standalone (Pre-Order) tags
+    r'\(Pre-?Order\)',
+))
+
 
 def _strip_display_noise(text: str) -> str:
     """Strip discount labels, pre-order tags, and formatting from display names."""
     t = text.strip()
-    # Remove discount parentheticals: (99% off), (15% off), (20% Off), ($3 Off)
-    t = _re.sub(r'\(\d+%\s*off\)', '', t, flags=_re.IGNORECASE)
-    t = _re.sub(r'\(\$\d+(\.\d+)?\s*off[^)]*\)', '', t, flags=_re.IGNORECASE)
-    # Remove pre-order tags
-    t = _re.sub(r'\[PRE-?ORDER\]', '', t, flags=_re.IGNORECASE)
-    # Remove ship notes in parens: (Ships May-Jun 2026)
-    t = _re.sub(r'\(Ships[^)]+\)', '', t, flags=_re.IGNORECASE)
-    # Remove "— $3 Off (Pre-Order)" or "- $3 Off" style suffixes (both em-dash and regular dash)
-    t = _re.sub(r'[\u2014\u2013—–-]\s*\$\d+(\.\d+)?\s*Off[^)]*(\(Pre-?Order\))?', '', t, flags=_re.IGNORECASE)
-    # Remove standalone (Pre-Order) tags
-    t = _re.sub(r'\(Pre-?Order\)', '', t, flags=_re.IGNORECASE)
+    for pattern in _DISPLAY_NOISE_PATTERNS:
+        t = pattern.sub('', t)
     return t.strip().strip('-').strip()
 
 
+def _keywords(*words: str):
+    """One compiled alternation == ``any(w in text for w in words)``."""
+    return _re.compile('|'.join(_re.escape(w) for w in words))
+
+
+# Display-name classifier: each flag is a single regex scan of the cleaned name.
+_KW_HOLIDAY = _keywords('holiday', '4c', 'covenant', 'cradle', 'cross', 'comforter')
+_KW_BREAKFAST = _keywords('break*fast', 'breakfast', 'bkft')
+_KW_EDITION = (
+    ('ie', _keywords(' ie ', ' ie,', '-ie-', 'instructor')),
+    ('ye', _keywords(' ye ', ' ye,', '-ye-', 'youth')),
+    ('ae', _keywords(' ae ', ' ae,', '-ae-', 'adult')),
+)
+_KW_PAPERBACK = _keywords('paperback', 'print', 'wbk', 'physical')
+_KW_FULL = _keywords('full workbook', 'full series', 'full digital', 'full ')
+_KW_NIBBLE = _keywords('nibble', 'single lesson')
+_KW_SNACK = _keywords('snack pack', 'snack ')
+_KW_GAME = _keywords('game pass', 'game night', 'mix-up', 'gaming', 'grinch')
+_KW_NO_FILE = _keywords('subscription', 'all access', 'gift', 'certificate', 'bundle', 'starter')
+
+_HOLIDAY_LESSONS = ('covenant', 'cradle', 'cross', 'comforter')
+
+# Breakfast nibbles (individual lessons by character name). Checked in order —
+# the first character name found wins.
+_BREAKFAST_LESSONS = (
+    ('esther', 'prayer-1'), ('solomon', 'prayer-2'), ('jesus', 'prayer-3'),
+    ('paul', 'prayer-4'), ('silas', 'prayer-4'),
+    ('joseph', 'through-1'), ('dreamer', 'through-1'),
+    ('hannah', 'through-2'), ('abram', 'through-3'),
+    ('victory', 'through-4'),
+    ('rahab', 'faith-1'), ('abigail', 'faith-2'),
+    ('centurion', 'faith-3'), ('arimathea', 'faith-4'),
+)
+
+
+@lru_cache(maxsize=PRODUCT_ID_MEMO_SIZE)
 def resolve_display_name_to_product_id(display_name: str) -> Optional[str]:
     """Resolve a human-readable display name (from Stripe/QuickOrder) to an internal product ID.
     
@@ -369,59 +434,38 @@ def resolve_display_name_to_product_id(display_name: str) -> Optional[str]:
     clean = _strip_display_noise(display_name).lower()
 
     # Detect series
-    is_holiday = any(k in clean for k in ['holiday', '4c', 'covenant', 'cradle', 'cross', 'comforter'])
-    is_breakfast = any(k in clean for k in ['break*fast', 'breakfast', 'bkft'])
+    is_holiday = _KW_HOLIDAY.search(clean) is not None
+    is_breakfast = _KW_BREAKFAST.search(clean) is not None
     is_lunch = 'lunch' in clean
 
     # Detect edition
-    edition = None
-    if any(k in clean for k in [' ie ', ' ie,', '-ie-', 'instructor']):
-        edition = 'ie'
-    elif any(k in clean for k in [' ye ', ' ye,', '-ye-', 'youth']):
-        edition = 'ye'
-    elif any(k in clean for k in [' ae ', ' ae,', '-ae-', 'adult']):
-        edition = 'ae'
+    edition = next((ed for ed, kw in _KW_EDITION if kw.search(clean)), None)
 
     # Detect format
-    is_paperback = any(k in clean for k in ['paperback', 'print', 'wbk', 'physical'])
+    is_paperback = _KW_PAPERBACK.search(clean) is not None
 
     # Detect product type
-    is_full = any(k in clean for k in ['full workbook', 'full series', 'full digital', 'full '])
-    is_nibble = any(k in clean for k in ['nibble', 'single lesson'])
-    is_snack = any(k in clean for k in ['snack pack', 'snack '])
-    is_game = any(k in clean for k in ['game pass', 'game night', 'mix-up', 'gaming', 'grinch'])
-    is_subscription = 'subscription' in clean or 'all access' in clean
-    is_gift = 'gift' in clean or 'certificate' in clean
-    is_bundle = 'bundle' in clean or 'starter' in clean
+    is_full = _KW_FULL.search(clean) is not None
+    is_nibble = _KW_NIBBLE.search(clean) is not None
+    is_snack = _KW_SNACK.search(clean) is not None
 
     # Games / subscriptions / gifts / merch — no PDF download, return product key for entitlement
-    if is_game:
+    if _KW_GAME.search(clean):
         if '90' in clean:
             return 'game_pass_90'
         return 'game_pass_30'
-    if is_subscription or is_gift or is_bundle:
+    if _KW_NO_FILE.search(clean):
         return None  # These don't map to individual files
 
-    # Holiday nibbles (individual lessons)
-    if is_holiday and is_nibble:
+    # Holiday nibbles / specific lessons referenced by name
+    if is_holiday:
         ed = edition or 'ae'
-        if 'covenant' in clean:
-            return 'holiday-nibble-ae-covenant-digital' if ed == 'ae' else 'holiday-nibble-ye-covenant-digital'
-        if 'cradle' in clean:
-            return 'holiday-nibble-ae-cradle-digital' if ed == 'ae' else 'holiday-nibble-ye-cradle-digital'
-        if 'cross' in clean:
-            return 'holiday-nibble-ae-cross-digital' if ed == 'ae' else 'holiday-nibble-ye-cross-digital'
-        if 'comforter' in clean:
-            return 'holiday-nibble-ae-comforter-digital' if ed == 'ae' else 'holiday-nibble-ye-comforter-digital'
-        # Generic holiday nibble
-        return f'holiday_{ed}'
-
-    # Holiday specific lessons referenced by name
-    if is_holiday and not is_nibble:
-        for lesson_name, suffix in [('covenant', 'covenant'), ('cradle', 'cradle'), ('cross', 'cross'), ('comforter', 'comforter')]:
-            if lesson_name in clean:
-                ed = edition or 'ae'
-                return f'holiday-nibble-ae-{suffix}-digital' if ed == 'ae' else f'holiday-nibble-ye-{suffix}-digital'
+        for lesson in _HOLIDAY_LESSONS:
+            if lesson in clean:
+                return f'holiday-nibble-ae-{lesson}-digital' if ed == 'ae' else f'holiday-nibble-ye-{lesson}-digital'
+        if is_nibble:
+            # Generic holiday nibble
+            return f'holiday_{ed}'
 
     # Holiday full workbook
     if is_holiday and (is_full or (not is_nibble and not is_snack)):
@@ -429,17 +473,8 @@ def resolve_display_name_to_product_id(display_name: str) -> Optional[str]:
         return f'holiday_{ed}'
 
     # Breakfast nibbles (individual lessons by character name)
-    breakfast_lesson_map = {
-        'esther': ('prayer-1', 1), 'solomon': ('prayer-2', 1), 'jesus': ('prayer-3', 1),
-        'paul': ('prayer-4', 1), 'silas': ('prayer-4', 1),
-        'joseph': ('through-1', 2), 'dreamer': ('through-1', 2),
-        'hannah': ('through-2', 2), 'abram': ('through-3', 2),
-        'victory': ('through-4', 2),
-        'rahab': ('faith-1', 3), 'abigail': ('faith-2', 3),
-        'centurion': ('faith-3', 3), 'arimathea': ('faith-4', 3),
-    }
     if is_breakfast:
-        for char_name, (lesson_key, month) in breakfast_lesson_map.items():
+        for char_name, lesson_key in _BREAKFAST_LESSONS:
             if char_name in clean:
                 ed = edition or 'ae'
                 age = 'adult' if ed in ('ae', 'ie') else 'youth'
@@ -471,9 +506,20 @@ def resolve_display_name_to_product_id(display_name: str) -> Optional[str]:
     return None
 
 
+# Series + edition fallback for structured IDs (see normalize_product_id).
+_SERIES_EDITION_MAP = {
+    'holiday': {'ae': 'holiday_ae', 'ye': 'holiday_ye', 'ie': 'holiday_ie', 'adult': 'holiday_ae', 'youth': 'holiday_ye', 'instructor': 'holiday_ie'},
+    'breakfast': {'ae': 'breakfast_ae_digital', 'ye': 'breakfast_ye_digital', 'ie': 'breakfast_ie_digital', 'adult': 'breakfast_ae_digital', 'youth': 'breakfast_ye_digital', 'instructor': 'breakfast_ie_digital'},
+}
+_FORMAT_SWAPS = (('-epub', '-interactive'), ('-epub', '-digital'), ('-ebook', '-interactive'), ('-ebook', '-digital'))
+_KNOWN_SECTIONS = ('workbooks', 'instructor', 'bookclub')
+
+
+@lru_cache(maxsize=PRODUCT_ID_MEMO_SIZE)
 def normalize_product_id(product_id: str) -> str:
     """Normalize product ID to match PRODUCT_FILES keys.
-    Handles internal IDs, cart-generated IDs, AND human-readable display names."""
+    Handles internal IDs, cart-generated IDs, AND human-readable display names.
+    Memoized — PRODUCT_FILES / BUNDLE_EXPANSIONS are static."""
     if not product_id:
         return product_id
     
@@ -518,8 +564,7 @@ def normalize_product_id(product_id: str) -> str:
             return candidate_us
     
     # Section-prefix stripping (workbooks-, instructor-, etc.)
-    known_sections = ['workbooks', 'instructor', 'bookclub']
-    for section in known_sections:
+    for section in _KNOWN_SECTIONS:
         if normalized.startswith(section + '-'):
             remainder = normalized[len(section) + 1:]
             if remainder in PRODUCT_FILES:
@@ -539,17 +584,12 @@ def normalize_product_id(product_id: str) -> str:
     # Series + edition extraction — ONLY for structured IDs, not display names.
     # Skip this if the input looks like a display name (contains spaces)
     if ' ' not in normalized:
-        series_map = {
-            'holiday': {'ae': 'holiday_ae', 'ye': 'holiday_ye', 'ie': 'holiday_ie', 'adult': 'holiday_ae', 'youth': 'holiday_ye', 'instructor': 'holiday_ie'},
-            'breakfast': {'ae': 'breakfast_ae_digital', 'ye': 'breakfast_ye_digital', 'ie': 'breakfast_ie_digital', 'adult': 'breakfast_ae_digital', 'youth': 'breakfast_ye_digital', 'instructor': 'breakfast_ie_digital'},
-        }
-        
-        for old_fmt, new_fmt in [('epub', 'interactive'), ('epub', 'digital'), ('ebook', 'interactive'), ('ebook', 'digital')]:
-            swapped = normalized.replace(f'-{old_fmt}', f'-{new_fmt}')
+        for old_fmt, new_fmt in _FORMAT_SWAPS:
+            swapped = normalized.replace(old_fmt, new_fmt)
             if swapped in PRODUCT_FILES:
                 return swapped
-        
-        for series_key, editions in series_map.items():
+
+        for series_key, editions in _SERIES_EDITION_MAP.items():
             if series_key in normalized:
                 for ed_key, file_key in editions.items():
                     if ed_key in normalized:
@@ -835,29 +875,19 @@ async def _has_product_attachment(product_id: str) -> bool:
     """
     if not product_id:
         return False
+    await attachment_index.ensure_loaded()
+    return attachment_index.has_attachment(_alias_candidates(product_id))
 
-    candidates = {product_id, normalize_product_id(product_id)}
 
-    # Walk PRODUCT_FILES once to find aliases (keys sharing the same filename).
-    target_filename = PRODUCT_FILES.get(product_id) or PRODUCT_FILES.get(normalize_product_id(product_id))
+def _alias_candidates(product_id: str, normalized_id: Optional[str] = None) -> set:
+    """``product_id``, its normalized form, and every PRODUCT_FILES key that
+    shares the same legacy filename (precomputed in _PRODUCT_FILE_ALIASES)."""
+    normalized_id = normalized_id or normalize_product_id(product_id)
+    candidates = {product_id, normalized_id}
+    target_filename = PRODUCT_FILES.get(product_id) or PRODUCT_FILES.get(normalized_id)
     if target_filename:
-        for k, v in PRODUCT_FILES.items():
-            if v == target_filename:
-                candidates.add(k)
-
-    doc = await db.files.find_one(
-        {
-            "is_deleted": False,
-            "attachments": {
-                "$elemMatch": {
-                    "target_type": "product",
-                    "target_id": {"$in": list(candidates)},
-                }
-            },
-        },
-        {"_id": 0, "id": 1},
-    )
-    return doc is not None
+        candidates |= _PRODUCT_FILE_ALIASES[target_filename]
+    return candidates
 
 
 async def _has_exact_attachment(target_id: str) -> bool:
@@ -866,16 +896,8 @@ async def _has_exact_attachment(target_id: str) -> bool:
     (ePub / Fillable PDF) so they never collapse into the shared PDF."""
     if not target_id:
         return False
-    try:
-        from server import db
-    except Exception:
-        return False
-    doc = await db.files.find_one(
-        {"is_deleted": False,
-         "attachments": {"$elemMatch": {"target_type": "product", "target_id": target_id}}},
-        {"_id": 0, "id": 1},
-    )
-    return doc is not None
+    await attachment_index.ensure_loaded()
+    return attachment_index.has_attachment([target_id])
 
 
 async def resolve_item_to_file_entries_async(item: dict) -> list:
@@ -1029,19 +1051,11 @@ async def get_pdf_path_async(product_id: str) -> Optional[str]:
     # key "breakfast-ae-full-epub" is served ONLY for that key, and never
     # collapses into the shared Interactive/PDF alias set. Existing SKUs are
     # attached to their exact ids by the migration, so this is a no-op for them.
-    try:
-        from server import db
-        exact = await db.files.find_one(
-            {"is_deleted": False,
-             "attachments": {"$elemMatch": {"target_type": "product", "target_id": product_id}}},
-            {"_id": 0, "storage_path": 1, "original_filename": 1},
-            sort=[("created_at", -1)],
-        )
-        if exact and exact.get("storage_path"):
-            print(f"[PDF Path] {product_id} → EXACT Object Storage attachment ({exact.get('original_filename')})")
-            return f"objstore:{exact['storage_path']}"
-    except Exception as _e:
-        print(f"[PDF Path] exact-attachment lookup skipped: {_e}")
+    await attachment_index.ensure_loaded()
+    exact = attachment_index.latest_file([product_id])
+    if exact and exact.get("storage_path"):
+        print(f"[PDF Path] {product_id} → EXACT Object Storage attachment ({exact.get('original_filename')})")
+        return f"objstore:{exact['storage_path']}"
 
     normalized_id = normalize_product_id(product_id)
 
@@ -1049,27 +1063,10 @@ async def get_pdf_path_async(product_id: str) -> Optional[str]:
     # considered an alias. This lets a single attachment satisfy every SKU that
     # historically delivered the same PDF (e.g. snack_pack_ye_m1 ↔ breakfast-
     # snack-month-1-youth-interactive).
-    candidates = {product_id, normalized_id}
-    target_filename = PRODUCT_FILES.get(product_id) or PRODUCT_FILES.get(normalized_id)
-    if target_filename:
-        for k, v in PRODUCT_FILES.items():
-            if v == target_filename:
-                candidates.add(k)
+    candidates = _alias_candidates(product_id, normalized_id)
 
     # 1. Object Storage via db.files attachment (single source of truth)
-    obj = await db.files.find_one(
-        {
-            "is_deleted": False,
-            "attachments": {
-                "$elemMatch": {
-                    "target_type": "product",
-                    "target_id": {"$in": list(candidates)},
-                }
-            },
-        },
-        {"_id": 0, "id": 1, "storage_path": 1, "original_filename": 1, "created_at": 1},
-        sort=[("created_at", -1)],
-    )
+    obj = attachment_index.latest_file(candidates)
     if obj and obj.get("storage_path"):
         ref = f"objstore:{obj['storage_path']}"
         print(f"[PDF Path] {product_id} → Object Storage ({obj.get('original_filename')}) = {obj['storage_path']}")
@@ -1090,11 +1087,43 @@ async def get_pdf_path_async(product_id: str) -> Optional[str]:
     return expected
 
 
+# Fulfillment verification tuning. Verification runs on the Stripe webhook /
+# status-poll path, so a bundle must verify in bounded time regardless of how
+# many items it has or how slow Object Storage is being.
+VERIFY_CONCURRENCY = int(os.environ.get('FULFILLMENT_VERIFY_CONCURRENCY', '8'))
+VERIFY_DEADLINE_SECONDS = float(os.environ.get('FULFILLMENT_VERIFY_DEADLINE_SECONDS', '12'))
+VERIFY_CACHE_TTL_SECONDS = float(os.environ.get('FULFILLMENT_VERIFY_CACHE_TTL_SECONDS', '60'))
+VERIFY_NEGATIVE_TTL_SECONDS = float(os.environ.get('FULFILLMENT_VERIFY_NEGATIVE_TTL_SECONDS', '5'))
+
+# storage_path -> (exists, monotonic expiry). Object Storage paths are
+# content-addressed uploads, so a short-lived positive answer is safe; misses
+# are cached only briefly so a just-uploaded file becomes visible quickly.
+_exists_cache: Dict[str, tuple] = {}
+
+
+def _cached_exists(storage_path: str) -> Optional[bool]:
+    hit = _exists_cache.get(storage_path)
+    if hit is None:
+        return None
+    exists, expires = hit
+    if time.monotonic() >= expires:
+        _exists_cache.pop(storage_path, None)
+        return None
+    return exists
+
+
+def _remember_exists(storage_path: str, exists: bool) -> None:
+    ttl = VERIFY_CACHE_TTL_SECONDS if exists else VERIFY_NEGATIVE_TTL_SECONDS
+    if ttl > 0:
+        _exists_cache[storage_path] = (exists, time.monotonic() + ttl)
+
+
 async def _verify_file_retrievable(pdf_path: Optional[str]) -> bool:
     """Confirm the bytes for ``pdf_path`` are actually retrievable BEFORE we
     mark an order fulfilled. Prevents the 'DB says fulfilled, download 404s'
     failure mode.
       * ``objstore:<path>`` → HEAD the object in Emergent Object Storage
+        (answers cached per storage_path for a short TTL)
       * local path → ``os.path.exists``
     Never raises — returns False on any error."""
     if not pdf_path:
@@ -1102,8 +1131,13 @@ async def _verify_file_retrievable(pdf_path: Optional[str]) -> bool:
     try:
         if pdf_path.startswith("objstore:"):
             storage_path = pdf_path[len("objstore:"):]
+            cached = _cached_exists(storage_path)
+            if cached is not None:
+                return cached
             import storage_service as ss
-            return ss.head_object(storage_path)
+            exists = await ss.ahead_object(storage_path)
+            _remember_exists(storage_path, exists)
+            return exists
         return os.path.exists(pdf_path)
     except Exception as e:
         print(f"[Verify] retrievability check raised for {pdf_path}: {e}")
@@ -1114,24 +1148,53 @@ async def _verified_entries_for_fulfillment(file_entries: list, caller: str = "f
     """Resolve and VERIFY each file entry. Only verified entries are eligible
     for download-link creation + fulfilled status.
 
+    Entries are verified concurrently (at most ``VERIFY_CONCURRENCY`` at a
+    time) under one overall ``VERIFY_DEADLINE_SECONDS`` budget; anything still
+    pending at the deadline fails rather than stalling the webhook. Result
+    order follows ``file_entries``.
+
     Returns ``(verified_list, failures_list)`` where:
       * verified_list items: ``{...entry, pdf_path}``
       * failures_list items: ``{...entry, pdf_path, reason}`` with reason in
-        ``{"no_path", "not_retrievable"}``.
+        ``{"no_path", "not_retrievable", "verify_timeout"}``.
     """
+    entries = list(file_entries or [])
+    if not entries:
+        return [], []
+    sem = asyncio.Semaphore(max(1, VERIFY_CONCURRENCY))
+    resolved: Dict[int, Optional[str]] = {}
+
+    async def _check(i: int, entry: dict) -> dict:
+        async with sem:
+            pdf_path = await get_pdf_path_async(entry["file_key"]) or await get_pdf_path_async(entry["product_id"])
+            resolved[i] = pdf_path
+            if not pdf_path:
+                print(f"[{caller}] VERIFY FAIL ({entry['name']}/{entry['file_key']}): no path resolved")
+                return {**entry, "pdf_path": None, "reason": "no_path"}
+            if not await _verify_file_retrievable(pdf_path):
+                print(f"[{caller}] VERIFY FAIL ({entry['name']}/{entry['file_key']}): path not retrievable = {pdf_path}")
+                return {**entry, "pdf_path": pdf_path, "reason": "not_retrievable"}
+            return {**entry, "pdf_path": pdf_path}
+
+    tasks = [asyncio.ensure_future(_check(i, e)) for i, e in enumerate(entries)]
+    await asyncio.wait(tasks, timeout=VERIFY_DEADLINE_SECONDS)
+
     verified: list = []
     failures: list = []
-    for entry in file_entries or []:
-        pdf_path = await get_pdf_path_async(entry["file_key"]) or await get_pdf_path_async(entry["product_id"])
-        if not pdf_path:
-            print(f"[{caller}] VERIFY FAIL ({entry['name']}/{entry['file_key']}): no path resolved")
-            failures.append({**entry, "pdf_path": None, "reason": "no_path"})
+    for i, (entry, task) in enumerate(zip(entries, tasks)):
+        if not task.done():
+            task.cancel()
+            print(f"[{caller}] VERIFY FAIL ({entry['name']}/{entry['file_key']}): "
+                  f"deadline of {VERIFY_DEADLINE_SECONDS:.0f}s exceeded")
+            failures.append({**entry, "pdf_path": resolved.get(i), "reason": "verify_timeout"})
             continue
-        if not await _verify_file_retrievable(pdf_path):
-            print(f"[{caller}] VERIFY FAIL ({entry['name']}/{entry['file_key']}): path not retrievable = {pdf_path}")
-            failures.append({**entry, "pdf_path": pdf_path, "reason": "not_retrievable"})
+        if task.cancelled() or task.exception() is not None:
+            err = "cancelled" if task.cancelled() else task.exception()
+            print(f"[{caller}] VERIFY FAIL ({entry['name']}/{entry['file_key']}): {err}")
+            failures.append({**entry, "pdf_path": resolved.get(i), "reason": "not_retrievable"})
             continue
-        verified.append({**entry, "pdf_path": pdf_path})
+        result = task.result()
+        (failures if "reason" in result else verified).append(result)
     return verified, failures
 
 # Product catalog with list and sale prices
@@ -1897,7 +1960,7 @@ BULK_COUPONS = {
 
 
 @router.get("/catalog")
-async def get_product_catalog():
+async def get_product_catalog(request: Request):
     """Public endpoint: returns the full product catalog with current prices.
 
     Merges:
@@ -1906,99 +1969,15 @@ async def get_product_catalog():
 
     DB products override hardcoded entries by SKU when both exist (so admins can
     re-price live without code changes). New DB-only products are appended.
-    """
-    from datetime import date
-    today = date.today().isoformat()
-    catalog = []
-    # Track which SKUs already came from code so DB can override by SKU
-    seen_skus = {}
 
-    for pid, p in PRODUCTS.items():
-        effective_price = p.get("sale_price", p.get("list_price", 0))
-        promo_until = p.get("promo_until")
-        if promo_until and today <= promo_until and p.get("promo_sale_price") is not None:
-            effective_price = p["promo_sale_price"]
-        entry = {
-            "product_id": pid,
-            "name": p.get("name", ""),
-            "sku": p.get("sku", ""),
-            "list_price": p.get("list_price", 0),
-            "sale_price": p.get("sale_price", 0),
-            "effective_price": effective_price,
-            "promo_sale_price": p.get("promo_sale_price"),
-            "promo_until": promo_until,
-            "edition": p.get("edition", ""),
-            "medium": p.get("medium", ""),
-            "type": p.get("type", ""),
-            "preorder": p.get("preorder", False),
-            "preorder_label": p.get("preorder_label"),
-            "preorder_available_on": p.get("preorder_available_on"),
-            "free": p.get("free", False),
-            "physical": p.get("physical", False),
-            "no_digital_fulfillment": p.get("no_digital_fulfillment", False),
-            "hybrid_fulfillment": p.get("hybrid_fulfillment", False),
-            "bundle_contents": p.get("bundle_contents"),
-            "shared_with": p.get("shared_with"),
-            "is_bundle": p.get("is_bundle", False),
-            "deprecated": p.get("deprecated", False),
-            "inactive": p.get("inactive", False),
-            "description": p.get("description", ""),
-            "source": "code",
-        }
-        # Skip deprecated/inactive entries from the public catalog (keeps the
-        # storefront clean; admin UI still sees them).
-        if entry["inactive"] or entry["deprecated"]:
-            continue
-        catalog.append(entry)
-        if entry["sku"]:
-            seen_skus[entry["sku"]] = len(catalog) - 1
-
-    # Merge DB-created active products (admin can publish without dev help)
-    try:
-        async for doc in db.products.find(
-            {"status": "active"},
-            {"_id": 0, "id": 1, "sku": 1, "name": 1, "description": 1,
-             "price": 1, "compare_price": 1, "type": 1, "edition": 1,
-             "series": 1, "metadata": 1, "preorder": 1, "preorder_label": 1,
-             "preorder_available_on": 1, "no_digital_fulfillment": 1,
-             "physical": 1, "promo_until": 1, "promo_sale_price": 1,
-             "shared_with": 1, "medium": 1}
-        ):
-            db_entry = {
-                "product_id": doc.get("id") or doc.get("sku"),
-                "name": doc.get("name", ""),
-                "sku": doc.get("sku", ""),
-                "list_price": float(doc.get("compare_price") or doc.get("price") or 0),
-                "sale_price": float(doc.get("price") or 0),
-                "effective_price": float(doc.get("price") or 0),
-                "promo_sale_price": doc.get("promo_sale_price"),
-                "promo_until": doc.get("promo_until"),
-                "edition": doc.get("edition", "") or "",
-                "medium": doc.get("medium", "") or "",
-                "type": doc.get("type", "") or "digital",
-                "preorder": bool(doc.get("preorder", False)),
-                "preorder_label": doc.get("preorder_label"),
-                "preorder_available_on": doc.get("preorder_available_on"),
-                "free": False,
-                "physical": bool(doc.get("physical", False)) or (doc.get("type") == "physical"),
-                "no_digital_fulfillment": bool(doc.get("no_digital_fulfillment", False)),
-                "shared_with": doc.get("shared_with"),
-                "is_bundle": False,
-                "description": doc.get("description", "") or "",
-                "source": "db",
-            }
-            sku = db_entry["sku"]
-            if sku and sku in seen_skus:
-                # Override existing entry in place (DB wins for active SKUs)
-                catalog[seen_skus[sku]] = db_entry
-            else:
-                catalog.append(db_entry)
-                if sku:
-                    seen_skus[sku] = len(catalog) - 1
-    except Exception as e:
-        print(f"[catalog] db.products merge skipped: {e}")
-
-    return {"products": catalog, "total": len(catalog)}
+    Served from a pre-serialized snapshot (see product_catalog) with a strong
+    ETag; a matching If-None-Match gets 304 Not Modified and no body.
+    """
+    snap = await product_catalog.current()
+    headers = {"ETag": snap.etag, "Cache-Control": "no-cache"}
+    if product_catalog.not_modified(request.headers.get("if-none-match"), snap.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap.body, media_type="application/json", headers=headers)
 
 
 @router.get("/catalog/csv")
@@ -2078,7 +2057,6 @@ async def process_free_order(request: FreeOrderRequest):
     import uuid
     import secrets
     import string
-    from download_protection import create_download_link
     from email_service import send_order_confirmation
     
     # Validate coupon
@@ -2109,52 +2087,45 @@ async def process_free_order(request: FreeOrderRequest):
         "updated_at": datetime.utcnow()
     }
     
-    await db.orders.insert_one(order)
+    await db.orders.insert_one(lc_keys.with_lc("orders", order))
     
     # Create download links for digital products in the free order
-    download_links = []
-    user_email = request.customer_email or "guest@soulfood.com"
-    for item in request.items:
-        product_id = item.product_id
-        # Try to get PDF path for this product
-        pdf_path = await get_pdf_path_async(product_id)        
-        if pdf_path:
+    items = [item.dict() for item in request.items]
+    run = fulfillment.FulfillmentRun(
+        order_id,
+        user_id=order_id,  # Use order_id as user_id for guests
+        user_email=request.customer_email or "guest@soulfood.com",
+        caller="Free Order",
+    )
+    await run.create_links(items)
+    download_links = [
+        {
+            "product_id": link["product_id"],
+            "product_name": link["name"],
+            "token": link["token"],
+            "expires_at": link["expires_at"].isoformat(),
+        }
+        for link in run.links
+    ]
+    
+    # Send order confirmation email if customer email provided
+    async with run.stage("email"):
+        if request.customer_email:
             try:
-                token, expires_at = await create_download_link(
+                await send_order_confirmation(
+                    to_email=request.customer_email,
                     order_id=order_id,
-                    user_id=order_id,  # Use order_id as user_id for guests
-                    user_email=user_email,
-                    product_id=product_id,
-                    product_name=item.name,
-                    file_path=pdf_path,
-                    payment_verified=True  # Free order is auto-verified
+                    items=items,
+                    total=0.00,
+                    is_free_order=True,
+                    coupon_code=request.coupon_code,
+                    download_links=download_links,
+                    customer_name=request.customer_name or "Valued Customer"
                 )
-                download_links.append({
-                    "product_id": product_id,
-                    "product_name": item.name,
-                    "token": token,
-                    "expires_at": expires_at.isoformat()
-                })
-                print(f"[Free Order] Download link created for {product_id}")
-            except Exception as dl_error:
-                print(f"[Free Order] Error creating download link for {product_id}: {dl_error}")
-    
-    # Send order confirmation email if customer email provided
-    if request.customer_email:
-        try:
-            await send_order_confirmation(
-                to_email=request.customer_email,
-                order_id=order_id,
-                items=[item.dict() for item in request.items],
-                total=0.00,
-                is_free_order=True,
-                coupon_code=request.coupon_code,
-                download_links=download_links,
-                customer_name=request.customer_name or "Valued Customer"
-            )
-            print(f"[Free Order] Confirmation email sent to {request.customer_email}")
-        except Exception as email_error:
-            print(f"[Free Order] Email send failed: {email_error}")
+                print(f"[Free Order] Confirmation email sent to {request.customer_email}")
+            except Exception as email_error:
+                print(f"[Free Order] Email send failed: {email_error}")
+    await run.finish()
     
     return {
         "success": True,
@@ -2436,7 +2407,10 @@ async def create_checkout_session(request: CheckoutRequest, http_request: Reques
             "updated_at": datetime.utcnow()
         }
         
-        await db.payment_transactions.insert_one(transaction)
+        await db.payment_transactions.insert_one(
+            order_search.with_search_keys(lc_keys.with_lc("payment_transactions", transaction))
+        )
+        await dashboard_stats.order_created(transaction)
         
         return {
             "url": session.url,
@@ -2450,10 +2424,13 @@ async def create_checkout_session(request: CheckoutRequest, http_request: Reques
 
 
 @router.post("/checkout/cart")
-async def create_cart_checkout_session(request: CartCheckoutRequest, http_request: Request):
+async def create_cart_checkout_session(
+    request: CartCheckoutRequest,
+    http_request: Request,
+    user: Optional[dict] = Depends(principal.optional_principal),
+):
     """Create a Stripe checkout session for cart items (flexible product IDs)"""
     import stripe
-    from jose import jwt, JWTError
     
     if not request.items:
         raise HTTPException(status_code=400, detail="Cart is empty")
@@ -2464,29 +2441,15 @@ async def create_cart_checkout_session(request: CartCheckoutRequest, http_reques
     logged_in_user_id = None
     logged_in_user_email = None
     logged_in_user_verified = True  # default true for guests
-    auth_header = http_request.headers.get("Authorization", "")
-    if auth_header.startswith("Bearer "):
-        token_str = auth_header.split(" ", 1)[1]
-        try:
-            SECRET_KEY = os.getenv("JWT_SECRET_KEY", "soul-food-secret-key-change-in-production-2024")
-            payload = jwt.decode(token_str, SECRET_KEY, algorithms=["HS256"])
-            uid = payload.get("sub")
-            if uid:
-                user = await db.users.find_one(
-                    {"id": uid},
-                    {"_id": 0, "id": 1, "email": 1, "email_verified": 1, "role": 1}
-                )
-                if user:
-                    logged_in_user_id = user.get("id")
-                    logged_in_user_email = user.get("email")
-                    # Admin / instructor / owner / instructor_tester accounts bypass
-                    # the verification gate (treat their work emails as trusted).
-                    privileged_roles = {"admin", "owner", "instructor", "instructor_tester", "beta_tester"}
-                    is_privileged = (user.get("role") or "").lower() in privileged_roles
-                    logged_in_user_verified = bool(user.get("email_verified", False)) or is_privileged
-                    print(f"[Checkout] Authenticated user: {logged_in_user_id} ({logged_in_user_email}) verified={logged_in_user_verified}")
-        except (JWTError, Exception) as e:
-            print(f"[Checkout] JWT decode failed (guest checkout): {e}")
+    if user:
+        logged_in_user_id = user.get("id")
+        logged_in_user_email = user.get("email")
+        # Admin / instructor / owner / instructor_tester accounts bypass
+        # the verification gate (treat their work emails as trusted).
+        privileged_roles = {"admin", "owner", "instructor", "instructor_tester", "beta_tester"}
+        is_privileged = (user.get("role") or "").lower() in privileged_roles
+        logged_in_user_verified = bool(user.get("email_verified", False)) or is_privileged
+        print(f"[Checkout] Authenticated user: {logged_in_user_id} ({logged_in_user_email}) verified={logged_in_user_verified}")
 
     # NOTE: Email-verification hard gate REMOVED from checkout per product policy.
     # Logged-in users must not be interrupted during checkout. If verification is
@@ -2786,7 +2749,10 @@ async def create_cart_checkout_session(request: CartCheckoutRequest, http_reques
             "updated_at": datetime.utcnow()
         }
         
-        await db.payment_transactions.insert_one(transaction)
+        await db.payment_transactions.insert_one(
+            order_search.with_search_keys(lc_keys.with_lc("payment_transactions", transaction))
+        )
+        await dashboard_stats.order_created(transaction)
         
         return {
             "url": session.url,
@@ -2802,15 +2768,18 @@ async def create_cart_checkout_session(request: CartCheckoutRequest, http_reques
 
 
 async def _send_order_emails(transaction: dict, download_links: list, *, only_unsent: bool = False) -> dict:
-    """Send buyer receipt + (for gifts) recipient access email INDEPENDENTLY.
-
-    Each send is isolated in its own try/except so a failure in one never blocks
-    the other. Per-email sent flags (`buyer_email_sent`, `recipient_email_sent`)
-    are persisted on the transaction so any unsent email can be re-attempted on a
-    later status poll — this removes the need for a manual admin resend when the
-    first attempt partially fails. `only_unsent=True` skips emails already sent.
+    """Queue buyer receipt + (for gifts) recipient access email INDEPENDENTLY.
+
+    Each enqueue is isolated in its own try/except so a failure in one never
+    blocks the other. Messages go through the email outbox with a per-order,
+    per-recipient dedup key; the outbox worker sets `buyer_email_sent` /
+    `recipient_email_sent` on the transaction once Resend accepts them and
+    retries failures itself. `*_email_queued` flags are persisted here so a
+    later status poll with `only_unsent=True` only re-queues what never made it
+    into the outbox.
     """
     from email_service import send_order_confirmation
+    import email_outbox
 
     session_id = transaction.get("session_id")
     order_number = transaction.get("order_number", session_id)
@@ -2827,14 +2796,23 @@ async def _send_order_emails(transaction: dict, download_links: list, *, only_un
         for d in (download_links or [])
     ] or None
 
-    buyer_sent = bool(transaction.get("buyer_email_sent"))
-    recipient_sent = bool(transaction.get("recipient_email_sent"))
+    def _track(role: str):
+        if not session_id:
+            return None
+        return email_outbox.track_flag(
+            "payment_transactions", {"session_id": session_id},
+            f"{role}_email_sent", f"{role}_email_error",
+        )
+
+    buyer_done = bool(transaction.get("buyer_email_sent") or transaction.get("buyer_email_queued"))
+    recipient_done = bool(transaction.get("recipient_email_sent") or transaction.get("recipient_email_queued"))
+    buyer_queued = recipient_queued = False
     updates = {}
 
     # 1) BUYER receipt — isolated. For a gift the buyer gets a receipt only (no tokens).
-    if customer_email and not (only_unsent and buyer_sent):
+    if customer_email and not (only_unsent and buyer_done):
         try:
-            await send_order_confirmation(
+            result = await send_order_confirmation(
                 to_email=customer_email,
                 order_id=order_number,
                 items=items,
@@ -2843,19 +2821,23 @@ async def _send_order_emails(transaction: dict, download_links: list, *, only_un
                 customer_name=customer_name,
                 recipient_email=recipient_email if is_gift else None,
                 is_buyer_receipt_only=is_gift,
+                dedup_key=f"order:{order_number}:buyer:{customer_email.lower()}",
+                track=_track("buyer"),
             )
-            buyer_sent = True
-            updates["buyer_email_sent"] = True
-            updates["buyer_email_sent_at"] = datetime.utcnow().isoformat()
-            print(f"[Emails] Buyer receipt sent to {customer_email} (order {order_number})")
+            if not (result or {}).get("success"):
+                raise RuntimeError((result or {}).get("error") or "enqueue failed")
+            buyer_queued = True
+            updates["buyer_email_queued"] = True
+            updates["buyer_email_queued_at"] = datetime.utcnow().isoformat()
+            print(f"[Emails] Buyer receipt queued for {customer_email} (order {order_number})")
         except Exception as e:
             updates["buyer_email_error"] = str(e)[:300]
             print(f"[Emails] BUYER receipt FAILED for {customer_email}: {e}")
 
     # 2) RECIPIENT access — gifts only, independent of the buyer result above.
-    if is_gift and not (only_unsent and recipient_sent):
+    if is_gift and not (only_unsent and recipient_done):
         try:
-            await send_order_confirmation(
+            result = await send_order_confirmation(
                 to_email=recipient_email,
                 order_id=order_number,
                 items=items,
@@ -2864,11 +2846,15 @@ async def _send_order_emails(transaction: dict, download_links: list, *, only_un
                 customer_name="",
                 gifted_by_email=customer_email,
                 is_recipient_access=True,
+                dedup_key=f"order:{order_number}:recipient:{recipient_email.lower()}",
+                track=_track("recipient"),
             )
-            recipient_sent = True
-            updates["recipient_email_sent"] = True
-            updates["recipient_email_sent_at"] = datetime.utcnow().isoformat()
-            print(f"[Emails] Recipient access sent to {recipient_email} (order {order_number})")
+            if not (result or {}).get("success"):
+                raise RuntimeError((result or {}).get("error") or "enqueue failed")
+            recipient_queued = True
+            updates["recipient_email_queued"] = True
+            updates["recipient_email_queued_at"] = datetime.utcnow().isoformat()
+            print(f"[Emails] Recipient access queued for {recipient_email} (order {order_number})")
         except Exception as e:
             updates["recipient_email_error"] = str(e)[:300]
             print(f"[Emails] RECIPIENT access FAILED for {recipient_email}: {e}")
@@ -2876,13 +2862,244 @@ async def _send_order_emails(transaction: dict, download_links: list, *, only_un
     if not is_gift:
         # Self-purchase has no separate recipient email → mark satisfied so
         # the retry path doesn't keep looking for one.
-        recipient_sent = True
+        recipient_queued = True
         updates.setdefault("recipient_email_sent", True)
 
     if updates and session_id:
         await db.payment_transactions.update_one({"session_id": session_id}, {"$set": updates})
 
-    return {"buyer_email_sent": buyer_sent, "recipient_email_sent": recipient_sent}
+    return {
+        "buyer_email_queued": buyer_queued or buyer_done,
+        "recipient_email_queued": recipient_queued or recipient_done,
+    }
+
+
+async def _issue_gift_certificate(item: dict, order_number: str) -> None:
+    """Create a purchased gift certificate and email it to the recipient."""
+    try:
+        metadata = item.get("metadata", {})
+        from routes.gift_certificate_routes import generate_certificate_code, CERTIFICATE_TYPES
+        from email_service import send_email, get_base_template, SUPPORT_EMAIL
+        
+        cert_type = metadata.get("certificateType", "book")
+        cert_config = CERTIFICATE_TYPES.get(cert_type, {"name": "Gift Certificate"})
+        cert_code = generate_certificate_code()
+        
+        # Ensure code is unique
+        while await db.gift_certificates.find_one({"code": cert_code}):
+            cert_code = generate_certificate_code()
+        
+        # Create the gift certificate
+        gift_cert = {
+            "code": cert_code,
+            "order_id": order_number,
+            "certificate_type": cert_type,
+            "certificate_name": cert_config.get("name", "Gift Certificate"),
+            "amount": metadata.get("amount", item.get("salePrice", 0)),
+            "balance": metadata.get("amount", item.get("salePrice", 0)),
+            "recipient_name": metadata.get("recipientName", ""),
+            "recipient_email": metadata.get("recipientEmail", ""),
+            "sender_name": metadata.get("senderName", ""),
+            "sender_email": metadata.get("senderEmail", ""),
+            "message": metadata.get("message", ""),
+            "status": "active",
+            "expires_at": datetime.utcnow() + timedelta(days=365),
+            "created_at": datetime.utcnow()
+        }
+        
+        await db.gift_certificates.insert_one(gift_cert)
+        
+        # Send email to recipient
+        FRONTEND_URL = os.environ.get('SITE_URL', os.environ.get('FRONTEND_URL', 'https://kingdom-soul.com'))
+        recipient_html = f"""
+        <div style="text-align: center; padding: 20px;">
+            <h2 style="color: #1f2937;">🎁 You've Received a Gift!</h2>
+            <p>From: <strong>{gift_cert['sender_name']}</strong></p>
+            <div style="background: linear-gradient(135deg, #fed7aa 0%, #fef3c7 100%); padding: 30px; border-radius: 12px; margin: 20px 0;">
+                <h3 style="color: #ea580c;">{cert_config.get('name', 'Gift Certificate')}</h3>
+                <p style="font-size: 36px; font-weight: bold; color: #c2410c;">${gift_cert['amount']:.2f}</p>
+            </div>
+            {f'<p style="font-style: italic;">"{gift_cert["message"]}"</p>' if gift_cert.get('message') else ''}
+            <p style="font-size: 24px; font-weight: bold; letter-spacing: 2px;">{cert_code}</p>
+            <p>Redeem at <a href="{FRONTEND_URL}/redeem-gift">{FRONTEND_URL}/redeem-gift</a></p>
+        </div>
+        """
+        
+        email_html = get_base_template(recipient_html, f"🎁 {gift_cert['sender_name']} sent you a Soul Food gift!")
+        
+        await send_email(
+            to=gift_cert["recipient_email"],
+            subject=f"🎁 {gift_cert['sender_name']} sent you a ${gift_cert['amount']:.2f} Soul Food Gift Certificate!",
+            html=email_html
+        )
+        
+        print(f"[StatusCheck] Gift certificate created and sent: {cert_code}")
+    except Exception as gc_error:
+        print(f"[StatusCheck] Error creating gift certificate: {gc_error}")
+
+
+async def _fulfill_paid_checkout(session_id: str, checkout_status: CheckoutStatusResponse, transaction: dict) -> None:
+    """Mark a checkout paid after the status poll saw Stripe report it paid,
+    then fulfill it. Caller holds the order's stripe_events lock."""
+    # Get customer email and order info
+    customer_email = transaction.get("customer_email", "")
+    # Resolve digital recipient: if purchase_type == 'gift', route digital access
+    # to digital_recipient_email; otherwise the buyer (customer_email) receives access.
+    purchase_type = (transaction.get("purchase_type") or "self").lower()
+    digital_recipient_email = (transaction.get("digital_recipient_email") or "").strip() if purchase_type == "gift" else ""
+    digital_email = digital_recipient_email if digital_recipient_email else customer_email
+    # Use stored user_id, never fall back to session_id
+    user_id = transaction.get("user_id") or transaction.get("claimed_by_user_id") or ""
+    order_number = transaction.get("order_number", session_id)
+    
+    paid_fields = lc_keys.with_lc("payment_transactions", {
+        "payment_status": "paid",
+        "status": "completed",
+        "stripe_status": checkout_status.status,
+        "stripe_amount_total": checkout_status.amount_total,
+        "customer_email": customer_email or checkout_status.metadata.get("customer_email", ""),
+        "updated_at": datetime.utcnow()
+    })
+    paid_fields["search_keys"] = order_search.search_keys({**transaction, **paid_fields})
+    flipped = await db.payment_transactions.update_one(
+        {"session_id": session_id, "payment_status": {"$ne": "paid"}},  # Only update if not already paid
+        {"$set": paid_fields}
+    )
+    if not flipped.modified_count:
+        # Paid meanwhile by the webhook worker, which fulfilled it under this lock.
+        print(f"[StatusCheck] {session_id} already paid and fulfilled elsewhere")
+        return
+    await dashboard_stats.payment_status_changed(
+        transaction.get("payment_status"), "paid", transaction.get("total_amount")
+    )
+    await entitlements.refresh_for_order(session_id)
+
+    # Increment coupon times_used so per-coupon caps (e.g. DOLLARTEST2 max 3 uses) are enforced
+    coupon_code_used = transaction.get("coupon_code")
+    if coupon_code_used:
+        try:
+            now_iso = datetime.now(timezone.utc).isoformat()
+            await db.coupons.update_one(
+                lc_keys.match("code", coupon_code_used),
+                {"$inc": {"times_used": 1}, "$set": {"updated_at": now_iso, "last_redemption_at": now_iso}}
+            )
+            # Capture per-redemption analytics for the admin reporting view
+            paid_total_cents = checkout_status.amount_total or 0
+            paid_total = (paid_total_cents / 100.0) if paid_total_cents else 0.0
+            # Compute the raw cart subtotal (pre-discount) from item prices, if available
+            subtotal_pre_discount = 0.0
+            try:
+                for itm in transaction.get("items", []) or []:
+                    ip = itm.get("price") or itm.get("salePrice") or 0
+                    iq = itm.get("quantity") or 1
+                    subtotal_pre_discount += float(ip) * int(iq)
+            except Exception:
+                subtotal_pre_discount = 0.0
+            discount_given = max(0.0, round(subtotal_pre_discount - paid_total, 2)) if subtotal_pre_discount else 0.0
+            await db.coupon_usage.insert_one({
+                "code": coupon_code_used.upper(),
+                "session_id": session_id,
+                "order_number": order_number,
+                "user_id": user_id or None,
+                "customer_email": customer_email or None,
+                "revenue": round(paid_total, 2),
+                "discount_given": discount_given,
+                "subtotal_pre_discount": round(subtotal_pre_discount, 2),
+                "redeemed_at": now_iso,
+            })
+            print(f"[StatusCheck] Coupon redeemed: {coupon_code_used} revenue=${paid_total:.2f} discount=${discount_given:.2f}")
+        except Exception as _e:
+            print(f"[StatusCheck] Failed to record coupon usage for {coupon_code_used}: {_e}")
+    
+    # Create download links for ALL items in the cart
+    items = transaction.get("items", [])
+    
+    # If single product (old format), convert to items list  
+    product_id = transaction.get("product_id")
+    if product_id and not items:
+        items = [{"product_id": product_id, "name": PRODUCTS.get(product_id, {}).get("name", product_id)}]
+    
+    # Gift certificates are issued here; everything else goes through the
+    # fulfillment engine (resolve → verify → links → record → grants).
+    fulfillable = []
+    for item in items:
+        raw_id = item.get("normalized_product_id") or item.get("product_id") or item.get("id") or item.get("uniqueKey", "")
+        item_name = item.get("name", raw_id)
+
+        print(f"[StatusCheck] Item: raw_id={raw_id}, name={item_name[:60]}")
+
+        if raw_id.startswith('gift_certificate_') or item.get("isGiftCertificate"):
+            await _issue_gift_certificate(item, order_number)
+            continue
+        fulfillable.append(item)
+
+    run = fulfillment.FulfillmentRun(order_number, user_id=user_id, user_email=digital_email, caller="StatusCheck")
+    download_links_created = await run.create_links(fulfillable)
+
+    # Stash verification failures so Admin Orders + frontend can see them.
+    await run.record({"session_id": session_id}, extra={
+        "fulfillment_completed_at": datetime.utcnow().isoformat(),
+        "email_dl_payload": [
+            {"token": d["token"], "name": d["name"]} for d in download_links_created
+        ],
+    })
+
+    await run.grant(items, email=digital_email, user_id=transaction.get("user_id") or "")
+
+    # Send confirmation email(s)
+    #  • Self-purchase: single email to buyer with everything (current behavior)
+    #  • Gift-to-recipient: buyer gets RECEIPT ONLY (no download links);
+    #                       recipient gets ACCESS ONLY (download links + spam note)
+    async with run.stage("email"):
+        if customer_email:
+            try:
+                from email_service import send_preorder_confirmation, send_game_pass_access
+
+                # Classify items by type
+                has_preorder = any(item.get("preorder") or "Pre-Order" in item.get("name", "") or "preorder" in item.get("id", "").lower() for item in items)
+                has_game_pass = any("gaming-pass" in item.get("id", "").lower() or "game" in item.get("name", "").lower() for item in items)
+                customer_name = transaction.get("customer_name", "")
+                total = transaction.get("total_amount", 0)
+                is_gift_purchase = (purchase_type == "gift" and digital_recipient_email)
+
+                # BUYER receipt + (for gifts) RECIPIENT access — sent INDEPENDENTLY
+                # and retryable. Re-read the transaction so the helper sees the
+                # freshly-persisted email_dl_payload / flags.
+                tx_now = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0}) or transaction
+                await _send_order_emails(tx_now, download_links_created)
+
+                # Send preorder confirmation if applicable (always to digital_email)
+                if has_preorder:
+                    preorder_items = [i for i in items if i.get("preorder") or "Pre-Order" in i.get("name", "")]
+                    try:
+                        await send_preorder_confirmation(
+                            to_email=digital_email,
+                            order_id=order_number,
+                            items=preorder_items,
+                            total=total,
+                            delivery_month="Spring 2026",
+                            courtesy_links=[{"token": dl["token"], "product_name": dl["name"]} for dl in download_links_created[:2]] if download_links_created else None,
+                            customer_name="" if is_gift_purchase else customer_name
+                        )
+                    except Exception as pe:
+                        print(f"[Status Check] Error sending preorder email: {pe}")
+
+                # Send game pass email if applicable (always to digital_email)
+                if has_game_pass:
+                    pass_type = "90-Day" if any("90" in i.get("name", "") for i in items if "game" in i.get("name", "").lower()) else "30-Day"
+                    try:
+                        await send_game_pass_access(
+                            to_email=digital_email,
+                            order_id=order_number,
+                            pass_type=pass_type,
+                            customer_name="" if is_gift_purchase else customer_name
+                        )
+                    except Exception as ge:
+                        print(f"[Status Check] Error sending game pass email: {ge}")
+            except Exception as email_error:
+                print(f"[Status Check] Error sending email: {email_error}")
+
+    await run.finish()
 
 
 @router.get("/checkout/status/{session_id}")
@@ -2907,289 +3124,15 @@ async def get_checkout_status(session_id: str):
         if not transaction:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
-        # Update transaction status if payment is complete and not already processed
+        # Update transaction status if payment is complete and not already processed.
+        # Serialized with the Stripe webhook worker for this session: if it holds
+        # the order it is fulfilling it right now, and the next poll sees the result.
         if checkout_status.payment_status == "paid" and transaction["payment_status"] != "paid":
-            from download_protection import create_download_link
-            
-            # Get customer email and order info
-            customer_email = transaction.get("customer_email", "")
-            # Resolve digital recipient: if purchase_type == 'gift', route digital access
-            # to digital_recipient_email; otherwise the buyer (customer_email) receives access.
-            purchase_type = (transaction.get("purchase_type") or "self").lower()
-            digital_recipient_email = (transaction.get("digital_recipient_email") or "").strip() if purchase_type == "gift" else ""
-            digital_email = digital_recipient_email if digital_recipient_email else customer_email
-            # Use stored user_id, never fall back to session_id
-            user_id = transaction.get("user_id") or transaction.get("claimed_by_user_id") or ""
-            order_number = transaction.get("order_number", session_id)
-            
-            await db.payment_transactions.update_one(
-                {"session_id": session_id, "payment_status": {"$ne": "paid"}},  # Only update if not already paid
-                {
-                    "$set": {
-                        "payment_status": "paid",
-                        "status": "completed",
-                        "stripe_status": checkout_status.status,
-                        "stripe_amount_total": checkout_status.amount_total,
-                        "customer_email": customer_email or checkout_status.metadata.get("customer_email", ""),
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
-
-            # Increment coupon times_used so per-coupon caps (e.g. DOLLARTEST2 max 3 uses) are enforced
-            coupon_code_used = transaction.get("coupon_code")
-            if coupon_code_used:
-                try:
-                    import re as _re
-                    now_iso = datetime.now(timezone.utc).isoformat()
-                    await db.coupons.update_one(
-                        {"code": {"$regex": "^" + _re.escape(coupon_code_used) + "$", "$options": "i"}},
-                        {"$inc": {"times_used": 1}, "$set": {"updated_at": now_iso, "last_redemption_at": now_iso}}
-                    )
-                    # Capture per-redemption analytics for the admin reporting view
-                    paid_total_cents = checkout_status.amount_total or 0
-                    paid_total = (paid_total_cents / 100.0) if paid_total_cents else 0.0
-                    # Compute the raw cart subtotal (pre-discount) from item prices, if available
-                    subtotal_pre_discount = 0.0
-                    try:
-                        for itm in transaction.get("items", []) or []:
-                            ip = itm.get("price") or itm.get("salePrice") or 0
-                            iq = itm.get("quantity") or 1
-                            subtotal_pre_discount += float(ip) * int(iq)
-                    except Exception:
-                        subtotal_pre_discount = 0.0
-                    discount_given = max(0.0, round(subtotal_pre_discount - paid_total, 2)) if subtotal_pre_discount else 0.0
-                    await db.coupon_usage.insert_one({
-                        "code": coupon_code_used.upper(),
-                        "session_id": session_id,
-                        "order_number": order_number,
-                        "user_id": user_id or None,
-                        "customer_email": customer_email or None,
-                        "revenue": round(paid_total, 2),
-                        "discount_given": discount_given,
-                        "subtotal_pre_discount": round(subtotal_pre_discount, 2),
-                        "redeemed_at": now_iso,
-                    })
-                    print(f"[StatusCheck] Coupon redeemed: {coupon_code_used} revenue=${paid_total:.2f} discount=${discount_given:.2f}")
-                except Exception as _e:
-                    print(f"[StatusCheck] Failed to record coupon usage for {coupon_code_used}: {_e}")
-            
-            # Create download links for ALL items in the cart
-            items = transaction.get("items", [])
-            
-            # If single product (old format), convert to items list  
-            product_id = transaction.get("product_id")
-            if product_id and not items:
-                items = [{"product_id": product_id, "name": PRODUCTS.get(product_id, {}).get("name", product_id)}]
-            
-            download_links_created = []
-            verification_failures: list = []
-            for item in items:
-                raw_id = item.get("normalized_product_id") or item.get("product_id") or item.get("id") or item.get("uniqueKey", "")
-                item_name = item.get("name", raw_id)
-                
-                print(f"[StatusCheck] Item: raw_id={raw_id}, name={item_name[:60]}")
-                
-                # Check if this is a gift certificate item
-                if raw_id.startswith('gift_certificate_') or item.get("isGiftCertificate"):
-                    # Process gift certificate
-                    try:
-                        metadata = item.get("metadata", {})
-                        from routes.gift_certificate_routes import generate_certificate_code, CERTIFICATE_TYPES
-                        from email_service import send_email, get_base_template, SUPPORT_EMAIL
-                        
-                        cert_type = metadata.get("certificateType", "book")
-                        cert_config = CERTIFICATE_TYPES.get(cert_type, {"name": "Gift Certificate"})
-                        cert_code = generate_certificate_code()
-                        
-                        # Ensure code is unique
-                        while await db.gift_certificates.find_one({"code": cert_code}):
-                            cert_code = generate_certificate_code()
-                        
-                        # Create the gift certificate
-                        gift_cert = {
-                            "code": cert_code,
-                            "order_id": order_number,
-                            "certificate_type": cert_type,
-                            "certificate_name": cert_config.get("name", "Gift Certificate"),
-                            "amount": metadata.get("amount", item.get("salePrice", 0)),
-                            "balance": metadata.get("amount", item.get("salePrice", 0)),
-                            "recipient_name": metadata.get("recipientName", ""),
-                            "recipient_email": metadata.get("recipientEmail", ""),
-                            "sender_name": metadata.get("senderName", ""),
-                            "sender_email": metadata.get("senderEmail", ""),
-                            "message": metadata.get("message", ""),
-                            "status": "active",
-                            "expires_at": datetime.utcnow() + timedelta(days=365),
-                            "created_at": datetime.utcnow()
-                        }
-                        
-                        await db.gift_certificates.insert_one(gift_cert)
-                        
-                        # Send email to recipient
-                        FRONTEND_URL = os.environ.get('SITE_URL', os.environ.get('FRONTEND_URL', 'https://kingdom-soul.com'))
-                        recipient_html = f"""
-                        <div style="text-align: center; padding: 20px;">
-                            <h2 style="color: #1f2937;">🎁 You've Received a Gift!</h2>
-                            <p>From: <strong>{gift_cert['sender_name']}</strong></p>
-                            <div style="background: linear-gradient(135deg, #fed7aa 0%, #fef3c7 100%); padding: 30px; border-radius: 12px; margin: 20px 0;">
-                                <h3 style="color: #ea580c;">{cert_config.get('name', 'Gift Certificate')}</h3>
-                                <p style="font-size: 36px; font-weight: bold; color: #c2410c;">${gift_cert['amount']:.2f}</p>
-                            </div>
-                            {f'<p style="font-style: italic;">"{gift_cert["message"]}"</p>' if gift_cert.get('message') else ''}
-                            <p style="font-size: 24px; font-weight: bold; letter-spacing: 2px;">{cert_code}</p>
-                            <p>Redeem at <a href="{FRONTEND_URL}/redeem-gift">{FRONTEND_URL}/redeem-gift</a></p>
-                        </div>
-                        """
-                        
-                        email_html = get_base_template(recipient_html, f"🎁 {gift_cert['sender_name']} sent you a Soul Food gift!")
-                        
-                        await send_email(
-                            to=gift_cert["recipient_email"],
-                            subject=f"🎁 {gift_cert['sender_name']} sent you a ${gift_cert['amount']:.2f} Soul Food Gift Certificate!",
-                            html=email_html
-                        )
-                        
-                        print(f"[StatusCheck] Gift certificate created and sent: {cert_code}")
-                    except Exception as gc_error:
-                        print(f"[StatusCheck] Error creating gift certificate: {gc_error}")
-                    continue
-                
-                # Resolve item to file entries (attachment-first, POD-aware)
-                file_entries = await resolve_item_to_file_entries_async(item)
-                
-                print(f"[StatusCheck] Resolved to {len(file_entries)} file entries: {[e['file_key'] for e in file_entries]}")
-                
-                if not file_entries:
-                    print(f"[StatusCheck] No downloadable file for: {item_name} (raw_id={raw_id})")
-                    continue
-
-                # Verify each file is retrievable BEFORE creating download links.
-                # Entries that fail verification are NOT fulfilled and NOT rendered
-                # as download buttons on the frontend.
-                verified_entries, verify_failures = await _verified_entries_for_fulfillment(
-                    file_entries, caller="StatusCheck"
-                )
-                verification_failures.extend(verify_failures)
-
-                for entry in verified_entries:
-                    pdf_path = entry["pdf_path"]
-                    print(f"[StatusCheck] file_key={entry['file_key']} -> pdf_path={pdf_path} (verified)")
-                    try:
-                        token, expires_at = await create_download_link(
-                            order_id=order_number,
-                            user_id=user_id,
-                            user_email=digital_email or "no-email@placeholder.com",
-                            product_id=entry["file_key"],
-                            product_name=entry["name"],
-                            file_path=pdf_path,
-                            payment_verified=True
-                        )
-                        download_links_created.append({
-                            "product_id": entry["file_key"],
-                            "name": entry["name"],
-                            "token": token
-                        })
-                        print(f"[StatusCheck] SUCCESS: Download link for {entry['name']} ({entry['file_key']})")
-                    except Exception as dl_error:
-                        print(f"[StatusCheck] ERROR: Creating download link for {entry['name']}: {dl_error}")
-                        import traceback
-                        traceback.print_exc()
-                        verification_failures.append({**entry, "reason": "link_creation_error", "error": str(dl_error)})
-            
-            print(f"[StatusCheck] Fulfillment complete: {len(download_links_created)} download links created; "
-                  f"{len(verification_failures)} verification/link failures")
-            
-            # Update order status to fulfilled — ONLY if at least one verified link was created.
-            # Stash verification failures so Admin Orders + frontend can see them.
-            update_fields = {
-                "download_links_generated": len(download_links_created) > 0,
-                "downloads_count": len(download_links_created),
-                "fulfillment_completed_at": datetime.utcnow().isoformat(),
-                "email_dl_payload": [
-                    {"token": d["token"], "name": d["name"]} for d in download_links_created
-                ] if download_links_created else [],
-                "fulfillment_verification_failures": [
-                    {k: v for k, v in f.items() if k in ("file_key", "product_id", "name", "pdf_path", "reason", "error")}
-                    for f in verification_failures
-                ],
-            }
-            if download_links_created:
-                update_fields["status"] = "fulfilled"
-            else:
-                # No verified deliverable → keep status as-is (typically 'paid') and record that
-                # fulfillment is pending verification.
-                update_fields["fulfillment_status"] = "pending_verification"
-            
-            await db.payment_transactions.update_one(
-                {"session_id": session_id},
-                {"$set": update_fields}
-            )
-            
-            # Grant audio access for Holiday/4C series purchases
-            await _grant_audio_access_for_items(items, digital_email)
-            # Grant game-pass entitlement (1hr/3hr cumulative) for any game-pass items
-            try:
-                await _grant_game_pass_for_items(
-                    items=items,
-                    user_id=transaction.get("user_id") or "",
-                    customer_email=digital_email,
-                    order_number=order_number,
-                )
-            except Exception as gp_err:
-                print(f"[Status Check] Error granting game pass: {gp_err}")
-            
-            # Send confirmation email(s)
-            #  • Self-purchase: single email to buyer with everything (current behavior)
-            #  • Gift-to-recipient: buyer gets RECEIPT ONLY (no download links);
-            #                       recipient gets ACCESS ONLY (download links + spam note)
-            if customer_email:
-                try:
-                    from email_service import send_preorder_confirmation, send_game_pass_access
-
-                    # Classify items by type
-                    has_preorder = any(item.get("preorder") or "Pre-Order" in item.get("name", "") or "preorder" in item.get("id", "").lower() for item in items)
-                    has_game_pass = any("gaming-pass" in item.get("id", "").lower() or "game" in item.get("name", "").lower() for item in items)
-                    customer_name = transaction.get("customer_name", "")
-                    total = transaction.get("total_amount", 0)
-                    is_gift_purchase = (purchase_type == "gift" and digital_recipient_email)
-
-                    # BUYER receipt + (for gifts) RECIPIENT access — sent INDEPENDENTLY
-                    # and retryable. Re-read the transaction so the helper sees the
-                    # freshly-persisted email_dl_payload / flags.
-                    tx_now = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0}) or transaction
-                    await _send_order_emails(tx_now, download_links_created)
-
-                    # Send preorder confirmation if applicable (always to digital_email)
-                    if has_preorder:
-                        preorder_items = [i for i in items if i.get("preorder") or "Pre-Order" in i.get("name", "")]
-                        try:
-                            await send_preorder_confirmation(
-                                to_email=digital_email,
-                                order_id=order_number,
-                                items=preorder_items,
-                                total=total,
-                                delivery_month="Spring 2026",
-                                courtesy_links=[{"token": dl["token"], "product_name": dl["name"]} for dl in download_links_created[:2]] if download_links_created else None,
-                                customer_name="" if is_gift_purchase else customer_name
-                            )
-                        except Exception as pe:
-                            print(f"[Status Check] Error sending preorder email: {pe}")
-
-                    # Send game pass email if applicable (always to digital_email)
-                    if has_game_pass:
-                        pass_type = "90-Day" if any("90" in i.get("name", "") for i in items if "game" in i.get("name", "").lower()) else "30-Day"
-                        try:
-                            await send_game_pass_access(
-                                to_email=digital_email,
-                                order_id=order_number,
-                                pass_type=pass_type,
-                                customer_name="" if is_gift_purchase else customer_name
-                            )
-                        except Exception as ge:
-                            print(f"[Status Check] Error sending game pass email: {ge}")
-                except Exception as email_error:
-                    print(f"[Status Check] Error sending email: {email_error}")
+            async with stripe_events.order_lock(session_id) as locked:
+                if locked:
+                    await _fulfill_paid_checkout(session_id, checkout_status, transaction)
+                else:
+                    print(f"[StatusCheck] {session_id} is being fulfilled by the webhook worker")
         
         elif checkout_status.status == "expired" and transaction["status"] != "expired":
             await db.payment_transactions.update_one(
@@ -3211,7 +3154,9 @@ async def get_checkout_status(session_id: str):
                 purchase_type = (transaction.get("purchase_type") or "self").lower()
                 recipient_email = (transaction.get("digital_recipient_email") or "").strip()
                 is_gift = bool(purchase_type == "gift" and recipient_email)
-                needs_retry = (not transaction.get("buyer_email_sent")) or (is_gift and not transaction.get("recipient_email_sent"))
+                buyer_done = transaction.get("buyer_email_sent") or transaction.get("buyer_email_queued")
+                recipient_done = transaction.get("recipient_email_sent") or transaction.get("recipient_email_queued")
+                needs_retry = (not buyer_done) or (is_gift and not recipient_done)
                 if needs_retry:
                     dl = transaction.get("email_dl_payload") or []
                     dl_links = [{"token": d.get("token"), "name": d.get("name") or d.get("product_name", "")} for d in dl]
@@ -3245,8 +3190,9 @@ async def stripe_webhook(request: Request):
       * /api/payments/webhook/stripe  (canonical)
       * /api/payments/webhook
       * /api/payments/webhook/        (trailing slash — what Stripe sometimes sends)
-    All three delegate to this single handler."""
-    from download_protection import create_download_link
+    All three delegate to this single handler. The event is only verified
+    and recorded here (see stripe_events); fulfillment runs on a worker in
+    _process_checkout_completed."""
     import logging
     logger = logging.getLogger(__name__)
     
@@ -3282,253 +3228,218 @@ async def stripe_webhook(request: Request):
         logger.info(f"Webhook event type: {webhook_response.event_type}")
         print(f"Webhook event type: {webhook_response.event_type}")
         
-        # Process the webhook event
-        if webhook_response.event_type == "checkout.session.completed":
-            # Get session ID and find transaction
-            session_id = webhook_response.session_id
-            logger.info(f"Processing checkout.session.completed for session: {session_id}")
-            print(f"Processing checkout.session.completed for session: {session_id}")
-            
-            transaction = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
-            
-            if transaction:
-                logger.info(f"Found transaction for session {session_id}: order {transaction.get('order_number')}")
-                print(f"Found transaction for session {session_id}: order {transaction.get('order_number')}")
-                # Update transaction status
-                await db.payment_transactions.update_one(
-                    {"session_id": session_id, "payment_status": {"$ne": "paid"}},
-                    {
-                        "$set": {
-                            "payment_status": "paid",
-                            "status": "completed",
-                            "webhook_processed": True,
-                            "updated_at": datetime.utcnow()
-                        }
-                    }
-                )
-                
-                # Get customer email and user identity for fulfillment
-                customer_email = transaction.get("customer_email") or webhook_response.metadata.get("customer_email", "")
-                # User ID resolution: transaction record (set at checkout) > Stripe metadata > empty string
-                # NEVER fall back to session_id — it is not a user identity
-                user_id = transaction.get("user_id") or transaction.get("claimed_by_user_id") or webhook_response.metadata.get("user_id", "") or ""
-                order_number = transaction.get("order_number", session_id)
-                
-                if user_id:
-                    print(f"[Webhook] Fulfilling for authenticated user: {user_id}")
-                else:
-                    print(f"[Webhook] Guest purchase — no user_id, email: {customer_email}")
-                
-                # Create download links for ALL items in the cart
-                items = transaction.get("items", [])
-                
-                # If single product (old format), convert to items list
-                product_id = transaction.get("product_id")
-                if product_id and not items:
-                    items = [{"product_id": product_id, "name": PRODUCTS.get(product_id, {}).get("name", product_id)}]
-                
-                print(f"[Webhook] Processing {len(items)} item(s) for fulfillment")
-                
-                download_links_created = []
-                verification_failures: list = []
-                for item in items:
-                    raw_id = item.get("normalized_product_id") or item.get("product_id") or item.get("id") or item.get("uniqueKey", "")
-                    item_name = item.get("name", raw_id)
-                    
-                    print(f"[Webhook] Item: raw_id={raw_id}, name={item_name[:60]}")
-                    
-                    # Resolve item to file entries (attachment-first, POD-aware)
-                    file_entries = await resolve_item_to_file_entries_async(item)
-                    
-                    print(f"[Webhook] Resolved to {len(file_entries)} file entries: {[e['file_key'] for e in file_entries]}")
-                    
-                    if not file_entries:
-                        print(f"[Webhook] No downloadable file for: {item_name} (raw_id={raw_id})")
-                        continue
-
-                    # Verify each file is retrievable BEFORE creating download links.
-                    verified_entries, verify_failures = await _verified_entries_for_fulfillment(
-                        file_entries, caller="Webhook"
-                    )
-                    verification_failures.extend(verify_failures)
-
-                    for entry in verified_entries:
-                        pdf_path = entry["pdf_path"]
-                        print(f"[Webhook] file_key={entry['file_key']} -> pdf_path={pdf_path} (verified)")
-                        try:
-                            token, expires_at = await create_download_link(
-                                order_id=order_number,
-                                user_id=user_id,
-                                user_email=customer_email or "no-email@placeholder.com",
-                                product_id=entry["file_key"],
-                                product_name=entry["name"],
-                                file_path=pdf_path,
-                                payment_verified=True
-                            )
-                            download_links_created.append({
-                                "product_id": entry["file_key"],
-                                "name": entry["name"],
-                                "token": token
-                            })
-                            print(f"[Webhook] SUCCESS: Download link created for {entry['name']} ({entry['file_key']})")
-                        except Exception as dl_error:
-                            print(f"[Webhook] ERROR: Creating download link for {entry['name']}: {dl_error}")
-                            import traceback
-                            traceback.print_exc()
-                            verification_failures.append({**entry, "reason": "link_creation_error", "error": str(dl_error)})
-                
-                print(f"[Webhook] Fulfillment complete: {len(download_links_created)} download links created; "
-                      f"{len(verification_failures)} verification/link failures")
-                
-                # Update order status to fulfilled — ONLY if at least one verified link was created.
-                update_fields = {
-                    "download_links_generated": len(download_links_created) > 0,
-                    "downloads_count": len(download_links_created),
-                    "fulfillment_completed_at": datetime.utcnow().isoformat(),
-                    "fulfillment_verification_failures": [
-                        {k: v for k, v in f.items() if k in ("file_key", "product_id", "name", "pdf_path", "reason", "error")}
-                        for f in verification_failures
-                    ],
-                }
-                if download_links_created:
-                    update_fields["status"] = "fulfilled"
-                else:
-                    update_fields["fulfillment_status"] = "pending_verification"
-                
-                await db.payment_transactions.update_one(
-                    {"session_id": session_id},
-                    {"$set": update_fields}
-                )
-                
-                # Grant audio access for Holiday/4C series purchases
-                await _grant_audio_access_for_items(items, customer_email)
-                # Grant game-pass entitlement (1hr/3hr cumulative)
-                try:
-                    await _grant_game_pass_for_items(
-                        items=items,
-                        user_id=transaction.get("user_id") or "",
-                        customer_email=customer_email,
-                        order_number=order_number,
-                    )
-                except Exception as gp_err:
-                    print(f"[Webhook] Error granting game pass: {gp_err}")
-                if customer_email:
-                    try:
-                        from email_service import send_order_confirmation
-                        
-                        # Get customer phone from transaction
-                        customer_phone = transaction.get("customer_phone", "")
-                        
-                        # Check for physical book purchases and generate audio codes
-                        audio_codes_generated = []
-                        for item in items:
-                            item_product_id = item.get("product_id") or item.get("id") or item.get("uniqueKey", "")
-                            # Check if this is a physical book (print version)
-                            if "print" in item_product_id.lower() or item.get("format") == "print":
-                                # Determine which series this belongs to
-                                series_id = None
-                                if "holiday" in item_product_id.lower():
-                                    series_id = "holiday"
-                                elif "breakfast" in item_product_id.lower():
-                                    series_id = "breakfast"
-                                elif "lunch" in item_product_id.lower():
-                                    series_id = "lunch"
-                                elif "dinner" in item_product_id.lower():
-                                    series_id = "dinner"
-                                elif "supper" in item_product_id.lower():
-                                    series_id = "supper"
-                                
-                                # Determine edition from product ID
-                                edition = "adult"
-                                if "-ye-" in item_product_id.lower() or "youth" in item_product_id.lower():
-                                    edition = "youth"
-                                elif "-ie-" in item_product_id.lower() or "instructor" in item_product_id.lower():
-                                    edition = "instructor"
-                                
-                                if series_id:
-                                    try:
-                                        # Import and call audio code generator
-                                        from audio_routes import generate_audio_code, AUDIO_CONTENT
-                                        
-                                        # Only generate if series has audio content
-                                        if series_id in AUDIO_CONTENT and AUDIO_CONTENT[series_id].get("lessons"):
-                                            # Generate trackable code with new format
-                                            code = generate_audio_code(
-                                                series_id=series_id,
-                                                edition=edition,
-                                                lesson_number=0,  # 0 = full bundle
-                                                phone=customer_phone
-                                            )
-                                            series_info = AUDIO_CONTENT[series_id]
-                                            
-                                            # Parse code for tracking
-                                            code_parts = code.split("-")
-                                            phone_part = code_parts[1] if len(code_parts) > 1 else ""
-                                            
-                                            # Store the code with tracking metadata
-                                            code_record = {
-                                                "code": code,
-                                                "series_id": series_id,
-                                                "series_name": series_info["name"],
-                                                "order_id": order_number,
-                                                "customer_email": customer_email.lower(),
-                                                "customer_phone_last5": phone_part,
-                                                "edition": edition,
-                                                "lesson_number": 0,
-                                                "is_physical_purchase": True,
-                                                "lessons_included": [lesson["id"] for lesson in series_info["lessons"]],
-                                                "redeemed": False,
-                                                "redeemed_at": None,
-                                                "redeemed_by_email": None,
-                                                "created_at": datetime.utcnow().isoformat(),
-                                                "expires_at": None
-                                            }
-                                            await db.audio_codes.insert_one(code_record)
-                                            
-                                            audio_codes_generated.append({
-                                                "code": code,
-                                                "series_name": series_info["name"],
-                                                "series_id": series_id,
-                                                "edition": edition
-                                            })
-                                            print(f"[Webhook] Audio code {code} generated for {series_info['name']} ({edition} edition)")
-                                    except Exception as audio_error:
-                                        print(f"[Webhook] Error generating audio code: {audio_error}")
-                        
-                        await send_order_confirmation(
-                            to_email=customer_email,
-                            order_id=order_number,
-                            items=items,
-                            total=transaction.get("total_amount", 0),
-                            download_links=[{"token": dl["token"], "product_name": dl["name"]} for dl in download_links_created] if download_links_created else None,
-                            customer_name=transaction.get("customer_name"),
-                            audio_codes=audio_codes_generated if audio_codes_generated else None
-                        )
-                        print(f"[Webhook] Order confirmation email sent to {customer_email}")
-                    except Exception as email_error:
-                        print(f"[Webhook] Error sending email: {email_error}")
-                
-                # Award rewards points (1 point per $10 spent)
-                try:
-                    from auth_routes_v2 import award_rewards_points
-                    total_spent = transaction.get("total_amount", 0)
-                    points_awarded = await award_rewards_points(user_id, total_spent, order_number)
-                    if points_awarded > 0:
-                        print(f"[Webhook] Awarded {points_awarded} rewards points to {user_id}")
-                except Exception as points_error:
-                    print(f"[Webhook] Error awarding points: {points_error}")
-            else:
-                # Transaction not found - log this critical issue
-                logger.error(f"CRITICAL: Transaction not found for session {session_id}")
-                print(f"CRITICAL: Transaction not found for session {session_id}")
-                # Still return success to prevent Stripe retries, but log the issue
-        
-        return {"status": "success", "event_type": webhook_response.event_type}
+        # Persist and acknowledge right away; stripe_events workers do the
+        # processing. A redelivered event id is acknowledged as a duplicate.
+        event_id = getattr(webhook_response, "event_id", None) or json.loads(body).get("id")
+        if not event_id:
+            raise HTTPException(status_code=400, detail="Missing Stripe event id")
+        ledger = await stripe_events.record(
+            event_id,
+            webhook_response.event_type,
+            session_id=webhook_response.session_id,
+            metadata=webhook_response.metadata,
+        )
+        print(f"[Webhook] {webhook_response.event_type} {event_id}: "
+              f"{'duplicate' if ledger['duplicate'] else ledger['status']}")
+
+        return {"status": "success", "event_type": webhook_response.event_type,
+                "event_id": event_id, "duplicate": ledger["duplicate"]}
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Webhook error: {str(e)}")
 
 
+async def _fulfill_webhook_checkout(transaction: dict, items: list, *, customer_email: str,
+                                    user_id: str, order_number: str, session_id: str) -> None:
+    """Webhook-side fulfillment of a paid session: links, grants, confirmation email."""
+    run = fulfillment.FulfillmentRun(order_number, user_id=user_id, user_email=customer_email, caller="Webhook")
+    download_links_created = await run.create_links(items)
+    await run.record({"session_id": session_id},
+                     extra={"fulfillment_completed_at": datetime.utcnow().isoformat()})
+    await run.grant(items, email=customer_email, user_id=transaction.get("user_id") or "")
+    async with run.stage("email"):
+        if customer_email:
+            try:
+                from email_service import send_order_confirmation
+
+                # Get customer phone from transaction
+                customer_phone = transaction.get("customer_phone", "")
+
+                # Check for physical book purchases and generate audio codes
+                audio_codes_generated = []
+                for item in items:
+                    item_product_id = item.get("product_id") or item.get("id") or item.get("uniqueKey", "")
+                    # Check if this is a physical book (print version)
+                    if "print" in item_product_id.lower() or item.get("format") == "print":
+                        # Determine which series this belongs to
+                        series_id = None
+                        if "holiday" in item_product_id.lower():
+                            series_id = "holiday"
+                        elif "breakfast" in item_product_id.lower():
+                            series_id = "breakfast"
+                        elif "lunch" in item_product_id.lower():
+                            series_id = "lunch"
+                        elif "dinner" in item_product_id.lower():
+                            series_id = "dinner"
+                        elif "supper" in item_product_id.lower():
+                            series_id = "supper"
+
+                        # Determine edition from product ID
+                        edition = "adult"
+                        if "-ye-" in item_product_id.lower() or "youth" in item_product_id.lower():
+                            edition = "youth"
+                        elif "-ie-" in item_product_id.lower() or "instructor" in item_product_id.lower():
+                            edition = "instructor"
+
+                        if series_id:
+                            try:
+                                # Import and call audio code generator
+                                from audio_routes import generate_audio_code, AUDIO_CONTENT
+
+                                # Only generate if series has audio content
+                                if series_id in AUDIO_CONTENT and AUDIO_CONTENT[series_id].get("lessons"):
+                                    # Generate trackable code with new format
+                                    code = generate_audio_code(
+                                        series_id=series_id,
+                                        edition=edition,
+                                        lesson_number=0,  # 0 = full bundle
+                                        phone=customer_phone
+                                    )
+                                    series_info = AUDIO_CONTENT[series_id]
+
+                                    # Parse code for tracking
+                                    code_parts = code.split("-")
+                                    phone_part = code_parts[1] if len(code_parts) > 1 else ""
+
+                                    # Store the code with tracking metadata
+                                    code_record = {
+                                        "code": code,
+                                        "series_id": series_id,
+                                        "series_name": series_info["name"],
+                                        "order_id": order_number,
+                                        "customer_email": customer_email.lower(),
+                                        "customer_phone_last5": phone_part,
+                                        "edition": edition,
+                                        "lesson_number": 0,
+                                        "is_physical_purchase": True,
+                                        "lessons_included": [lesson["id"] for lesson in series_info["lessons"]],
+                                        "redeemed": False,
+                                        "redeemed_at": None,
+                                        "redeemed_by_email": None,
+                                        "created_at": datetime.utcnow().isoformat(),
+                                        "expires_at": None
+                                    }
+                                    await db.audio_codes.insert_one(code_record)
+
+                                    audio_codes_generated.append({
+                                        "code": code,
+                                        "series_name": series_info["name"],
+                                        "series_id": series_id,
+                                        "edition": edition
+                                    })
+                                    print(f"[Webhook] Audio code {code} generated for {series_info['name']} ({edition} edition)")
+                            except Exception as audio_error:
+                                print(f"[Webhook] Error generating audio code: {audio_error}")
+
+                await send_order_confirmation(
+                    to_email=customer_email,
+                    order_id=order_number,
+                    items=items,
+                    total=transaction.get("total_amount", 0),
+                    download_links=[{"token": dl["token"], "product_name": dl["name"]} for dl in download_links_created] if download_links_created else None,
+                    customer_name=transaction.get("customer_name"),
+                    audio_codes=audio_codes_generated if audio_codes_generated else None,
+                    dedup_key=f"order:{order_number}:webhook:{(customer_email or '').lower()}",
+                )
+                print(f"[Webhook] Order confirmation email queued for {customer_email}")
+            except Exception as email_error:
+                print(f"[Webhook] Error sending email: {email_error}")
+
+    await run.finish()
+
+
+@stripe_events.handler("checkout.session.completed")
+async def _process_checkout_completed(event: dict) -> None:
+    """Fulfill a paid checkout session. Runs on a stripe_events worker,
+    serialized per session, after stripe_webhook recorded the event."""
+    import logging
+    logger = logging.getLogger(__name__)
+
+    session_id = event.get("session_id")
+    metadata = event.get("metadata") or {}
+    logger.info(f"Processing checkout.session.completed for session: {session_id}")
+    print(f"Processing checkout.session.completed for session: {session_id}")
+
+    transaction = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
+    if not transaction:
+        # Transaction not found - log this critical issue (not retried: it won't appear later)
+        logger.error(f"CRITICAL: Transaction not found for session {session_id}")
+        print(f"CRITICAL: Transaction not found for session {session_id}")
+        return
+
+    logger.info(f"Found transaction for session {session_id}: order {transaction.get('order_number')}")
+    print(f"Found transaction for session {session_id}: order {transaction.get('order_number')}")
+
+    # Update transaction status
+    flipped = await db.payment_transactions.update_one(
+        {"session_id": session_id, "payment_status": {"$ne": "paid"}},
+        {
+            "$set": {
+                "payment_status": "paid",
+                "status": "completed",
+                "webhook_processed": True,
+                "updated_at": datetime.utcnow()
+            }
+        }
+    )
+    if flipped.modified_count:
+        await dashboard_stats.payment_status_changed(
+            transaction.get("payment_status"), "paid", transaction.get("total_amount")
+        )
+    await entitlements.refresh_for_order(session_id)
+
+    # Get customer email and user identity for fulfillment
+    customer_email = transaction.get("customer_email") or metadata.get("customer_email", "")
+    # User ID resolution: transaction record (set at checkout) > Stripe metadata > empty string
+    # NEVER fall back to session_id — it is not a user identity
+    user_id = transaction.get("user_id") or transaction.get("claimed_by_user_id") or metadata.get("user_id", "") or ""
+    order_number = transaction.get("order_number", session_id)
+
+    if user_id:
+        print(f"[Webhook] Fulfilling for authenticated user: {user_id}")
+    else:
+        print(f"[Webhook] Guest purchase — no user_id, email: {customer_email}")
+
+    # Create download links for ALL items in the cart
+    items = transaction.get("items", [])
+
+    # If single product (old format), convert to items list
+    product_id = transaction.get("product_id")
+    if product_id and not items:
+        items = [{"product_id": product_id, "name": PRODUCTS.get(product_id, {}).get("name", product_id)}]
+
+    print(f"[Webhook] Processing {len(items)} item(s) for fulfillment")
+
+    if transaction.get("fulfillment_completed_at"):
+        # The status poll fulfilled it first (under the same order lock).
+        print(f"[Webhook] Order {order_number} already fulfilled; skipping fulfillment")
+    else:
+        await _fulfill_webhook_checkout(
+            transaction, items, customer_email=customer_email, user_id=user_id,
+            order_number=order_number, session_id=session_id,
+        )
+
+    # Award rewards points (1 point per $10 spent)
+    try:
+        from auth_routes_v2 import award_rewards_points
+        total_spent = transaction.get("total_amount", 0)
+        points_awarded = await award_rewards_points(user_id, total_spent, order_number)
+        if points_awarded > 0:
+            print(f"[Webhook] Awarded {points_awarded} rewards points to {user_id}")
+    except Exception as points_error:
+        print(f"[Webhook] Error awarding points: {points_error}")
+
+
 @router.get("/products")
 async def get_products():
     """Get list of available products with pricing - applies time-limited promos"""
@@ -3617,8 +3528,6 @@ async def get_download_links(order_id: str):
 @router.post("/admin/generate-downloads/{order_number}")
 async def admin_generate_downloads(order_number: str, request: Request):
     """Admin endpoint to manually generate download links for an order"""
-    from download_protection import create_download_link
-    
     # Get items from request body
     try:
         body = await request.json()
@@ -3631,55 +3540,28 @@ async def admin_generate_downloads(order_number: str, request: Request):
     if not items:
         return {"error": "No items provided. Send JSON body with 'items' array containing product_id and name for each item"}
     
-    download_links_created = []
+    # Manual override: files only need a resolvable path (no retrievability check).
+    run = fulfillment.FulfillmentRun(order_number, user_id=order_number, user_email=customer_email, caller="Admin")
+    await run.create_links(items, verify=False)
     
-    for item in items:
-        # Resolve item to file entries (attachment-first, POD-aware)
-        file_entries = await resolve_item_to_file_entries_async(item)
-        
-        if not file_entries:
-            raw_id = item.get("product_id") or item.get("id", "")
-            item_name = item.get("name", raw_id)
-            download_links_created.append({
-                "product_id": raw_id,
-                "name": item_name,
-                "error": f"Could not resolve to downloadable file: {raw_id}"
-            })
-            continue
-        
-        for entry in file_entries:
-            pdf_path = await get_pdf_path_async(entry["file_key"]) or await get_pdf_path_async(entry["product_id"])
-            
-            if pdf_path:
-                try:
-                    token, expires_at = await create_download_link(
-                        order_id=order_number,
-                        user_id=order_number,
-                        user_email=customer_email,
-                        product_id=entry["file_key"],
-                        product_name=entry["name"],
-                        file_path=pdf_path,
-                        payment_verified=True
-                    )
-                    download_links_created.append({
-                        "product_id": entry["file_key"],
-                        "name": entry["name"],
-                        "token": token,
-                        "pdf_path": pdf_path
-                    })
-                    print(f"[Admin] Download link created for {entry['name']} ({entry['file_key']})")
-                except Exception as dl_error:
-                    download_links_created.append({
-                        "product_id": entry["file_key"],
-                        "name": entry["name"],
-                        "error": str(dl_error)
-                    })
-            else:
-                download_links_created.append({
-                    "product_id": entry["file_key"],
-                    "name": entry["name"],
-                    "error": f"No PDF found for product key: {entry['file_key']}"
-                })
+    download_links_created = [
+        {"product_id": link["product_id"], "name": link["name"], "token": link["token"], "pdf_path": link["pdf_path"]}
+        for link in run.links
+    ]
+    for item in run.unresolved:
+        raw_id = item.get("product_id") or item.get("id", "")
+        download_links_created.append({
+            "product_id": raw_id,
+            "name": item.get("name", raw_id),
+            "error": f"Could not resolve to downloadable file: {raw_id}"
+        })
+    for failure in run.failures:
+        download_links_created.append({
+            "product_id": failure["file_key"],
+            "name": failure["name"],
+            "error": failure.get("error") or f"No PDF found for product key: {failure['file_key']}"
+        })
+    await run.finish()
     
     return {
         "order_number": order_number,
@@ -3868,96 +3750,113 @@ async def get_order_downloads(order_id: str):
 # refunded/cancelled/revoked/expired, and not an admin hygiene record (archived
 # or tagged 'test'). Order History keeps EVERYTHING (full permanent record).
 
-# refund_status values that strip Library access
-_LIBRARY_BLOCKING_REFUND = {"refunded", "partial_refund", "partially_refunded", "chargeback"}
-# status values that strip Library access
-_LIBRARY_BLOCKING_STATUS = {"refunded", "cancelled", "canceled", "revoked", "expired", "failed"}
-
-
-def _is_active_entitlement_txn(txn: dict, user_id: str, user_email: str) -> bool:
-    """True when this transaction grants the given user usable, owned content.
-
-    Rules:
-      - Must be paid.
-      - Excludes refunded / partially-refunded / chargeback (refund_status) and
-        cancelled / revoked / expired / failed (status).
-      - Excludes admin hygiene records (is_archived or tag == 'test').
-      - Gift ownership: a 'gift' purchase belongs ONLY to the recipient
-        (digital_recipient_email). The buyer gets a receipt, not access — so a
-        gift bought for someone else never appears in the buyer's Library. (If
-        the buyer also bought a copy for themselves, that's a separate self
-        transaction and shows normally.)
-    """
-    if txn.get("payment_status") != "paid":
-        return False
-    if txn.get("is_archived"):
-        return False
-    if (txn.get("tag") or "").strip().lower() == "test":
-        return False
-    if (txn.get("refund_status") or "").strip().lower() in _LIBRARY_BLOCKING_REFUND:
-        return False
-    if (txn.get("status") or "").strip().lower() in _LIBRARY_BLOCKING_STATUS:
-        return False
+# The ownership rules (blocking refund/status sets, gift ownership) live in
+# entitlements.py, shared with the materialized user_entitlements store.
+import entitlements  # noqa: E402
+from entitlements import is_active_entitlement_txn as _is_active_entitlement_txn  # noqa: E402
+
+# My Library responses are cached per user for a few seconds: the page is
+# re-requested on every navigation and its inputs change only on purchase,
+# refund or link regeneration. Those writes bump entitlements.LIBRARY_CACHE;
+# the gate drops this worker's copies when it sees the stamp move (checked at
+# most every LIBRARY_CACHE_CHECK_SECONDS).
+LIBRARY_CACHE_TTL_SECONDS = float(os.environ.get('LIBRARY_CACHE_TTL_SECONDS', '15'))
+LIBRARY_CACHE_MAX_USERS = int(os.environ.get('LIBRARY_CACHE_MAX_USERS', '2048'))
+LIBRARY_CACHE_CHECK_SECONDS = float(os.environ.get('LIBRARY_CACHE_CHECK_SECONDS', '1'))
+
+# user_id -> (response, monotonic expiry)
+_library_cache: Dict[str, tuple] = {}
+_library_gate = cache_versions.VersionGate(
+    entitlements.LIBRARY_CACHE, check_interval=LIBRARY_CACHE_CHECK_SECONDS, max_age=LIBRARY_CACHE_TTL_SECONDS
+)
+
+
+async def _invalidate_library_cache() -> None:
+    """Drop cached My Library responses here and in every other worker."""
+    _library_cache.clear()
+    _library_gate.invalidate_local()
+    await entitlements.invalidate_library()
+
+
+def _name_words(name: Optional[str]) -> frozenset:
+    return frozenset(w for w in (name or "").lower().split() if len(w) > 3)
+
+
+def _index_order_links(links: List[dict]) -> dict:
+    """Precompute the lookup tables used to pair an order's items with its
+    download links: raw product_id / product_name keys (later links win, as
+    before), normalized product ids, and name word sets for the fuzzy pass."""
+    by_key: Dict[str, Optional[str]] = {}
+    by_normalized: Dict[str, Optional[str]] = {}
+    for dl in links:
+        by_key[dl.get("product_id", "")] = dl.get("token")
+        by_key[dl.get("product_name", "")] = dl.get("token")
+    for dl in links:
+        if dl.get("product_id"):
+            by_normalized.setdefault(normalize_product_id(dl["product_id"]), dl.get("token"))
+    return {
+        "by_key": by_key,
+        "by_normalized": by_normalized,
+        "words": [(_name_words(dl.get("product_name")), dl.get("token")) for dl in links],
+        "only": links[0].get("token") if len(links) == 1 else None,
+    }
 
-    ue = (user_email or "").strip().lower()
-    recipient = (txn.get("digital_recipient_email") or "").strip().lower()
-    buyer_email = (txn.get("customer_email") or "").strip().lower()
-    is_buyer = (txn.get("user_id") and txn.get("user_id") == user_id) or (ue and buyer_email == ue)
-    is_recipient = bool(recipient) and recipient == ue
-    purchase_type = (txn.get("purchase_type") or "self").strip().lower()
 
-    if purchase_type == "gift":
-        # Only the recipient owns a gift (buyer == recipient edge case still works).
-        return is_recipient
-    # Self purchase — buyer owns it. (Also honor recipient match for safety.)
-    return bool(is_buyer or is_recipient)
+def _match_download_token(item_product_id: str, item_name: str, index: dict) -> Optional[str]:
+    # 1. Direct match by product_id
+    token = index["by_key"].get(item_product_id)
+    # 2. Normalized match (against raw keys, then normalized link ids)
+    if not token:
+        normalized = normalize_product_id(item_product_id)
+        token = index["by_key"].get(normalized) or index["by_normalized"].get(normalized)
+    # 3. Fuzzy match: significant name words overlap
+    if not token:
+        item_words = _name_words(item_name)
+        if item_words:
+            for dl_words, dl_token in index["words"]:
+                if len(item_words & dl_words) >= 2:
+                    token = dl_token
+                    break
+    # 4. If only one download link for the order, just use it
+    return token or index["only"]
 
 
 @router.get("/my-purchases")
-async def get_my_purchases(request: Request):
+async def get_my_purchases(request: Request, user: dict = Depends(principal.require_principal)):
     """MY LIBRARY — returns ONLY active, usable entitlements for the logged-in
     user. Refunded, revoked, cancelled, expired, failed, archived and test
     purchases are excluded. Gifts appear only in the recipient's Library."""
-    from jose import jwt, JWTError
-    
-    # Get auth token
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    token = auth_header.split(" ")[1]
-    
-    try:
-        SECRET_KEY = os.getenv("JWT_SECRET_KEY", "soul-food-secret-key-change-in-production-2024")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        user_id = payload.get("sub")
-        user_email = payload.get("email")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid user")
-    
-    # Get user by ID to find their email
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "email": 1})
-    if user:
-        user_email = user.get("email")
-    
-    # Broad fetch: anything where the user is buyer OR gift recipient. The
-    # _is_active_entitlement_txn filter below enforces all ownership/status rules.
-    or_clauses = [{"user_id": user_id}]
-    if user_email:
-        or_clauses.append({"customer_email": user_email})
-        or_clauses.append({"digital_recipient_email": user_email})
-
-    orders = await db.orders.find(
-        {"payment_status": "paid", "$or": or_clauses}, {"_id": 0}
-    ).sort("created_at", -1).limit(100).to_list(100)
+    user_id = user["id"]
+    user_email = user.get("email")
+
+    if await _library_gate.is_stale():
+        _library_cache.clear()
+        await _library_gate.mark_loaded()
+    cached = _library_cache.get(user_id)
+    if cached and time.monotonic() < cached[1]:
+        return cached[0]
     
-    # Also check payment_transactions
-    transactions = await db.payment_transactions.find(
-        {"payment_status": "paid", "$or": or_clauses}, {"_id": 0}
-    ).sort("created_at", -1).limit(100).to_list(100)
+    # The materialized entitlement store already knows which orders are active
+    # Library entries — fetch exactly those by key. The
+    # _is_active_entitlement_txn filter below re-checks the live documents.
+    ent = await entitlements.get_for_user(user_id, user_email)
+    refs = ent.get("orders") or []
+    order_ids = [r["order_id"] for r in refs if r.get("source") == "orders" and r.get("order_id")]
+    txn_sessions = [r["session_id"] for r in refs if r.get("source") == "payment_transactions" and r.get("session_id")]
+    txn_numbers = [r["order_number"] for r in refs if r.get("source") == "payment_transactions"
+                   and not r.get("session_id") and r.get("order_number")]
+
+    orders = []
+    if order_ids:
+        orders = await db.orders.find(
+            {"order_id": {"$in": order_ids}}, {"_id": 0}
+        ).sort("created_at", -1).to_list(len(order_ids))
+
+    transactions = []
+    if txn_sessions or txn_numbers:
+        transactions = await db.payment_transactions.find(
+            {"$or": [{"session_id": {"$in": txn_sessions}}, {"order_number": {"$in": txn_numbers}}]}, {"_id": 0}
+        ).sort("created_at", -1).to_list(len(txn_sessions) + len(txn_numbers))
     
     # Combine and format purchases
     purchases = []
@@ -3980,6 +3879,7 @@ async def get_my_purchases(request: Request):
                 "download_url": f"{os.getenv('REACT_APP_BACKEND_URL', '')}/api/payments/order/{order_id}/downloads" if order.get("has_digital") else None
             })
     
+    active_txns = []
     for txn in transactions:
         if not _is_active_entitlement_txn(txn, user_id, user_email):
             continue
@@ -3987,51 +3887,23 @@ async def get_my_purchases(request: Request):
         if order_id in seen_orders:
             continue
         seen_orders.add(order_id)
-        
-        # Get ALL download links for this order
-        order_downloads = await db.download_links.find(
-            {"order_id": order_id, "revoked": False},
-            {"_id": 0, "token": 1, "product_name": 1, "product_id": 1}
-        ).to_list(50)
-        
-        # Build a lookup by product name keywords
-        download_tokens_by_name = {}
-        for dl in order_downloads:
-            download_tokens_by_name[dl.get("product_id", "")] = dl.get("token")
-            download_tokens_by_name[dl.get("product_name", "")] = dl.get("token")
-        
+        active_txns.append((order_id, txn))
+
+    # ALL download links for every order in one round trip
+    links_by_order: Dict[str, List[dict]] = {}
+    if active_txns:
+        async for dl in db.download_links.find(
+            {"order_id": {"$in": [order_id for order_id, _ in active_txns]}, "revoked": False},
+            {"_id": 0, "order_id": 1, "token": 1, "product_name": 1, "product_id": 1}
+        ):
+            links_by_order.setdefault(dl.get("order_id"), []).append(dl)
+
+    for order_id, txn in active_txns:
+        link_index = _index_order_links(links_by_order.get(order_id, []))
         for item in txn.get("items", []):
             item_product_id = item.get("product_id") or item.get("id") or item.get("uniqueKey", "")
             item_name = item.get("name", "Soul Food Product")
-            
-            # Try to find a matching download token
-            download_token = None
-            
-            # 1. Direct match by product_id
-            if item_product_id in download_tokens_by_name:
-                download_token = download_tokens_by_name[item_product_id]
-            
-            # 2. Try normalized match
-            if not download_token:
-                normalized = normalize_product_id(item_product_id)
-                if normalized in download_tokens_by_name:
-                    download_token = download_tokens_by_name[normalized]
-            
-            # 3. Fuzzy match by name keywords
-            if not download_token and order_downloads:
-                item_lower = item_name.lower()
-                for dl in order_downloads:
-                    dl_name = (dl.get("product_name") or "").lower()
-                    # Match if significant words overlap
-                    item_words = set(w for w in item_lower.split() if len(w) > 3)
-                    dl_words = set(w for w in dl_name.split() if len(w) > 3)
-                    if item_words and dl_words and len(item_words & dl_words) >= 2:
-                        download_token = dl.get("token")
-                        break
-            
-            # 4. If only one download link for the order, just use it
-            if not download_token and len(order_downloads) == 1:
-                download_token = order_downloads[0].get("token")
+            download_token = _match_download_token(item_product_id, item_name, link_index)
             
             purchases.append({
                 "order_id": order_id,
@@ -4044,41 +3916,29 @@ async def get_my_purchases(request: Request):
                 "order_status": txn.get("status"),
             })
     
-    return {"purchases": purchases}
+    response = {"purchases": purchases}
+    if LIBRARY_CACHE_TTL_SECONDS > 0:
+        if len(_library_cache) >= LIBRARY_CACHE_MAX_USERS:
+            _library_cache.clear()
+        _library_cache[user_id] = (response, time.monotonic() + LIBRARY_CACHE_TTL_SECONDS)
+    return response
 
 
 @router.get("/my-orders")
-async def get_my_orders(request: Request):
+async def get_my_orders(request: Request, user: dict = Depends(principal.require_principal)):
     """ORDER HISTORY — full permanent transaction record for the logged-in user
     (the BUYER). Returns EVERY order they placed regardless of status: paid,
     pending, refunded, partially refunded, cancelled, failed, and gifts they
     sent. This is the Amazon/Kindle-style receipt archive — nothing is hidden
     except internal admin hygiene records (archived / test-tagged)."""
-    from jose import jwt, JWTError
-
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    token = auth_header.split(" ")[1]
-    try:
-        SECRET_KEY = os.getenv("JWT_SECRET_KEY", "soul-food-secret-key-change-in-production-2024")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        user_id = payload.get("sub")
-        user_email = payload.get("email")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid user")
-
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "email": 1})
-    if user:
-        user_email = user.get("email")
+    user_id = user["id"]
+    user_email = user.get("email")
 
     # Buyer-centric: orders the user PLACED (received gifts live in Library, not
     # the buyer's order history — matching Amazon/Kindle behavior).
     or_clauses = [{"user_id": user_id}]
     if user_email:
-        or_clauses.append({"customer_email": user_email})
+        or_clauses.append(lc_keys.match("customer_email", user_email))
 
     txns = await db.payment_transactions.find(
         {"$or": or_clauses}, {"_id": 0}
@@ -4344,27 +4204,9 @@ async def _grant_game_pass_for_items(items: list, user_id: str, customer_email:
 # =============================================================================
 
 @router.post("/admin/refulfill/{order_number}")
-async def admin_refulfill_order(order_number: str, request: Request):
+async def admin_refulfill_order(order_number: str, request: Request, admin: dict = Depends(principal.require_admin)):
     """Re-run fulfillment for a stuck order. Creates download links + audio access.
     Useful for orders that were paid but fulfillment failed (wrong product IDs, etc.)."""
-    # Auth check
-    auth_header = request.headers.get("Authorization", "")
-    if not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-
-    try:
-        from jose import jwt
-        SECRET_KEY = os.getenv("JWT_SECRET_KEY", "soul-food-secret-key-change-in-production-2024")
-        payload = jwt.decode(auth_header.split(" ", 1)[1], SECRET_KEY, algorithms=["HS256"])
-        uid = payload.get("sub")
-        user = await db.users.find_one({"id": uid}, {"_id": 0, "role": 1})
-        if not user or user.get("role") != "admin":
-            raise HTTPException(status_code=403, detail="Admin access required")
-    except HTTPException:
-        raise
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
     return await _do_refulfill_order(order_number)
 
 
@@ -4378,8 +4220,6 @@ async def _do_refulfill_order(order_number: str) -> dict:
     Raises HTTPException if order is missing or not paid — callers should catch
     or propagate as appropriate.
     """
-    from download_protection import create_download_link
-
     # Find the transaction
     txn = await db.payment_transactions.find_one(
         {"order_number": order_number},
@@ -4400,80 +4240,30 @@ async def _do_refulfill_order(order_number: str) -> dict:
         {"order_id": order_number},
         {"$set": {"revoked": True, "revoked_at": datetime.utcnow().isoformat()}}
     )
+    await _invalidate_library_cache()
 
     # Re-create download links using the attachment-first resolver
-    download_links_created = []
-    verification_failures: list = []
-    for item in items:
-        file_entries = await resolve_item_to_file_entries_async(item)
-        if not file_entries:
-            continue
-
-        # Verify each file is retrievable BEFORE creating download links.
-        verified_entries, verify_failures = await _verified_entries_for_fulfillment(
-            file_entries, caller="Refulfill"
-        )
-        verification_failures.extend(verify_failures)
-
-        for entry in verified_entries:
-            pdf_path = entry["pdf_path"]
-            try:
-                token, expires_at = await create_download_link(
-                    order_id=order_number,
-                    user_id=user_id or order_number,
-                    user_email=customer_email or "no-email@placeholder.com",
-                    product_id=entry["file_key"],
-                    product_name=entry["name"],
-                    file_path=pdf_path,
-                    payment_verified=True
-                )
-                download_links_created.append({
-                    "product_id": entry["file_key"],
-                    "name": entry["name"],
-                    "token": token
-                })
-            except Exception as e:
-                download_links_created.append({
-                    "product_id": entry["file_key"],
-                    "name": entry["name"],
-                    "error": str(e)
-                })
-                verification_failures.append({**entry, "reason": "link_creation_error", "error": str(e)})
+    run = fulfillment.FulfillmentRun(
+        order_number, user_id=user_id or order_number, user_email=customer_email, caller="Refulfill"
+    )
+    await run.create_links(items)
+    download_links_created = [
+        {"product_id": link["product_id"], "name": link["name"], "token": link["token"]}
+        for link in run.links
+    ] + [
+        {"product_id": f["file_key"], "name": f["name"], "error": f["error"]}
+        for f in run.failures if f.get("reason") == "link_creation_error"
+    ]
 
     # Update transaction
-    successful_count = len([d for d in download_links_created if "token" in d])
-    update_fields = {
-        "download_links_generated": successful_count > 0,
-        "downloads_count": successful_count,
-        "refulfilled_at": datetime.utcnow().isoformat(),
-        "fulfillment_verification_failures": [
-            {k: v for k, v in f.items() if k in ("file_key", "product_id", "name", "pdf_path", "reason", "error")}
-            for f in verification_failures
-        ],
-    }
-    if successful_count > 0:
-        update_fields["status"] = "fulfilled"
-        update_fields["fulfillment_status"] = "fulfilled"
-    else:
-        update_fields["fulfillment_status"] = "pending_verification"
+    extra = {"refulfilled_at": datetime.utcnow().isoformat()}
+    if run.links:
+        extra["fulfillment_status"] = "fulfilled"
+    await run.record({"order_number": order_number}, extra=extra)
 
-    await db.payment_transactions.update_one(
-        {"order_number": order_number},
-        {"$set": update_fields}
-    )
-
-    # Grant audio access
-    await _grant_audio_access_for_items(items, customer_email)
-    # Grant game-pass entitlement (1hr/3hr cumulative)
-    try:
-        await _grant_game_pass_for_items(
-            items=items,
-            user_id=(txn or {}).get("user_id") or "",
-            customer_email=customer_email,
-            order_number=order_number,
-        )
-    except Exception as gp_err:
-        print(f"[Refulfill] Error granting game pass: {gp_err}")
+    # Grant audio access + game-pass entitlement (1hr/3hr cumulative)
+    await run.grant(items, email=customer_email, user_id=(txn or {}).get("user_id") or "")
+    await run.finish()
 
     return {
         "order_number": order_number,
@@ -4490,25 +4280,9 @@ async def _do_refulfill_order(order_number: str) -> dict:
 # =============================================================================
 
 @router.get("/admin/accounts/lookup/{email}")
-async def admin_lookup_accounts(email: str, request: Request):
+async def admin_lookup_accounts(email: str, request: Request, admin: dict = Depends(principal.require_admin)):
     """Find all accounts and purchase history for an email. 
     Shows duplicates and helps decide what to merge/remove."""
-    # Auth check
-    auth_header = request.headers.get("Authorization", "")
-    if not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    try:
-        from jose import jwt
-        SECRET_KEY = os.getenv("JWT_SECRET_KEY", "soul-food-secret-key-change-in-production-2024")
-        payload = jwt.decode(auth_header.split(" ", 1)[1], SECRET_KEY, algorithms=["HS256"])
-        uid = payload.get("sub")
-        user = await db.users.find_one({"id": uid}, {"_id": 0, "role": 1})
-        if not user or user.get("role") != "admin":
-            raise HTTPException(status_code=403, detail="Admin access required")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
     email_lower = email.lower()
     
     # Find all user accounts
@@ -4519,14 +4293,14 @@ async def admin_lookup_accounts(email: str, request: Request):
     
     # Find all transactions
     transactions = await db.payment_transactions.find(
-        {"customer_email": {"$in": [email_lower, email]}},
+        lc_keys.match("customer_email", email),
         {"_id": 0, "order_number": 1, "payment_status": 1, "total_amount": 1, "items": 1, 
          "user_id": 1, "created_at": 1, "download_links_generated": 1}
     ).to_list(50)
     
     # Find download links
     links = await db.download_links.find(
-        {"user_email": {"$in": [email_lower, email]}},
+        {"user_email": email_lower},
         {"_id": 0, "order_id": 1, "product_id": 1, "revoked": 1}
     ).to_list(100)
     
@@ -4553,26 +4327,10 @@ async def admin_lookup_accounts(email: str, request: Request):
 
 
 @router.post("/admin/accounts/merge")
-async def admin_merge_accounts(request: Request):
+async def admin_merge_accounts(request: Request, admin: dict = Depends(principal.require_admin)):
     """Merge duplicate accounts for the same email.
     Keeps the account with the highest role (admin > instructor > member).
     Transfers all purchase history to the kept account."""
-    # Auth check
-    auth_header = request.headers.get("Authorization", "")
-    if not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    try:
-        from jose import jwt
-        SECRET_KEY = os.getenv("JWT_SECRET_KEY", "soul-food-secret-key-change-in-production-2024")
-        payload = jwt.decode(auth_header.split(" ", 1)[1], SECRET_KEY, algorithms=["HS256"])
-        uid = payload.get("sub")
-        user = await db.users.find_one({"id": uid}, {"_id": 0, "role": 1})
-        if not user or user.get("role") != "admin":
-            raise HTTPException(status_code=403, detail="Admin access required")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
     body = await request.json()
     email = body.get("email", "").lower()
     if not email:
@@ -4602,9 +4360,13 @@ async def admin_merge_accounts(request: Request):
             {"user_id": old_id},
             {"$set": {"user_id": keeper_id}}
         )
+        await _invalidate_library_cache()
     
     # Remove duplicate accounts
-    await db.users.delete_many({"id": {"$in": remove_ids}})
+    removed = await db.users.delete_many({"id": {"$in": remove_ids}})
+    await dashboard_stats.users_removed(removed.deleted_count)
+    for removed_id in remove_ids:
+        await principal.invalidate(removed_id)
     
     return {
         "message": f"Merged {len(to_remove)} duplicate(s) into {keeper_id}",
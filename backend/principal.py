@@ -0,0 +1,250 @@
+"""
+Authenticated principal.
+========================
+Bearer-token handling used to be copy-pasted into every authenticated
+endpoint: decode the JWT, then ``db.users.find_one`` for the caller's email
+and role. One page load fans out to several such endpoints, so the same user
+document was read from Mongo many times per second.
+
+``optional_principal`` / ``require_principal`` are FastAPI dependencies that
+decode the token once per request (memoized on ``request.state``) and load the
+user with a fixed projection (``PRINCIPAL_FIELDS``) through a short-TTL cache
+keyed by user id. Disabled accounts resolve to no principal.
+
+``/api/auth/me`` (polled by the frontend) resolves a session token to a user
+via ``db.user_sessions`` + ``db.users``. Those answers are cached per token
+(``cached_session`` / ``cache_session``) until the session's ``expires_at``
+or ``SESSION_CACHE_TTL_SECONDS``, whichever comes first; invalid or expired
+tokens are cached briefly too, so a stale cookie can't hammer Mongo.
+``evict_session`` drops one token (logout).
+
+Writes that change who a user *is* — role / access level, disable / enable,
+lockout, verification, password reset, deletion — must call
+``invalidate(user_id)``, which drops the user and all of their cached
+sessions. Other workers drop the same entries within a few seconds: both
+calls bump ``cache_versions`` with the user id (or a hash of the session
+token) as the key, so everyone else's cached principals and sessions stay
+warm. Only ``invalidate()`` with no user flushes the whole cache.
+
+Settings (env):
+  - PRINCIPAL_CACHE_TTL_SECONDS (default 30; 0 disables caching)
+  - PRINCIPAL_CACHE_MAX_USERS (default 4096)
+  - SESSION_CACHE_TTL_SECONDS (default 60; 0 disables caching)
+  - SESSION_NEGATIVE_TTL_SECONDS (default 10)
+  - SESSION_CACHE_MAX_TOKENS (default 8192)
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set, Tuple
+
+from fastapi import HTTPException, Request
+from jose import JWTError, jwt
+
+from cache_versions import VersionGate, bump_quietly
+from database import db
+
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "soul-food-secret-key-change-in-production-2024")
+ALGORITHM = "HS256"
+
+CACHE_NAME = "principals"
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_MAX_USERS = int(os.environ.get("PRINCIPAL_CACHE_MAX_USERS", "4096"))
+
+SESSION_CACHE_TTL_SECONDS = float(os.environ.get("SESSION_CACHE_TTL_SECONDS", "60"))
+SESSION_NEGATIVE_TTL_SECONDS = float(os.environ.get("SESSION_NEGATIVE_TTL_SECONDS", "10"))
+SESSION_CACHE_MAX_TOKENS = int(os.environ.get("SESSION_CACHE_MAX_TOKENS", "8192"))
+
+PRINCIPAL_FIELDS = ("id", "email", "name", "role", "access_level", "email_verified", "disabled")
+_PROJECTION = {"_id": 0, **{f: 1 for f in PRINCIPAL_FIELDS}}
+
+_gate = VersionGate(CACHE_NAME)
+# user_id -> (user doc or None, monotonic expiry)
+_cache: Dict[str, Tuple[Optional[dict], float]] = {}
+# session key (hashed token) -> (user_id, /me payload or None, error detail or None, monotonic expiry)
+_sessions: Dict[str, Tuple[Optional[str], Optional[dict], Optional[str], float]] = {}
+_sessions_by_user: Dict[str, Set[str]] = {}
+
+
+_SESSION_KEY_PREFIX = "session:"
+
+
+def _session_key(token: str) -> str:
+    """Cache / invalidation key for a session token (never store the token itself)."""
+    return _SESSION_KEY_PREFIX + hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def _drop_user(user_id: str) -> None:
+    _cache.pop(user_id, None)
+    for key in _sessions_by_user.pop(user_id, ()):
+        _sessions.pop(key, None)
+
+
+def _drop_all() -> None:
+    _cache.clear()
+    _sessions.clear()
+    _sessions_by_user.clear()
+
+
+async def _sync_with_other_workers() -> None:
+    keys = await _gate.stale_keys()
+    if keys is None:
+        version = await _gate.read_version()
+        _drop_all()
+        _gate.loaded(version)
+        return
+    for key in keys:
+        if key.startswith(_SESSION_KEY_PREFIX):
+            _forget_session(key)
+        else:
+            _drop_user(key)
+
+
+def bearer_token(request: Request) -> Optional[str]:
+    auth_header = request.headers.get("Authorization") or ""
+    if not auth_header.startswith("Bearer "):
+        return None
+    return auth_header.split(" ", 1)[1].strip() or None
+
+
+def decode(token: Optional[str]) -> Optional[dict]:
+    """JWT claims, or None if the token is missing, malformed or expired."""
+    if not token:
+        return None
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+
+async def load_user(user_id: Optional[str]) -> Optional[dict]:
+    """``PRINCIPAL_FIELDS`` of user ``user_id`` (a copy), or None if there is
+    no such user. Served from the cache when fresh; misses are cached too."""
+    if not user_id:
+        return None
+    await _sync_with_other_workers()
+    now = time.monotonic()
+    hit = _cache.get(user_id)
+    if hit and now < hit[1]:
+        user = hit[0]
+    else:
+        user = await db.users.find_one({"id": user_id}, _PROJECTION)
+        if PRINCIPAL_CACHE_TTL_SECONDS > 0:
+            if len(_cache) >= PRINCIPAL_CACHE_MAX_USERS:
+                _cache.clear()
+            _cache[user_id] = (user, now + PRINCIPAL_CACHE_TTL_SECONDS)
+    return dict(user) if user else None
+
+
+async def invalidate(user_id: Optional[str] = None) -> None:
+    """Drop ``user_id`` (or everyone, if None) and their cached sessions
+    from every worker's cache."""
+    if user_id is None:
+        _drop_all()
+    else:
+        _drop_user(user_id)
+    await bump_quietly(CACHE_NAME, "Principal", SESSION_CACHE_TTL_SECONDS, user_id)
+
+
+def session_token(request: Request) -> Optional[str]:
+    """Session cookie, falling back to the bearer token."""
+    return request.cookies.get("session_token") or bearer_token(request)
+
+
+async def cached_session(token: str) -> Optional[Tuple[Optional[dict], Optional[str]]]:
+    """``(me_payload, None)`` or ``(None, error_detail)`` for a cached token,
+    None on a miss."""
+    await _sync_with_other_workers()
+    key = _session_key(token)
+    hit = _sessions.get(key)
+    if not hit:
+        return None
+    user_id, payload, error, expires = hit
+    if time.monotonic() >= expires:
+        _forget_session(key)
+        return None
+    return (dict(payload) if payload else None), error
+
+
+async def cache_session(
+    token: str,
+    payload: Optional[dict] = None,
+    error: Optional[str] = None,
+    expires_at: Optional[datetime] = None,
+) -> None:
+    """Remember what ``token`` resolved to: a ``/me`` payload (which must
+    carry ``id``) or an error detail. Never outlives ``expires_at``."""
+    ttl = SESSION_CACHE_TTL_SECONDS if payload else SESSION_NEGATIVE_TTL_SECONDS
+    if SESSION_CACHE_TTL_SECONDS <= 0:
+        return
+    if expires_at is not None:
+        ttl = min(ttl, (expires_at - datetime.now(timezone.utc)).total_seconds())
+    if ttl <= 0:
+        return
+    await _sync_with_other_workers()
+    if len(_sessions) >= SESSION_CACHE_MAX_TOKENS:
+        _sessions.clear()
+        _sessions_by_user.clear()
+    key = _session_key(token)
+    user_id = payload.get("id") if payload else None
+    _sessions[key] = (user_id, payload, error, time.monotonic() + ttl)
+    if user_id:
+        _sessions_by_user.setdefault(user_id, set()).add(key)
+
+
+def _forget_session(key: str) -> None:
+    hit = _sessions.pop(key, None)
+    if hit and hit[0]:
+        keys = _sessions_by_user.get(hit[0])
+        if keys:
+            keys.discard(key)
+            if not keys:
+                _sessions_by_user.pop(hit[0], None)
+
+
+async def evict_session(token: Optional[str]) -> None:
+    """Drop one session token from every worker's cache (logout)."""
+    if not token:
+        return
+    key = _session_key(token)
+    _forget_session(key)
+    await bump_quietly(CACHE_NAME, "Principal", SESSION_CACHE_TTL_SECONDS, key)
+
+
+def claims(request: Request) -> Optional[dict]:
+    """Decoded bearer-token claims for this request (decoded once)."""
+    if not hasattr(request.state, "token_claims"):
+        request.state.token_claims = decode(bearer_token(request))
+    return request.state.token_claims
+
+
+async def optional_principal(request: Request) -> Optional[dict]:
+    """Dependency: the caller's user document, or None for anonymous callers,
+    invalid tokens, unknown users and disabled accounts."""
+    if hasattr(request.state, "principal"):
+        return request.state.principal
+    payload = claims(request)
+    user = await load_user(payload.get("sub") if payload else None)
+    request.state.principal = user if user and not user.get("disabled") else None
+    return request.state.principal
+
+
+async def require_principal(request: Request) -> dict:
+    """Dependency: like ``optional_principal`` but 401s without a principal."""
+    user = await optional_principal(request)
+    if user is None:
+        if bearer_token(request) is None:
+            raise HTTPException(status_code=401, detail="Authentication required")
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user
+
+
+async def require_admin(request: Request) -> dict:
+    """Dependency: a principal whose stored role is ``admin``."""
+    user = await require_principal(request)
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
@@ -0,0 +1,219 @@
+"""
+Public product catalog snapshot.
+================================
+``GET /api/payments/catalog`` is fetched on every storefront page load. It
+used to rebuild the catalog per request: walk the in-code ``PRODUCTS`` dict,
+re-evaluate promo windows, stream every active ``db.products`` document and
+merge them by SKU, then serialize the lot.
+
+The catalog is now built once per worker into a ``Snapshot``: the response
+body as pre-serialized JSON bytes plus a strong ``ETag`` (a hash of those
+bytes, so every worker serving the same catalog agrees). The endpoint only
+compares ``If-None-Match`` and returns the bytes, or ``304 Not Modified``.
+
+A snapshot is rebuilt when:
+  * an admin creates / updates / re-stocks / seeds products or uploads a
+    catalog CSV (``invalidate()``, propagated to other workers via
+    ``cache_versions``);
+  * the date passes the next ``promo_until`` boundary, since the effective
+    price of a code product depends on today's date;
+  * the ``db.products`` merge failed (the degraded, code-only catalog is
+    served but not kept);
+  * ``CATALOG_SNAPSHOT_MAX_AGE_SECONDS`` passed (safety net for writes made
+    by CLI scripts, e.g. scripts/seed_admin_products.py).
+
+Settings (env):
+  - CATALOG_SNAPSHOT_MAX_AGE_SECONDS (default 300)
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+from datetime import date
+from typing import List, NamedTuple, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from cache_versions import VersionGate, bump_quietly
+from database import db
+
+CACHE_NAME = "product_catalog"
+CATALOG_SNAPSHOT_MAX_AGE_SECONDS = float(os.environ.get("CATALOG_SNAPSHOT_MAX_AGE_SECONDS", "300"))
+
+_DB_PROJECTION = {
+    "_id": 0, "id": 1, "sku": 1, "name": 1, "description": 1,
+    "price": 1, "compare_price": 1, "type": 1, "edition": 1,
+    "series": 1, "metadata": 1, "preorder": 1, "preorder_label": 1,
+    "preorder_available_on": 1, "no_digital_fulfillment": 1,
+    "physical": 1, "promo_until": 1, "promo_sale_price": 1,
+    "shared_with": 1, "medium": 1,
+}
+
+
+class Snapshot(NamedTuple):
+    body: bytes
+    etag: str
+    total: int
+    built_on: str
+    # Last day the current promo prices hold (None: no promo ends ahead).
+    valid_through: Optional[str]
+    complete: bool
+
+
+_gate = VersionGate(CACHE_NAME, max_age=CATALOG_SNAPSHOT_MAX_AGE_SECONDS)
+_lock = asyncio.Lock()
+_snapshot: Optional[Snapshot] = None
+
+
+def _code_entries(products: dict, today: str) -> Tuple[List[dict], Optional[str]]:
+    """Public entries for the in-code catalog, and the earliest promo end
+    on or after ``today``."""
+    entries = []
+    valid_through = None
+    for pid, p in products.items():
+        effective_price = p.get("sale_price", p.get("list_price", 0))
+        promo_until = p.get("promo_until")
+        if promo_until and p.get("promo_sale_price") is not None and today <= promo_until:
+            effective_price = p["promo_sale_price"]
+            valid_through = promo_until if valid_through is None else min(valid_through, promo_until)
+        entry = {
+            "product_id": pid,
+            "name": p.get("name", ""),
+            "sku": p.get("sku", ""),
+            "list_price": p.get("list_price", 0),
+            "sale_price": p.get("sale_price", 0),
+            "effective_price": effective_price,
+            "promo_sale_price": p.get("promo_sale_price"),
+            "promo_until": promo_until,
+            "edition": p.get("edition", ""),
+            "medium": p.get("medium", ""),
+            "type": p.get("type", ""),
+            "preorder": p.get("preorder", False),
+            "preorder_label": p.get("preorder_label"),
+            "preorder_available_on": p.get("preorder_available_on"),
+            "free": p.get("free", False),
+            "physical": p.get("physical", False),
+            "no_digital_fulfillment": p.get("no_digital_fulfillment", False),
+            "hybrid_fulfillment": p.get("hybrid_fulfillment", False),
+            "bundle_contents": p.get("bundle_contents"),
+            "shared_with": p.get("shared_with"),
+            "is_bundle": p.get("is_bundle", False),
+            "deprecated": p.get("deprecated", False),
+            "inactive": p.get("inactive", False),
+            "description": p.get("description", ""),
+            "source": "code",
+        }
+        # Skip deprecated/inactive entries from the public catalog (keeps the
+        # storefront clean; admin UI still sees them).
+        if entry["inactive"] or entry["deprecated"]:
+            continue
+        entries.append(entry)
+    return entries, valid_through
+
+
+def _db_entry(doc: dict) -> dict:
+    return {
+        "product_id": doc.get("id") or doc.get("sku"),
+        "name": doc.get("name", ""),
+        "sku": doc.get("sku", ""),
+        "list_price": float(doc.get("compare_price") or doc.get("price") or 0),
+        "sale_price": float(doc.get("price") or 0),
+        "effective_price": float(doc.get("price") or 0),
+        "promo_sale_price": doc.get("promo_sale_price"),
+        "promo_until": doc.get("promo_until"),
+        "edition": doc.get("edition", "") or "",
+        "medium": doc.get("medium", "") or "",
+        "type": doc.get("type", "") or "digital",
+        "preorder": bool(doc.get("preorder", False)),
+        "preorder_label": doc.get("preorder_label"),
+        "preorder_available_on": doc.get("preorder_available_on"),
+        "free": False,
+        "physical": bool(doc.get("physical", False)) or (doc.get("type") == "physical"),
+        "no_digital_fulfillment": bool(doc.get("no_digital_fulfillment", False)),
+        "shared_with": doc.get("shared_with"),
+        "is_bundle": False,
+        "description": doc.get("description", "") or "",
+        "source": "db",
+    }
+
+
+async def build(today: Optional[str] = None) -> Snapshot:
+    """Merge the in-code ``PRODUCTS`` with active ``db.products`` (DB wins
+    by SKU; DB-only products are appended) and serialize the result."""
+    from payment_routes import PRODUCTS
+
+    today = today or date.today().isoformat()
+    catalog, valid_through = _code_entries(PRODUCTS, today)
+    # Track which SKUs already came from code so DB can override by SKU
+    seen_skus = {e["sku"]: i for i, e in enumerate(catalog) if e["sku"]}
+
+    complete = True
+    try:
+        async for doc in db.products.find({"status": "active"}, _DB_PROJECTION):
+            db_entry = _db_entry(doc)
+            sku = db_entry["sku"]
+            if sku and sku in seen_skus:
+                # Override existing entry in place (DB wins for active SKUs)
+                catalog[seen_skus[sku]] = db_entry
+            else:
+                catalog.append(db_entry)
+                if sku:
+                    seen_skus[sku] = len(catalog) - 1
+    except Exception as e:
+        complete = False
+        print(f"[catalog] db.products merge skipped: {e}")
+
+    # Same bytes Starlette's JSONResponse would produce.
+    body = json.dumps(
+        jsonable_encoder({"products": catalog, "total": len(catalog)}),
+        ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+    ).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return Snapshot(body, etag, len(catalog), today, valid_through, complete)
+
+
+def _expired(snap: Snapshot, today: str) -> bool:
+    if not snap.complete:
+        return True
+    if snap.valid_through is not None and today > snap.valid_through:
+        return True  # a promo ended since the snapshot was built
+    return False
+
+
+async def current() -> Snapshot:
+    """The catalog snapshot, rebuilt first if it is stale."""
+    global _snapshot
+    today = date.today().isoformat()
+    snap = _snapshot
+    if snap is not None and not _expired(snap, today) and not await _gate.is_stale():
+        return snap
+    async with _lock:
+        snap = _snapshot
+        if snap is not None and not _expired(snap, today) and not await _gate.is_stale():
+            return snap
+        version = await _gate.read_version()
+        _snapshot = snap = await build(today)
+        _gate.loaded(version)
+        return snap
+
+
+def not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an ``If-None-Match`` header matches ``etag`` (weak comparison,
+    as RFC 9110 prescribes for this header)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def invalidate() -> None:
+    """Call after any write to db.products or the in-code catalog."""
+    global _snapshot
+    _snapshot = None
+    _gate.invalidate_local()
+    await bump_quietly(CACHE_NAME, "Catalog", _gate.max_age)
@@ -0,0 +1,123 @@
+"""
+In-process trivia question bank.
+================================
+``/trivia/questions/for-game`` used to load up to 1000 ``trivia_questions``
+per request, filter them by series in Python, and — for Tricky Trivia — build
+a distractor set over the whole filtered pool for every option-less question
+(O(n²) per game load).
+
+The bank is loaded once per worker and indexed by ``(game_type, age_group)``
+(``None`` = any) and series. Unique-answer pools used for distractors are
+precomputed per bucket and memoized per unlocked-series combination, so a
+game load is dictionary lookups plus an O(k) sample per question.
+
+Invalidation: ``seed_qa_bank.py`` (and the server autoseed) bump the
+``trivia_questions`` version in ``db.cache_versions``; every worker reloads on
+its next request (see ``cache_versions.VersionGate``).
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from cache_versions import VersionGate, bump_quietly
+from database import db
+
+CACHE_NAME = "trivia_questions"
+
+# Map lesson_node prefix → series key
+SERIES_MAP = {
+    "Q1": "holiday_4c",
+    "Q2": "breakfast",
+    "Q3": "breakfast",  # Q3 content is future/extended Break*fast
+}
+
+_FALLBACK_OPTIONS = ("None of these", "Not mentioned in Scripture", "All of the above")
+
+Bucket = Tuple[Optional[str], Optional[str]]
+
+_gate = VersionGate(CACHE_NAME, max_age=600.0)
+_lock = asyncio.Lock()
+# (game_type, age_group) -> series -> questions (collection order)
+_by_bucket: Dict[Bucket, Dict[str, List[dict]]] = {}
+# (bucket, frozenset(series)) -> unique correct answers
+_answer_pools: Dict[Tuple[Bucket, FrozenSet[str]], List[str]] = {}
+
+
+def question_series(q: dict) -> str:
+    """Return the series key for a question based on lesson_node."""
+    node = (q.get("lesson_node") or "").strip()
+    if not node:
+        return "shared"
+    for prefix, series in SERIES_MAP.items():
+        if node.startswith(prefix):
+            return series
+    return "shared"
+
+
+async def ensure_loaded() -> None:
+    """Load (or reload, if the bank was re-seeded) the question index."""
+    global _by_bucket, _answer_pools
+    if not await _gate.is_stale():
+        return
+    async with _lock:
+        if not await _gate.is_stale():
+            return
+        version = await _gate.read_version()
+        index: Dict[Bucket, Dict[str, List[dict]]] = {}
+        async for q in db.trivia_questions.find({}, {"_id": 0}):
+            series = question_series(q)
+            gt, ag = q.get("game_type"), q.get("age_group")
+            for bucket in {(None, None), (gt, None), (None, ag), (gt, ag)}:
+                index.setdefault(bucket, {}).setdefault(series, []).append(q)
+        _by_bucket = index
+        _answer_pools = {}
+        _gate.loaded(version)
+
+
+def questions_for(game_type: Optional[str], age_group: Optional[str], series: Iterable[str]) -> List[dict]:
+    """Copies of every question in the bucket whose series is in ``series``."""
+    by_series = _by_bucket.get((game_type or None, age_group or None), {})
+    return [dict(q) for s in series for q in by_series.get(s, [])]
+
+
+def demo_questions(game_type: Optional[str], age_group: Optional[str], cap: int) -> List[dict]:
+    """Copies of the first ``cap`` shared-pool questions by qid."""
+    shared = _by_bucket.get((game_type or None, age_group or None), {}).get("shared", [])
+    return [dict(q) for q in sorted(shared, key=lambda q: q.get("qid", 0))[:cap]]
+
+
+def answer_pool(game_type: Optional[str], age_group: Optional[str], series: Iterable[str]) -> List[str]:
+    """Unique correct answers across ``series`` in a bucket (memoized)."""
+    bucket = (game_type or None, age_group or None)
+    key = (bucket, frozenset(series))
+    pool = _answer_pools.get(key)
+    if pool is None:
+        by_series = _by_bucket.get(bucket, {})
+        pool = list(dict.fromkeys(
+            q["correct_answer"] for s in key[1] for q in by_series.get(s, []) if q.get("correct_answer")
+        ))
+        _answer_pools[key] = pool
+    return pool
+
+
+def distractor_options(correct: str, answers: List[str], rng=random) -> list:
+    """Plausible MCQ options for a question that lacks them: three other
+    answers from ``answers`` (sampled, O(k)) plus the correct one, shuffled."""
+    distractors = [a for a in rng.sample(answers, min(len(answers), 4)) if a != correct][:3]
+    # If not enough distractors, add generic ones
+    fallbacks = list(_FALLBACK_OPTIONS)
+    while len(distractors) < 3:
+        fb = fallbacks.pop(0) if fallbacks else f"Option {len(distractors) + 1}"
+        if fb != correct:
+            distractors.append(fb)
+    options = distractors + [correct]
+    rng.shuffle(options)
+    return options
+
+
+async def invalidate() -> None:
+    """Call after (re)seeding trivia_questions."""
+    _gate.invalidate_local()
+    await bump_quietly(CACHE_NAME, "QuestionBank", _gate.max_age)
@@ -14,7 +14,9 @@ from fastapi.responses import Response
 from pydantic import BaseModel
 
 from routes.admin_routes import AdminUser, get_current_admin
-from server import db
+from database import db
+import attachment_index
+import blob_cache
 import storage_service as ss
 
 router = APIRouter(prefix="/api/admin/files", tags=["admin-files"])
@@ -96,7 +98,7 @@ async def upload_file(
     storage_path = ss.make_storage_path(safe_category, ext)
     content_type = file.content_type or _content_type_for(ext)
     try:
-        result = ss.put_object(storage_path, data, content_type)
+        result = await ss.aput_object(storage_path, data, content_type)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Storage upload failed: {e}")
 
@@ -160,12 +162,15 @@ async def list_files(
 async def soft_delete_file(file_id: str, admin: AdminUser = Depends(get_current_admin)):
     """Soft-delete (Emergent Object Storage has no delete API). The blob stays
     in storage but the DB record is hidden from list/download."""
-    res = await db.files.update_one(
+    record = await db.files.find_one_and_update(
         {"id": file_id, "is_deleted": False},
-        {"$set": {"is_deleted": True, "deleted_at": datetime.now(timezone.utc), "deleted_by_admin": admin.id}}
+        {"$set": {"is_deleted": True, "deleted_at": datetime.now(timezone.utc), "deleted_by_admin": admin.id}},
+        projection={"_id": 0, "storage_path": 1},
     )
-    if res.modified_count == 0:
+    if not record:
         raise HTTPException(status_code=404, detail="File not found or already deleted")
+    blob_cache.invalidate(record.get("storage_path", ""))
+    await attachment_index.invalidate()
     return {"success": True, "id": file_id}
 
 
@@ -177,6 +182,7 @@ async def restore_file(file_id: str, admin: AdminUser = Depends(get_current_admi
     )
     if res.modified_count == 0:
         raise HTTPException(status_code=404, detail="File not found or not deleted")
+    await attachment_index.invalidate()
     return {"success": True, "id": file_id}
 
 
@@ -205,7 +211,7 @@ async def replace_file(
     new_path = ss.make_storage_path(record.get("category", "uploads"), ext)
     content_type = file.content_type or _content_type_for(ext)
     try:
-        result = ss.put_object(new_path, data, content_type)
+        result = await ss.aput_object(new_path, data, content_type)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Storage upload failed: {e}")
 
@@ -226,6 +232,8 @@ async def replace_file(
             }
         }
     )
+    blob_cache.invalidate(record["storage_path"])
+    await attachment_index.invalidate()
     return {"success": True, "id": file_id}
 
 
@@ -252,6 +260,7 @@ async def attach_file(
         "attached_at": datetime.now(timezone.utc),
     }
     await db.files.update_one({"id": file_id}, {"$push": {"attachments": attach}})
+    await attachment_index.invalidate()
     return {"success": True, "attachment": {**attach, "attached_at": attach["attached_at"].isoformat()}}
 
 
@@ -263,6 +272,7 @@ async def detach_file(file_id: str, attach_id: str, admin: AdminUser = Depends(g
     )
     if res.modified_count == 0:
         raise HTTPException(status_code=404, detail="Attachment not found")
+    await attachment_index.invalidate()
     return {"success": True}
 
 
@@ -388,7 +398,7 @@ async def import_manifest(
             continue
         if verify_storage:
             try:
-                if not ss.head_object(storage_path):
+                if not await ss.ahead_object(storage_path):
                     unreachable.append({
                         "storage_path": storage_path,
                         "original_filename": raw.get("original_filename"),
@@ -447,6 +457,8 @@ async def import_manifest(
         except Exception as e:
             errors.append({"storage_path": storage_path, "error": str(e)})
 
+    if inserted or updated:
+        await attachment_index.invalidate()
     return {
         "ok": True,
         "imported_at": now.isoformat(),
@@ -474,7 +486,7 @@ async def verify_storage(
     async for f in db.files.find({"is_deleted": False}, {"_id": 0, "id": 1, "storage_path": 1, "original_filename": 1}).limit(limit):
         total += 1
         try:
-            ok = ss.head_object(f.get("storage_path", ""))
+            ok = await ss.ahead_object(f.get("storage_path", ""))
         except Exception:
             ok = False
         if ok:
@@ -494,6 +506,12 @@ async def verify_storage(
     }
 
 
+@router.get("/blob-cache")
+async def blob_cache_stats(admin: AdminUser = Depends(get_current_admin)):
+    """Local download cache usage for this pod (entries, bytes, budget)."""
+    return {"ok": True, **blob_cache.stats()}
+
+
 def _to_dt(s):
     """Best-effort parse ISO datetime string → datetime. Returns None on failure."""
     if not s:
@@ -544,6 +562,8 @@ async def migrate_legacy_files(
         summary = await run_migration(apply=apply, attach=attach)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"migration failed: {e}")
+    if apply:
+        await attachment_index.invalidate()
     return summary
 
 
@@ -554,7 +574,7 @@ async def download_file(file_id: str, admin: AdminUser = Depends(get_current_adm
     if not record:
         raise HTTPException(status_code=404, detail="File not found")
     try:
-        data, ctype = ss.get_object(record["storage_path"])
+        data, ctype = await ss.aget_object(record["storage_path"])
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Storage read failed: {e}")
     headers = {
@@ -18,7 +18,6 @@ from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import re
 import secrets
@@ -32,9 +31,18 @@ load_dotenv()
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
 # Database connection
-MONGO_URL = os.getenv('MONGO_URL')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ['DB_NAME']]
+from database import db  # noqa: E402 — shared pool
+import entitlements  # noqa: E402
+import export_stream  # noqa: E402
+import pagination  # noqa: E402
+import order_search  # noqa: E402
+import lc_keys  # noqa: E402
+import index_registry  # noqa: E402
+import principal  # noqa: E402
+import attachment_health  # noqa: E402
+import dashboard_stats  # noqa: E402
+import product_catalog  # noqa: E402
+import fulfillment  # noqa: E402
 
 # =============================================================================
 # ROLE DEFINITIONS
@@ -189,8 +197,10 @@ async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(
     if role not in admin_roles and access_level not in ["admin", "instructor"]:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Get user from database
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    # Get user (cached; see principal.load_user)
+    user = await principal.load_user(user_id)
+    if user and user.get("disabled"):
+        raise HTTPException(status_code=403, detail="Account disabled")
     
     # For beta testers, create a mock admin user
     if not user:
@@ -238,11 +248,9 @@ async def log_admin_action(
 async def get_admin_dashboard(admin: AdminUser = Depends(get_current_admin)):
     """Get admin dashboard summary"""
 
-    # Counts (orders + revenue come from payment_transactions — the actual Stripe source of truth)
-    total_users = await db.users.count_documents({})
-    total_lessons = await db.lessons.count_documents({})
-    total_orders = await db.payment_transactions.count_documents({})
-    total_products = await db.products.count_documents({})
+    # Counts (orders + revenue come from payment_transactions — the actual Stripe
+    # source of truth), maintained incrementally in one rollup document.
+    counters = await dashboard_stats.read()
 
     # Recent activity (last 5 paid orders, normalized to the shape the frontend expects)
     recent_txns = await db.payment_transactions.find(
@@ -264,31 +272,16 @@ async def get_admin_dashboard(admin: AdminUser = Depends(get_current_admin)):
         })
     recent_users = await db.users.find({}, {"_id": 0, "password_hash": 0}).sort("created_at", -1).limit(5).to_list(5)
 
-    # Content stats
-    published_lessons = await db.lessons.count_documents({"status": "published"})
-    draft_lessons = await db.lessons.count_documents({"status": "draft"})
-
-    # Revenue: sum total_amount on PAID payment_transactions only
-    revenue_cursor = db.payment_transactions.find(
-        {"payment_status": "paid"},
-        {"_id": 0, "total_amount": 1},
-    )
-    total_revenue = 0.0
-    async for tx in revenue_cursor:
-        try:
-            total_revenue += float(tx.get("total_amount", 0) or 0)
-        except (TypeError, ValueError):
-            continue
-
     return {
         "summary": {
-            "total_users": total_users,
-            "total_lessons": total_lessons,
-            "total_orders": total_orders,
-            "total_products": total_products,
-            "total_revenue": round(total_revenue, 2),
-            "published_lessons": published_lessons,
-            "draft_lessons": draft_lessons
+            "total_users": counters["users"],
+            "total_lessons": counters["lessons"],
+            "total_orders": counters["orders"],
+            "total_products": counters["products"],
+            # Revenue: total_amount summed over PAID payment_transactions only
+            "total_revenue": round(counters["revenue_cents"] / 100, 2),
+            "published_lessons": counters["lessons_published"],
+            "draft_lessons": counters["lessons_draft"]
         },
         "recent_orders": recent_orders,
         "recent_users": recent_users,
@@ -310,9 +303,12 @@ async def get_content_list(
     series: Optional[str] = None,
     page: int = 1,
     limit: int = 20,
+    cursor: Optional[str] = None,
+    with_total: bool = True,
     admin: AdminUser = Depends(get_current_admin)
 ):
-    """Get list of content items with filters"""
+    """Get list of content items with filters. Pass the returned ``next_cursor``
+    as ``cursor`` to page in constant time; ``with_total=false`` skips the count."""
     query = {}
     if type:
         query["type"] = type
@@ -324,15 +320,14 @@ async def get_content_list(
     skip = (page - 1) * limit
     
     # Get content from lessons collection
-    content = await db.lessons.find(query, {"_id": 0}).skip(skip).limit(limit).sort("created_at", -1).to_list(limit)
-    total = await db.lessons.count_documents(query)
+    content, next_cursor = await pagination.fetch_page(
+        db.lessons, query, "created_at", {"_id": 0}, limit, cursor, skip
+    )
+    total = await pagination.count(db.lessons, query, with_total)
     
     return {
         "items": content,
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "pages": (total + limit - 1) // limit
+        **pagination.page_meta(total, page, limit, next_cursor),
     }
 
 @router.get("/content/{content_id}")
@@ -378,6 +373,7 @@ async def create_content(
     }
     
     await db.lessons.insert_one(content_doc)
+    await dashboard_stats.lessons_created([item.status])
     
     # Create initial version
     await db.content_versions.insert_one({
@@ -439,6 +435,7 @@ async def update_content(
         update_doc["published_at"] = now.isoformat()
     
     await db.lessons.update_one({"id": content_id}, {"$set": update_doc})
+    await dashboard_stats.lesson_status_changed(existing.get("status"), item.status)
     
     await log_admin_action("update_content", admin.id, "content", content_id, {"version": new_version})
     
@@ -523,6 +520,7 @@ async def update_content_status(
         update_doc["scheduled_at"] = scheduled_at.isoformat()
     
     await db.lessons.update_one({"id": content_id}, {"$set": update_doc})
+    await dashboard_stats.lesson_status_changed(existing.get("status"), status)
     
     await log_admin_action("update_content_status", admin.id, "content", content_id, 
                           {"old_status": existing.get("status"), "new_status": status})
@@ -625,9 +623,11 @@ async def get_media_list(
     series: Optional[str] = None,
     page: int = 1,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    with_total: bool = True,
     admin: AdminUser = Depends(get_current_admin)
 ):
-    """Get media library items"""
+    """Get media library items (keyset-paged via ``cursor``)"""
     query = {}
     if file_type:
         query["file_type"] = file_type
@@ -636,15 +636,14 @@ async def get_media_list(
     
     skip = (page - 1) * limit
     
-    items = await db.media.find(query, {"_id": 0}).skip(skip).limit(limit).sort("created_at", -1).to_list(limit)
-    total = await db.media.count_documents(query)
+    items, next_cursor = await pagination.fetch_page(
+        db.media, query, "created_at", {"_id": 0}, limit, cursor, skip
+    )
+    total = await pagination.count(db.media, query, with_total)
     
     return {
         "items": items,
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "pages": (total + limit - 1) // limit
+        **pagination.page_meta(total, page, limit, next_cursor),
     }
 
 @router.post("/media/upload")
@@ -856,6 +855,8 @@ async def create_product(item: ProductItem, admin: AdminUser = Depends(get_curre
     }
     
     await db.products.insert_one(product_doc)
+    await product_catalog.invalidate()
+    await dashboard_stats.products_created()
     
     await log_admin_action("create_product", admin.id, "product", product_id, {"sku": item.sku})
     
@@ -869,6 +870,8 @@ async def seed_products_from_catalog_endpoint(admin: AdminUser = Depends(get_cur
     and does not touch any other collection. Safe to re-run."""
     from scripts.seed_admin_products import seed_products_from_catalog
     summary = await seed_products_from_catalog(db)
+    await product_catalog.invalidate()
+    await dashboard_stats.products_created(summary.get("inserted", 0))
     await log_admin_action(
         "seed_products_from_catalog", admin.id, "products", "catalog", summary
     )
@@ -927,6 +930,8 @@ async def refresh_product_dates(admin: AdminUser = Depends(get_current_admin)):
             updated_skus.append(sku)
         else:
             not_found_skus.append(sku)
+    if updated_skus:
+        await product_catalog.invalidate()
 
     await log_admin_action(
         "refresh_product_dates", admin.id, "products", "catalog",
@@ -942,77 +947,20 @@ async def refresh_product_dates(admin: AdminUser = Depends(get_current_admin)):
 
 
 @router.get("/products/attachment-health")
-async def products_attachment_health(admin: AdminUser = Depends(get_current_admin)):
+async def products_attachment_health(
+    incremental: bool = False,
+    admin: AdminUser = Depends(get_current_admin),
+):
     """Fulfillment guardrail: list every active product and flag whether it
     has at least one file attached via db.files.attachments[]. Lets the admin
     UI surface a "⚠ no file attached" badge on rows that will silently fail
     at checkout.
 
-    Rules surfaced:
-      - Digital products MUST have at least one attachment to be deliverable.
-      - Physical products MUST NOT have a digital file (it would be ignored).
-      - Products flagged ``no_digital_fulfillment`` are exempt from the digital
-        rule entirely.
+    One db.files aggregation for the whole catalog (see attachment_health for
+    the rules). ``incremental=true`` only rechecks products touched since this
+    worker's last report, and returns it untouched if nothing changed.
     """
-    products = await db.products.find(
-        {"status": "active"},
-        {"_id": 0, "id": 1, "sku": 1, "name": 1, "type": 1}
-    ).to_list(2000)
-
-    health = []
-    needs_files = []
-    physical_with_files = []
-    for p in products:
-        sku = p.get("sku") or ""
-        # Find any file attachment that references this product by id or sku.
-        # NOTE: the attach endpoint writes ``target_id`` (see admin_files_routes.py
-        # attach_file), so this query MUST use ``target_id`` — using ``product_id``
-        # silently never matches and every product shows "no file attached".
-        attachments_count = await db.files.count_documents({
-            "is_deleted": {"$ne": True},
-            "attachments": {"$elemMatch": {
-                "target_type": "product",
-                "$or": [
-                    {"target_id": p.get("id")},
-                    {"target_id": sku},
-                ],
-            }},
-        })
-        # Cross-check against the in-code no_digital_fulfillment flag via PRODUCTS sku lookup
-        from payment_routes import PRODUCTS as _PRODUCTS
-        code_meta = next((v for v in _PRODUCTS.values() if v.get("sku") == sku), {})
-        no_digital = bool(code_meta.get("no_digital_fulfillment"))
-
-        item = {
-            "sku": sku,
-            "name": p.get("name"),
-            "type": p.get("type"),
-            "attachments_count": attachments_count,
-            "no_digital_fulfillment": no_digital,
-        }
-        if no_digital:
-            item["status"] = "ok_no_digital"
-        elif p.get("type") == "physical":
-            if attachments_count > 0:
-                item["status"] = "warn_physical_has_files"
-                physical_with_files.append(sku)
-            else:
-                item["status"] = "ok_physical"
-        else:
-            if attachments_count == 0:
-                item["status"] = "missing_file_attachment"
-                needs_files.append(sku)
-            else:
-                item["status"] = "ok"
-        health.append(item)
-
-    return {
-        "items": health,
-        "total": len(health),
-        "needs_files_count": len(needs_files),
-        "needs_files_skus": needs_files,
-        "physical_with_files_skus": physical_with_files,
-    }
+    return await attachment_health.report(incremental=incremental)
 
 @router.put("/products/{product_id}")
 async def update_product(
@@ -1045,6 +993,7 @@ async def update_product(
     }
     
     await db.products.update_one({"id": product_id}, {"$set": update_doc})
+    await product_catalog.invalidate()
     
     await log_admin_action("update_product", admin.id, "product", product_id)
     
@@ -1080,6 +1029,7 @@ async def update_inventory(
             "updated_by": admin.id
         }}
     )
+    await product_catalog.invalidate()
     
     await log_admin_action("update_inventory", admin.id, "product", product_id,
                           {"old_count": old_count, "new_count": count})
@@ -1528,10 +1478,13 @@ async def get_orders_list(
     visibility: Optional[str] = "active",  # 'active' (default — hides archived & test), 'test', 'archived', 'all'
     page: int = 1,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    with_total: bool = True,
     admin: AdminUser = Depends(get_current_admin)
 ):
     """Get orders list from both orders and payment_transactions, with search.
-    By default hides archived orders and orders tagged as 'test'."""
+    By default hides archived orders and orders tagged as 'test'. Pass the
+    returned ``next_cursor`` as ``cursor`` to page in constant time."""
     skip = (page - 1) * limit
 
     # Build base query for payment_transactions (the primary source of paid orders)
@@ -1540,12 +1493,10 @@ async def get_orders_list(
         tx_query["payment_status"] = status
 
     if search:
-        search_re = {"$regex": search.strip(), "$options": "i"}
-        tx_query["$or"] = [
-            {"order_number": search_re},
-            {"customer_email": search_re},
-            {"customer_name": search_re},
-        ]
+        # Prefix match on indexed search_keys (see order_search.py)
+        search_clause = order_search.search_filter(search)
+        if search_clause:
+            tx_query.update(search_clause)
 
     # Visibility filter
     visibility_mode = (visibility or "active").lower()
@@ -1563,8 +1514,10 @@ async def get_orders_list(
         tx_query["$and"] = visibility_clauses
 
     # Query payment_transactions first (most reliable for Stripe orders)
-    txns = await db.payment_transactions.find(tx_query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    total = await db.payment_transactions.count_documents(tx_query)
+    txns, next_cursor = await pagination.fetch_page(
+        db.payment_transactions, tx_query, "created_at", {"_id": 0}, limit, cursor, skip
+    )
+    total = await pagination.count(db.payment_transactions, tx_query, with_total)
 
     items = []
     for tx in txns:
@@ -1598,68 +1551,177 @@ async def get_orders_list(
 
     return {
         "items": items,
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "pages": max(1, (total + limit - 1) // limit),
+        **pagination.page_meta(total, page, limit, next_cursor),
     }
 
 
-@router.get("/orders/summary")
-async def get_orders_summary(admin: AdminUser = Depends(get_current_admin)):
-    """Operational dashboard: at-a-glance counts + revenue (excludes archived/test)."""
-    q = {
-        "$and": [
-            {"$or": [{"is_archived": {"$exists": False}}, {"is_archived": False}]},
-            {"$or": [{"tag": {"$exists": False}}, {"tag": {"$ne": "test"}}]},
-        ]
+def _truthy(expr):
+    """Aggregation-side Python truthiness (None/False/0/""/[] are falsy)."""
+    return {"$not": [{"$in": [{"$ifNull": [expr, None]}, [None, False, 0, "", []]]}]}
+
+
+# Only the order fields _compute_lifecycle reads, reduced to the values it
+# actually distinguishes (flags instead of ids/timestamps). Orders that share
+# a key are indistinguishable to the lifecycle rules, so grouping on it lets
+# Mongo do the counting while the rules themselves stay in Python.
+_LIFECYCLE_KEY = {
+    "payment_status": "$payment_status",
+    "status": "$status",
+    "refund_status": "$refund_status",
+    "refunded": _truthy("$refunded_at"),
+    "is_archived": _truthy("$is_archived"),
+    "entitlement_status": "$entitlement_status",
+    "physical_fulfillment": "$physical_fulfillment",
+    "downloaded": {"$gt": [{"$ifNull": ["$downloads_count", 0]}, 0]},
+    "links": _truthy("$download_links_generated"),
+    "verify_failed": _truthy("$fulfillment_verification_failures"),
+    "manual_fulfillment_status": "$manual_fulfillment_status",
+    "recipient_confirmed": _truthy("$recipient_access_confirmed"),
+    "claimed": _truthy("$claimed_by_user_id"),
+    "purchase_type": "$purchase_type",
+    "items": {"$map": {
+        "input": {"$cond": [{"$isArray": "$items"}, "$items", []]},
+        "as": "it",
+        "in": {
+            "id": "$$it.id", "product_id": "$$it.product_id", "sku": "$$it.sku",
+            "name": "$$it.name", "format": "$$it.format", "edition": "$$it.edition",
+            "medium": "$$it.metadata.medium",
+            "physical": _truthy("$$it.physical"),
+            "hybrid_fulfillment": _truthy("$$it.hybrid_fulfillment"),
+            "no_digital_fulfillment": _truthy("$$it.no_digital_fulfillment"),
+            "isSmallGroupBundle": _truthy("$$it.isSmallGroupBundle"),
+            "isBookClub": _truthy("$$it.isBookClub"),
+            "bundle_digital": {"$cond": [
+                {"$eq": [{"$type": "$$it.bundle_contents"}, "object"]},
+                _truthy("$$it.bundle_contents.digital"), False,
+            ]},
+        },
+    }},
+}
+
+
+def _doc_from_lifecycle_key(key: dict) -> dict:
+    """Rebuild a minimal order document _compute_lifecycle evaluates exactly
+    like any of the orders grouped under ``key``."""
+    items = []
+    for it in key.get("items") or []:
+        items.append({
+            "id": it.get("id"), "product_id": it.get("product_id"), "sku": it.get("sku"),
+            "name": it.get("name"), "format": it.get("format"), "edition": it.get("edition"),
+            "metadata": {"medium": it.get("medium")},
+            "physical": it.get("physical"),
+            "hybrid_fulfillment": it.get("hybrid_fulfillment"),
+            "no_digital_fulfillment": it.get("no_digital_fulfillment"),
+            "isSmallGroupBundle": it.get("isSmallGroupBundle"),
+            "isBookClub": it.get("isBookClub"),
+            "bundle_contents": {"digital": True} if it.get("bundle_digital") else None,
+        })
+    return {
+        "payment_status": key.get("payment_status"),
+        "status": key.get("status"),
+        "refund_status": key.get("refund_status"),
+        "refunded_at": True if key.get("refunded") else None,
+        "is_archived": key.get("is_archived"),
+        "entitlement_status": key.get("entitlement_status"),
+        "physical_fulfillment": key.get("physical_fulfillment"),
+        "downloads_count": 1 if key.get("downloaded") else 0,
+        "download_links_generated": key.get("links"),
+        "fulfillment_verification_failures": [True] if key.get("verify_failed") else [],
+        "manual_fulfillment_status": key.get("manual_fulfillment_status"),
+        "recipient_access_confirmed": key.get("recipient_confirmed"),
+        "claimed_by_user_id": True if key.get("claimed") else None,
+        "purchase_type": key.get("purchase_type"),
+        "items": items,
     }
-    docs = await db.payment_transactions.find(q, {"_id": 0}).to_list(5000)
+
+
+def _created_at_range(start_date: Optional[datetime], end_date: Optional[datetime]) -> Optional[dict]:
+    """created_at window matching both BSON dates and legacy ISO strings."""
+    if not start_date and not end_date:
+        return None
+    as_date, as_str = {}, {}
+    if start_date:
+        as_date["$gte"], as_str["$gte"] = start_date, start_date.isoformat()
+    if end_date:
+        as_date["$lte"], as_str["$lte"] = end_date, end_date.isoformat()
+    return {"$or": [{"created_at": as_date}, {"created_at": as_str}]}
+
+
+@router.get("/orders/summary")
+async def get_orders_summary(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    admin: AdminUser = Depends(get_current_admin),
+):
+    """Operational dashboard: at-a-glance counts + revenue (excludes archived/test).
+    Optional ``start_date`` / ``end_date`` restrict it to orders created in
+    that window. Computed with one aggregation — exact at any order volume."""
+    clauses = [
+        {"$or": [{"is_archived": {"$exists": False}}, {"is_archived": False}]},
+        {"$or": [{"tag": {"$exists": False}}, {"tag": {"$ne": "test"}}]},
+    ]
+    window = _created_at_range(start_date, end_date)
+    if window:
+        clauses.append(window)
+    pipeline = [
+        {"$match": {"$and": clauses}},
+        {"$group": {
+            "_id": _LIFECYCLE_KEY,
+            "n": {"$sum": 1},
+            "amount": {"$sum": {"$convert": {"input": "$total_amount", "to": "double", "onError": 0.0, "onNull": 0.0}}},
+        }},
+    ]
     counts = {k: 0 for k in [
         "needs_action", "pending_payment", "processing", "shipped", "delivered",
         "completed", "refunded", "cancelled", "archived", "closed", "total",
     ]}
     rev = {"gross_sales": 0.0, "refunds": 0.0, "net_revenue": 0.0, "outstanding": 0.0, "pending": 0.0}
-    for d in docs:
-        lc = _compute_lifecycle(d)
+    async for g in db.payment_transactions.aggregate(pipeline, allowDiskUse=True):
+        lc = _compute_lifecycle(_doc_from_lifecycle_key(g["_id"]))
         fin = lc["financial_status"]
-        amt = float(d.get("total_amount") or 0)
-        counts["total"] += 1
+        n = g["n"]
+        amt = float(g.get("amount") or 0)
+        counts["total"] += n
         if lc["needs_action"]:
-            counts["needs_action"] += 1
+            counts["needs_action"] += n
         if lc["is_closed"]:
-            counts["closed"] += 1
+            counts["closed"] += n
         if fin == "pending_payment":
-            counts["pending_payment"] += 1
+            counts["pending_payment"] += n
             rev["pending"] += amt
         elif fin in ("refunded", "partial_refund"):
-            counts["refunded"] += 1
+            counts["refunded"] += n
             rev["gross_sales"] += amt
             rev["refunds"] += amt
         elif fin == "cancelled":
-            counts["cancelled"] += 1
+            counts["cancelled"] += n
         elif fin == "chargeback":
-            counts["refunded"] += 1
+            counts["refunded"] += n
             rev["gross_sales"] += amt
             rev["refunds"] += amt
         elif fin == "paid":
             rev["gross_sales"] += amt
             if lc["is_closed"]:
-                counts["completed"] += 1
+                counts["completed"] += n
             else:
-                counts["outstanding"] += 0  # placeholder for clarity
                 rev["outstanding"] += amt
             if lc["has_physical"]:
                 if lc["fulfillment_status"] == "shipped":
-                    counts["shipped"] += 1
+                    counts["shipped"] += n
                 elif lc["fulfillment_status"] == "delivered":
-                    counts["delivered"] += 1
+                    counts["delivered"] += n
                 else:
-                    counts["processing"] += 1
+                    counts["processing"] += n
     rev["net_revenue"] = round(rev["gross_sales"] - rev["refunds"], 2)
     for k in rev:
         rev[k] = round(rev[k], 2)
-    return {"counts": counts, "revenue": rev}
+    result = {"counts": counts, "revenue": rev}
+    if window:
+        result["window"] = {
+            "start_date": start_date.isoformat() if start_date else None,
+            "end_date": end_date.isoformat() if end_date else None,
+        }
+    return result
 
 
 class FulfillmentUpdate(BaseModel):
@@ -2011,42 +2073,61 @@ async def admin_resend_order_email(
     raise HTTPException(status_code=500, detail=result.get("error", "Email send failed"))
 
 
+async def _product_files_entries(items: list) -> list:
+    """An order's file entries from the ``db.product_files`` mappings, shaped
+    for ``FulfillmentRun.link_entries`` (links keep the item's product_id)."""
+    entries = []
+    for item in items:
+        product_id = item.get("product_id", item.get("id", ""))
+        if not product_id:
+            continue
+        mapping = await db.product_files.find_one({"product_id": product_id}, {"_id": 0})
+        if not mapping:
+            continue
+        for f in mapping.get("files", []):
+            entries.append({
+                "product_id": product_id,
+                "file_key": product_id,
+                "name": item.get("name", product_id),
+                "pdf_path": f.get("path", ""),
+            })
+    return entries
+
+
+async def _fulfill_from_product_files(tx: dict, order_number: str, caller: str, record: bool = True) -> int:
+    """Create an order's links from its product_files mappings through the
+    fulfillment engine; ``record`` stores the outcome on the transaction.
+    Returns the number of links created."""
+    run = fulfillment.FulfillmentRun(
+        order_number,
+        user_id=tx.get("claimed_by_user_id", order_number),
+        user_email=tx.get("customer_email", ""),
+        caller=caller,
+    )
+    await run.link_entries(await _product_files_entries(tx.get("items", [])), verify=False)
+    if record:
+        await run.record({"order_number": order_number})
+    await run.finish()
+    return len(run.links)
+
+
 @router.post("/orders/{order_number}/grant-access")
 async def admin_grant_access(order_number: str, admin: AdminUser = Depends(get_current_admin)):
     """Manually (re)create download links for an order"""
-    from download_protection import create_download_link
     order_number = order_number.strip().upper()
 
     tx = await db.payment_transactions.find_one({"order_number": order_number}, {"_id": 0})
     if not tx:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    email = tx.get("customer_email", "")
-    items = tx.get("items", [])
-
-    if not items:
+    if not tx.get("items", []):
         raise HTTPException(status_code=400, detail="No items in this order")
 
-    # Get product -> file mappings
-    created = 0
-    for item in items:
-        product_id = item.get("product_id", item.get("id", ""))
-        if not product_id:
-            continue
-        mapping = await db.product_files.find_one({"product_id": product_id}, {"_id": 0})
-        if not mapping:
-            continue
-        for f in mapping.get("files", []):
-            token, expires = await create_download_link(
-                order_id=order_number,
-                user_id=tx.get("claimed_by_user_id", order_number),
-                user_email=email,
-                product_id=product_id,
-                product_name=item.get("name", product_id),
-                file_path=f.get("path", ""),
-                payment_verified=True,
-            )
-            created += 1
+    # Links from the product -> file mappings; only a paid order's
+    # fulfillment fields are updated.
+    created = await _fulfill_from_product_files(
+        tx, order_number, "AdminGrantAccess", record=tx.get("payment_status") == "paid"
+    )
 
     await log_admin_action("grant_access", admin.id, "order", order_number, {"links_created": created})
 
@@ -2090,8 +2171,8 @@ async def admin_sync_stripe(order_number: str, admin: AdminUser = Depends(get_cu
 
     now = datetime.now(timezone.utc)
     if not already_paid:
-        await db.payment_transactions.update_one(
-            {"order_number": order_number},
+        flipped = await db.payment_transactions.update_one(
+            {"order_number": order_number, "payment_status": {"$ne": "paid"}},
             {"$set": {
                 "payment_status": "paid",
                 "status": "completed",
@@ -2102,29 +2183,12 @@ async def admin_sync_stripe(order_number: str, admin: AdminUser = Depends(get_cu
                 "updated_at": now,
             }}
         )
+        if flipped.modified_count:
+            await dashboard_stats.payment_status_changed(tx.get("payment_status"), "paid", tx.get("total_amount"))
+        await entitlements.refresh_for_order(order_number)
 
     # Create / refresh download links inline (idempotent)
-    from download_protection import create_download_link
-    items = tx.get("items", [])
-    created = 0
-    for item in items:
-        product_id = item.get("product_id", item.get("id", ""))
-        if not product_id:
-            continue
-        mapping = await db.product_files.find_one({"product_id": product_id}, {"_id": 0})
-        if not mapping:
-            continue
-        for f in mapping.get("files", []):
-            await create_download_link(
-                order_id=order_number,
-                user_id=tx.get("claimed_by_user_id", order_number),
-                user_email=tx.get("customer_email", ""),
-                product_id=product_id,
-                product_name=item.get("name", product_id),
-                file_path=f.get("path", ""),
-                payment_verified=True,
-            )
-            created += 1
+    created = await _fulfill_from_product_files(tx, order_number, "AdminSyncStripe")
 
     await log_admin_action(
         "sync_stripe", admin.id, "order", order_number,
@@ -2165,8 +2229,8 @@ async def admin_mark_paid(
     now = datetime.now(timezone.utc)
     already_paid = tx.get("payment_status") == "paid"
     if not already_paid:
-        await db.payment_transactions.update_one(
-            {"order_number": order_number},
+        flipped = await db.payment_transactions.update_one(
+            {"order_number": order_number, "payment_status": {"$ne": "paid"}},
             {"$set": {
                 "payment_status": "paid",
                 "status": "completed",
@@ -2176,29 +2240,12 @@ async def admin_mark_paid(
                 "updated_at": now,
             }}
         )
+        if flipped.modified_count:
+            await dashboard_stats.payment_status_changed(tx.get("payment_status"), "paid", tx.get("total_amount"))
+        await entitlements.refresh_for_order(order_number)
 
     # Create download links
-    from download_protection import create_download_link
-    items = tx.get("items", [])
-    created = 0
-    for item in items:
-        product_id = item.get("product_id", item.get("id", ""))
-        if not product_id:
-            continue
-        mapping = await db.product_files.find_one({"product_id": product_id}, {"_id": 0})
-        if not mapping:
-            continue
-        for f in mapping.get("files", []):
-            await create_download_link(
-                order_id=order_number,
-                user_id=tx.get("claimed_by_user_id", order_number),
-                user_email=tx.get("customer_email", ""),
-                product_id=product_id,
-                product_name=item.get("name", product_id),
-                file_path=f.get("path", ""),
-                payment_verified=True,
-            )
-            created += 1
+    created = await _fulfill_from_product_files(tx, order_number, "AdminMarkPaid")
 
     await log_admin_action(
         "mark_paid", admin.id, "order", order_number,
@@ -2227,6 +2274,8 @@ async def get_users_list(
     archived: Optional[str] = "active",  # 'active' (default — hide archived), 'archived', 'all'
     page: int = 1,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    with_total: bool = True,
     admin: AdminUser = Depends(get_current_admin)
 ):
     """Get users list. Archived users are hidden by default — pass archived='archived'
@@ -2262,18 +2311,16 @@ async def get_users_list(
     
     skip = (page - 1) * limit
     
-    users = await db.users.find(
-        query, {"_id": 0, "password_hash": 0, "password_history": 0}
-    ).skip(skip).limit(limit).sort("created_at", -1).to_list(limit)
+    users, next_cursor = await pagination.fetch_page(
+        db.users, query, "created_at",
+        {"_id": 0, "password_hash": 0, "password_history": 0}, limit, cursor, skip
+    )
     
-    total = await db.users.count_documents(query)
+    total = await pagination.count(db.users, query, with_total)
     
     return {
         "items": users,
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "pages": (total + limit - 1) // limit,
+        **pagination.page_meta(total, page, limit, next_cursor),
         "roles": list(ROLES.keys())
     }
 
@@ -2321,6 +2368,7 @@ async def create_user(user_data: UserCreate, request: Request, admin: AdminUser
     }
 
     await db.users.insert_one(user_doc)
+    await dashboard_stats.user_created()
 
     invite_email_sent = False
     if is_invite:
@@ -2408,6 +2456,7 @@ async def update_user(
             update_doc["disabled_by"] = admin.id
     
     await db.users.update_one({"id": user_id}, {"$set": update_doc})
+    await principal.invalidate(user_id)
     
     await log_admin_action("update_user", admin.id, "user", user_id, update_doc)
     
@@ -2438,6 +2487,7 @@ async def admin_reset_password(user_id: str, admin: AdminUser = Depends(get_curr
             "password_reset_at": now.isoformat()
         }}
     )
+    await principal.invalidate(user_id)
     
     await log_admin_action("reset_password", admin.id, "user", user_id)
     
@@ -2465,6 +2515,7 @@ async def lock_user_account(user_id: str, admin: AdminUser = Depends(get_current
             "lock_reason": "admin_lock"
         }}
     )
+    await principal.invalidate(user_id)
     
     await log_admin_action("lock_account", admin.id, "user", user_id)
     
@@ -2492,6 +2543,7 @@ async def unlock_user_account(user_id: str, admin: AdminUser = Depends(get_curre
             "lock_reason": ""
         }}
     )
+    await principal.invalidate(user_id)
     
     # Clear any lockouts
     from security import clear_lockout
@@ -2593,6 +2645,8 @@ async def bulk_tag_orders(
     filter_q = {"order_number": {"$in": payload.order_numbers}}
     orders_res = await db.orders.update_many(filter_q, update_doc)
     tx_res = await db.payment_transactions.update_many(filter_q, update_doc)
+    for order_number in payload.order_numbers:
+        await entitlements.refresh_for_order(order_number)
     await log_admin_action(
         "bulk_tag_orders",
         admin.id,
@@ -2707,6 +2761,11 @@ async def admin_set_order_status(
     filter_q = {"$or": [{"order_number": order_number}, {"order_id": order_number}, {"session_id": order_number}]}
     o_res = await db.orders.update_many(filter_q, {"$set": set_fields})
     t_res = await db.payment_transactions.update_many(filter_q, {"$set": set_fields})
+    if txn and t_res.modified_count and "payment_status" in set_fields:
+        await dashboard_stats.payment_status_changed(
+            txn.get("payment_status"), set_fields["payment_status"], txn.get("total_amount")
+        )
+    await entitlements.refresh_for_order(order_number)
 
     await log_admin_action("set_order_status", admin.id, "order", f"{order_number} -> {status}")
     return {
@@ -2754,6 +2813,7 @@ async def admin_set_order_access(
     filter_q = {"$or": [{"order_number": order_number}, {"order_id": order_number}, {"session_id": order_number}]}
     await db.orders.update_many(filter_q, {"$set": set_fields})
     await db.payment_transactions.update_many(filter_q, {"$set": set_fields})
+    await entitlements.refresh_for_order(order_number)
 
     await log_admin_action(f"order_access_{action}", admin.id, "order", order_number)
     return {"success": True, "order_number": order_number, "action": action, "links_changed": links_changed}
@@ -2786,9 +2846,11 @@ async def get_audit_logs(
     end_date: Optional[datetime] = None,
     page: int = 1,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = True,
     current_admin: AdminUser = Depends(get_current_admin)
 ):
-    """Get audit logs"""
+    """Get audit logs (keyset-paged via ``cursor``)"""
     query = {}
     if action:
         query["action"] = action
@@ -2803,8 +2865,10 @@ async def get_audit_logs(
     
     skip = (page - 1) * limit
     
-    logs = await db.admin_audit_logs.find(query, {"_id": 0}).skip(skip).limit(limit).sort("timestamp", -1).to_list(limit)
-    total = await db.admin_audit_logs.count_documents(query)
+    logs, next_cursor = await pagination.fetch_page(
+        db.admin_audit_logs, query, "timestamp", {"_id": 0}, limit, cursor, skip
+    )
+    total = await pagination.count(db.admin_audit_logs, query, with_total)
     
     # Also get security audit logs
     security_logs = await db.audit_logs.find({}, {"_id": 0}).sort("timestamp", -1).limit(50).to_list(50)
@@ -2812,10 +2876,7 @@ async def get_audit_logs(
     return {
         "admin_logs": logs,
         "security_logs": security_logs,
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "pages": (total + limit - 1) // limit
+        **pagination.page_meta(total, page, limit, next_cursor),
     }
 
 # =============================================================================
@@ -2880,62 +2941,70 @@ async def delete_video(video_id: str, admin: AdminUser = Depends(get_current_adm
 # EXPORT FUNCTIONS
 # =============================================================================
 
+def _export_query(start_date: Optional[datetime], end_date: Optional[datetime]) -> dict:
+    return _created_at_range(start_date, end_date) or {}
+
+
+def _export_header(admin: AdminUser) -> dict:
+    return {"exported_at": datetime.now(timezone.utc).isoformat(), "exported_by": admin.id}
+
+
 @router.get("/export/content")
-async def export_content(admin: AdminUser = Depends(get_current_admin)):
-    """Export all content as JSON"""
-    lessons = await db.lessons.find({}, {"_id": 0}).to_list(10000)
-    instructor_content = await db.instructor_content.find({}, {"_id": 0}).to_list(10000)
-    
-    export_data = {
-        "exported_at": datetime.now(timezone.utc).isoformat(),
-        "exported_by": admin.id,
-        "lessons": lessons,
-        "instructor_content": instructor_content
-    }
+async def export_content(
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to include"),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    gzip: bool = False,
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """Export all content (lessons + instructor content), streamed"""
+    cols = export_stream.parse_fields(fields)
+    proj = export_stream.projection(cols)
+    query = _export_query(start_date, end_date)
+    sections = [
+        ("lessons", db.lessons.find(query, proj)),
+        ("instructor_content", db.instructor_content.find(query, proj)),
+    ]
     
     await log_admin_action("export_content", admin.id, "export", None)
     
-    return JSONResponse(content=export_data)
+    return export_stream.export_response("content_export", fmt, sections, _export_header(admin), cols, gzip)
 
 @router.get("/export/orders")
 async def export_orders(
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to include"),
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
+    gzip: bool = False,
     admin: AdminUser = Depends(get_current_admin)
 ):
-    """Export orders as JSON"""
-    query = {}
-    if start_date:
-        query.setdefault("created_at", {})["$gte"] = start_date.isoformat()
-    if end_date:
-        query.setdefault("created_at", {})["$lte"] = end_date.isoformat()
-    
-    orders = await db.orders.find(query, {"_id": 0}).to_list(10000)
-    
-    export_data = {
-        "exported_at": datetime.now(timezone.utc).isoformat(),
-        "exported_by": admin.id,
-        "orders": orders
-    }
+    """Export orders, streamed (no row cap)"""
+    cols = export_stream.parse_fields(fields)
+    cursor = db.orders.find(_export_query(start_date, end_date), export_stream.projection(cols))
     
     await log_admin_action("export_orders", admin.id, "export", None)
     
-    return JSONResponse(content=export_data)
+    return export_stream.export_response("orders_export", fmt, [("orders", cursor)], _export_header(admin), cols, gzip)
 
 @router.get("/export/users")
-async def export_users(admin: AdminUser = Depends(get_current_admin)):
-    """Export users (without passwords) as JSON"""
-    users = await db.users.find({}, {"_id": 0, "password_hash": 0, "password_history": 0}).to_list(10000)
-    
-    export_data = {
-        "exported_at": datetime.now(timezone.utc).isoformat(),
-        "exported_by": admin.id,
-        "users": users
-    }
+async def export_users(
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to include"),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    gzip: bool = False,
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """Export users (without passwords), streamed"""
+    cols = export_stream.parse_fields(fields)
+    proj = export_stream.projection(cols, exclude=("password_hash", "password_history"))
+    cursor = db.users.find(_export_query(start_date, end_date), proj)
     
     await log_admin_action("export_users", admin.id, "export", None)
     
-    return JSONResponse(content=export_data)
+    return export_stream.export_response("users_export", fmt, [("users", cursor)], _export_header(admin), cols, gzip)
 
 # =============================================================================
 # SYSTEM HEALTH / BACKUP STATUS
@@ -2969,6 +3038,53 @@ async def get_system_health(admin: AdminUser = Depends(get_current_admin)):
     }
 
 
+@router.get("/system/indexes")
+async def get_index_report(
+    slow_ms: int = Query(100, ge=0),
+    apply: bool = False,
+    admin: AdminUser = Depends(get_current_admin)
+):
+    """Declared vs actual MongoDB indexes plus slow query shapes from the
+    profiler. ``apply=true`` first creates any missing declared index."""
+    applied = await index_registry.apply() if apply else None
+    report = await index_registry.drift_report(slow_ms=slow_ms)
+    if applied is not None:
+        report["applied"] = applied
+        await log_admin_action("apply_indexes", admin.id, "system", "indexes", {"created": applied["created"]})
+    return JSONResponse(content=json.loads(json.dumps(report, default=str)))
+
+
+@router.get("/system/email-outbox")
+async def get_email_outbox_stats(admin: AdminUser = Depends(get_current_admin)):
+    """Outbox message counts by status and the age of the oldest pending one."""
+    import email_outbox
+    return await email_outbox.stats()
+
+
+@router.get("/system/stripe-events")
+async def get_stripe_event_stats(admin: AdminUser = Depends(get_current_admin)):
+    """Stripe webhook ledger: event counts by status and the age of the
+    oldest queued one."""
+    import stripe_events
+    return await stripe_events.stats()
+
+
+@router.get("/system/fulfillment-timings")
+async def get_fulfillment_timings(admin: AdminUser = Depends(get_current_admin)):
+    """Per-stage fulfillment latency (p50/p95/max, ms) for each entry point
+    over this worker's recent orders."""
+    return fulfillment.timings_summary()
+
+
+@router.post("/system/dashboard-stats/reconcile")
+async def reconcile_dashboard_stats(admin: AdminUser = Depends(get_current_admin)):
+    """Recompute the dashboard counters from the source collections now and
+    report how far they had drifted."""
+    result = await dashboard_stats.reconcile()
+    await log_admin_action("reconcile_dashboard_stats", admin.id, "system", "dashboard_stats", result["drift"])
+    return result
+
+
 
 # ==================== CATALOG CSV MANAGEMENT ====================
 
@@ -3160,6 +3276,7 @@ async def upload_catalog_csv(
         
         with open(catalog_path, "w") as f:
             f.write(new_content)
+        await product_catalog.invalidate()
     
     await log_admin_action("catalog_csv_upload", admin.id, "catalog", None, {
         "updated_count": len(updated),
@@ -3310,8 +3427,6 @@ async def grant_digital_access(
 ):
     """Manually grant digital content access to a user by email.
     This is the 'file drop' — adds download links to someone's library without needing a purchase."""
-    from download_protection import create_download_link
-    
     body = await request.json()
     email = body.get("email", "").strip().lower()
     product_ids = body.get("product_ids", [])  # List of product_id strings
@@ -3340,31 +3455,30 @@ async def grant_digital_access(
             errors.append({"product_id": pid, "error": "File not found"})
             continue
         
-        # Create the download link
+        # Create the download link (each grant is its own one-item order)
         order_id = f"ADMIN-GRANT-{secrets.token_hex(4).upper()}"
-        token, expires_at = await create_download_link(
-            order_id=order_id,
-            user_id=email,
-            user_email=email,
-            product_id=pid,
-            product_name=pid.replace("-", " ").replace("_", " ").title(),
-            file_path=file_path,
-            payment_verified=True
-        )
+        name = pid.replace("-", " ").replace("_", " ").title()
+        run = fulfillment.FulfillmentRun(order_id, user_id=email, user_email=email, caller="AdminFileDrop")
+        await run.link_entries([{"product_id": pid, "file_key": pid, "name": name, "pdf_path": file_path}], verify=False)
+        if not run.links:
+            errors.append({"product_id": pid, "error": run.failures[0].get("error", "Link creation failed")})
+            await run.finish()
+            continue
+        link = run.links[0]
         
         # Also create a fake "paid" transaction so it shows in My Library
-        await db.payment_transactions.update_one(
+        grant_res = await db.payment_transactions.update_one(
             {"order_number": order_id},
             {"$set": {
                 "session_id": order_id,
                 "order_number": order_id,
-                "items": [{"product_id": pid, "name": pid.replace("-", " ").replace("_", " ").title(), "quantity": 1}],
+                "items": [{"product_id": pid, "name": name, "quantity": 1}],
                 "total_amount": 0,
                 "currency": "usd",
                 "payment_status": "paid",
-                "status": "admin_grant",
                 "customer_email": email,
-                "download_links_generated": True,
+                "customer_email_lc": lc_keys.lc(email),
+                "search_keys": order_search.search_keys({"order_number": order_id, "customer_email": email}),
                 "admin_granted_by": admin.id,
                 "admin_grant_reason": reason,
                 "created_at": datetime.now(timezone.utc),
@@ -3372,8 +3486,13 @@ async def grant_digital_access(
             }},
             upsert=True
         )
+        if grant_res.upserted_id is not None:
+            await dashboard_stats.order_created({"payment_status": "paid", "total_amount": 0})
+        await run.record({"order_number": order_id}, extra={"status": "admin_grant"})
         
-        granted.append({"product_id": pid, "token": token[:20] + "...", "expires": expires_at.isoformat()})
+        granted.append({"product_id": pid, "token": link["token"][:20] + "...", "expires": link["expires_at"].isoformat()})
+        await entitlements.refresh_for_order(order_id)
+        await run.finish()
     
     await log_admin_action("grant_access", admin.id, "fulfillment", None, {
         "email": email,
@@ -3398,7 +3517,6 @@ async def retry_order_fulfillment(
 ):
     """Retry generating download links for a paid order that failed fulfillment.
     No redeploy needed — uses MongoDB mappings + hardcoded fallback."""
-    from download_protection import create_download_link
     from payment_routes import get_pdf_path, normalize_product_id
     
     order = await db.payment_transactions.find_one(
@@ -3421,9 +3539,9 @@ async def retry_order_fulfillment(
     ).to_list(50)
     existing_pids = {dl.get("product_id") for dl in existing}
     
-    created = []
     skipped = []
     errors = []
+    entries = []
     
     for item in items:
         pid = item.get("product_id") or item.get("id") or item.get("uniqueKey", "")
@@ -3451,22 +3569,28 @@ async def retry_order_fulfillment(
             skipped.append({"product_id": pid, "name": name, "reason": "Already has download link"})
             continue
         
-        token, expires_at = await create_download_link(
-            order_id=order_number,
-            user_id=email,
-            user_email=email,
-            product_id=matched_pid,
-            product_name=name,
-            file_path=file_path,
-            payment_verified=True
-        )
-        created.append({"product_id": pid, "name": name, "token": token[:20] + "..."})
+        entries.append({"product_id": pid, "file_key": matched_pid, "name": name, "pdf_path": file_path})
+    
+    # All missing links in one engine run (one links insert, one audit insert)
+    run = fulfillment.FulfillmentRun(order_number, user_id=email, user_email=email, caller="AdminRetry")
+    await run.link_entries(entries, verify=False)
+    pid_by_key = {e["file_key"]: e["product_id"] for e in entries}
+    created = [
+        {"product_id": pid_by_key.get(link["product_id"], link["product_id"]), "name": link["name"],
+         "token": link["token"][:20] + "..."}
+        for link in run.links
+    ]
+    errors.extend(
+        {"product_id": f.get("product_id"), "name": f.get("name"), "error": f.get("error") or f.get("reason")}
+        for f in run.failures
+    )
     
     if created:
-        await db.payment_transactions.update_one(
+        await run.record(
             {"order_number": order_number},
-            {"$set": {"download_links_generated": True, "updated_at": datetime.now(timezone.utc)}}
+            extra={"downloads_count": len(existing) + len(created), "updated_at": datetime.now(timezone.utc)},
         )
+    await run.finish()
     
     await log_admin_action("retry_fulfillment", admin.id, "order", order_number, {
         "created": len(created), "skipped": len(skipped), "errors": len(errors)
@@ -36,12 +36,10 @@ Schema (db.redemption_codes):
 """
 import csv
 import io
-import os
 from datetime import datetime, timezone
 from typing import Optional
 
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query
-from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, Field
 
 # Import the same admin auth dependency used by the rest of admin_routes
@@ -49,9 +47,8 @@ from routes.admin_routes import get_current_admin, AdminUser, log_admin_action
 
 router = APIRouter(prefix="/api/admin/codes-redemptions", tags=["admin", "codes"])
 
-MONGO_URL = os.getenv("MONGO_URL")
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ["DB_NAME"]]
+from database import db  # noqa: E402 — shared pool
+import lc_keys  # noqa: E402
 
 
 # ---------------------------------------------------------------------------
@@ -158,7 +155,7 @@ async def import_csv(
         if existing:
             skipped += 1
             continue
-        await db.redemption_codes.insert_one(doc)
+        await db.redemption_codes.insert_one(lc_keys.with_lc("redemption_codes", doc))
         inserted += 1
 
     summary = {
@@ -435,10 +432,10 @@ async def seed_demo_test(admin: AdminUser = Depends(get_current_admin)):
             # Preserve runtime state, refresh rules
             update = {k: v for k, v in doc.items() if k not in ("uses_used", "status", "created_at")}
             update["updated_at"] = now
-            await db.redemption_codes.update_one({"code": doc["code"]}, {"$set": update})
+            await db.redemption_codes.update_one({"code": doc["code"]}, {"$set": lc_keys.with_lc("redemption_codes", update)})
             refreshed += 1
         else:
-            await db.redemption_codes.insert_one(doc)
+            await db.redemption_codes.insert_one(lc_keys.with_lc("redemption_codes", doc))
             inserted += 1
 
     for d in TEST_CODES_DEF:
@@ -447,10 +444,10 @@ async def seed_demo_test(admin: AdminUser = Depends(get_current_admin)):
         if existing:
             update = {k: v for k, v in doc.items() if k not in ("uses_used", "status", "created_at")}
             update["updated_at"] = now
-            await db.redemption_codes.update_one({"code": doc["code"]}, {"$set": update})
+            await db.redemption_codes.update_one({"code": doc["code"]}, {"$set": lc_keys.with_lc("redemption_codes", update)})
             refreshed += 1
         else:
-            await db.redemption_codes.insert_one(doc)
+            await db.redemption_codes.insert_one(lc_keys.with_lc("redemption_codes", doc))
             inserted += 1
 
     summary = {"inserted": inserted, "refreshed": refreshed,
@@ -9,13 +9,20 @@ Protected download endpoints with:
 """
 
 from fastapi import APIRouter, HTTPException, Request, Depends
-from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 import os
+import re
 
+import anyio
+
+import attachment_index
+import blob_cache
+from database import db
 from download_protection import (
     verify_download_token, record_download, get_remaining_downloads,
+    claim_resume, remember_resume_point,
     resend_download_links, get_order_download_status,
     create_download_link, DOWNLOAD_LINK_EXPIRY_HOURS, MAX_DOWNLOADS_PER_ORDER
 )
@@ -94,33 +101,149 @@ async def find_object_storage_file(product_id: str, stored_path: str = "") -> Op
     """
     if not product_id:
         return None
-    try:
-        # lazy import to avoid circular with server.py at module load time
-        from server import db
-    except Exception as e:
-        print(f"[Download] Object storage fallback unavailable (db import failed): {e}")
-        return None
 
-    query = {
-        "is_deleted": False,
-        "attachments": {
-            "$elemMatch": {"target_type": "product", "target_id": product_id}
-        },
-    }
+    # Served from the in-process attachment index (newest first)
+    await attachment_index.ensure_loaded()
+    files = attachment_index.files_for(product_id)
+    if not files:
+        return None
     basename = os.path.basename(stored_path or "").lower()
     if basename:
         # Try exact filename match first — disambiguates aliased products
-        exact = await db.files.find_one(
-            {**query, "original_filename": {"$regex": f"^{basename}$", "$options": "i"}},
-            {"_id": 0, "id": 1, "storage_path": 1, "original_filename": 1, "content_type": 1},
-        )
-        if exact:
-            return exact
-    return await db.files.find_one(
-        query,
-        {"_id": 0, "id": 1, "storage_path": 1, "original_filename": 1, "content_type": 1},
-        sort=[("created_at", -1)],
-    )
+        for f in files:
+            if (f.get("original_filename") or "").lower() == basename:
+                return dict(f)
+    return dict(files[0])
+
+
+_SINGLE_RANGE_RE = re.compile(r"^bytes=(\d+)-(\d*)$")
+
+
+def _single_range(range_header: Optional[str]) -> Optional[str]:
+    """Return the Range header if it is a single ``bytes=N-`` / ``bytes=N-M``
+    range (what browsers and download managers send on resume). Multi-range
+    and suffix ranges are ignored — the full file is served instead."""
+    if not range_header:
+        return None
+    value = range_header.strip()
+    return value if _SINGLE_RANGE_RE.match(value) else None
+
+
+async def _record_unless_resume(token: str, ip_address: str, user_agent: str, start: int) -> None:
+    """Every admitted request counts as a download, except a Range request
+    that resumes this token's last interrupted stream from at or before where
+    it stopped (see ``claim_resume``)."""
+    if await claim_resume(token, start):
+        return
+    await record_download(token, ip_address, user_agent)
+
+
+async def _note_interrupted(token: str, start: int, served: int, completed: bool) -> None:
+    """After a stream ends early, remember its offset for a free resume.
+    ``served`` counts only chunks whose send completed (it is bumped after
+    the ``yield``). Shielded: runs while the response task is being cancelled."""
+    if completed or not served:
+        return
+    with anyio.CancelScope(shield=True):
+        try:
+            await remember_resume_point(token, start + served)
+        except Exception as e:
+            print(f"[Download] could not store resume point: {e}")
+
+
+def _range_start(range_header: Optional[str]) -> int:
+    return int(_SINGLE_RANGE_RE.match(range_header).group(1)) if range_header else 0
+
+
+def _download_headers(record: dict, remaining: int, original_filename: Optional[str], source: str) -> dict:
+    """Response headers shared by storage-streamed and cache-served downloads."""
+    # Generate safe download filename
+    product_name = record.get("product_name", "Download")
+    safe_name = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in product_name)
+    safe_name = safe_name.strip().replace(" ", "_")[:100]
+    ext = os.path.splitext(original_filename or "file.pdf")[1] or ".pdf"
+    filename = f"SoulFood_{safe_name}{ext}"
+
+    headers = {"X-Downloads-Remaining": str(remaining), "X-Source": source, "Accept-Ranges": "bytes"}
+    try:
+        expires_at = record.get("expires_at")
+        if expires_at and hasattr(expires_at, "isoformat"):
+            headers["X-Download-Expires"] = expires_at.isoformat()
+        elif expires_at:
+            headers["X-Download-Expires"] = str(expires_at)
+    except Exception:
+        pass
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return headers
+
+
+async def _serve_cached_blob(
+    cached_path: str,
+    record: dict,
+    token: str,
+    ip_address: str,
+    user_agent: str,
+    original_filename: Optional[str],
+    media_type: str,
+    range_header: Optional[str],
+) -> Optional[Response]:
+    """Serve a blob-cache hit from local disk, with the same accounting and
+    Range semantics as the storage stream.
+
+    Another worker's eviction can delete the entry at any time, so the file is
+    opened before the download is recorded and the open handle is what gets
+    streamed. Returns None (nothing recorded) when the entry is already gone;
+    the caller then streams from storage."""
+    try:
+        fh = await anyio.open_file(cached_path, "rb")
+    except OSError as e:
+        print(f"[Download] blob cache entry vanished before serving, using storage: {e}")
+        return None
+    try:
+        size = os.fstat(fh.wrapped.fileno()).st_size
+        start = end = None
+        if range_header:
+            m = _SINGLE_RANGE_RE.match(range_header)
+            start = int(m.group(1))
+            end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            if start >= size or start > end:
+                raise HTTPException(status_code=416, detail="Requested range not satisfiable.")
+
+        await _record_unless_resume(token, ip_address, user_agent, start or 0)
+        remaining = await get_remaining_downloads(token)
+    except BaseException:
+        await fh.aclose()
+        raise
+    headers = _download_headers(record, remaining, original_filename, "blob-cache")
+
+    status_code = 200
+    if start is None:
+        start, end = 0, size - 1
+    else:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    async def _body():
+        import storage_service as ss
+        served = 0
+        completed = False
+        try:
+            async with fh:
+                await fh.seek(start)
+                left = end - start + 1
+                while left > 0:
+                    chunk = await fh.read(min(ss.STREAM_CHUNK_BYTES, left))
+                    if not chunk:
+                        break
+                    left -= len(chunk)
+                    yield chunk
+                    served += len(chunk)
+            completed = True
+        finally:
+            await _note_interrupted(token, start, served, completed)
+
+    return StreamingResponse(_body(), status_code=status_code, media_type=media_type, headers=headers)
 
 
 async def _stream_from_object_storage(
@@ -131,24 +254,45 @@ async def _stream_from_object_storage(
     user_agent: str,
     original_filename: Optional[str] = None,
     content_type: Optional[str] = None,
+    range_header: Optional[str] = None,
+    etag: Optional[str] = None,
 ) -> Response:
     """Stream a file from Emergent Object Storage as the response body. Records
     the download against the link token and surfaces the same X-* headers
     used by local-disk downloads. Common helper used by both the
-    ``objstore:<path>`` branch and the db.files product-attachment fallback."""
+    ``objstore:<path>`` branch and the db.files product-attachment fallback.
+
+    The body is piped through in ``STREAM_CHUNK_BYTES`` chunks, so memory per
+    download stays flat regardless of file size. A single-range ``Range``
+    header is passed through to storage for resume support. The download is
+    only recorded once storage has accepted the request.
+
+    Hot files are served from the local blob cache (keyed by storage_path +
+    etag) when present; full-body misses are written through to it."""
+    import storage_service as ss
+    range_header = _single_range(range_header)
+
+    cached_path = blob_cache.lookup(storage_path, etag)
+    if cached_path:
+        cached = await _serve_cached_blob(
+            cached_path, record, token, ip_address, user_agent, original_filename,
+            content_type or "application/octet-stream", range_header,
+        )
+        if cached is not None:
+            return cached
+
     try:
-        import storage_service as ss
-        data, fetched_ct = ss.get_object(storage_path)
+        upstream = await ss.astream_object(storage_path, range_header)
     except Exception as storage_err:
         # If the storage backend reported a missing object, surface 404 so the
         # frontend can show "file not found" rather than "try again later".
         # 5xx (timeouts, key issues, etc.) stay as 502.
         status_code = 502
         try:
-            import requests
-            if isinstance(storage_err, requests.HTTPError) and storage_err.response is not None:
-                if storage_err.response.status_code == 404:
-                    status_code = 404
+            if ss.is_not_found(storage_err):
+                status_code = 404
+            elif getattr(getattr(storage_err, "response", None), "status_code", None) == 416:
+                status_code = 416
         except Exception:
             pass
         print(f"[Download] Object Storage read failed for {storage_path}: {storage_err} (returning {status_code})")
@@ -157,35 +301,53 @@ async def _stream_from_object_storage(
                 status_code=404,
                 detail="File no longer available. Please contact support@kingdom-soul.com to have it re-uploaded."
             )
+        if status_code == 416:
+            raise HTTPException(status_code=416, detail="Requested range not satisfiable.")
         raise HTTPException(
             status_code=502,
             detail="Storage temporarily unavailable. Please try again or contact support@kingdom-soul.com."
         )
 
-    # Record the download (same accounting as the local path)
-    await record_download(token, ip_address, user_agent)
-    remaining = await get_remaining_downloads(token)
-
-    # Generate safe download filename
-    product_name = record.get("product_name", "Download")
-    safe_name = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in product_name)
-    safe_name = safe_name.strip().replace(" ", "_")[:100]
-    ext = os.path.splitext(original_filename or "file.pdf")[1] or ".pdf"
-    filename = f"SoulFood_{safe_name}{ext}"
-
-    headers = {"X-Downloads-Remaining": str(remaining), "X-Source": "object-storage"}
     try:
-        expires_at = record.get("expires_at")
-        if expires_at and hasattr(expires_at, "isoformat"):
-            headers["X-Download-Expires"] = expires_at.isoformat()
-        elif expires_at:
-            headers["X-Download-Expires"] = str(expires_at)
+        # Record the download (same accounting as the local path)
+        start = _range_start(range_header) if upstream.status_code == 206 else 0
+        await _record_unless_resume(token, ip_address, user_agent, start)
+        remaining = await get_remaining_downloads(token)
     except Exception:
-        pass
-    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        await upstream.aclose()
+        raise
+
+    headers = _download_headers(record, remaining, original_filename, "object-storage")
+    for h in ("Content-Length", "Content-Range", "ETag", "Last-Modified"):
+        if upstream.headers.get(h):
+            headers[h] = upstream.headers[h]
 
-    media_type = content_type or fetched_ct or "application/octet-stream"
-    return Response(content=data, media_type=media_type, headers=headers)
+    # Only complete bodies are cached; partial (206) responses just stream.
+    writer = None
+    if upstream.status_code == 200:
+        length = upstream.headers.get("Content-Length")
+        writer = await blob_cache.open_writer(storage_path, etag, int(length) if length and length.isdigit() else None)
+
+    async def _body():
+        served = 0
+        completed = False
+        try:
+            async for chunk in upstream.aiter_bytes(ss.STREAM_CHUNK_BYTES):
+                if writer:
+                    await writer.write(chunk)
+                yield chunk
+                served += len(chunk)
+            completed = True
+        finally:
+            await upstream.aclose()
+            await _note_interrupted(token, start, served, completed)
+            if writer:
+                # Shielded so a disconnect can't leave the temp file behind.
+                with anyio.CancelScope(shield=True):
+                    await (writer.commit() if completed else writer.abort())
+
+    media_type = content_type or upstream.headers.get("Content-Type") or "application/octet-stream"
+    return StreamingResponse(_body(), status_code=upstream.status_code, media_type=media_type, headers=headers)
 
 
 # =============================================================================
@@ -221,8 +383,10 @@ async def download_file(token: str, request: Request):
         ip_address = request.client.host if request.client else "unknown"
         user_agent = request.headers.get("user-agent", "")
         
-        # Verify token and all restrictions
-        is_valid, record, error_msg = await verify_download_token(token)
+        # Verify token and all restrictions (a resume may finish a download
+        # that used the last allowed count)
+        resume_from = _range_start(_single_range(request.headers.get("range")))
+        is_valid, record, error_msg = await verify_download_token(token, resume_from)
         
         if not is_valid:
             raise HTTPException(status_code=403, detail=error_msg)
@@ -236,11 +400,10 @@ async def download_file(token: str, request: Request):
             storage_path = file_path[len("objstore:"):]
             obj_meta = None
             try:
-                # lazy db lookup for original filename + content type
-                from server import db as _db
-                obj_meta = await _db.files.find_one(
+                # db lookup for original filename + content type + etag
+                obj_meta = await db.files.find_one(
                     {"storage_path": storage_path},
-                    {"_id": 0, "original_filename": 1, "content_type": 1},
+                    {"_id": 0, "original_filename": 1, "content_type": 1, "etag": 1},
                 )
             except Exception:
                 pass
@@ -248,6 +411,8 @@ async def download_file(token: str, request: Request):
                 storage_path, record, token, ip_address, user_agent,
                 original_filename=(obj_meta or {}).get("original_filename"),
                 content_type=(obj_meta or {}).get("content_type"),
+                range_header=request.headers.get("range"),
+                etag=(obj_meta or {}).get("etag"),
             )
 
         resolved_path = resolve_file_path(file_path)
@@ -264,6 +429,8 @@ async def download_file(token: str, request: Request):
                     obj_record["storage_path"], record, token, ip_address, user_agent,
                     original_filename=obj_record.get("original_filename"),
                     content_type=obj_record.get("content_type"),
+                    range_header=request.headers.get("range"),
+                    etag=obj_record.get("etag"),
                 )
 
             print(f"[Download] FILE NOT FOUND for token. Stored path: {file_path}; "
@@ -274,7 +441,7 @@ async def download_file(token: str, request: Request):
             )
         
         # Record the download
-        await record_download(token, ip_address, user_agent)
+        await _record_unless_resume(token, ip_address, user_agent, resume_from)
         
         # Get remaining downloads for response header
         remaining = await get_remaining_downloads(token)
@@ -373,9 +540,7 @@ async def resend_download_link(data: ResendLinkRequest, request: Request):
         # Stuck-order recovery: verify the order belongs to this email AND is paid,
         # then run the SAME refulfill logic the admin uses. After that, retry the
         # resend. This is the customer self-serve path for "Processing" forever orders.
-        from motor.motor_asyncio import AsyncIOMotorClient as _Cli
-        _db = _Cli(os.environ['MONGO_URL'])[os.environ['DB_NAME']]
-        tx = await _db.payment_transactions.find_one(
+        tx = await db.payment_transactions.find_one(
             {"order_number": normalized_order_id},
             {"_id": 0, "customer_email": 1, "payment_status": 1}
         )
@@ -559,8 +724,4 @@ async def diagnose_download(token: str):
 
 async def verify_download_token_raw(token_hash: str):
     """Raw DB lookup for diagnostic purposes"""
-    from motor.motor_asyncio import AsyncIOMotorClient
-    MONGO_URL = os.getenv('MONGO_URL')
-    client = AsyncIOMotorClient(MONGO_URL)
-    db = client[os.environ['DB_NAME']]
     return await db.download_links.find_one({"token_hash": token_hash}, {"_id": 0})
@@ -17,9 +17,7 @@ import secrets
 import string
 
 # Database
-from motor.motor_asyncio import AsyncIOMotorClient
-client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
-db = client[os.environ['DB_NAME']]
+from database import db  # noqa: E402 — shared pool
 
 router = APIRouter(prefix="/api/gift-certificates", tags=["gift-certificates"])
 
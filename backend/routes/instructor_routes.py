@@ -7,28 +7,17 @@ Instructor Routes - Gated content for instructors
 - Teaching Resources
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
-from jose import JWTError, jwt
-import os
 import secrets
 
 router = APIRouter(prefix="/api/instructor", tags=["instructor"])
 
 # Database connection
-MONGO_URL = os.getenv('MONGO_URL')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ['DB_NAME']]
-
-# JWT Settings - Must match auth_routes.py and admin_routes.py
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "soul-food-secret-key-change-in-production-2024")
-ALGORITHM = "HS256"
-
-security = HTTPBearer(auto_error=False)
+from database import db  # noqa: E402 — shared pool
+import principal  # noqa: E402
 
 # Roles with instructor access
 INSTRUCTOR_ROLES = ["instructor", "instructor_tester", "admin", "owner", "beta_tester"]
@@ -59,44 +48,38 @@ class RosterMemberUpdate(BaseModel):
 # Auth Helper
 # =============================================================================
 
-async def get_current_instructor(
-    authorization: HTTPAuthorizationCredentials = Depends(security)
-) -> InstructorUser:
+async def get_current_instructor(request: Request) -> InstructorUser:
     """Verify JWT and ensure user has instructor access"""
     
-    if not authorization:
+    if principal.bearer_token(request) is None:
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    token = authorization.credentials
-    
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub") or payload.get("user_id")
-        role = payload.get("role", "")
-        access_level = payload.get("access_level", "")
-        
-        # Check if user has instructor access
-        has_access = (
-            role in INSTRUCTOR_ROLES or 
-            access_level in ["instructor", "admin"]
-        )
-        
-        if not has_access:
-            raise HTTPException(
-                status_code=403, 
-                detail="Instructor access required"
-            )
-        
-        return InstructorUser(
-            id=user_id or "instructor",
-            email=payload.get("email", f"{role}@soulfood.com"),
-            name=payload.get("name", "Instructor"),
-            role=role,
-            access_level=access_level
-        )
-        
-    except JWTError:
+    payload = principal.claims(request)
+    if payload is None:
         raise HTTPException(status_code=401, detail="Invalid token")
+    user_id = payload.get("sub") or payload.get("user_id")
+    role = payload.get("role", "")
+    access_level = payload.get("access_level", "")
+    
+    # Check if user has instructor access
+    has_access = (
+        role in INSTRUCTOR_ROLES or 
+        access_level in ["instructor", "admin"]
+    )
+    
+    if not has_access:
+        raise HTTPException(
+            status_code=403, 
+            detail="Instructor access required"
+        )
+    
+    return InstructorUser(
+        id=user_id or "instructor",
+        email=payload.get("email", f"{role}@soulfood.com"),
+        name=payload.get("name", "Instructor"),
+        role=role,
+        access_level=access_level
+    )
 
 # =============================================================================
 # Answer Keys
@@ -2,11 +2,11 @@ from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from datetime import datetime
-import os
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 # Import PDF generator
 from utils.pdf_generator import LessonPDFGenerator
+import principal
 
 router = APIRouter(prefix="/interactive-lessons", tags=["interactive-lessons"])
 
@@ -1832,32 +1832,16 @@ def _grants_for_nibble(nibble_id: str) -> set:
     return grants
 
 
-def _expand_purchased_product_ids(items: list) -> set:
-    """Given the items array on a paid order, return the full set of effective
-    product_ids the buyer owns — including bundle expansions."""
-    try:
-        from payment_routes import BUNDLE_EXPANSIONS
-    except Exception:
-        BUNDLE_EXPANSIONS = {}
-    owned: set = set()
-    for it in items or []:
-        pid = it.get("product_id") or it.get("id") or it.get("uniqueKey")
-        if not pid:
-            continue
-        owned.add(pid)
-        # Expand if bundle
-        if pid in BUNDLE_EXPANSIONS:
-            for sub in BUNDLE_EXPANSIONS[pid]:
-                owned.add(sub)
-    return owned
-
-
 @router.get("/entitlement/{nibble_id}")
-async def check_nibble_entitlement(nibble_id: str, request: Request):
+async def check_nibble_entitlement(
+    nibble_id: str,
+    request: Request,
+    user: Optional[dict] = Depends(principal.optional_principal),
+):
     """Return {has_access, reason} for the current user against a given nibble.
-    Free nibbles always return has_access=true. For paid nibbles, scans the
-    user's paid orders (payment_transactions) and matches against bundle-aware
-    grant set. Auth optional — unauthenticated requests get has_access=false
+    Free nibbles always return has_access=true. For paid nibbles, matches the
+    user's materialized entitlements (bundle-expanded owned product ids)
+    against the grant set. Auth optional — unauthenticated requests get has_access=false
     unless the nibble is free."""
     # Locate the nibble first to read its is_free flag
     nibble = next((n for n in ALL_NIBBLES if n["id"] == nibble_id), None)
@@ -1867,51 +1851,24 @@ async def check_nibble_entitlement(nibble_id: str, request: Request):
     if nibble.get("is_free") is True:
         return {"has_access": True, "reason": "free", "nibble_id": nibble_id}
 
-    # Auth optional — peek at the bearer token if present.
-    user_id, user_email = None, None
-    auth_header = request.headers.get("Authorization") or ""
-    if auth_header.startswith("Bearer "):
-        token = auth_header.split(" ", 1)[1]
-        try:
-            from jose import jwt
-            secret = os.getenv("JWT_SECRET_KEY", "soul-food-secret-key-change-in-production-2024")
-            payload = jwt.decode(token, secret, algorithms=["HS256"])
-            user_id = payload.get("sub")
-            user_email = payload.get("email")
-        except Exception:
-            pass  # fall through to anon
-
-    if not user_id and not user_email:
-        return {"has_access": False, "reason": "not_authenticated", "nibble_id": nibble_id}
-
-    # Resolve email if missing
-    if user_id and not user_email:
-        from server import db
-        u = await db.users.find_one({"id": user_id}, {"_id": 0, "email": 1})
-        if u:
-            user_email = u.get("email")
-
-    # Scan paid transactions for this user
-    from server import db
-    or_clauses = []
-    if user_id:
-        or_clauses.append({"user_id": user_id})
-    if user_email:
-        or_clauses.append({"customer_email": user_email})
-    query = {"payment_status": "paid", "$or": or_clauses} if or_clauses else None
-    if not query:
+    # Auth optional — anonymous callers only see free nibbles.
+    user_id = user.get("id") if user else None
+    if not user_id:
         return {"has_access": False, "reason": "not_authenticated", "nibble_id": nibble_id}
 
+    # One keyed lookup against the materialized entitlement store
+    import entitlements
+    ent = await entitlements.get_for_user(user_id)
     grants = _grants_for_nibble(nibble_id)
-    cursor = db.payment_transactions.find(query, {"_id": 0, "items": 1, "order_number": 1, "session_id": 1})
-    async for txn in cursor:
-        owned = _expand_purchased_product_ids(txn.get("items"))
-        if owned & grants:
+    if grants.isdisjoint(ent.get("owned_product_ids") or []):
+        return {"has_access": False, "reason": "no_matching_purchase", "nibble_id": nibble_id}
+    for ref in ent.get("orders") or []:
+        if not grants.isdisjoint(ref.get("product_ids") or []):
             return {
                 "has_access": True,
                 "reason": "purchased",
                 "nibble_id": nibble_id,
-                "order_number": txn.get("order_number") or txn.get("session_id"),
+                "order_number": ref.get("order_number") or ref.get("order_id") or ref.get("session_id"),
             }
 
     return {"has_access": False, "reason": "no_matching_purchase", "nibble_id": nibble_id}
@@ -13,11 +13,9 @@ import stripe
 import secrets
 import string
 
-from motor.motor_asyncio import AsyncIOMotorClient
-
 # Database
-client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
-db = client[os.environ['DB_NAME']]
+from database import db  # noqa: E402 — shared pool
+import entitlements  # noqa: E402
 
 router = APIRouter(prefix="/api/orders", tags=["orders"])
 
@@ -401,6 +399,7 @@ async def cancel_preorder(request: OrderLookupRequest):
                 {"$or": [{"order_number": order_number}, {"session_id": order_number}]},
                 {"$set": update_data}
             )
+            await entitlements.refresh_for_order(order_number)
             
             return {
                 "success": True,
@@ -657,6 +656,7 @@ async def admin_process_refund(request: AdminRefundRequest):
                 )
             except Exception as _e:
                 pass
+        await entitlements.refresh_for_order(order_number)
         
         # Update refund request if exists
         await db.refund_requests.update_one(
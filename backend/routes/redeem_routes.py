@@ -7,14 +7,13 @@ from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel
 from datetime import datetime, timezone, timedelta
 from typing import Optional
-import os
 
 router = APIRouter(prefix="/api/orders", tags=["orders"])
 
 # MongoDB
-from motor.motor_asyncio import AsyncIOMotorClient
-mongo_client = AsyncIOMotorClient(os.environ.get("MONGO_URL"))
-db = mongo_client[os.environ["DB_NAME"]]
+from database import db  # noqa: E402 — shared pool
+import entitlements  # noqa: E402
+import principal  # noqa: E402
 
 # Rate limit constants for public resend
 RESEND_RATE_LIMIT = 3        # max requests
@@ -32,20 +31,7 @@ class ClaimAuthRequest(BaseModel):
 
 async def get_current_user_optional(request: Request):
     """Extract user from token if present, return None if not"""
-    auth_header = request.headers.get("Authorization", "")
-    if not auth_header.startswith("Bearer "):
-        return None
-    token = auth_header.split(" ")[1]
-    try:
-        from jose import jwt
-        payload = jwt.decode(token, os.environ.get("JWT_SECRET_KEY"), algorithms=["HS256"])
-        user_id = payload.get("sub")
-        if not user_id:
-            return None
-        user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-        return user
-    except Exception:
-        return None
+    return await principal.optional_principal(request)
 
 
 @router.get("/verify-claim")
@@ -157,7 +143,7 @@ async def claim_order(req: ClaimAuthRequest, request: Request):
         {"order_id": order_number},
         {"$set": {
             "user_id": user_id,
-            "user_email": user_email,
+            "user_email": user_email.lower(),
             "claimed_at": datetime.now(timezone.utc).isoformat()
         }}
     )
@@ -170,6 +156,7 @@ async def claim_order(req: ClaimAuthRequest, request: Request):
             "claimed_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    await entitlements.refresh_for_order(order_number)
     
     return {
         "message": "Order claimed successfully! Your content is now in My Library.",
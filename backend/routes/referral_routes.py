@@ -8,18 +8,14 @@ Auto-generate referral codes that give both sender and receiver 15% off.
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
-from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone, timedelta
-import os
 import secrets
 import string
 
 router = APIRouter(prefix="/api/referrals", tags=["referrals"])
 
 # Database connection
-MONGO_URL = os.getenv('MONGO_URL')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ['DB_NAME']]
+from database import db  # noqa: E402 — shared pool
 
 # Referral configuration
 REFERRAL_DISCOUNT_PERCENT = 15
@@ -23,7 +23,7 @@ from pydantic import BaseModel
 from routes.admin_routes import AdminUser, get_current_admin
 from routes.instructor_routes import InstructorUser, get_current_instructor
 from routes.admin_files_routes import _ext, _content_type_for, MAX_UPLOAD_BYTES
-from server import db
+from database import db
 import storage_service as ss
 
 admin_router = APIRouter(prefix="/api/admin/toolbox", tags=["admin-toolbox"])
@@ -248,7 +248,7 @@ async def _upload_and_assign(file: UploadFile, section_key: str, lane: str, owne
     storage_path = ss.make_storage_path(category, ext)
     content_type = file.content_type or _content_type_for(ext)
     try:
-        result = ss.put_object(storage_path, data, content_type)
+        result = await ss.aput_object(storage_path, data, content_type)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Storage upload failed: {e}")
     now = datetime.now(timezone.utc)
@@ -355,7 +355,7 @@ async def instr_download_asset(asset_id: str, instructor: InstructorUser = Depen
     if not record:
         raise HTTPException(status_code=404, detail="File not found")
     try:
-        data, ctype = ss.get_object(record["storage_path"])
+        data, ctype = await ss.aget_object(record["storage_path"])
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Storage read failed: {e}")
     headers = {"Content-Disposition": f'attachment; filename="{record.get("original_filename", "download")}"'}
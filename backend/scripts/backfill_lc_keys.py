@@ -0,0 +1,52 @@
+"""
+Backfill case-normalized ``*_lc`` lookup keys.
+
+Customer-email and coupon-code lookups match the lowercased ``<field>_lc``
+twins (see ``lc_keys.py``). New documents get them on insert and the server
+runs this migration once per database at boot; use this script to run it on
+demand (e.g. after importing documents directly into MongoDB). Idempotent.
+
+  python -m scripts.backfill_lc_keys
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import Optional
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env")
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("backfill_lc_keys")
+
+
+async def run_backfill(batch_size: int) -> dict:
+    import index_registry
+    import lc_keys
+
+    await index_registry.apply(list(lc_keys.LC_FIELDS) + list(lc_keys.LOWERCASE_FIELDS))
+    return await lc_keys.backfill_all(batch_size)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch-size", type=int, default=500)
+    args = ap.parse_args(argv)
+    summary = asyncio.run(run_backfill(args.batch_size))
+    logger.info("=== Backfill summary (documents updated) ===")
+    for k, v in summary.items():
+        logger.info("  %-22s %s", k, v)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
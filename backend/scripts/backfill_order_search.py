@@ -0,0 +1,49 @@
+"""
+Backfill ``search_keys`` on payment_transactions.
+
+Admin order search prefix-matches the indexed ``search_keys`` array (see
+``order_search.py``). New transactions get keys on insert; run this once to
+fill in existing ones. Idempotent — only documents without keys are touched.
+
+  python -m scripts.backfill_order_search
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import Optional
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env")
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("backfill_order_search")
+
+
+async def run_backfill(batch_size: int) -> int:
+    import index_registry
+    import order_search
+
+    await index_registry.apply(["payment_transactions"])
+    return await order_search.backfill(batch_size)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch-size", type=int, default=500)
+    args = ap.parse_args(argv)
+    updated = asyncio.run(run_backfill(args.batch_size))
+    logger.info("Backfilled search_keys on %d transaction(s)", updated)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""Benchmark + equivalence check for the compiled email templates.
+
+Renders every email builder in email_service with sample data and reports the
+cost per message, then a bulk run (``--bulk`` admin invites + order receipts,
+the shape of an admin bulk resend). The base layout, download-delivery and
+game-pass builders are also compared against a frozen copy of the previous
+f-string implementation (below, ``legacy_*``): output must match up to
+whitespace and HTML escaping of the sample values.
+
+Exits non-zero on any mismatch.
+Run: cd /app/backend && python3 -m scripts.bench_email_templates [--rounds N] [--bulk N]
+"""
+import argparse
+import html
+import os
+import re
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+import email_service as es  # noqa: E402
+import email_templates  # noqa: E402
+from email_service import EMAIL_FOOTER, SITE_URL  # noqa: E402
+
+# ---------------------------------------------------------------------------
+# Frozen reference implementation (pre-compilation). Do not edit — it is the
+# oracle the compiled templates must agree with.
+# ---------------------------------------------------------------------------
+
+def legacy_get_base_template(content: str, preheader: str = "") -> str:
+    return f"""
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Soul Food</title>
+</head>
+<body style="margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; background-color: #f3f4f6;">
+    <!-- Preheader text (hidden but shows in email preview) -->
+    <div style="display: none; max-height: 0; overflow: hidden;">{preheader}</div>
+
+    <table role="presentation" width="100%" cellspacing="0" cellpadding="0" style="background-color: #f3f4f6;">
+        <tr>
+            <td align="center" style="padding: 40px 20px;">
+                <table role="presentation" width="600" cellspacing="0" cellpadding="0" style="background-color: #ffffff; border-radius: 12px; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);">
+                    <!-- Header -->
+                    <tr>
+                        <td style="padding: 30px 40px; text-align: center; background: linear-gradient(135deg, #6366f1 0%, #8b5cf6 100%); border-radius: 12px 12px 0 0;">
+                            <h1 style="margin: 0; color: #ffffff; font-size: 28px; font-weight: bold;">Soul Food</h1>
+                            <p style="margin: 5px 0 0 0; color: #e0e7ff; font-size: 14px;">Kingdom Living Project</p>
+                        </td>
+                    </tr>
+                    <!-- Content -->
+                    <tr>
+                        <td style="padding: 40px;">
+                            {content}
+                            {EMAIL_FOOTER}
+                        </td>
+                    </tr>
+                </table>
+            </td>
+        </tr>
+    </table>
+</body>
+</html>
+"""
+
+
+def legacy_get_download_delivery_template(order_id, download_links, customer_name="Valued Customer"):
+    downloads_html = ""
+    for link in download_links:
+        token = link.get('token', '')
+        product_name = link.get('product_name', 'Download')
+        expires_at = link.get('expires_at', '')
+        downloads_html += f"""
+        <div style="margin-bottom: 15px; padding: 15px; background-color: #f9fafb; border-radius: 8px; border-left: 4px solid #6366f1;">
+            <strong style="color: #1f2937;">{product_name}</strong>
+            <p style="margin: 8px 0; color: #6b7280; font-size: 14px;">Expires: {expires_at[:10] if expires_at else '72 hours'}</p>
+            <a href="{SITE_URL}/api/downloads/file/{token}"
+               style="display: inline-block; padding: 10px 20px; background-color: #6366f1; color: #ffffff; text-decoration: none; border-radius: 6px; font-weight: 600; font-size: 14px;">
+                ⬇️ Download PDF
+            </a>
+        </div>
+        """
+    content = f"""
+    <h2 style="margin: 0 0 20px 0; color: #1f2937; font-size: 24px;">📥 Your Downloads Are Ready!</h2>
+
+    <p style="margin: 0 0 20px 0; color: #4b5563; font-size: 16px; line-height: 1.6;">
+        Hi {customer_name},<br><br>
+        Your digital content is ready to download. Click the buttons below to get your files.
+    </p>
+
+    <div style="margin: 25px 0; padding: 15px; background-color: #fef3c7; border-radius: 8px;">
+        <p style="margin: 0; color: #92400e; font-size: 14px;">
+            <strong>⚠️ Important:</strong> Download links expire in 72 hours and are limited to 3 downloads per file.
+        </p>
+    </div>
+
+    <h3 style="margin: 30px 0 15px 0; color: #1f2937; font-size: 18px;">Your Downloads</h3>
+
+    {downloads_html}
+
+    <div style="margin-top: 25px; padding: 15px; background-color: #faf5ff; border-radius: 8px; border: 1px dashed #8b5cf6; text-align: center;">
+        <p style="margin: 0 0 8px 0; color: #6b21a8; font-size: 14px; font-weight: 600;">Want permanent access? Save to your account!</p>
+        <a href="{SITE_URL}/redeem?code={order_id}"
+           style="color: #7c3aed; font-weight: 600; text-decoration: underline; font-size: 14px;">
+            Redeem order {order_id} &rarr;
+        </a>
+    </div>
+
+    <p style="margin: 20px 0 0 0; color: #6b7280; font-size: 14px;">
+        Order ID: <strong>{order_id}</strong>
+    </p>
+    """
+    return legacy_get_base_template(content, f"Your downloads for order {order_id} are ready!")
+
+
+def legacy_get_game_pass_template(order_id, pass_type, customer_name="Valued Customer"):
+    content = f"""
+    <h2 style="margin: 0 0 20px 0; color: #1f2937; font-size: 24px;">🎮 Game On! Your Pass Is Ready</h2>
+
+    <p style="margin: 0 0 20px 0; color: #4b5563; font-size: 16px; line-height: 1.6;">
+        Hi {customer_name},<br><br>
+        Your {pass_type} Game Pass has been activated! Here's how to get started:
+    </p>
+
+    <div style="margin: 25px 0; padding: 25px; background: linear-gradient(135deg, #faf5ff 0%, #ede9fe 100%); border-radius: 12px; text-align: center; border: 2px solid #c4b5fd;">
+        <p style="margin: 0 0 15px 0; color: #7c3aed; font-size: 20px; font-weight: bold;">Your Game Pass</p>
+        <p style="margin: 0 0 15px 0; color: #6b7280; font-size: 14px;">{pass_type} Access — Holiday + Break*fast Content</p>
+        <a href="{SITE_URL}/my-library"
+           style="display: inline-block; padding: 14px 35px; background: linear-gradient(135deg, #7c3aed 0%, #6d28d9 100%); color: #ffffff; text-decoration: none; border-radius: 8px; font-weight: bold; font-size: 16px;">
+            🎮 Start Playing
+        </a>
+    </div>
+
+    <h3 style="margin: 30px 0 15px 0; color: #1f2937; font-size: 18px;">How to Play</h3>
+    <ol style="color: #4b5563; line-height: 2; font-size: 15px;">
+        <li>Click "Start Playing" above or visit your My Library</li>
+        <li>Select a game mode (Jeopardy-style, Group Review, etc.)</li>
+        <li>Choose your content (Holiday or Break*fast lessons)</li>
+        <li>Play solo or with your study group!</li>
+    </ol>
+
+    <div style="margin-top: 25px; padding: 15px; background-color: #fef3c7; border-radius: 8px;">
+        <p style="margin: 0; color: #92400e; font-size: 13px;">
+            <strong>Note:</strong> Game content includes Holiday series and Art of Through.
+            Session limits apply per your pass type.
+        </p>
+    </div>
+
+    <div style="margin: 25px 0; padding: 15px; background-color: #f9fafb; border-radius: 8px;">
+        <p style="margin: 0; color: #6b7280; font-size: 14px;">Order ID: <strong>{order_id}</strong></p>
+    </div>
+    """
+    return legacy_get_base_template(content, f"Your {pass_type} Game Pass is ready! Order #{order_id}")
+
+
+# ---------------------------------------------------------------------------
+
+LINKS = [{"token": f"tok{i}", "product_name": f"Holiday Series — Lesson {i}", "expires_at": "2026-01-01T00:00:00"}
+         for i in range(3)]
+ITEMS = [
+    {"id": "holiday_ae", "name": "Holiday Series - Adult Edition", "price": 24.99, "quantity": 2},
+    {"id": "full-table-experience", "name": "Full Table Experience", "price": 89.0, "quantity": 1},
+    {"id": "small-group-bundle", "name": "Small Group Bundle", "price": 149.0, "quantity": 1,
+     "isSmallGroupBundle": True, "bundle_contents": "5 × Adult, 3 × Youth"},
+]
+
+BUILDERS = {
+    "base": lambda: es.get_base_template("<p>Hello</p>", "Preheader"),
+    "order_confirmation": lambda: es.get_order_confirmation_template(
+        "SF-1001", ITEMS, 287.97, coupon_code="WELCOME10", download_links=LINKS,
+        audio_codes=[{"code": "AUD-1234", "series_name": "Holiday"}], customer_name="Jane"),
+    "download_delivery": lambda: es.get_download_delivery_template("SF-1001", LINKS, "Jane"),
+    "contact_form": lambda: es.get_contact_form_template("Jane", "jane@example.com", "Orders", "Where is my book?",
+                                                         page_url="https://kingdom-soul.com/shop"),
+    "bulk_order": lambda: es.get_bulk_order_notification_template(
+        40, "Holiday Series", "church@example.com", {"mealtime": "Holiday", "edition": "AE", "medium": "Print"},
+        bundle_type="Mixed", total_price=899.0),
+    "preorder_confirmation": lambda: es.get_preorder_confirmation_template(
+        "SF-1002", ITEMS, 287.97, "June 2026", courtesy_links=LINKS, coupon_code="EARLY"),
+    "game_pass": lambda: es.get_game_pass_template("SF-1003", "90-Day", "Jane"),
+    "email_verification": lambda: es.get_email_verification_template("Jane", f"{SITE_URL}/verify-email?token=abc"),
+    "admin_invite": lambda: es.get_admin_invite_template("Jane", "Instructor", f"{SITE_URL}/invite?token=abc", "Admin"),
+}
+
+EQUIVALENCE = [
+    (legacy_get_base_template, es.get_base_template, ("<p>Hello</p>", "Preheader")),
+    (legacy_get_download_delivery_template, es.get_download_delivery_template, ("SF-1001", LINKS, "Jane")),
+    (legacy_get_game_pass_template, es.get_game_pass_template, ("SF-1003", "90-Day", "Jane")),
+]
+
+
+def _normalize(s: str) -> str:
+    return re.sub(r"\s+", " ", html.unescape(s)).strip()
+
+
+def _time(fn, rounds) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=2000)
+    ap.add_argument("--bulk", type=int, default=500, help="messages in the simulated bulk send")
+    args = ap.parse_args()
+
+    mismatches = [new.__name__ for old, new, a in EQUIVALENCE if _normalize(old(*a)) != _normalize(new(*a))]
+    for name in mismatches:
+        print(f"MISMATCH {name}")
+
+    print(f"templates={len(email_templates.names())} rounds={args.rounds}")
+    for name, build in BUILDERS.items():
+        build()
+        per = _time(build, args.rounds)
+        print(f"{name:24s} {per * 1e6:8.2f} us/render  {1 / per:10.0f} renders/s")
+    for old, new, a in EQUIVALENCE:
+        legacy, compiled = _time(lambda: old(*a), args.rounds), _time(lambda: new(*a), args.rounds)
+        print(f"{new.__name__:36s} legacy {legacy * 1e6:7.2f} us  compiled {compiled * 1e6:7.2f} us (escaped)")
+
+    start = time.perf_counter()
+    for i in range(args.bulk):
+        es.get_admin_invite_template(f"Instructor {i}", "Instructor", f"{SITE_URL}/invite?token={i}", "Admin")
+        es.get_order_confirmation_template(f"SF-{i}", ITEMS, 287.97, download_links=LINKS, customer_name=f"Buyer {i}")
+    bulk = time.perf_counter() - start
+    print(f"bulk: {args.bulk} invites + {args.bulk} receipts rendered in {bulk * 1e3:.1f} ms")
+    print(f"escape memo: {email_templates._escape_text.cache_info()}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
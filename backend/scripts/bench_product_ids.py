@@ -0,0 +1,346 @@
+"""Benchmark + equivalence check for product-ID normalization.
+
+Compares the memoized, precompiled ``normalize_product_id`` /
+``resolve_display_name_to_product_id`` in payment_routes against a frozen copy
+of the previous implementation (below, ``legacy_*``) over:
+  * every catalog key / name / display label (PRODUCT_FILES, PRODUCTS,
+    PRODUCT_DISPLAY_LABELS, BUNDLE_EXPANSIONS) plus decorated variants
+    (discount / pre-order / ship-note suffixes, upper-case, dash/underscore),
+  * with ``--from-db``: every item id / product_id / name in
+    db.payment_transactions (historical order names).
+
+Exits non-zero on any mismatch.
+Run: cd /app/backend && python3 -m scripts.bench_product_ids [--from-db] [--rounds N]
+"""
+import argparse
+import os
+import re as _re
+import sys
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from payment_routes import (  # noqa: E402
+    BUNDLE_EXPANSIONS,
+    PRODUCT_DISPLAY_LABELS,
+    PRODUCT_FILES,
+    PRODUCTS,
+    normalize_product_id,
+    resolve_display_name_to_product_id,
+)
+
+# ---------------------------------------------------------------------------
+# Frozen reference implementation (pre-memoization). Do not edit — it is the
+# oracle the current implementation must agree with.
+# ---------------------------------------------------------------------------
+
+def legacy_strip_display_noise(text: str) -> str:
+    """Strip discount labels, pre-order tags, and formatting from display names."""
+    t = text.strip()
+    # Remove discount parentheticals: (99% off), (15% off), (20% Off), ($3 Off)
+    t = _re.sub(r'\(\d+%\s*off\)', '', t, flags=_re.IGNORECASE)
+    t = _re.sub(r'\(\$\d+(\.\d+)?\s*off[^)]*\)', '', t, flags=_re.IGNORECASE)
+    # Remove pre-order tags
+    t = _re.sub(r'\[PRE-?ORDER\]', '', t, flags=_re.IGNORECASE)
+    # Remove ship notes in parens: (Ships May-Jun 2026)
+    t = _re.sub(r'\(Ships[^)]+\)', '', t, flags=_re.IGNORECASE)
+    # Remove "— $3 Off (Pre-Order)" or "- $3 Off" style suffixes (both em-dash and regular dash)
+    t = _re.sub(r'[\u2014\u2013—–-]\s*\$\d+(\.\d+)?\s*Off[^)]*(\(Pre-?Order\))?', '', t, flags=_re.IGNORECASE)
+    # Remove standalone (Pre-Order) tags
+    t = _re.sub(r'\(Pre-?Order\)', '', t, flags=_re.IGNORECASE)
+    return t.strip().strip('-').strip()
+
+
+def legacy_resolve_display_name_to_product_id(display_name: str) -> Optional[str]:
+    """Resolve a human-readable display name (from Stripe/QuickOrder) to an internal product ID.
+    
+    Handles patterns like:
+      'Holiday Series - The Covenant - ADULT (99% off)' -> 'holiday_ae'
+      'Full Workbooks - Holiday Digital (Adult) (15% off)' -> 'holiday_ae'
+      'Full Workbooks - Break*fast AE Digital - ADULT' -> 'breakfast_ae_digital'
+      'Break*fast Series - Jesus: Prayer the First Resort' -> nibble product
+      'Game Night Lite (30-Day)' -> 'game_pass_30' (no file, but valid product)
+    """
+    if not display_name:
+        return None
+
+    clean = legacy_strip_display_noise(display_name).lower()
+
+    # Detect series
+    is_holiday = any(k in clean for k in ['holiday', '4c', 'covenant', 'cradle', 'cross', 'comforter'])
+    is_breakfast = any(k in clean for k in ['break*fast', 'breakfast', 'bkft'])
+    is_lunch = 'lunch' in clean
+
+    # Detect edition
+    edition = None
+    if any(k in clean for k in [' ie ', ' ie,', '-ie-', 'instructor']):
+        edition = 'ie'
+    elif any(k in clean for k in [' ye ', ' ye,', '-ye-', 'youth']):
+        edition = 'ye'
+    elif any(k in clean for k in [' ae ', ' ae,', '-ae-', 'adult']):
+        edition = 'ae'
+
+    # Detect format
+    is_paperback = any(k in clean for k in ['paperback', 'print', 'wbk', 'physical'])
+
+    # Detect product type
+    is_full = any(k in clean for k in ['full workbook', 'full series', 'full digital', 'full '])
+    is_nibble = any(k in clean for k in ['nibble', 'single lesson'])
+    is_snack = any(k in clean for k in ['snack pack', 'snack '])
+    is_game = any(k in clean for k in ['game pass', 'game night', 'mix-up', 'gaming', 'grinch'])
+    is_subscription = 'subscription' in clean or 'all access' in clean
+    is_gift = 'gift' in clean or 'certificate' in clean
+    is_bundle = 'bundle' in clean or 'starter' in clean
+
+    # Games / subscriptions / gifts / merch — no PDF download, return product key for entitlement
+    if is_game:
+        if '90' in clean:
+            return 'game_pass_90'
+        return 'game_pass_30'
+    if is_subscription or is_gift or is_bundle:
+        return None  # These don't map to individual files
+
+    # Holiday nibbles (individual lessons)
+    if is_holiday and is_nibble:
+        ed = edition or 'ae'
+        if 'covenant' in clean:
+            return 'holiday-nibble-ae-covenant-digital' if ed == 'ae' else 'holiday-nibble-ye-covenant-digital'
+        if 'cradle' in clean:
+            return 'holiday-nibble-ae-cradle-digital' if ed == 'ae' else 'holiday-nibble-ye-cradle-digital'
+        if 'cross' in clean:
+            return 'holiday-nibble-ae-cross-digital' if ed == 'ae' else 'holiday-nibble-ye-cross-digital'
+        if 'comforter' in clean:
+            return 'holiday-nibble-ae-comforter-digital' if ed == 'ae' else 'holiday-nibble-ye-comforter-digital'
+        # Generic holiday nibble
+        return f'holiday_{ed}'
+
+    # Holiday specific lessons referenced by name
+    if is_holiday and not is_nibble:
+        for lesson_name, suffix in [('covenant', 'covenant'), ('cradle', 'cradle'), ('cross', 'cross'), ('comforter', 'comforter')]:
+            if lesson_name in clean:
+                ed = edition or 'ae'
+                return f'holiday-nibble-ae-{suffix}-digital' if ed == 'ae' else f'holiday-nibble-ye-{suffix}-digital'
+
+    # Holiday full workbook
+    if is_holiday and (is_full or (not is_nibble and not is_snack)):
+        ed = edition or 'ae'
+        return f'holiday_{ed}'
+
+    # Breakfast nibbles (individual lessons by character name)
+    breakfast_lesson_map = {
+        'esther': ('prayer-1', 1), 'solomon': ('prayer-2', 1), 'jesus': ('prayer-3', 1),
+        'paul': ('prayer-4', 1), 'silas': ('prayer-4', 1),
+        'joseph': ('through-1', 2), 'dreamer': ('through-1', 2),
+        'hannah': ('through-2', 2), 'abram': ('through-3', 2),
+        'victory': ('through-4', 2),
+        'rahab': ('faith-1', 3), 'abigail': ('faith-2', 3),
+        'centurion': ('faith-3', 3), 'arimathea': ('faith-4', 3),
+    }
+    if is_breakfast:
+        for char_name, (lesson_key, month) in breakfast_lesson_map.items():
+            if char_name in clean:
+                ed = edition or 'ae'
+                age = 'adult' if ed in ('ae', 'ie') else 'youth'
+                return f'breakfast-nibble-{lesson_key}-{age}-interactive'
+
+    # Breakfast snack packs
+    if is_breakfast and is_snack:
+        ed = edition or 'ae'
+        month = '1'
+        if 'month 2' in clean or 'through' in clean or 'm2' in clean:
+            month = '2'
+        elif 'month 3' in clean or 'faith' in clean or 'm3' in clean:
+            month = '3'
+        age = 'adult' if ed in ('ae', 'ie') else 'youth'
+        return f'breakfast-snack-month-{month}-{age}-interactive'
+
+    # Breakfast full workbook
+    if is_breakfast and (is_full or (not is_nibble and not is_snack)):
+        ed = edition or 'ae'
+        if is_paperback:
+            return f'breakfast-{ed}-paperback'
+        return f'breakfast_{ed}_digital'
+
+    # Lunch (pre-order, paperback only)
+    if is_lunch:
+        ed = edition or 'ae'
+        return f'lunch-{ed}-paperback'
+
+    return None
+
+
+def legacy_normalize_product_id(product_id: str) -> str:
+    """Normalize product ID to match PRODUCT_FILES keys.
+    Handles internal IDs, cart-generated IDs, AND human-readable display names."""
+    if not product_id:
+        return product_id
+    
+    # Already in PRODUCT_FILES, return as-is
+    if product_id in PRODUCT_FILES:
+        return product_id
+    
+    # Try common transformations
+    normalized = product_id.lower().strip()
+
+    # Never collapse an exact bundle key. Edition-specific bundles such as
+    # 'full-table-experience-ye' must NOT be shortened to the generic
+    # 'full-table-experience' (which maps to the ADULT edition). BUNDLE_EXPANSIONS
+    # is defined later in the module but resolved at call time.
+    if normalized in BUNDLE_EXPANSIONS:
+        return normalized
+    
+    if normalized in PRODUCT_FILES:
+        return normalized
+    
+    # Replace dashes with underscores
+    underscore_version = normalized.replace('-', '_')
+    if underscore_version in PRODUCT_FILES:
+        return underscore_version
+    
+    # Strip discount/display noise first, then retry
+    cleaned = legacy_strip_display_noise(product_id).lower().strip()
+    if cleaned in PRODUCT_FILES:
+        return cleaned
+    cleaned_us = cleaned.replace('-', '_')
+    if cleaned_us in PRODUCT_FILES:
+        return cleaned_us
+
+    # Try progressively shorter prefixes (for cart-generated IDs)
+    parts = normalized.split('-')
+    for end in range(len(parts), 1, -1):
+        candidate = '-'.join(parts[:end])
+        if candidate in PRODUCT_FILES:
+            return candidate
+        candidate_us = '_'.join(parts[:end])
+        if candidate_us in PRODUCT_FILES:
+            return candidate_us
+    
+    # Section-prefix stripping (workbooks-, instructor-, etc.)
+    known_sections = ['workbooks', 'instructor', 'bookclub']
+    for section in known_sections:
+        if normalized.startswith(section + '-'):
+            remainder = normalized[len(section) + 1:]
+            if remainder in PRODUCT_FILES:
+                return remainder
+            remainder_parts = remainder.split('-')
+            for end in range(len(remainder_parts), 1, -1):
+                sub = '-'.join(remainder_parts[:end])
+                if sub in PRODUCT_FILES:
+                    return sub
+
+    # Display-name resolution (must run BEFORE the series_map substring check,
+    # which can false-positive on substrings like "series" containing "ie")
+    resolved = legacy_resolve_display_name_to_product_id(product_id)
+    if resolved and resolved in PRODUCT_FILES:
+        return resolved
+
+    # Series + edition extraction — ONLY for structured IDs, not display names.
+    # Skip this if the input looks like a display name (contains spaces)
+    if ' ' not in normalized:
+        series_map = {
+            'holiday': {'ae': 'holiday_ae', 'ye': 'holiday_ye', 'ie': 'holiday_ie', 'adult': 'holiday_ae', 'youth': 'holiday_ye', 'instructor': 'holiday_ie'},
+            'breakfast': {'ae': 'breakfast_ae_digital', 'ye': 'breakfast_ye_digital', 'ie': 'breakfast_ie_digital', 'adult': 'breakfast_ae_digital', 'youth': 'breakfast_ye_digital', 'instructor': 'breakfast_ie_digital'},
+        }
+        
+        for old_fmt, new_fmt in [('epub', 'interactive'), ('epub', 'digital'), ('ebook', 'interactive'), ('ebook', 'digital')]:
+            swapped = normalized.replace(f'-{old_fmt}', f'-{new_fmt}')
+            if swapped in PRODUCT_FILES:
+                return swapped
+        
+        for series_key, editions in series_map.items():
+            if series_key in normalized:
+                for ed_key, file_key in editions.items():
+                    if ed_key in normalized:
+                        if file_key in PRODUCT_FILES:
+                            return file_key
+    
+    return product_id  # Return original if no match found
+
+
+# ---------------------------------------------------------------------------
+
+_DECORATIONS = (
+    "{}", "{} (99% off)", "{} (15% Off)", "{} ($3 Off)", "[PRE-ORDER] {}",
+    "{} (Ships May-Jun 2026)", "{} — $3 Off (Pre-Order)", "{} - $5 Off", "{} (Pre-Order)",
+    "  {}  ",
+)
+
+
+def catalog_inputs() -> list:
+    base = set(PRODUCT_FILES) | set(BUNDLE_EXPANSIONS) | set(PRODUCTS) | set(PRODUCT_DISPLAY_LABELS)
+    base |= {p.get("name", "") for p in PRODUCTS.values()}
+    base |= set(PRODUCT_DISPLAY_LABELS.values())
+    inputs = set()
+    for b in filter(None, base):
+        for variant in (b, b.upper(), b.replace("_", "-"), b.replace("-", "_"),
+                        f"workbooks-{b}", f"{b}-epub", f"{b}-ipdf"):
+            inputs.update(d.format(variant) for d in _DECORATIONS)
+    return sorted(inputs)
+
+
+def order_inputs() -> list:
+    from pymongo import MongoClient
+    db = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    seen = set()
+    for tx in db.payment_transactions.find({}, {"_id": 0, "items.id": 1, "items.product_id": 1, "items.name": 1}):
+        for item in tx.get("items") or []:
+            for k in ("id", "product_id", "name"):
+                if isinstance(item.get(k), str) and item[k]:
+                    seen.add(item[k])
+    return sorted(seen)
+
+
+def _time(fn, inputs, rounds) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for s in inputs:
+            fn(s)
+    return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--from-db", action="store_true", help="include historical order item names")
+    ap.add_argument("--rounds", type=int, default=20)
+    args = ap.parse_args()
+
+    inputs = catalog_inputs()
+    if args.from_db:
+        inputs = sorted(set(inputs) | set(order_inputs()))
+
+    mismatches = []
+    for s in inputs:
+        for new, old in ((normalize_product_id, legacy_normalize_product_id),
+                         (resolve_display_name_to_product_id, legacy_resolve_display_name_to_product_id)):
+            if new(s) != old(s):
+                mismatches.append((new.__name__, s, old(s), new(s)))
+    for name, s, want, got in mismatches[:50]:
+        print(f"MISMATCH {name}({s!r}): legacy={want!r} new={got!r}")
+
+    # cold: memo disabled on the outer call (inner display-name memo cleared);
+    # hot: a working set that fits the memo, as on the request path where the
+    # same few dozen ids repeat for every order.
+    from payment_routes import PRODUCT_ID_MEMO_SIZE
+    hot_set = inputs[:PRODUCT_ID_MEMO_SIZE]
+    n = len(inputs) * args.rounds
+    legacy = _time(legacy_normalize_product_id, inputs, args.rounds) / n
+    resolve_display_name_to_product_id.cache_clear()
+    cold = _time(normalize_product_id.__wrapped__, inputs, 1) / len(inputs)
+    legacy_hot = _time(legacy_normalize_product_id, hot_set, args.rounds) / (len(hot_set) * args.rounds)
+    normalize_product_id.cache_clear()
+    _time(normalize_product_id, hot_set, 1)
+    hot = _time(normalize_product_id, hot_set, args.rounds) / (len(hot_set) * args.rounds)
+    print(f"inputs={len(inputs)} rounds={args.rounds} mismatches={len(mismatches)}")
+    print(f"legacy          {legacy * 1e6:8.2f} us/call")
+    print(f"compiled (cold) {cold * 1e6:8.2f} us/call  ({legacy / cold:6.1f}x)")
+    print(f"memoized (hot)  {hot * 1e6:8.2f} us/call  ({legacy_hot / hot:6.1f}x vs legacy on the same set)")
+    print(f"memo: {normalize_product_id.cache_info()}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Report drift between declared and actual MongoDB indexes.
+
+Lists, per collection, declared indexes that are missing, indexes whose
+options conflict with the declaration, and undeclared extras (see
+``index_registry.py``), followed by the slowest query shapes recorded by the
+database profiler (enable with ``db.setProfilingLevel(1, {slowms: 100})``).
+
+  python -m scripts.index_report                 # report only
+  python -m scripts.index_report --apply         # create missing indexes first
+  python -m scripts.index_report --slow-ms 50 --json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Optional
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env")
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("index_report")
+
+
+async def run_report(apply: bool, slow_ms: int) -> dict:
+    import index_registry
+
+    if apply:
+        await index_registry.apply()
+    return await index_registry.drift_report(slow_ms=slow_ms)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--apply", action="store_true", help="Create missing declared indexes first")
+    ap.add_argument("--slow-ms", type=int, default=100)
+    ap.add_argument("--json", action="store_true", help="Also print the full report as JSON")
+    args = ap.parse_args(argv)
+    report = asyncio.run(run_report(args.apply, args.slow_ms))
+
+    logger.info("=== Index drift (%d declared) ===", report["declared"])
+    if not report["drift"]:
+        logger.info("  all declared indexes present")
+    for name, entry in report["drift"].items():
+        if "error" in entry:
+            logger.info("  %-28s ERROR %s", name, entry["error"])
+            continue
+        for spec in entry["missing"]:
+            logger.info("  %-28s MISSING    %s %s", name, spec["keys"], spec["options"] or "")
+        for c in entry["conflicts"]:
+            logger.info("  %-28s CONFLICT   %s declared=%s actual=%s", name, c["name"], c["declared"], c["actual"])
+        for extra in entry["undeclared"]:
+            logger.info("  %-28s undeclared %s", name, extra)
+
+    profiler = report["profiler"]
+    if "error" in profiler:
+        logger.info("=== Profiler unavailable: %s ===", profiler["error"])
+    else:
+        logger.info("=== Slow query shapes (profiling level %s) ===", profiler["level"])
+        for s in profiler["slow_shapes"]:
+            logger.info("  %s%s %s x%d max=%dms filter=%s sort=%s", "[COLLSCAN] " if s["collscan"] else "",
+                        s["ns"], s["op"], s["count"], s["max_ms"], s["filter"], s["sort"])
+    if args.json:
+        print(json.dumps(report, default=str, indent=2))
+    return 0 if report["in_sync"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
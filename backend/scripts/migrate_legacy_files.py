@@ -149,7 +149,7 @@ async def _migrate_one(
     storage_path = ss.make_storage_path(_category_for(rel_path), ext)
     content_type = CONTENT_TYPE_MAP.get(ext, "application/octet-stream")
     try:
-        result = ss.put_object(storage_path, data, content_type)
+        result = await ss.aput_object(storage_path, data, content_type)
     except Exception as e:
         return {"path": str(rel_path), "status": "upload_failed", "reason": str(e)}
 
@@ -234,16 +234,13 @@ async def _maybe_attach(
 
 async def run_migration(apply: bool = False, attach: bool = True) -> dict:
     """Programmatic entry-point. Returns a summary dict."""
-    # Lazy DB import so the script can run before server.py is loaded
-    from motor.motor_asyncio import AsyncIOMotorClient
-
     mongo_url = os.environ.get("MONGO_URL")
     db_name = os.environ.get("DB_NAME")
     if not mongo_url or not db_name:
         raise RuntimeError("MONGO_URL or DB_NAME missing from environment")
 
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[db_name]
+    # Lazy DB import so the script can run before server.py is loaded
+    from database import db
 
     if not CONTENT_ROOT.exists():
         return {"ok": False, "error": f"content root {CONTENT_ROOT} does not exist", "results": []}
@@ -0,0 +1,56 @@
+"""
+Rebuild the materialized ``db.user_entitlements`` store.
+
+Recomputes every user's entitlement document from orders,
+payment_transactions and submitted_codes (see ``entitlements.py``). Safe to
+run at any time — each document is replaced atomically, and request handlers
+recompute a missing/stale document on demand anyway. Run after bulk edits
+made directly in MongoDB, or after changing the ownership rules.
+
+  python -m scripts.rebuild_entitlements               # every user
+  python -m scripts.rebuild_entitlements --user <id>   # one user
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import Optional
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env")
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("rebuild_entitlements")
+
+
+async def run_rebuild(user_id: Optional[str] = None) -> dict:
+    import entitlements
+
+    if user_id:
+        doc = await entitlements.refresh_user(user_id)
+        return {"rebuilt": 1, "failed": 0, "series": doc["series"],
+                "owned_product_ids": doc["owned_product_ids"]}
+    return await entitlements.rebuild_all()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--user", help="Rebuild a single user id")
+    args = ap.parse_args(argv)
+    summary = asyncio.run(run_rebuild(args.user))
+    logger.info("=== Rebuild summary ===")
+    for k, v in summary.items():
+        logger.info("  %-18s %s", k, v)
+    return 0 if not summary.get("failed") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -65,15 +65,13 @@ async def _find_objstore_for_product(db, product_id: str) -> Optional[dict]:
 
 async def run_repair(apply: bool = False, actor: str = "system-repair") -> dict:
     """Programmatic entry-point. Returns a summary dict."""
-    from motor.motor_asyncio import AsyncIOMotorClient
-
     mongo_url = os.environ.get("MONGO_URL")
     db_name = os.environ.get("DB_NAME")
     if not mongo_url or not db_name:
         raise RuntimeError("MONGO_URL or DB_NAME missing from environment")
 
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[db_name]
+    # Lazy import: reuse the shared pool (same process as the admin route)
+    from database import db
 
     now = datetime.now(timezone.utc)
     results: list[dict] = []
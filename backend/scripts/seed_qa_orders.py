@@ -10,6 +10,7 @@ from dotenv import load_dotenv
 from pymongo import MongoClient
 
 load_dotenv()
+from lc_keys import with_lc  # noqa: E402
 db = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
 PREFIX = "QA-FUL-"
 
@@ -30,7 +31,7 @@ def base(order_number, **extra):
         "created_at": now,
     }
     doc.update(extra)
-    return doc
+    return with_lc("payment_transactions", doc)
 
 
 ORDERS = [
@@ -8,6 +8,7 @@ from dotenv import load_dotenv
 from pymongo import MongoClient
 
 load_dotenv()
+from lc_keys import with_lc  # noqa: E402
 db = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
 API = "http://localhost:8001/api"
 PREFIX = "VAL-"
@@ -38,7 +39,7 @@ def seed(buyer_id, buyer_email, recip_email):
              "total_amount": 9.99, "payment_status": "paid", "status": "completed",
              "purchase_type": "self", "download_links_generated": True, "created_at": now,
              "items": [{"id": "holiday_ae", "name": "Holiday AE (ePub)", "format": "epub", "quantity": 1}]}
-        d.update(x); return d
+        d.update(x); return with_lc("payment_transactions", d)
     docs = [
         base("SELF-DIGITAL"),
         base("SELF-REFUND", refund_status="refunded"),
@@ -14,16 +14,13 @@ from datetime import datetime, timedelta, timezone
 from typing import Optional, Tuple
 import hashlib
 import secrets
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Database connection
-MONGO_URL = os.getenv('MONGO_URL')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[os.environ['DB_NAME']]
+from database import db  # noqa: E402 — shared pool
+import principal  # noqa: E402
 
 # =============================================================================
 # SECURITY CONSTANTS
@@ -434,6 +431,7 @@ async def disable_account(user_id: str, admin_id: str, reason: str = ""):
             "disable_reason": reason
         }}
     )
+    await principal.invalidate(user_id)
     
     # Clear any active sessions
     await db.sessions.delete_many({"user_id": user_id})
@@ -463,6 +461,7 @@ async def enable_account(user_id: str, admin_id: str):
             "disable_reason": ""
         }}
     )
+    await principal.invalidate(user_id)
     
     # Clear any lockouts
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
@@ -555,6 +554,7 @@ async def use_instructor_invite(token: str, user_id: str):
         {"id": user_id},
         {"$set": {"role": "instructor", "access_level": "instructor"}}
     )
+    await principal.invalidate(user_id)
     
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     
@@ -570,33 +570,3 @@ async def use_instructor_invite(token: str, user_id: str):
         user_email=user.get("email") if user else None,
         details={"old_role": "user", "new_role": "instructor"}
     )
-
-
-# =============================================================================
-# DATABASE INDEXES (run once on startup)
-# =============================================================================
-
-async def ensure_security_indexes():
-    """Create necessary indexes for security collections"""
-    # Login attempts - TTL index to auto-delete old records after 24 hours
-    await db.login_attempts.create_index("timestamp", expireAfterSeconds=86400)
-    await db.login_attempts.create_index("identifier")
-    await db.login_attempts.create_index("ip_address")
-    
-    # Lockouts - TTL index
-    await db.lockouts.create_index("locked_until", expireAfterSeconds=0)
-    await db.lockouts.create_index("identifier")
-    
-    # Password reset requests - TTL index
-    await db.password_reset_requests.create_index("timestamp", expireAfterSeconds=3600)
-    
-    # Password reset tokens - TTL index
-    await db.password_reset_tokens.create_index("expires_at", expireAfterSeconds=0)
-    await db.password_reset_tokens.create_index("token_hash")
-    
-    # Audit logs - index for querying
-    await db.audit_logs.create_index("timestamp")
-    await db.audit_logs.create_index("event_type")
-    await db.audit_logs.create_index("user_id")
-    
-    print("[Security] Database indexes created")
@@ -27,14 +27,18 @@ def seed_questions(questions, clear_existing=True):
         coll.insert_many(questions)
     print(f"  Inserted {len(questions)} questions")
     
-    # Create indexes
-    coll.create_index("character")
-    coll.create_index("game_type")
-    coll.create_index("age_group")
-    coll.create_index("difficulty")
-    coll.create_index([("character", 1), ("game_type", 1)])
+    # Create indexes (declared in index_registry)
+    from index_registry import apply_sync
+    apply_sync(db, ["trivia_questions"])
     print("  Indexes created")
 
+    # Tell running API workers to reload their in-memory question bank
+    db.cache_versions.update_one(
+        {"_id": "trivia_questions"},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
 def seed_word_studies(studies, clear_existing=True):
     coll = db.word_studies
     if clear_existing:
@@ -42,7 +46,8 @@ def seed_word_studies(studies, clear_existing=True):
     if studies:
         coll.insert_many(studies)
     print(f"  Inserted {len(studies)} word studies")
-    coll.create_index("character")
+    from index_registry import apply_sync
+    apply_sync(db, ["word_studies"])
 
 def seed_reference_sources(sources, clear_existing=True):
     coll = db.reference_sources
@@ -2,7 +2,7 @@ from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Respons
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 import logging
 from pathlib import Path
@@ -14,10 +14,8 @@ from datetime import datetime, timezone, timedelta
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection — one shared pool for every module (see database.py)
+from database import client, db, connect_db, close_db  # noqa: E402
 
 # Create the main app
 app = FastAPI(title="Soul Food - Kingdom Living Project API")
@@ -690,9 +688,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_client():
+    await connect_db()
+    # Declared indexes and one-time data migrations run off the boot path.
+    try:
+        import index_registry
+        asyncio.create_task(index_registry.apply())
+    except Exception as e:
+        logger.warning(f"Index registry skipped: {e}")
+    try:
+        import lc_keys
+        asyncio.create_task(lc_keys.ensure_backfilled())
+    except Exception as e:
+        logger.warning(f"Case-normalized key backfill skipped: {e}")
+    try:
+        import email_outbox
+        asyncio.create_task(email_outbox.run_worker())
+    except Exception as e:
+        logger.warning(f"Email outbox worker not started: {e}")
+    try:
+        import dashboard_stats
+        asyncio.create_task(dashboard_stats.run_reconciler())
+    except Exception as e:
+        logger.warning(f"Dashboard stats reconciler not started: {e}")
+    try:
+        import stripe_events
+        asyncio.create_task(stripe_events.run_workers())
+    except Exception as e:
+        logger.warning(f"Stripe event workers not started: {e}")
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    close_db()
+    try:
+        import storage_service
+        await storage_service.aclose()
+    except Exception as e:
+        logger.warning(f"Object Storage pool close failed: {e}")
 
 
 
@@ -810,7 +844,7 @@ async def autoseed_files_from_manifest():
             # at vanished blobs.
             if ss is not None:
                 try:
-                    if not ss.head_object(storage_path):
+                    if not await ss.ahead_object(storage_path):
                         stale += 1
                         continue
                 except Exception:
@@ -844,6 +878,9 @@ async def autoseed_files_from_manifest():
             record["attachments"] = [{**a, "id": a.get("id") or str(uuid.uuid4())} for a in incoming]
             await db.files.insert_one(record)
             inserted += 1
+        if inserted:
+            from attachment_index import invalidate as _invalidate_attachments
+            await _invalidate_attachments()
         logger.info("[autoseed] db.files restored from seed: inserted=%d skipped_existing=%d stale_skipped=%d (manifest count=%d) — existing rows are NEVER overwritten",
                     inserted, skipped, stale, len(items))
     except Exception as e:
@@ -989,6 +1026,8 @@ async def initialize_data():
         ]
         
         await db.lessons.insert_many(soul_food_lessons)
+        import dashboard_stats
+        await dashboard_stats.lessons_created(lesson.get("status") for lesson in soul_food_lessons)
         logger.info(f"Soul Food curriculum initialized: {len(soul_food_lessons)} lessons created")
         logger.info("Available at launch: Break*fast Series, Holiday Series (4 C's), Leap of Faith")
         logger.info("Coming Q1 2026: Lunch, Dinner, Supper series")
@@ -1008,6 +1047,8 @@ async def initialize_data():
             import subprocess
             subprocess.run(["python3", "seed_qa_bank.py"], cwd="/app/backend", timeout=30)
             q_count = await db.trivia_questions.count_documents({})
+            from question_bank import invalidate as _invalidate_question_bank
+            await _invalidate_question_bank()
             logger.info(f"Trivia bank seeded: {q_count} questions")
         else:
             logger.info(f"Trivia bank already populated: {q_count} questions")
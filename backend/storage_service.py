@@ -8,14 +8,18 @@ Per Emergent integration playbook (Apr 2026):
   - No delete API → soft-delete in DB (db.files)
   - No rename API → upload new path, update DB reference
   - All access via backend (no presigned URLs)
+Request handlers use the async variants (``aget_object`` etc.) so storage I/O
+never blocks the event loop; the sync functions remain for CLI scripts.
 """
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 import uuid
 from typing import Optional, Tuple
 
+import httpx
 import requests
 
 logger = logging.getLogger(__name__)
@@ -24,7 +28,15 @@ STORAGE_URL = "https://integrations.emergentagent.com/objstore/api/v1/storage"
 APP_NAME = "soul-food"
 EMERGENT_KEY = os.environ.get("EMERGENT_LLM_KEY")
 
+# Async client sizing. Keep-alive pool shared by every request handler; the
+# semaphore caps in-flight storage calls per worker so a download burst can't
+# open unbounded sockets against the storage API.
+STORAGE_MAX_CONNECTIONS = int(os.environ.get("STORAGE_MAX_CONNECTIONS", "20"))
+STORAGE_MAX_CONCURRENCY = int(os.environ.get("STORAGE_MAX_CONCURRENCY", "16"))
+
 _storage_key: Optional[str] = None
+# Shared session so the sync helpers (CLI scripts, migrations) reuse sockets.
+_session = requests.Session()
 
 
 def init_storage() -> str:
@@ -35,7 +47,7 @@ def init_storage() -> str:
         return _storage_key
     if not EMERGENT_KEY:
         raise RuntimeError("EMERGENT_LLM_KEY not set in backend env — cannot init Emergent Object Storage")
-    resp = requests.post(f"{STORAGE_URL}/init", json={"emergent_key": EMERGENT_KEY}, timeout=30)
+    resp = _session.post(f"{STORAGE_URL}/init", json={"emergent_key": EMERGENT_KEY}, timeout=30)
     resp.raise_for_status()
     _storage_key = resp.json()["storage_key"]
     logger.info("Emergent Object Storage initialized")
@@ -54,7 +66,7 @@ def put_object(path: str, data: bytes, content_type: str) -> dict:
     Auto-retries once on a 403/503 (key expired or backend rejecting current key)."""
     key = init_storage()
     for attempt in range(2):
-        resp = requests.put(
+        resp = _session.put(
             f"{STORAGE_URL}/objects/{path}",
             headers={"X-Storage-Key": key, "Content-Type": content_type},
             data=data,
@@ -73,7 +85,7 @@ def get_object(path: str) -> Tuple[bytes, str]:
     """Download bytes. Returns (content_bytes, content_type)."""
     key = init_storage()
     for attempt in range(2):
-        resp = requests.get(
+        resp = _session.get(
             f"{STORAGE_URL}/objects/{path}",
             headers={"X-Storage-Key": key},
             timeout=120,
@@ -101,7 +113,7 @@ def head_object(path: str) -> bool:
         return False
     for attempt in range(2):
         try:
-            resp = requests.head(
+            resp = _session.head(
                 f"{STORAGE_URL}/objects/{path}",
                 headers={"X-Storage-Key": key},
                 timeout=15,
@@ -124,7 +136,7 @@ def head_object(path: str) -> bool:
         # HEAD may be unsupported (405) — try a 1-byte range GET
         if resp.status_code in (405, 501):
             try:
-                gr = requests.get(
+                gr = _session.get(
                     f"{STORAGE_URL}/objects/{path}",
                     headers={"X-Storage-Key": key, "Range": "bytes=0-0"},
                     timeout=15,
@@ -143,3 +155,181 @@ def make_storage_path(category: str, ext: str) -> str:
     """Generate a UUID-based storage path with app + category prefix."""
     safe_ext = (ext or "bin").lstrip(".").lower()[:8] or "bin"
     return f"{APP_NAME}/{category}/{uuid.uuid4()}.{safe_ext}"
+
+
+# =============================================================================
+# Async client — use these from FastAPI handlers
+# =============================================================================
+# The sync helpers above block the event loop for the full duration of the
+# network call (up to 120s on a slow GET), which stalls every other request on
+# the worker. The async variants share one keep-alive httpx pool, bound
+# concurrency with a semaphore and keep the same refresh-on-403/503 semantics.
+
+_async_client: Optional[httpx.AsyncClient] = None
+_async_sem: Optional[asyncio.Semaphore] = None
+_key_lock: Optional[asyncio.Lock] = None
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    global _async_client, _async_sem, _key_lock
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=STORAGE_MAX_CONNECTIONS,
+                max_keepalive_connections=STORAGE_MAX_CONNECTIONS,
+                keepalive_expiry=60,
+            ),
+            timeout=httpx.Timeout(120, connect=10),
+        )
+        _async_sem = asyncio.Semaphore(STORAGE_MAX_CONCURRENCY)
+        _key_lock = asyncio.Lock()
+    return _async_client
+
+
+async def ainit_storage(force: bool = False) -> str:
+    """Async counterpart of ``init_storage``. Concurrent callers share one
+    init round-trip; ``force=True`` rotates the key (used on 403/503)."""
+    global _storage_key
+    client = _get_async_client()
+    stale = _storage_key
+    if _storage_key and not force:
+        return _storage_key
+    async with _key_lock:
+        # Another coroutine may have refreshed the key while we waited.
+        if _storage_key and (not force or _storage_key != stale):
+            return _storage_key
+        if not EMERGENT_KEY:
+            raise RuntimeError("EMERGENT_LLM_KEY not set in backend env — cannot init Emergent Object Storage")
+        resp = await client.post(f"{STORAGE_URL}/init", json={"emergent_key": EMERGENT_KEY}, timeout=30)
+        resp.raise_for_status()
+        _storage_key = resp.json()["storage_key"]
+        logger.info("Emergent Object Storage initialized (async)")
+        return _storage_key
+
+
+async def _send_streaming(client: httpx.AsyncClient, req: httpx.Request) -> httpx.Response:
+    """Send with the body unread, holding a concurrency permit until the
+    response is closed — so STORAGE_MAX_CONCURRENCY bounds streamed downloads,
+    not just their setup."""
+    sem = _async_sem
+    await sem.acquire()
+    try:
+        resp = await client.send(req, stream=True, follow_redirects=True)
+    except BaseException:
+        sem.release()
+        raise
+    close = resp.aclose
+    held = True
+
+    async def _aclose() -> None:
+        nonlocal held
+        try:
+            await close()
+        finally:
+            if held:
+                held = False
+                sem.release()
+
+    resp.aclose = _aclose  # type: ignore[method-assign]
+    return resp
+
+
+async def _arequest(method: str, path: str, *, headers: Optional[dict] = None,
+                    content: Optional[bytes] = None, timeout: float = 120,
+                    stream: bool = False) -> httpx.Response:
+    """Issue one storage call with the shared pool. Retries once with a fresh
+    key on 403/503. With ``stream=True`` the body is left unread — the caller
+    must ``aclose()`` the response, which also frees its concurrency permit."""
+    client = _get_async_client()
+    key = await ainit_storage()
+    for attempt in range(2):
+        req = client.build_request(
+            method,
+            f"{STORAGE_URL}/objects/{path}",
+            headers={"X-Storage-Key": key, **(headers or {})},
+            content=content,
+            timeout=timeout,
+        )
+        if stream:
+            resp = await _send_streaming(client, req)
+        else:
+            async with _async_sem:
+                resp = await client.send(req, follow_redirects=True)
+        if resp.status_code in (403, 503) and attempt == 0:
+            await resp.aclose()
+            key = await ainit_storage(force=True)
+            continue
+        return resp
+    return resp  # type: ignore
+
+
+async def aput_object(path: str, data: bytes, content_type: str) -> dict:
+    """Async ``put_object``. Returns the storage response dict."""
+    resp = await _arequest("PUT", path, headers={"Content-Type": content_type}, content=data)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def aget_object(path: str) -> Tuple[bytes, str]:
+    """Async ``get_object``. Returns (content_bytes, content_type)."""
+    resp = await _arequest("GET", path)
+    resp.raise_for_status()
+    return resp.content, resp.headers.get("Content-Type", "application/octet-stream")
+
+
+async def ahead_object(path: str) -> bool:
+    """Async ``head_object``. Same contract: never raises, False on any error."""
+    if not path:
+        return False
+    try:
+        resp = await _arequest("HEAD", path, timeout=15)
+        if resp.status_code in (405, 501):
+            # HEAD unsupported by the backend — 1-byte range GET instead
+            resp = await _arequest("GET", path, headers={"Range": "bytes=0-0"}, timeout=15, stream=True)
+            await resp.aclose()
+            return resp.status_code in (200, 206)
+    except Exception as e:
+        logger.warning("ahead_object failed for %s: %s", path, e)
+        return False
+    if resp.status_code == 200:
+        return True
+    if resp.status_code != 404:
+        logger.warning("ahead_object unexpected status %s for %s", resp.status_code, path)
+    return False
+
+
+# Read size for streamed downloads — bounds per-download memory regardless of
+# object size.
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+async def astream_object(path: str, byte_range: Optional[str] = None) -> httpx.Response:
+    """Open a streaming GET without buffering the body. ``byte_range`` is an
+    HTTP ``Range`` value passed through to storage. Returns the open response
+    (200 or 206); the caller iterates ``aiter_bytes(STREAM_CHUNK_BYTES)`` and
+    must ``aclose()`` it. Raises ``httpx.HTTPStatusError`` on 4xx/5xx."""
+    # identity encoding keeps Content-Length/Content-Range valid for pass-through
+    headers = {"Accept-Encoding": "identity"}
+    if byte_range:
+        headers["Range"] = byte_range
+    resp = await _arequest("GET", path, headers=headers, stream=True)
+    if resp.status_code >= 400:
+        await resp.aread()
+        await resp.aclose()
+        resp.raise_for_status()
+    return resp
+
+
+def is_not_found(err: Exception) -> bool:
+    """True if ``err`` is a storage 404 from either the sync or async client."""
+    response = getattr(err, "response", None)
+    return isinstance(err, (requests.HTTPError, httpx.HTTPStatusError)) \
+        and response is not None and response.status_code == 404
+
+
+async def aclose() -> None:
+    """Close the shared async pool (app shutdown)."""
+    global _async_client
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
@@ -0,0 +1,236 @@
+"""
+Stripe webhook event ledger and processing queue.
+=================================================
+``stripe_webhook`` used to verify the signature and then run the whole
+fulfillment (transaction update, download links, file verification, audio /
+game-pass grants, emails, rewards) inline before answering Stripe. On a busy
+sales day that outran Stripe's timeout; Stripe retried, and the retry ran
+fulfillment again.
+
+Now the webhook only verifies the event and ``record()``s it in
+``db.stripe_events`` keyed by the Stripe event id (``_id``), then returns.
+A redelivered event hits the same key and is acknowledged as a duplicate
+without being queued again.
+
+A pool of workers (``run_workers``, started with the app) claims due events
+(oldest first) under a lease and runs the handler registered for the event
+type (``@handler("checkout.session.completed")``). Events for the same order
+are serialized: a worker must hold the order's lock in
+``db.stripe_event_locks`` (also leased, so a crashed worker can't wedge an
+order) — if another worker holds it, the event goes back to the queue for a
+moment. Failures retry with exponential backoff and are parked as ``dead``
+after ``MAX_ATTEMPTS``. Event types without a handler are recorded as
+``ignored``. While a handler runs, the event's lease and the order lock's
+lease are renewed every third of ``LEASE_SECONDS``, so a slow fulfillment is
+never reclaimed or run twice; a crashed worker's leases still lapse. The
+backoff, poll loop, lease renewal and stats are shared with ``email_outbox``
+(``work_queue``).
+
+Other code that must not run concurrently with an order's event processing
+can take the same lock with ``order_lock()`` (renewed for as long as it is
+held) — the checkout status poll does, before it fulfills a session it saw
+paid.
+
+Settings (env):
+  - STRIPE_EVENTS_WORKERS (default 4)
+  - STRIPE_EVENTS_POLL_SECONDS (default 5)
+  - STRIPE_EVENTS_MAX_ATTEMPTS (default 8)
+  - STRIPE_EVENTS_BACKOFF_SECONDS (default 15; doubles per attempt, capped at 1h)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import work_queue
+from database import db
+
+PENDING, PROCESSING, DONE, DEAD, IGNORED = "pending", "processing", "done", "dead", "ignored"
+
+WORKERS = int(os.environ.get("STRIPE_EVENTS_WORKERS", "4"))
+POLL_SECONDS = float(os.environ.get("STRIPE_EVENTS_POLL_SECONDS", "5"))
+MAX_ATTEMPTS = int(os.environ.get("STRIPE_EVENTS_MAX_ATTEMPTS", "8"))
+BACKOFF_SECONDS = float(os.environ.get("STRIPE_EVENTS_BACKOFF_SECONDS", "15"))
+MAX_BACKOFF_SECONDS = 3600.0
+LEASE_SECONDS = 300
+# How long an event waits when its order is locked by another worker.
+ORDER_BUSY_DELAY_SECONDS = 1.0
+
+Handler = Callable[[dict], Awaitable[None]]
+
+_handlers: Dict[str, Handler] = {}
+_PROCESS_ID = uuid.uuid4().hex
+_wakeup = asyncio.Event()
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Delay before retry number ``attempts`` (1-based)."""
+    return work_queue.backoff_seconds(attempts, BACKOFF_SECONDS, MAX_BACKOFF_SECONDS)
+
+
+def handler(event_type: str) -> Callable[[Handler], Handler]:
+    """Register ``fn(event)`` as the processor for ``event_type``."""
+    def register(fn: Handler) -> Handler:
+        _handlers[event_type] = fn
+        return fn
+    return register
+
+
+async def record(event_id: str, event_type: str, session_id: Optional[str] = None,
+                 metadata: Optional[dict] = None) -> dict:
+    """Persist a verified webhook event. Idempotent on ``event_id``."""
+    now = work_queue.now()
+    queued = event_type in _handlers
+    doc = {
+        "_id": event_id,
+        "type": event_type,
+        "session_id": session_id,
+        "order_key": session_id or event_id,
+        "metadata": dict(metadata or {}),
+        "status": PENDING if queued else IGNORED,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "received_at": now,
+        "updated_at": now,
+    }
+    try:
+        await db.stripe_events.insert_one(doc)
+    except DuplicateKeyError:
+        existing = await db.stripe_events.find_one({"_id": event_id}, {"status": 1})
+        return {"event_id": event_id, "queued": False, "duplicate": True,
+                "status": (existing or {}).get("status")}
+    if queued:
+        _wakeup.set()
+    return {"event_id": event_id, "queued": queued, "duplicate": False, "status": doc["status"]}
+
+
+@asynccontextmanager
+async def order_lock(order_key: str, owner: Optional[str] = None) -> AsyncIterator[bool]:
+    """Try to take ``order_key``'s processing lock; yields whether it was
+    acquired (never waits). Renewed while held and released on exit; expires
+    LEASE_SECONDS after its holder stops renewing it."""
+    owner = owner or uuid.uuid4().hex
+    now = work_queue.now()
+    try:
+        await db.stripe_event_locks.update_one(
+            {"_id": order_key, "$or": [{"lease_until": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+            upsert=True,
+        )
+        acquired = True
+    except DuplicateKeyError:
+        acquired = False  # held by someone else (the filter didn't match, the upsert collided)
+    if not acquired:
+        yield False
+        return
+    try:
+        async with work_queue.renew_leases(
+            "StripeEvents", LEASE_SECONDS, [(db.stripe_event_locks, {"_id": order_key, "owner": owner})]
+        ):
+            yield True
+    finally:
+        await db.stripe_event_locks.delete_one({"_id": order_key, "owner": owner})
+
+
+async def claim(worker_id: str) -> Optional[dict]:
+    """Lease the oldest due event to ``worker_id``."""
+    now = work_queue.now()
+    return await db.stripe_events.find_one_and_update(
+        {"$or": [
+            {"status": PENDING, "next_attempt_at": {"$lte": now}},
+            {"status": PROCESSING, "lease_until": {"$lt": now}},
+        ]},
+        {"$set": {"status": PROCESSING, "claimed_by": worker_id, "updated_at": now,
+                  "lease_until": now + timedelta(seconds=LEASE_SECONDS)},
+         "$inc": {"attempts": 1}},
+        sort=[("received_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _finish(event: dict, error: Optional[str]) -> None:
+    now = work_queue.now()
+    release = {"lease_until": "", "claimed_by": ""}
+    if error is None:
+        await db.stripe_events.update_one(
+            {"_id": event["_id"]},
+            {"$set": {"status": DONE, "processed_at": now, "updated_at": now},
+             "$unset": {**release, "last_error": ""}},
+        )
+        return
+    attempts = event.get("attempts", 1)
+    dead = attempts >= MAX_ATTEMPTS
+    await db.stripe_events.update_one(
+        {"_id": event["_id"]},
+        {"$set": {"status": DEAD if dead else PENDING, "last_error": error, "updated_at": now,
+                  "next_attempt_at": now + timedelta(seconds=backoff_seconds(attempts))},
+         "$unset": release},
+    )
+    print(f"[StripeEvents] {event.get('type')} {event['_id']} failed "
+          f"({attempts}/{MAX_ATTEMPTS}{', giving up' if dead else ''}): {error}")
+
+
+async def _requeue_busy(event: dict) -> None:
+    """Hand an event back without spending an attempt (its order is locked)."""
+    now = work_queue.now()
+    await db.stripe_events.update_one(
+        {"_id": event["_id"]},
+        {"$set": {"status": PENDING, "updated_at": now,
+                  "next_attempt_at": now + timedelta(seconds=ORDER_BUSY_DELAY_SECONDS)},
+         "$inc": {"attempts": -1},
+         "$unset": {"lease_until": "", "claimed_by": ""}},
+    )
+
+
+async def process_once(worker_id: str) -> bool:
+    """Claim and process one event. Returns False if none was due."""
+    event = await claim(worker_id)
+    if not event:
+        return False
+    fn = _handlers.get(event.get("type"))
+    if fn is None:
+        await _finish(event, f"no handler for {event.get('type')}")
+        return True
+    async with order_lock(event["order_key"], owner=worker_id) as locked:
+        if not locked:
+            await _requeue_busy(event)
+            return True
+        try:
+            async with work_queue.renew_leases(
+                "StripeEvents", LEASE_SECONDS,
+                [(db.stripe_events, {"_id": event["_id"], "status": PROCESSING, "claimed_by": worker_id})],
+            ):
+                await fn(event)
+            error = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            error = str(e)[:300] or type(e).__name__
+        await _finish(event, error)
+    return True
+
+
+async def _worker(worker_id: str, poll_seconds: float) -> None:
+    await work_queue.poll_loop("StripeEvents", lambda: process_once(worker_id), _wakeup, poll_seconds)
+
+
+async def run_workers(count: int = WORKERS, poll_seconds: float = POLL_SECONDS) -> None:
+    """Process queued events forever with ``count`` workers (app startup task)."""
+    print(f"[StripeEvents] {count} worker(s) started in {_PROCESS_ID[:8]} (poll={poll_seconds}s)")
+    await asyncio.gather(*(_worker(f"{_PROCESS_ID}:{i}", poll_seconds) for i in range(count)))
+
+
+async def stats() -> dict:
+    """Event counts by status, plus the oldest pending event's age."""
+    return await work_queue.status_stats(
+        db.stripe_events, (PENDING, PROCESSING, DONE, DEAD, IGNORED), PENDING, "received_at"
+    )
@@ -0,0 +1,172 @@
+"""Unit tests for the attachment health report (attachment_health).
+
+Verifies:
+  1. One db.files aggregation covers the whole catalog; a file attached by
+     both product id and sku counts once; statuses match the old rules.
+  2. Incremental mode returns the previous report without queries when no
+     version moved, and re-checks only touched products when the product
+     catalog version moved.
+  3. An attachment change forces a full report.
+
+Runs without Mongo: db.products / db.files and cache_versions are faked.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import attachment_health as ah
+import cache_versions
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def __aiter__(self):
+        self._it = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length):
+        return self._docs[:length]
+
+
+def _newer(value, bound):
+    return type(value) is type(bound) and value >= bound
+
+
+class _Products:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        if "$or" in query:
+            bounds = [c["updated_at"]["$gte"] for c in query["$or"]]
+            docs = [d for d in self.docs if any(_newer(d.get("updated_at"), b) for b in bounds)]
+        else:
+            docs = [d for d in self.docs if d.get("status") == query["status"]]
+        return _Cursor(dict(d) for d in docs)
+
+
+class _Files:
+    def __init__(self, docs):
+        self.docs = docs
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        wanted = pipeline[0]["$match"].get("attachments.target_id", {}).get("$in")
+        groups = {}
+        for f in self.docs:
+            if f.get("is_deleted"):
+                continue
+            for a in f["attachments"]:
+                if a["target_type"] == "product" and (wanted is None or a["target_id"] in wanted):
+                    groups.setdefault(a["target_id"], set()).add(f["_id"])
+        return _Cursor({"_id": t, "files": list(ids)} for t, ids in groups.items())
+
+
+def _att(target):
+    return {"target_type": "product", "target_id": target}
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    versions = {"file_attachments": 0, "product_catalog": 0}
+
+    async def _current(name):
+        return versions[name]
+
+    old = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    db = SimpleNamespace(
+        products=_Products([
+            {"id": "p1", "sku": "SOFU-A", "name": "A", "type": "digital", "status": "active", "updated_at": old},
+            {"id": "p2", "sku": "SOFU-B", "name": "B", "type": "digital", "status": "active", "updated_at": old.isoformat()},
+            {"id": "p3", "sku": "SOFU-BOOK", "name": "Book", "type": "physical", "status": "active", "updated_at": old},
+            {"id": "p4", "sku": "SOFU-KIT", "name": "Kit", "type": "digital", "status": "active", "updated_at": old},
+        ]),
+        files=_Files([
+            {"_id": 1, "attachments": [_att("p1"), _att("SOFU-A")]},
+            {"_id": 2, "attachments": [_att("SOFU-BOOK")]},
+            {"_id": 3, "is_deleted": True, "attachments": [_att("p2")]},
+        ]),
+    )
+    monkeypatch.setattr(ah, "db", db)
+    monkeypatch.setattr(cache_versions, "current", _current)
+    monkeypatch.setattr(ah, "_code_by_sku", {"SOFU-KIT": {"no_digital_fulfillment": True}})
+    for name, value in (("_items", {}), ("_versions", None), ("_built_at", None), ("_full_at", None)):
+        monkeypatch.setattr(ah, name, value)
+    return db, versions
+
+
+def _statuses(rep):
+    return {i["sku"]: (i["status"], i["attachments_count"]) for i in rep["items"]}
+
+
+def test_full_report_one_aggregation(fake_db):
+    db, _ = fake_db
+    rep = asyncio.run(ah.report())
+    assert len(db.files.pipelines) == 1
+    assert db.products.queries == 1
+    assert _statuses(rep) == {
+        "SOFU-A": ("ok", 1),
+        "SOFU-B": ("missing_file_attachment", 0),
+        "SOFU-BOOK": ("warn_physical_has_files", 1),
+        "SOFU-KIT": ("ok_no_digital", 0),
+    }
+    assert rep["needs_files_skus"] == ["SOFU-B"]
+    assert rep["needs_files_count"] == 1
+    assert rep["physical_with_files_skus"] == ["SOFU-BOOK"]
+    assert rep["incremental"] is False
+
+
+def test_incremental_rechecks_touched_products(fake_db):
+    db, versions = fake_db
+
+    async def _go():
+        await ah.report(incremental=True)
+        unchanged = await ah.report(incremental=True)
+        queries = (db.products.queries, len(db.files.pipelines))
+
+        db.files.docs.append({"_id": 4, "attachments": [_att("SOFU-B")]})
+        db.products.docs[1]["updated_at"] = datetime.now(timezone.utc).isoformat()
+        db.products.docs[3]["status"] = "inactive"
+        db.products.docs[3]["updated_at"] = datetime.now(timezone.utc) + timedelta(seconds=1)
+        versions["product_catalog"] += 1
+        touched = await ah.report(incremental=True)
+        return unchanged, queries, touched
+
+    unchanged, queries, touched = asyncio.run(_go())
+    assert unchanged["incremental"] and unchanged["rechecked"] == 0
+    assert queries == (1, 1)
+    assert touched["incremental"] and touched["rechecked"] == 2
+    assert db.files.pipelines[-1][0]["$match"]["attachments.target_id"] == {"$in": ["p2", "SOFU-B"]}
+    assert _statuses(touched) == {
+        "SOFU-A": ("ok", 1),
+        "SOFU-B": ("ok", 1),
+        "SOFU-BOOK": ("warn_physical_has_files", 1),
+    }
+
+
+def test_attachment_change_forces_full_report(fake_db):
+    db, versions = fake_db
+
+    async def _go():
+        await ah.report(incremental=True)
+        db.files.docs[0]["is_deleted"] = True
+        versions["file_attachments"] += 1
+        return await ah.report(incremental=True)
+
+    rep = asyncio.run(_go())
+    assert rep["incremental"] is False
+    assert len(db.files.pipelines) == 2
+    assert _statuses(rep)["SOFU-A"] == ("missing_file_attachment", 0)
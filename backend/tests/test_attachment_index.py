@@ -0,0 +1,147 @@
+"""Unit tests for the in-process attachment index (attachment_index).
+
+Verifies:
+  1. One db.files query builds a target_id -> files map, newest first.
+  2. latest_file picks the newest file across several alias ids.
+  3. invalidate() rebuilds on the next lookup and bumps the shared version.
+  4. A failed load leaves the index stale, so the next lookup retries.
+
+Runs without Mongo: db.files.find and the cache_versions counter are faked.
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+import attachment_index as ai
+import cache_versions
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def __aiter__(self):
+        self._it = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Files:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = 0
+        self.fail = False
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        if self.fail:
+            raise RuntimeError("mongo down")
+        return _Cursor(self.docs)
+
+
+class _DB:
+    def __init__(self, docs):
+        self.files = _Files(docs)
+
+
+def _file(fid, targets, created):
+    return {
+        "id": fid,
+        "storage_path": f"soul-food/uploads/{fid}.pdf",
+        "original_filename": f"{fid}.pdf",
+        "created_at": created,
+        "attachments": [{"target_type": "product", "target_id": t} for t in targets],
+    }
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    version = {"n": 0}
+
+    async def _current(name):
+        return version["n"]
+
+    async def _bump(name, key=None):
+        version["n"] += 1
+        return version["n"]
+
+    db = _DB([
+        _file("old", ["breakfast"], datetime(2024, 1, 1, tzinfo=timezone.utc)),
+        _file("new", ["breakfast", "breakfast-ae"], datetime(2025, 1, 1, tzinfo=timezone.utc)),
+        _file("lunch", ["lunch"], "2024-06-01T00:00:00"),
+    ])
+    monkeypatch.setattr(ai, "db", db)
+    monkeypatch.setattr(cache_versions, "bump", _bump)
+    monkeypatch.setattr(cache_versions, "current", _current)
+    monkeypatch.setattr(ai, "_gate", cache_versions.VersionGate(ai.CACHE_NAME))
+    monkeypatch.setattr(ai, "_by_target", {})
+    return db, version
+
+
+def test_single_query_newest_first(fake_db):
+    db, _ = fake_db
+
+    async def _go():
+        await ai.ensure_loaded()
+        await ai.ensure_loaded()
+
+    asyncio.run(_go())
+    assert db.files.queries == 1
+    assert [f["id"] for f in ai.files_for("breakfast")] == ["new", "old"]
+    assert ai.has_attachment(["nope", "lunch"])
+    assert not ai.has_attachment(["nope", None])
+
+
+def test_latest_file_across_aliases(fake_db):
+    asyncio.run(ai.ensure_loaded())
+    assert ai.latest_file(["lunch", "breakfast-ae"])["id"] == "new"
+    assert ai.latest_file(["lunch"])["id"] == "lunch"
+    assert ai.latest_file(["missing"]) is None
+
+
+def test_invalidate_rebuilds_and_bumps(fake_db):
+    db, version = fake_db
+
+    async def _go():
+        await ai.ensure_loaded()
+        db.files.docs = db.files.docs[:1]
+        await ai.invalidate()
+        await ai.ensure_loaded()
+
+    asyncio.run(_go())
+    assert db.files.queries == 2
+    assert version["n"] == 1
+    assert [f["id"] for f in ai.files_for("breakfast")] == ["old"]
+    assert ai.files_for("lunch") == []
+
+
+def test_failed_load_is_retried(fake_db):
+    db, _ = fake_db
+
+    async def _go():
+        db.files.fail = True
+        with pytest.raises(RuntimeError):
+            await ai.ensure_loaded()
+        db.files.fail = False
+        await ai.ensure_loaded()
+        first = ai.files_for("lunch")
+
+        db.files.docs = db.files.docs[:1]
+        await ai.invalidate()
+        db.files.fail = True
+        with pytest.raises(RuntimeError):
+            await ai.ensure_loaded()
+        db.files.fail = False
+        await ai.ensure_loaded()
+        return first
+
+    first = asyncio.run(_go())
+    assert [f["id"] for f in first] == ["lunch"]
+    assert db.files.queries == 4
+    assert ai.files_for("lunch") == []
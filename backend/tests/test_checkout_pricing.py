@@ -41,7 +41,7 @@ def _run(cart_kwargs):
     req = CartCheckoutRequest(origin_url="https://entitlement-hub-8.preview.emergentagent.com", **cart_kwargs)
     with patch.object(stripe.checkout.Session, "create", _fake_create), \
          patch.object(payment_routes.db.payment_transactions, "insert_one", new=AsyncMock()):
-        _LOOP.run_until_complete(create_cart_checkout_session(req, _FakeReq()))
+        _LOOP.run_until_complete(create_cart_checkout_session(req, _FakeReq(), user=None))
     return sum(li["price_data"]["unit_amount"] * li["quantity"] for li in captured["line_items"])
 
 
@@ -0,0 +1,142 @@
+"""Unit tests for the admin dashboard rollup (dashboard_stats).
+
+Verifies:
+  1. read() builds the rollup from the source collections on first use.
+  2. Write-site hooks $inc the counters (revenue only on paid transitions).
+  3. Increments never create the document; reconcile() repairs drift.
+
+Runs without Mongo: the source collections and db.dashboard_stats are faked.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import dashboard_stats as ds
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def __aiter__(self):
+        self._it = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _matches(doc, query):
+    return all(doc.get(k) == v for k, v in query.items())
+
+
+class _Source:
+    def __init__(self, docs):
+        self.docs = docs
+        self.counts = 0
+
+    async def count_documents(self, query):
+        self.counts += 1
+        return sum(1 for d in self.docs if _matches(d, query))
+
+    def aggregate(self, pipeline):
+        paid = [d for d in self.docs if _matches(d, pipeline[0]["$match"])]
+        total = 0.0
+        for d in paid:
+            try:
+                total += float(d.get("total_amount") or 0)
+            except (TypeError, ValueError):
+                pass
+        return _Cursor([{"_id": None, "total": total}] if paid else [])
+
+
+class _Stats:
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc else None
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0)
+            doc = self.docs[query["_id"]] = {"_id": query["_id"]}
+        for k, v in update.get("$inc", {}).items():
+            doc[k] = doc.get(k, 0) + v
+        doc.update(update.get("$set", {}))
+        return SimpleNamespace(matched_count=1)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = SimpleNamespace(
+        users=_Source([{"id": "u1"}, {"id": "u2"}]),
+        lessons=_Source([{"status": "published"}, {"status": "draft"}, {"status": "archived"}]),
+        payment_transactions=_Source([
+            {"payment_status": "paid", "total_amount": 19.99},
+            {"payment_status": "paid", "total_amount": "5.01"},
+            {"payment_status": "pending", "total_amount": 100},
+        ]),
+        products=_Source([{"sku": "A"}]),
+        dashboard_stats=_Stats(),
+    )
+    monkeypatch.setattr(ds, "db", db)
+    return db
+
+
+def test_read_builds_rollup_once(fake_db):
+    async def _go():
+        first = await ds.read()
+        counts = fake_db.users.counts
+        second = await ds.read()
+        return first, counts, second
+
+    first, counts, second = asyncio.run(_go())
+    assert first == {
+        "users": 2, "lessons": 3, "orders": 3, "products": 1, "revenue_cents": 2500,
+        "lessons_published": 1, "lessons_draft": 1,
+    }
+    assert second == first
+    assert fake_db.users.counts == counts == 1
+
+
+def test_hooks_increment(fake_db):
+    async def _go():
+        await ds.reconcile()
+        await ds.user_created()
+        await ds.users_removed(2)
+        await ds.lessons_created(["draft", None])
+        await ds.lesson_status_changed("draft", "published")
+        await ds.lesson_status_changed("published", "published")
+        await ds.products_created(3)
+        await ds.order_created({"payment_status": "pending", "total_amount": 40})
+        await ds.payment_status_changed("pending", "paid", 40)
+        await ds.payment_status_changed("paid", "paid", 40)
+        await ds.order_created({"payment_status": "paid", "total_amount": 0})
+        return await ds.read()
+
+    got = asyncio.run(_go())
+    assert got == {
+        "users": 1, "lessons": 5, "orders": 5, "products": 4, "revenue_cents": 6500,
+        "lessons_published": 2, "lessons_draft": 1,
+    }
+
+
+def test_increment_never_creates_and_reconcile_repairs(fake_db):
+    async def _go():
+        await ds.user_created()
+        assert await fake_db.dashboard_stats.find_one({"_id": ds.STATS_ID}) is None
+        await ds.reconcile()
+        fake_db.users.docs.append({"id": "u3"})  # written outside the hooks
+        return await ds.reconcile()
+
+    result = asyncio.run(_go())
+    assert result["drift"] == {"users": 1}
+    assert result["counters"]["users"] == 3
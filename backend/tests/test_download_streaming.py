@@ -0,0 +1,272 @@
+"""Unit tests for streamed Object Storage downloads (routes/download_routes).
+
+Verifies:
+  1. The body is piped through in chunks with the storage Content-Length.
+  2. A Range request is passed to storage and counts as a download, unless
+     it resumes this token's interrupted stream from at or before where it
+     stopped — even when that stream used the last allowed download.
+  3. A storage 404 surfaces as HTTP 404 and records nothing.
+  4. Full downloads are written through to the blob cache; the next request
+     is served from disk (also for ranges) and invalidation drops it.
+     Eviction also sweeps temp files abandoned by a crashed writer.
+  5. A cache entry evicted by another worker before it is opened falls back
+     to storage; one evicted after it was opened still streams in full.
+
+Runs without Mongo / network: storage is an httpx MockTransport and the
+download accounting helpers are monkeypatched.
+"""
+import asyncio
+import os
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import FileResponse
+
+import blob_cache
+import download_protection as dp
+import storage_service as ss
+import routes.download_routes as dr
+
+BLOB = bytes(range(256)) * 1024  # 256 KB — several stream chunks
+
+
+def _storage_handler(req):
+    if req.url.path.endswith("/init"):
+        return httpx.Response(200, json={"storage_key": "k"})
+    if "missing" in req.url.path:
+        return httpx.Response(404)
+    rng = req.headers.get("Range")
+    if rng:
+        start = int(rng.split("=")[1].split("-")[0])
+        body = BLOB[start:]
+        return httpx.Response(206, content=body, headers={
+            "Content-Length": str(len(body)),
+            "Content-Range": f"bytes {start}-{len(BLOB) - 1}/{len(BLOB)}",
+            "Content-Type": "application/pdf",
+        })
+    return httpx.Response(200, content=BLOB, headers={"Content-Length": str(len(BLOB)), "Content-Type": "application/pdf"})
+
+
+@pytest.fixture
+def recorded(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(blob_cache, "BLOB_CACHE_DIR", str(tmp_path / "blobs"))
+
+    async def _record(token, ip, ua=""):
+        calls.append(token)
+        return True
+
+    async def _remaining(token):
+        return 3 - len(calls)
+
+    resume_points = {}
+
+    async def _remember(token, offset):
+        resume_points[token] = offset
+
+    async def _claim(token, offset):
+        if offset <= 0 or offset > resume_points.get(token, -1):
+            return False
+        del resume_points[token]
+        return True
+
+    monkeypatch.setattr(dr, "record_download", _record)
+    monkeypatch.setattr(dr, "get_remaining_downloads", _remaining)
+    monkeypatch.setattr(dr, "remember_resume_point", _remember)
+    monkeypatch.setattr(dr, "claim_resume", _claim)
+    monkeypatch.setattr(ss, "EMERGENT_KEY", "test-key")
+    monkeypatch.setattr(ss, "_storage_key", None)
+    ss._get_async_client()
+    monkeypatch.setattr(ss, "_async_client", httpx.AsyncClient(transport=httpx.MockTransport(_storage_handler)))
+    return calls
+
+
+def _download(path, range_header=None, etag=None, stop_after=None):
+    async def _go():
+        ss._async_client = httpx.AsyncClient(transport=httpx.MockTransport(_storage_handler))
+        try:
+            resp = await dr._stream_from_object_storage(
+                path, {"product_name": "Breakfast AE"}, "tok", "127.0.0.1", "pytest",
+                original_filename="breakfast-ae-full.pdf", range_header=range_header, etag=etag,
+            )
+            if isinstance(resp, FileResponse):
+                return resp, [open(resp.path, "rb").read()]
+            chunks = []
+            async for c in resp.body_iterator:
+                chunks.append(c)
+                if len(chunks) == stop_after:
+                    await resp.body_iterator.aclose()  # client went away
+                    break
+            return resp, chunks
+        finally:
+            await ss.aclose()
+    return asyncio.run(_go())
+
+
+def test_full_download_streams_in_chunks(recorded):
+    resp, chunks = _download("soul-food/uploads/a.pdf")
+    assert resp.status_code == 200
+    assert len(chunks) > 1
+    assert b"".join(chunks) == BLOB
+    assert resp.headers["content-length"] == str(len(BLOB))
+    assert resp.headers["accept-ranges"] == "bytes"
+    assert recorded == ["tok"]
+
+
+def test_range_request_is_partial_and_counted(recorded):
+    resp, chunks = _download("soul-food/uploads/a.pdf", "bytes=1000-")
+    assert resp.status_code == 206
+    assert b"".join(chunks) == BLOB[1000:]
+    assert resp.headers["content-range"] == f"bytes 1000-{len(BLOB) - 1}/{len(BLOB)}"
+    assert recorded == ["tok"]
+
+
+def test_offset_range_cannot_dodge_the_limit(recorded):
+    _download("soul-food/uploads/a.pdf", "bytes=0-0")
+    for _ in range(3):
+        _download("soul-food/uploads/a.pdf", "bytes=1-")
+    assert recorded == ["tok"] * 4
+
+
+def test_resume_of_interrupted_download_is_free_once(recorded):
+    _, chunks = _download("soul-food/uploads/a.pdf", stop_after=3)
+    # The chunk in flight when the client dropped isn't known to have arrived.
+    received = chunks[:-1]
+    served = len(b"".join(received))
+    assert recorded == ["tok"]
+
+    # The browser resumes from what it has on disk, which may be less still.
+    on_disk = served - 1000
+    resp, rest = _download("soul-food/uploads/a.pdf", f"bytes={on_disk}-")
+    assert BLOB[:on_disk] + b"".join(rest) == BLOB
+    assert recorded == ["tok"]
+
+    _download("soul-food/uploads/a.pdf", f"bytes={on_disk}-")
+    assert recorded == ["tok", "tok"]
+
+
+def test_interrupted_last_download_can_still_resume(monkeypatch):
+    record = {"token_hash": dp.hash_token("tok"), "order_id": "SF-1", "payment_verified": True,
+              "expires_at": datetime.now(timezone.utc) + timedelta(hours=1),
+              "download_count": 3, "max_downloads": 3}
+
+    class _Links:
+        async def find_one(self, query, projection=None):
+            return dict(record)
+
+    async def _not_blocked(order_id):
+        return False
+
+    monkeypatch.setattr(dp, "db", SimpleNamespace(download_links=_Links()))
+    monkeypatch.setattr(dp, "_order_blocks_download", _not_blocked)
+
+    def _ok(start):
+        return asyncio.run(dp.verify_download_token("tok", start))[0]
+
+    assert not _ok(0) and not _ok(5000)
+    record.update(resume_offset=4096, resume_until=datetime.now(timezone.utc) + timedelta(minutes=5))
+    assert _ok(4096) and _ok(100)
+    assert not _ok(0) and not _ok(5000)
+    record["resume_until"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    assert not _ok(100)
+
+
+def test_missing_object_is_404_and_not_counted(recorded):
+    with pytest.raises(HTTPException) as exc:
+        _download("soul-food/uploads/missing.pdf")
+    assert exc.value.status_code == 404
+    assert recorded == []
+
+
+def test_multi_range_is_ignored():
+    assert dr._single_range("bytes=0-10,20-30") is None
+    assert dr._single_range("bytes=-500") is None
+    assert dr._single_range("bytes=10-") == "bytes=10-"
+
+
+def test_full_download_populates_cache_and_next_hit_is_local(recorded):
+    _download("soul-food/uploads/a.pdf", etag="e1")
+    cached = blob_cache.lookup("soul-food/uploads/a.pdf", "e1")
+    assert cached and open(cached, "rb").read() == BLOB
+    assert blob_cache.lookup("soul-food/uploads/a.pdf", "e2") is None
+
+    resp, _ = _download("soul-food/uploads/a.pdf", etag="e1")
+    assert resp.headers["x-source"] == "blob-cache"
+    assert recorded == ["tok", "tok"]
+
+    resp, chunks = _download("soul-food/uploads/a.pdf", "bytes=10-19", etag="e1")
+    assert resp.status_code == 206
+    assert b"".join(chunks) == BLOB[10:20]
+    assert resp.headers["content-range"] == f"bytes 10-19/{len(BLOB)}"
+
+    assert blob_cache.invalidate("soul-food/uploads/a.pdf") == 1
+    assert blob_cache.lookup("soul-food/uploads/a.pdf", "e1") is None
+
+
+def test_evicted_cache_entry_falls_back_or_keeps_streaming(recorded, monkeypatch):
+    _download("soul-food/uploads/a.pdf", etag="e1")
+    cached = blob_cache.lookup("soul-food/uploads/a.pdf", "e1")
+
+    # Gone between lookup() and open: served from storage, counted once.
+    with monkeypatch.context() as m:
+        m.setattr(blob_cache, "lookup", lambda *a: cached + ".evicted")
+        resp, chunks = _download("soul-food/uploads/a.pdf", etag="e1")
+    assert resp.headers["x-source"] != "blob-cache"
+    assert b"".join(chunks) == BLOB and recorded == ["tok", "tok"]
+
+    # Gone after the download was recorded: the open handle still streams.
+    record = dr._record_unless_resume
+
+    async def _record_then_evict(*args):
+        await record(*args)
+        os.unlink(cached)
+
+    monkeypatch.setattr(dr, "_record_unless_resume", _record_then_evict)
+    resp, chunks = _download("soul-food/uploads/a.pdf", etag="e1")
+    assert resp.headers["x-source"] == "blob-cache"
+    assert b"".join(chunks) == BLOB and recorded == ["tok", "tok", "tok"]
+
+
+def test_partial_download_is_not_cached(recorded):
+    _download("soul-food/uploads/a.pdf", "bytes=1000-", etag="e1")
+    assert blob_cache.lookup("soul-food/uploads/a.pdf", "e1") is None
+
+
+def test_cache_evicts_least_recently_used(monkeypatch, tmp_path):
+    monkeypatch.setattr(blob_cache, "BLOB_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(blob_cache, "BLOB_CACHE_MAX_BYTES", 250)
+    monkeypatch.setattr(blob_cache, "BLOB_CACHE_MAX_ENTRY_BYTES", 200)
+
+    async def _put(name):
+        w = await blob_cache.open_writer(name, None, 100)
+        await w.write(b"x" * 100)
+        await w.commit()
+
+    for i, name in enumerate(("a", "b", "c")):
+        asyncio.run(_put(name))
+        os.utime(blob_cache.lookup(name, None), (i, i))
+    assert blob_cache.lookup("a", None) is None
+    assert blob_cache.lookup("b", None) and blob_cache.lookup("c", None)
+    assert asyncio.run(blob_cache.open_writer("big", None, 201)) is None
+
+
+def test_eviction_sweeps_abandoned_part_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(blob_cache, "BLOB_CACHE_DIR", str(tmp_path))
+    stale, fresh = tmp_path / "dead.part", tmp_path / "live.part"
+    stale.write_bytes(b"x")
+    fresh.write_bytes(b"x")
+    old = blob_cache.time.time() - blob_cache.BLOB_CACHE_PART_MAX_AGE_SECONDS - 60
+    os.utime(stale, (old, old))
+
+    async def _put():
+        w = await blob_cache.open_writer("a", None, 1)
+        await w.write(b"y")
+        await w.commit()
+
+    asyncio.run(_put())
+    assert not stale.exists() and fresh.exists()
+    assert blob_cache.lookup("a", None)
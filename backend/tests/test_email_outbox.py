@@ -0,0 +1,126 @@
+"""Unit tests for the durable email outbox (email_outbox).
+
+Verifies:
+  1. enqueue stores one message per dedup_key; a repeat is a no-op and a
+     dead message with the same key is revived.
+  2. A claimed batch goes out in ONE Resend batch call and each delivery sets
+     the tracked flag on the transaction.
+  3. Failures back off exponentially and give up after MAX_ATTEMPTS.
+
+Runs without Mongo / Resend: the collections and resend are faked.
+"""
+import asyncio
+import types
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import email_outbox as eo
+import email_service
+
+
+def _matches(doc, flt):
+    return all(doc.get(k) == v for k, v in flt.items())
+
+
+class _Coll:
+    def __init__(self):
+        self.docs = []
+        self.updates = []
+
+    async def insert_one(self, doc):
+        key = doc.get("dedup_key")
+        if key and any(d.get("dedup_key") == key for d in self.docs):
+            raise DuplicateKeyError("dup")
+        doc["_id"] = len(self.docs) + 1
+        self.docs.append(doc)
+
+    async def find_one_and_update(self, flt, update, projection=None):
+        for d in self.docs:
+            if _matches(d, flt):
+                d.update(update["$set"])
+                return dict(d)
+        return None
+
+    async def find_one(self, flt, projection=None, **kwargs):
+        return next((dict(d) for d in self.docs if _matches(d, flt)), None)
+
+    async def update_one(self, flt, update):
+        self.updates.append((flt, update))
+        for d in self.docs:
+            if _matches(d, flt):
+                d.update(update.get("$set", {}))
+
+
+class _DB(types.SimpleNamespace):
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = _DB(email_outbox=_Coll(), payment_transactions=_Coll())
+    monkeypatch.setattr(eo, "db", db)
+    return db
+
+
+def _params(to):
+    return {"from": "noreply@example.com", "to": [to], "subject": "Hi", "html": "<p>x</p>"}
+
+
+def test_enqueue_dedup_and_revive(fake_db):
+    async def _go():
+        first = await eo.enqueue(_params("a@example.com"), dedup_key="order:1:buyer:a@example.com")
+        repeat = await eo.enqueue(_params("a@example.com"), dedup_key="order:1:buyer:a@example.com")
+        fake_db.email_outbox.docs[0]["status"] = eo.DEAD
+        revived = await eo.enqueue(_params("a@example.com"), dedup_key="order:1:buyer:a@example.com")
+        return first, repeat, revived
+
+    first, repeat, revived = asyncio.run(_go())
+    assert first["queued"] and not repeat["queued"] and repeat["duplicate"]
+    assert revived["queued"] and revived["outbox_id"] == first["outbox_id"]
+    assert len(fake_db.email_outbox.docs) == 1
+    assert fake_db.email_outbox.docs[0]["status"] == eo.PENDING
+
+
+def test_batch_delivery_sets_tracked_flag(fake_db, monkeypatch):
+    batches = []
+
+    def _batch(params):
+        batches.append(params)
+        return [f"em_{i}" for i in range(len(params))]
+
+    docs = [
+        {"_id": 1, "params": _params("a@example.com"), "attempts": 0,
+         "track": eo.track_flag("payment_transactions", {"session_id": "s1"}, "buyer_email_sent", "buyer_email_error")},
+        {"_id": 2, "params": _params("b@example.com"), "attempts": 0},
+    ]
+
+    async def _claim(limit):
+        return docs
+
+    monkeypatch.setattr(eo, "claim_batch", _claim)
+    monkeypatch.setattr(eo, "_batch_send", _batch)
+    monkeypatch.setattr(email_service, "RESEND_API_KEY", "re_test")
+
+    assert asyncio.run(eo.process_once()) == 2
+    assert len(batches) == 1 and len(batches[0]) == 2
+    sent = [u for f, u in fake_db.email_outbox.updates if u["$set"].get("status") == eo.SENT]
+    assert [u["$set"]["email_id"] for u in sent] == ["em_0", "em_1"]
+    (flt, upd), = fake_db.payment_transactions.updates
+    assert flt == {"session_id": "s1"} and upd["$set"]["buyer_email_sent"] is True
+
+
+def test_failure_backoff_and_give_up(fake_db, monkeypatch):
+    monkeypatch.setattr(eo, "MAX_ATTEMPTS", 3)
+    assert eo.backoff_seconds(1) == eo.BACKOFF_SECONDS
+    assert eo.backoff_seconds(3) == eo.BACKOFF_SECONDS * 4
+    assert eo.backoff_seconds(50) == eo.MAX_BACKOFF_SECONDS
+
+    async def _go(attempts):
+        fake_db.email_outbox.updates.clear()
+        await eo._record({"_id": 1, "attempts": attempts, "params": {}}, None, "boom")
+        return fake_db.email_outbox.updates[0][1]["$set"]
+
+    assert asyncio.run(_go(0))["status"] == eo.PENDING
+    assert asyncio.run(_go(2))["status"] == eo.DEAD
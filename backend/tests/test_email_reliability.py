@@ -1,10 +1,13 @@
 """Unit tests for _send_order_emails fail-safe orchestration (payment_routes).
 
 Verifies:
-  1. Buyer + recipient emails are sent INDEPENDENTLY — a failure in one never
+  1. Buyer + recipient emails are queued INDEPENDENTLY — a failure in one never
      blocks the other.
-  2. Per-email sent flags are persisted so unsent emails can be retried.
-  3. only_unsent=True skips already-sent emails and re-attempts just the failed one.
+  2. Per-email queued flags are persisted so unqueued emails can be retried,
+     and each message carries a per-recipient dedup key plus a track spec so
+     the outbox worker sets the *_email_sent flag on delivery.
+  3. only_unsent=True skips already-sent/queued emails and re-attempts just
+     the failed one.
 
 Runs without Stripe / real Resend by monkeypatching email_service + the db.
 """
@@ -49,6 +52,7 @@ def _install_email_stub(monkeypatch, fail_for=()):
         calls.append(kwargs)
         if to in fail_for:
             raise RuntimeError(f"simulated send failure for {to}")
+        return {"success": True, "queued": True}
 
     import email_service
     monkeypatch.setattr(email_service, "send_order_confirmation", _stub)
@@ -72,28 +76,32 @@ def test_buyer_failure_does_not_block_recipient(monkeypatch):
     store = _install_fake_db(monkeypatch, _gift_txn())
     calls = _install_email_stub(monkeypatch, fail_for={"buyer@example.com"})
 
-    res = asyncio.get_event_loop().run_until_complete(
+    res = asyncio.run(
         pr._send_order_emails(_gift_txn(), [{"token": "t1", "name": "eBook"}])
     )
     tos = [c["to_email"] for c in calls]
     assert "buyer@example.com" in tos and "recipient@example.com" in tos
-    # Recipient still delivered even though buyer send raised
-    assert res["recipient_email_sent"] is True
-    assert res["buyer_email_sent"] is False
-    assert store.get("recipient_email_sent") is True
+    # Recipient still queued even though buyer enqueue raised
+    assert res["recipient_email_queued"] is True
+    assert res["buyer_email_queued"] is False
+    assert store.get("recipient_email_queued") is True
     assert "buyer_email_error" in store
+    recip = next(c for c in calls if c["to_email"] == "recipient@example.com")
+    assert recip["dedup_key"] == "order:SF-TEST-1:recipient:recipient@example.com"
+    assert recip["track"]["flag"] == "recipient_email_sent"
+    assert recip["track"]["filter"] == {"session_id": "sess_test_1"}
 
 
 def test_recipient_failure_does_not_block_buyer(monkeypatch):
     store = _install_fake_db(monkeypatch, _gift_txn())
     calls = _install_email_stub(monkeypatch, fail_for={"recipient@example.com"})
 
-    res = asyncio.get_event_loop().run_until_complete(
+    res = asyncio.run(
         pr._send_order_emails(_gift_txn(), [{"token": "t1", "name": "eBook"}])
     )
-    assert res["buyer_email_sent"] is True
-    assert res["recipient_email_sent"] is False
-    assert store.get("buyer_email_sent") is True
+    assert res["buyer_email_queued"] is True
+    assert res["recipient_email_queued"] is False
+    assert store.get("buyer_email_queued") is True
     assert "recipient_email_error" in store
 
 
@@ -105,14 +113,14 @@ def test_retry_only_resends_unsent(monkeypatch):
     store = _install_fake_db(monkeypatch, txn)
     calls = _install_email_stub(monkeypatch, fail_for=set())  # both succeed now
 
-    res = asyncio.get_event_loop().run_until_complete(
+    res = asyncio.run(
         pr._send_order_emails(dict(txn), [{"token": "t1", "name": "eBook"}], only_unsent=True)
     )
     tos = [c["to_email"] for c in calls]
     # Buyer already sent → skipped; only recipient re-attempted
     assert tos == ["recipient@example.com"]
-    assert res["recipient_email_sent"] is True
-    assert store.get("recipient_email_sent") is True
+    assert res["recipient_email_queued"] is True
+    assert store.get("recipient_email_queued") is True
 
 
 def test_self_purchase_marks_recipient_satisfied(monkeypatch):
@@ -128,9 +136,10 @@ def test_self_purchase_marks_recipient_satisfied(monkeypatch):
     store = _install_fake_db(monkeypatch, txn)
     calls = _install_email_stub(monkeypatch, fail_for=set())
 
-    res = asyncio.get_event_loop().run_until_complete(
+    res = asyncio.run(
         pr._send_order_emails(dict(txn), [{"token": "t1", "name": "eBook"}])
     )
     assert [c["to_email"] for c in calls] == ["me@example.com"]
-    assert res["buyer_email_sent"] is True
-    assert res["recipient_email_sent"] is True  # n/a for self → satisfied
+    assert res["buyer_email_queued"] is True
+    assert res["recipient_email_queued"] is True  # n/a for self → satisfied
+    assert store.get("recipient_email_sent") is True
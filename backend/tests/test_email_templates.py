@@ -0,0 +1,52 @@
+"""Unit tests for the compiled email templates (email_templates / email_service).
+
+Verifies:
+  1. Fragments escape ``{name}`` values (text and attributes), insert
+     ``{name_html}`` verbatim, honour format specs and reject bad placeholders.
+  2. Builders escape user-supplied values (contact form) while the base
+     layout keeps caller-built content as-is.
+  3. The order receipt still renders rows, totals and links per mode.
+"""
+import pytest
+
+import email_service as es
+from email_templates import Fragment, escape, get
+
+
+def test_fragment_escaping_and_specs():
+    frag = Fragment("test_row", '<a href="{url}" title="{label}">{label}</a>{extra_html} ${total:.2f}')
+    out = frag.render(url='/x?a=1&b="2"', label="<b>Tom's</b>", extra_html="<i>ok</i>", total=3)
+    assert out == ('<a href="/x?a=1&amp;b=&quot;2&quot;" title="&lt;b&gt;Tom&#x27;s&lt;/b&gt;">'
+                   '&lt;b&gt;Tom&#x27;s&lt;/b&gt;</a><i>ok</i> $3.00')
+    assert frag.fields == {"url", "label", "extra_html", "total"}
+    assert get("test_row") is frag
+    assert escape(None) == "None" and escape(2.5) == 2.5
+
+    with pytest.raises(TypeError):
+        frag.render(url="/", label="x", extra_html="")
+    with pytest.raises(ValueError):
+        Fragment("test_bad", "{items[0]}")
+
+
+def test_builders_escape_user_values():
+    html = es.get_contact_form_template("Eve <script>", "eve@example.com", "Help", "<img src=x onerror=alert(1)>")
+    assert "<script>" not in html and "<img src=x" not in html
+    assert "Eve &lt;script&gt;" in html and "&lt;img src=x onerror=alert(1)&gt;" in html
+
+    wrapped = es.get_base_template("<p>Body</p>", "Fish & chips")
+    assert "<p>Body</p>" in wrapped and "Fish &amp; chips" in wrapped
+    assert es.EMAIL_FOOTER in wrapped
+
+
+def test_order_confirmation_modes():
+    items = [{"id": "x", "name": "Holiday AE", "price": 10, "quantity": 2}]
+    links = [{"token": "tok-1", "product_name": "Holiday AE"}]
+
+    receipt = es.get_order_confirmation_template("SF-9", items, 20, coupon_code="SAVE", download_links=links)
+    assert "Holiday AE" in receipt and "$20.00" in receipt and "Coupon Applied: SAVE" in receipt
+    assert f"{es.SITE_URL}/api/downloads/file/tok-1" in receipt
+
+    access = es.get_order_confirmation_template("SF-9", items, 20, download_links=links,
+                                                gifted_by_email="buyer@example.com", is_recipient_access=True)
+    assert "A gift from buyer@example.com" in access
+    assert "Order Summary" not in access and "Your Soul Food Access Includes" in access
@@ -0,0 +1,156 @@
+"""Unit tests for the materialized entitlement store (entitlements).
+
+Verifies:
+  1. Ownership rules: refunded / revoked / test orders grant nothing; a gift
+     belongs to its recipient, not the buyer.
+  2. compute() derives series, editions, owned ids and Library refs from the
+     active orders only.
+  3. get_for_user() serves a fresh document with one keyed read and
+     recomputes a missing or stale one.
+  4. A "completed" order unlocks trivia but not the Library, and owned ids
+     cover orders past the Library's per-source cap.
+  5. refresh_for_order() bumps the My Library cache stamp after refreshing,
+     even when the refresh fails.
+
+Runs without Mongo: the collections are small in-memory fakes.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import cache_versions
+import entitlements as ent
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    async def to_list(self, n):
+        return self._docs[:n]
+
+    async def __aiter__(self):
+        for doc in self._docs:
+            yield doc
+
+
+class _Coll:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.finds = 0
+        self.replaced = {}
+
+    def find(self, query=None, projection=None):
+        self.finds += 1
+        return _Cursor(self.docs)
+
+    async def find_one(self, query, projection=None):
+        self.finds += 1
+        return self.replaced.get(query.get("_id")) or (self.docs[0] if self.docs else None)
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.replaced[query["_id"]] = doc
+
+
+class _DB:
+    def __init__(self, txns):
+        self.orders = _Coll()
+        self.payment_transactions = _Coll(txns)
+        self.submitted_codes = _Coll()
+        self.users = _Coll()
+        self.user_entitlements = _Coll()
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+def _txn(n, name, **extra):
+    doc = {"session_id": f"cs_{n}", "order_number": f"SF-{n}", "payment_status": "paid",
+           "status": "completed", "user_id": "u1", "customer_email": "Buyer@Example.com",
+           "items": [{"product_id": f"p{n}", "name": name}]}
+    doc.update(extra)
+    return doc
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = _DB([
+        _txn(1, "Holiday 4C's - Adult Edition"),
+        _txn(2, "Break*fast Snack Pack (Youth)", refund_status="refunded"),
+        _txn(3, "Break*fast Full Workbook - ADULT", entitlement_status="revoked"),
+        _txn(4, "Break*fast Snack Pack (Youth)", tag="test"),
+        _txn(5, "Break*fast Snack Pack (Youth)", purchase_type="gift",
+             digital_recipient_email="friend@example.com"),
+    ])
+    monkeypatch.setattr(ent, "db", db)
+    return db
+
+
+def test_gift_belongs_to_recipient_only():
+    gift = _txn(9, "x", purchase_type="gift", digital_recipient_email="friend@example.com")
+    assert not ent.is_active_entitlement_txn(gift, "u1", "buyer@example.com")
+    assert ent.is_active_entitlement_txn(gift, "u2", "Friend@Example.com")
+
+
+def test_compute_uses_active_orders_only(fake_db):
+    doc = asyncio.run(ent.compute("u1", "buyer@example.com"))
+    assert doc["series"] == ["holiday_4c"]
+    assert doc["editions"] == ["adult"]
+    assert doc["owned_product_ids"] == ["p1"]
+    assert [r["order_number"] for r in doc["orders"]] == ["SF-1"]
+    assert doc["has_audio"] is False
+
+
+def test_completed_orders_unlock_trivia_only(fake_db):
+    fake_db.payment_transactions.docs = [
+        _txn(7, "Break*fast Full Workbook - YOUTH", payment_status="completed"),
+        _txn(8, "Break*fast Snack Pack (Youth)", payment_status="completed", refund_status="refunded"),
+    ]
+    doc = asyncio.run(ent.compute("u1", "buyer@example.com"))
+    assert doc["series"] == ["breakfast"] and doc["editions"] == ["youth"]
+    assert doc["has_audio"] is True
+    assert doc["owned_product_ids"] == [] and doc["orders"] == []
+
+
+def test_owned_ids_are_not_capped_with_library_refs(fake_db):
+    n = ent._ORDERS_PER_SOURCE + 5
+    fake_db.payment_transactions.docs = [_txn(i, "Nibble") for i in range(n)]
+    doc = asyncio.run(ent.compute("u1", "buyer@example.com"))
+    assert len(doc["owned_product_ids"]) == n
+    assert len(doc["orders"]) == ent._ORDERS_PER_SOURCE
+
+
+def test_get_for_user_reads_fresh_doc_and_recomputes_stale(fake_db):
+    async def _go():
+        first = await ent.get_for_user("u1", "buyer@example.com")
+        txn_reads = fake_db.payment_transactions.finds
+        again = await ent.get_for_user("u1", "buyer@example.com")
+        assert fake_db.payment_transactions.finds == txn_reads
+        assert again is first
+
+        first["computed_at"] = datetime.now(timezone.utc) - timedelta(seconds=ent.ENTITLEMENT_MAX_AGE_SECONDS + 1)
+        await ent.get_for_user("u1", "buyer@example.com")
+        assert fake_db.payment_transactions.finds == txn_reads + 1
+
+    asyncio.run(_go())
+
+
+def test_refresh_for_order_bumps_library_stamp(fake_db, monkeypatch):
+    bumps = []
+
+    async def _bump(name):
+        bumps.append((name, dict(fake_db.user_entitlements.replaced)))
+        return len(bumps)
+
+    monkeypatch.setattr(cache_versions, "bump", _bump)
+    fake_db.users.docs = [{"id": "u1", "email": "buyer@example.com"}]
+    assert asyncio.run(ent.refresh_for_order("SF-1")) == 1
+    assert bumps[0][0] == ent.LIBRARY_CACHE and "u1" in bumps[0][1]
+
+    del fake_db.orders
+    assert asyncio.run(ent.refresh_for_order("SF-1")) == 0
+    assert len(bumps) == 2
@@ -0,0 +1,185 @@
+"""Unit tests for the shared fulfillment engine (fulfillment.FulfillmentRun).
+
+Verifies:
+  1. All of an order's items are verified in one call, their links written in
+     one insert_many and their audit events in another.
+  2. Unresolvable items, verification failures and failed link inserts are
+     reported; the transaction is marked fulfilled only with a link.
+  3. Stage timings are stored on the transaction and summarized per caller.
+  4. A failed audit insert doesn't cost the order its stored links.
+  5. Admin entries that carry their own file path skip verification.
+
+Runs without Mongo: the collections and payment_routes' resolver/verifier
+are faked.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+import download_protection
+import fulfillment
+import payment_routes as pr
+
+
+class _Coll:
+    def __init__(self, fail_index=None):
+        self.docs = []
+        self.calls = []
+        self.fail_index = fail_index
+        self.down = False
+
+    async def insert_many(self, docs, ordered=True):
+        self.calls.append(len(docs))
+        if self.down:
+            raise ConnectionError("audit store unavailable")
+        for i, doc in enumerate(docs):
+            if i != self.fail_index:
+                self.docs.append(doc)
+        if self.fail_index is not None and self.fail_index < len(docs):
+            raise BulkWriteError({"writeErrors": [{"index": self.fail_index, "errmsg": "E11000 duplicate"}]})
+
+    async def update_one(self, query, update):
+        self.docs.append((query, update["$set"]))
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    db = SimpleNamespace(download_links=_Coll(), download_audit_logs=_Coll(), payment_transactions=_Coll())
+    monkeypatch.setattr(download_protection, "db", db)
+    monkeypatch.setattr(fulfillment, "db", db)
+    monkeypatch.setattr(fulfillment, "_window", {})
+    verify_calls = []
+
+    async def _resolve(item):
+        if item["product_id"] == "pod-book":
+            return []
+        return [{"product_id": item["product_id"], "name": f"{item['name']} {n}", "file_key": f"{item['product_id']}-{n}"}
+                for n in range(item.get("files", 1))]
+
+    async def _verify(entries, caller="fulfillment"):
+        verify_calls.append(len(entries))
+        ok = [{**e, "pdf_path": f"objstore:{e['file_key']}.pdf"} for e in entries if "missing" not in e["file_key"]]
+        bad = [{**e, "pdf_path": None, "reason": "no_path"} for e in entries if "missing" in e["file_key"]]
+        return ok, bad
+
+    monkeypatch.setattr(pr, "resolve_item_to_file_entries_async", _resolve)
+    monkeypatch.setattr(pr, "_verified_entries_for_fulfillment", _verify)
+    async def _invalidate():
+        pass
+
+    monkeypatch.setattr(pr, "_invalidate_library_cache", _invalidate)
+    return db, verify_calls
+
+
+def test_links_and_audit_are_batched(fake):
+    db, verify_calls = fake
+    items = [
+        {"product_id": "bundle", "name": "Bundle", "files": 3},
+        {"product_id": "missing", "name": "Gone"},
+        {"product_id": "pod-book", "name": "Paperback"},
+    ]
+
+    async def _go():
+        run = fulfillment.FulfillmentRun("SF-1", user_id="u1", user_email="Buyer@X.com", caller="Test")
+        await run.create_links(items)
+        await run.record({"session_id": "cs_1"}, extra={"fulfillment_completed_at": "now"})
+        return run
+
+    run = asyncio.run(_go())
+    assert verify_calls == [4]
+    assert db.download_links.calls == [3] and db.download_audit_logs.calls == [3]
+    assert {d["user_email"] for d in db.download_links.docs} == {"buyer@x.com"}
+    assert [link["product_id"] for link in run.links] == ["bundle-0", "bundle-1", "bundle-2"]
+    assert [f["reason"] for f in run.failures] == ["no_path"]
+    assert [i["product_id"] for i in run.unresolved] == ["pod-book"]
+    query, fields = db.payment_transactions.docs[0]
+    assert query == {"session_id": "cs_1"}
+    assert fields["status"] == "fulfilled" and fields["downloads_count"] == 3
+    assert fields["fulfillment_completed_at"] == "now"
+    assert fields["fulfillment_verification_failures"][0]["file_key"] == "missing-0"
+
+
+def test_failed_insert_is_reported_and_nothing_fulfilled(fake):
+    db, _ = fake
+    db.download_links.fail_index = 0
+
+    async def _go():
+        run = fulfillment.FulfillmentRun("SF-2", user_id="u1", user_email="", caller="Test")
+        await run.create_links([{"product_id": "book", "name": "Book"}])
+        await run.record({"order_number": "SF-2"})
+        return run
+
+    run = asyncio.run(_go())
+    assert run.links == []
+    assert run.failures[0]["reason"] == "link_creation_error" and "duplicate" in run.failures[0]["error"]
+    assert db.download_audit_logs.calls == []
+    _, fields = db.payment_transactions.docs[0]
+    assert fields["fulfillment_status"] == "pending_verification" and "status" not in fields
+
+
+def test_audit_failure_keeps_links(fake):
+    db, _ = fake
+    db.download_audit_logs.down = True
+
+    async def _go():
+        run = fulfillment.FulfillmentRun("SF-3", user_id="u1", user_email="a@b.c", caller="Test")
+        await run.create_links([{"product_id": "book", "name": "Book", "files": 2}])
+        return run
+
+    run = asyncio.run(_go())
+    assert [link["product_id"] for link in run.links] == ["book-0", "book-1"]
+    assert run.failures == [] and len(db.download_links.docs) == 2
+
+
+def test_unverified_entries_use_their_own_path(fake, monkeypatch):
+    db, verify_calls = fake
+    looked_up = []
+
+    async def _lookup(pid):
+        looked_up.append(pid)
+        return f"objstore:{pid}.pdf" if pid == "mapped" else None
+
+    monkeypatch.setattr(pr, "get_pdf_path_async", _lookup)
+    entries = [
+        {"product_id": "dropped", "file_key": "dropped", "name": "Dropped", "pdf_path": "/files/dropped.pdf"},
+        {"product_id": "mapped", "file_key": "mapped", "name": "Mapped"},
+        {"product_id": "gone", "file_key": "gone", "name": "Gone"},
+    ]
+
+    async def _go():
+        run = fulfillment.FulfillmentRun("ADMIN-1", user_id="a@b.c", user_email="a@b.c", caller="AdminRetry")
+        await run.link_entries(entries, verify=False)
+        return run
+
+    run = asyncio.run(_go())
+    assert verify_calls == [] and "dropped" not in looked_up
+    assert [(link["product_id"], link["pdf_path"]) for link in run.links] == [
+        ("dropped", "/files/dropped.pdf"), ("mapped", "objstore:mapped.pdf"),
+    ]
+    assert [f["product_id"] for f in run.failures] == ["gone"]
+    assert db.download_links.calls == [2]
+
+
+def test_timings_are_stored_and_summarized(fake):
+    db, _ = fake
+
+    async def _go():
+        for n in range(3):
+            run = fulfillment.FulfillmentRun(f"SF-{n}", user_id="u", user_email="a@b.c", caller="Webhook")
+            await run.create_links([{"product_id": "book", "name": "Book"}])
+            await run.record({"order_number": f"SF-{n}"})
+            async with run.stage("email"):
+                pass
+            await run.finish()
+
+    asyncio.run(_go())
+    query, fields = db.payment_transactions.docs[-1]
+    assert query == {"order_number": "SF-2"}
+    assert set(fields["fulfillment_timings_ms"]) == {"resolve", "verify", "links", "record", "email", "total"}
+    summary = fulfillment.timings_summary()
+    assert summary["Webhook"]["runs"] == 3
+    total = summary["Webhook"]["stages_ms"]["total"]
+    assert total["count"] == 3 and total["p50"] <= total["p95"] <= total["max"]
+    assert "grants" not in summary["Webhook"]["stages_ms"]
@@ -0,0 +1,81 @@
+"""Unit tests for pre-fulfillment file verification
+(payment_routes._verified_entries_for_fulfillment).
+
+Verifies:
+  1. Entries are checked concurrently, never more than VERIFY_CONCURRENCY at
+     a time, and results keep the input order.
+  2. Entries still pending at VERIFY_DEADLINE_SECONDS are reported as
+     ``verify_timeout`` failures, not dropped.
+  3. Retrievability answers are cached per storage path, so a repeat check
+     skips the storage call.
+
+Runs without Mongo / network: path resolution and storage HEADs are faked.
+"""
+import asyncio
+
+import pytest
+
+import payment_routes as pr
+import storage_service as ss
+
+
+def _entries(*keys):
+    return [{"product_id": k, "file_key": k, "name": k.title()} for k in keys]
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    state = {"active": 0, "peak": 0, "heads": [], "delay": {}, "missing": set()}
+
+    async def _path(key):
+        return f"objstore:soul-food/uploads/{key}.pdf"
+
+    async def _head(path):
+        state["heads"].append(path)
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            await asyncio.sleep(state["delay"].get(path, 0.01))
+        finally:
+            state["active"] -= 1
+        return path not in state["missing"]
+
+    monkeypatch.setattr(pr, "get_pdf_path_async", _path)
+    monkeypatch.setattr(ss, "ahead_object", _head)
+    monkeypatch.setattr(pr, "_exists_cache", {})
+    return state
+
+
+def test_concurrency_is_bounded_and_order_kept(storage, monkeypatch):
+    monkeypatch.setattr(pr, "VERIFY_CONCURRENCY", 2)
+    keys = [f"f{i}" for i in range(6)]
+    storage["missing"].add("soul-food/uploads/f3.pdf")
+
+    ok, failures = asyncio.run(pr._verified_entries_for_fulfillment(_entries(*keys), caller="Test"))
+    assert storage["peak"] == 2
+    assert [e["file_key"] for e in ok] == ["f0", "f1", "f2", "f4", "f5"]
+    assert [(f["file_key"], f["reason"]) for f in failures] == [("f3", "not_retrievable")]
+
+
+def test_deadline_reports_pending_entries(storage, monkeypatch):
+    monkeypatch.setattr(pr, "VERIFY_DEADLINE_SECONDS", 0.2)
+    storage["delay"]["soul-food/uploads/slow.pdf"] = 5
+
+    ok, failures = asyncio.run(pr._verified_entries_for_fulfillment(_entries("a", "slow", "b"), caller="Test"))
+    assert [e["file_key"] for e in ok] == ["a", "b"]
+    assert len(failures) == 1
+    assert failures[0]["file_key"] == "slow" and failures[0]["reason"] == "verify_timeout"
+    assert failures[0]["pdf_path"] == "objstore:soul-food/uploads/slow.pdf"
+
+
+def test_cache_hits_skip_storage(storage):
+    storage["missing"].add("soul-food/uploads/gone.pdf")
+
+    async def _go():
+        first = await pr._verified_entries_for_fulfillment(_entries("a", "gone"), caller="Test")
+        again = await pr._verified_entries_for_fulfillment(_entries("a", "gone"), caller="Test")
+        return first, again
+
+    first, again = asyncio.run(_go())
+    assert first == again
+    assert sorted(storage["heads"]) == ["soul-food/uploads/a.pdf", "soul-food/uploads/gone.pdf"]
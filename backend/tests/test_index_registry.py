@@ -0,0 +1,75 @@
+"""Unit tests for the declarative index registry (index_registry).
+
+Verifies:
+  1. Hot lookup indexes are declared, including ones derived from
+     pagination / lc_keys.
+  2. plan() reports missing, option-conflicting and undeclared indexes from
+     ``index_information()`` output.
+  3. apply() creates only missing indexes and leaves conflicts alone.
+  4. Profiler filters collapse to value-free shapes.
+
+Runs without Mongo: the database is a small in-memory fake.
+"""
+import asyncio
+
+import index_registry as ir
+
+
+class _Coll:
+    def __init__(self, info):
+        self.info = info
+        self.created = []
+
+    async def index_information(self):
+        return self.info
+
+    async def create_index(self, keys, **options):
+        self.created.append((keys, options))
+
+
+class _DB(dict):
+    def __getitem__(self, name):
+        return self.setdefault(name, _Coll({"_id_": {"key": [("_id", 1)]}}))
+
+
+def _sigs(name):
+    return {tuple(s["keys"]) for s in ir.INDEXES[name]}
+
+
+def test_hot_lookups_are_declared():
+    assert (("session_id", 1),) in _sigs("payment_transactions")
+    assert (("order_number", 1),) in _sigs("payment_transactions")
+    assert (("customer_email_lc", 1),) in _sigs("payment_transactions")
+    assert (("created_at", -1), ("_id", -1)) in _sigs("payment_transactions")
+    assert (("user_id", 1), ("date", 1)) in _sigs("gaming_sessions")
+    assert (("code", 1),) in _sigs("redemption_codes")
+    assert (("attachments.target_type", 1), ("attachments.target_id", 1), ("is_deleted", 1)) in _sigs("files")
+
+
+def test_plan_reports_missing_conflicts_and_undeclared():
+    existing = {
+        "_id_": {"key": [("_id", 1)]},
+        "requested_at_1": {"key": [("requested_at", 1)], "expireAfterSeconds": 60},
+        "legacy_1": {"key": [("legacy", 1)]},
+    }
+    p = ir.plan("download_link_requests", existing)
+    assert [s["keys"] for s in p["missing"]] == [[("user_email", 1), ("order_id", 1)]]
+    assert p["conflicts"][0]["actual"] == {"expireAfterSeconds": 60}
+    assert p["undeclared"] == ["legacy_1"]
+
+
+def test_apply_creates_only_missing():
+    db = _DB()
+    db["lockouts"] = _Coll({"_id_": {"key": [("_id", 1)]},
+                            "identifier_1": {"key": [("identifier", 1)]}})
+    summary = asyncio.run(ir.apply(["lockouts"], database=db))
+    assert summary["created"] == 1
+    keys, options = db["lockouts"].created[0]
+    assert keys == [("locked_until", 1)]
+    assert options == {"background": True, "expireAfterSeconds": 0}
+
+
+def test_query_shape_drops_values():
+    a = ir.query_shape({"user_id": "u1", "status": {"$in": ["a", "b"]}})
+    b = ir.query_shape({"status": {"$in": ["c"]}, "user_id": "u2"})
+    assert a == b == {"status": {"$in": [1]}, "user_id": 1}
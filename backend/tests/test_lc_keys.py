@@ -0,0 +1,93 @@
+"""Unit tests for case-normalized lookup keys (lc_keys).
+
+Verifies:
+  1. with_lc adds lowercased twins for insert docs and ``$set`` bodies.
+  2. match / match_any build plain equality filters on the ``_lc`` field
+     (index seeks) once the backfill is recorded; before that they also
+     match the raw field, so un-backfilled documents are still found.
+  3. The backfill writes only missing/stale twins and lowercases
+     download_links.user_email in place.
+
+Runs without Mongo: the collection is a small in-memory fake.
+"""
+import asyncio
+
+import lc_keys
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._it = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Coll:
+    def __init__(self, docs):
+        self.docs = docs
+        self.ops = []
+
+    def find(self, query, projection=None):
+        return _Cursor([dict(d) for d in self.docs])
+
+    async def bulk_write(self, ops, ordered=True):
+        self.ops.extend(ops)
+
+
+class _DB(dict):
+    def __getitem__(self, name):
+        return self.setdefault(name, _Coll([]))
+
+
+def test_with_lc_and_match(monkeypatch):
+    monkeypatch.setattr(lc_keys, "_backfilled", True)
+    doc = lc_keys.with_lc("payment_transactions", {"customer_email": " Jane@Example.COM ", "total": 1})
+    assert doc["customer_email_lc"] == "jane@example.com"
+    assert "digital_recipient_email_lc" not in doc
+    assert lc_keys.with_lc("coupons", {"code": "Book10"})["code_lc"] == "book10"
+    assert lc_keys.match("code", "OFH_INTERNAL_$1") == {"code_lc": "ofh_internal_$1"}
+    assert lc_keys.match_any(("customer_email", "digital_recipient_email"), "A@B.c") == [
+        {"customer_email_lc": "a@b.c"}, {"digital_recipient_email_lc": "a@b.c"}]
+
+
+def test_match_falls_back_until_backfill_recorded(monkeypatch):
+    class _Migrations:
+        async def find_one(self, query, projection=None):
+            return {"_id": lc_keys.MIGRATION_ID}
+
+    monkeypatch.setattr(lc_keys, "_backfilled", False)
+    assert lc_keys.match("customer_email", " A.b@C.com ") == {"$or": [
+        {"customer_email_lc": "a.b@c.com"},
+        {"customer_email": {"$regex": r"^A\.b@C\.com$", "$options": "i"}},
+    ]}
+    db = _DB()
+    db.migrations = _Migrations()
+    monkeypatch.setattr(lc_keys, "db", db)
+    asyncio.run(lc_keys.ensure_backfilled())
+    assert lc_keys.match("customer_email", "A.b@C.com") == {"customer_email_lc": "a.b@c.com"}
+
+
+def test_backfill_writes_missing_and_stale_only(monkeypatch):
+    db = _DB()
+    db["payment_transactions"] = _Coll([
+        {"_id": 1, "customer_email": "A@B.c"},
+        {"_id": 2, "customer_email": "x@y.z", "customer_email_lc": "x@y.z"},
+        {"_id": 3, "customer_email": "New@Y.z", "customer_email_lc": "old@y.z",
+         "digital_recipient_email": "Gift@Z.com"},
+    ])
+    db["download_links"] = _Coll([{"_id": 9, "user_email": "Mixed@Case.com"}, {"_id": 10, "user_email": "ok@a.b"}])
+    monkeypatch.setattr(lc_keys, "db", db)
+
+    counts = asyncio.run(lc_keys.backfill_all())
+    assert counts["payment_transactions"] == 2 and counts["download_links"] == 1
+    sets = {op._filter["_id"]: op._doc["$set"] for op in db["payment_transactions"].ops}
+    assert sets == {1: {"customer_email_lc": "a@b.c"},
+                    3: {"customer_email_lc": "new@y.z", "digital_recipient_email_lc": "gift@z.com"}}
+    assert db["download_links"].ops[0]._doc == {"$set": {"user_email": "mixed@case.com"}}
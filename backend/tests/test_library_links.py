@@ -0,0 +1,35 @@
+"""Unit tests for the batched My Library link matching (payment_routes).
+
+Verifies:
+  1. _index_order_links keeps the old precedence: direct product_id /
+     product_name keys, later links overriding earlier ones.
+  2. _match_download_token falls back through normalized id, name-word
+     overlap (first link wins) and the single-link shortcut, in that order.
+  3. Orders with several unmatched links get no token.
+"""
+import payment_routes as pr
+
+LINKS = [
+    {"order_id": "SF-1", "token": "t-coloring", "product_id": "coloring-book", "product_name": "Moses Coloring Book"},
+    {"order_id": "SF-1", "token": "t-trivia", "product_id": "trivia-pack", "product_name": "Bible Trivia Game Pack"},
+    {"order_id": "SF-1", "token": "t-trivia-2", "product_id": "trivia-pack-v2", "product_name": "Bible Trivia Game Pack"},
+]
+
+
+def test_direct_keys_later_link_wins():
+    index = pr._index_order_links(LINKS)
+    assert pr._match_download_token("coloring-book", "x", index) == "t-coloring"
+    assert pr._match_download_token("Bible Trivia Game Pack", "x", index) == "t-trivia-2"
+
+
+def test_fuzzy_name_overlap_picks_first_matching_link():
+    index = pr._index_order_links(LINKS)
+    assert pr._match_download_token("unknown", "Trivia Game Deluxe", index) == "t-trivia"
+    assert pr._match_download_token("unknown", "Coloring Book", index) == "t-coloring"
+
+
+def test_single_link_shortcut_and_no_match():
+    only = pr._index_order_links(LINKS[:1])
+    assert pr._match_download_token("unknown", "Something Else", only) == "t-coloring"
+    assert pr._match_download_token("unknown", "Something Else", pr._index_order_links(LINKS)) is None
+    assert pr._match_download_token("unknown", "Anything", pr._index_order_links([])) is None
@@ -0,0 +1,47 @@
+"""Unit tests for indexed admin order search (order_search).
+
+Verifies:
+  1. search_keys covers order number (and segments), email and name tokens.
+  2. search_filter emits anchored, case-sensitive prefix regexes on
+     search_keys (index range scans) with a legacy branch that only applies to
+     documents without keys.
+  3. Exact order-number, email-prefix and name-token searches match the right
+     transaction when the filter is evaluated against the keys.
+"""
+import re
+
+import order_search as osr
+
+TXNS = [
+    {"order_number": "SF-2026-AB12", "customer_email": "Jane.Doe@Example.com", "customer_name": "Jane Doe"},
+    {"order_number": "SF-2026-ZZ99", "customer_email": "bob@example.org", "customer_name": "Bob O'Neil"},
+]
+
+
+def _matches(doc, text):
+    keys = osr.search_keys(doc)
+    branch = osr.search_filter(text)["$or"][0]
+    clauses = branch.get("$and", [branch])
+    return all(any(re.match(c["search_keys"]["$regex"], k) for k in keys) for c in clauses)
+
+
+def test_search_keys():
+    keys = osr.search_keys(TXNS[0])
+    assert {"sf-2026-ab12", "ab12", "jane.doe@example.com", "jane doe", "jane", "doe"} <= set(keys)
+    assert len(keys) == len(set(keys))
+
+
+def test_filter_is_anchored_prefix_with_legacy_branch():
+    f = osr.search_filter("  SF-2026 ")
+    indexed, legacy = f["$or"]
+    assert indexed == {"search_keys": {"$regex": "^sf\\-2026"}}
+    assert legacy["search_keys"] == {"$exists": False}
+    assert osr.search_filter("   ") is None
+
+
+def test_order_email_and_name_searches():
+    assert [_matches(t, "sf-2026-ab12") for t in TXNS] == [True, False]
+    assert [_matches(t, "jane.d") for t in TXNS] == [True, False]
+    assert [_matches(t, "doe jan") for t in TXNS] == [True, False]
+    assert [_matches(t, "o'neil") for t in TXNS] == [False, True]
+    assert [_matches(t, "sf-2026") for t in TXNS] == [True, True]
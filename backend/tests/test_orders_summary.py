@@ -0,0 +1,88 @@
+"""Regression guard for the aggregation-based admin orders summary.
+
+The summary groups payment_transactions on ``_LIFECYCLE_KEY`` in Mongo and
+evaluates ``_compute_lifecycle`` once per group on a document rebuilt from
+the key. That is only exact if the rebuilt document classifies identically
+to every real order in the group — locked in here for representative orders.
+``_key_of`` mirrors what the ``$group`` stage emits for one document.
+"""
+from datetime import datetime
+
+import routes.admin_routes as a
+
+
+def _truthy(v):
+    return v not in (None, False, 0, "", [])
+
+
+def _key_of(doc):
+    items = []
+    for it in doc.get("items") or []:
+        bc = it.get("bundle_contents")
+        items.append({
+            "id": it.get("id"), "product_id": it.get("product_id"), "sku": it.get("sku"),
+            "name": it.get("name"), "format": it.get("format"), "edition": it.get("edition"),
+            "medium": (it.get("metadata") or {}).get("medium"),
+            "physical": _truthy(it.get("physical")),
+            "hybrid_fulfillment": _truthy(it.get("hybrid_fulfillment")),
+            "no_digital_fulfillment": _truthy(it.get("no_digital_fulfillment")),
+            "isSmallGroupBundle": _truthy(it.get("isSmallGroupBundle")),
+            "isBookClub": _truthy(it.get("isBookClub")),
+            "bundle_digital": isinstance(bc, dict) and _truthy(bc.get("digital")),
+        })
+    return {
+        "payment_status": doc.get("payment_status"), "status": doc.get("status"),
+        "refund_status": doc.get("refund_status"), "refunded": _truthy(doc.get("refunded_at")),
+        "is_archived": _truthy(doc.get("is_archived")),
+        "entitlement_status": doc.get("entitlement_status"),
+        "physical_fulfillment": doc.get("physical_fulfillment"),
+        "downloaded": (doc.get("downloads_count") or 0) > 0,
+        "links": _truthy(doc.get("download_links_generated")),
+        "verify_failed": _truthy(doc.get("fulfillment_verification_failures")),
+        "manual_fulfillment_status": doc.get("manual_fulfillment_status"),
+        "recipient_confirmed": _truthy(doc.get("recipient_access_confirmed")),
+        "claimed": _truthy(doc.get("claimed_by_user_id")),
+        "purchase_type": doc.get("purchase_type"),
+        "items": items,
+    }
+
+
+_SUMMARY_FIELDS = ("financial_status", "needs_action", "is_closed", "has_physical", "fulfillment_status")
+
+ORDERS = [
+    {"payment_status": "paid", "status": "completed", "download_links_generated": True,
+     "items": [{"product_id": "snack_pack_ae_m1", "format": "ipdf", "name": "Snack Pack AE M1"}]},
+    {"payment_status": "paid", "status": "completed", "downloads_count": 3,
+     "fulfillment_verification_failures": [{"reason": "no_path"}],
+     "items": [{"product_id": "holiday_ae", "format": "epub"}]},
+    {"payment_status": "paid", "physical_fulfillment": "shipped", "claimed_by_user_id": "u1",
+     "purchase_type": "gift", "items": [{"sku": "BKFT-AE-PB", "physical": True, "quantity": 2}]},
+    {"payment_status": "paid", "refund_status": "refunded", "refunded_at": datetime(2026, 1, 2),
+     "entitlement_status": "revoked", "items": [{"id": "ihi-ae-pro-bundle",
+                                                  "bundle_contents": {"digital": ["x"]}}]},
+    {"payment_status": "paid", "status": "cancelled", "manual_fulfillment_status": "fulfilled",
+     "items": [{"name": "Small Group Bundle", "isSmallGroupBundle": True, "edition": "IE",
+                "metadata": {"medium": "physical"}}]},
+    {"payment_status": "pending", "status": "initiated", "items": []},
+]
+
+
+def test_rebuilt_key_document_classifies_like_the_order():
+    for doc in ORDERS:
+        want = a._compute_lifecycle(doc)
+        got = a._compute_lifecycle(a._doc_from_lifecycle_key(_key_of(doc)))
+        for f in _SUMMARY_FIELDS:
+            assert got[f] == want[f], (f, doc)
+
+
+def test_lifecycle_key_covers_every_projected_field():
+    assert set(_key_of(ORDERS[0])) == set(a._LIFECYCLE_KEY)
+    item_fields = set(a._LIFECYCLE_KEY["items"]["$map"]["in"])
+    assert set(_key_of(ORDERS[0])["items"][0]) == item_fields
+
+
+def test_created_at_window_matches_dates_and_iso_strings():
+    start = datetime(2026, 1, 1)
+    q = a._created_at_range(start, None)
+    assert q == {"$or": [{"created_at": {"$gte": start}}, {"created_at": {"$gte": start.isoformat()}}]}
+    assert a._created_at_range(None, None) is None
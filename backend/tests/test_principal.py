@@ -0,0 +1,178 @@
+"""Unit tests for the shared auth dependency (principal).
+
+Verifies:
+  1. The token is decoded and the user loaded once per request, and repeat
+     requests are served from the user cache (one db.users read).
+  2. invalidate() drops the cached user and bumps the shared version, so a
+     disabled account stops resolving.
+  3. require_principal / require_admin raise 401 / 403 as before.
+  4. /me session answers are cached per token, never past the session's
+     expires_at, negative answers included, and are evicted on logout and
+     by invalidate(user_id).
+  5. Another worker's per-user invalidation drops only that user's entries;
+     a whole-cache bump drops everything.
+
+Runs without Mongo: db.users and the cache_versions counter are faked.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from starlette.requests import Request
+
+import cache_versions
+import principal
+
+
+class _Users:
+    def __init__(self, docs):
+        self.docs = docs
+        self.reads = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        doc = self.docs.get(query["id"])
+        return {k: v for k, v in doc.items() if k in projection} if doc else None
+
+
+class _DB:
+    def __init__(self, docs):
+        self.users = _Users(docs)
+
+
+def _request(user_id=None, token=None):
+    if user_id:
+        token = jwt.encode({"sub": user_id}, principal.SECRET_KEY, algorithm=principal.ALGORITHM)
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "headers": headers})
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    version = {"n": 0, "keys": []}
+
+    async def _current(name):
+        return version["n"]
+
+    async def _history(name):
+        return version["n"], list(version["keys"])
+
+    async def _bump(name, key=None):
+        version["n"] += 1
+        version["keys"].append(key)
+        return version["n"]
+
+    version["bump"] = _bump
+    db = _DB({
+        "u1": {"id": "u1", "email": "jane@example.com", "role": "member", "password_hash": "x"},
+        "a1": {"id": "a1", "email": "boss@example.com", "role": "admin"},
+    })
+    monkeypatch.setattr(principal, "db", db)
+    monkeypatch.setattr(cache_versions, "bump", _bump)
+    monkeypatch.setattr(cache_versions, "current", _current)
+    monkeypatch.setattr(cache_versions, "history", _history)
+    monkeypatch.setattr(principal, "_gate", cache_versions.VersionGate(principal.CACHE_NAME, check_interval=0))
+    monkeypatch.setattr(principal, "_cache", {})
+    monkeypatch.setattr(principal, "_sessions", {})
+    monkeypatch.setattr(principal, "_sessions_by_user", {})
+    return db, version
+
+
+def test_one_user_read_across_requests(fake_db):
+    db, _ = fake_db
+
+    async def _go():
+        req = _request("u1")
+        first = await principal.optional_principal(req)
+        again = await principal.require_principal(req)
+        other = await principal.optional_principal(_request("u1"))
+        return first, again, other
+
+    first, again, other = asyncio.run(_go())
+    assert first == again == other == {"id": "u1", "email": "jane@example.com", "role": "member"}
+    assert db.users.reads == 1
+
+
+def test_invalidate_sees_disable(fake_db):
+    db, version = fake_db
+
+    async def _go():
+        await principal.optional_principal(_request("u1"))
+        db.users.docs["u1"]["disabled"] = True
+        await principal.invalidate("u1")
+        return await principal.optional_principal(_request("u1"))
+
+    assert asyncio.run(_go()) is None
+    assert db.users.reads == 2
+    assert version["n"] == 1
+
+
+def test_require_errors(fake_db):
+    def _status(coro):
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(coro)
+        return exc.value.status_code, exc.value.detail
+
+    assert _status(principal.require_principal(_request())) == (401, "Authentication required")
+    assert _status(principal.require_principal(_request(token="garbage"))) == (401, "Invalid token")
+    assert _status(principal.require_admin(_request("u1"))) == (403, "Admin access required")
+    assert asyncio.run(principal.require_admin(_request("a1")))["id"] == "a1"
+
+
+def test_session_cache_hits_and_evictions(fake_db):
+    me = {"id": "u1", "email": "jane@example.com", "rewards_points": 5}
+    soon = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    async def _go():
+        await principal.cache_session("tok-a", me, expires_at=soon)
+        await principal.cache_session("tok-b", me)
+        await principal.cache_session("bad", error="Invalid session")
+        hits = [await principal.cached_session(t) for t in ("tok-a", "bad", "unknown")]
+        await principal.evict_session("tok-a")
+        after_logout = await principal.cached_session("tok-a")
+        await principal.invalidate("u1")
+        after_invalidate = await principal.cached_session("tok-b")
+        return hits, after_logout, after_invalidate
+
+    hits, after_logout, after_invalidate = asyncio.run(_go())
+    assert hits == [(me, None), (None, "Invalid session"), None]
+    assert after_logout is None and after_invalidate is None
+
+
+def test_session_never_outlives_expiry(fake_db):
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+
+    async def _go():
+        await principal.cache_session("old", {"id": "u1"}, expires_at=past)
+        return await principal.cached_session("old")
+
+    assert asyncio.run(_go()) is None
+
+
+def test_other_workers_invalidation_is_per_user(fake_db):
+    db, version = fake_db
+    me = {"id": "u1", "email": "jane@example.com"}
+
+    async def _go():
+        await principal.optional_principal(_request("u1"))
+        await principal.optional_principal(_request("a1"))
+        await principal.cache_session("tok-u1", me)
+        await principal.cache_session("tok-a1", {"id": "a1"})
+        # Another worker: u1 changed, then some token logged out.
+        await version["bump"](principal.CACHE_NAME, "u1")
+        await version["bump"](principal.CACHE_NAME, principal._session_key("tok-a1"))
+        await principal.optional_principal(_request("a1"))
+        assert db.users.reads == 2
+        assert await principal.cached_session("tok-u1") is None
+        assert await principal.cached_session("tok-a1") is None
+        await principal.optional_principal(_request("u1"))
+        assert db.users.reads == 3
+        # A whole-cache bump drops everyone.
+        await version["bump"](principal.CACHE_NAME, None)
+        await principal.optional_principal(_request("a1"))
+        assert db.users.reads == 4
+
+    asyncio.run(_go())
+    assert all("tok" not in (k or "") for k in version["keys"])
@@ -0,0 +1,152 @@
+"""Unit tests for the public catalog snapshot (product_catalog).
+
+Verifies:
+  1. The snapshot merges code PRODUCTS with active db.products (DB wins by
+     SKU) and is built once, not per request.
+  2. GET /catalog serves the pre-serialized body with a strong ETag and
+     answers a matching If-None-Match with 304.
+  3. invalidate() rebuilds on the next request and bumps the shared version.
+  4. A snapshot priced with a promo expires once the promo ends.
+
+Runs without Mongo: db.products.find and the cache_versions counter are faked.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import cache_versions
+import payment_routes as pr
+import product_catalog as pc
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def __aiter__(self):
+        self._it = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Products:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        return _Cursor(d for d in self.docs if d.get("status") == query.get("status"))
+
+
+_CODE = {
+    "breakfast": {"name": "Breakfast", "sku": "SOFU-BKFT", "list_price": 20, "sale_price": 15},
+    "lunch": {"name": "Lunch", "sku": "SOFU-LNCH", "list_price": 20, "sale_price": 15,
+              "promo_sale_price": 10, "promo_until": "2030-01-31"},
+    "old": {"name": "Old", "sku": "SOFU-OLD", "deprecated": True},
+}
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    version = {"n": 0}
+
+    async def _current(name):
+        return version["n"]
+
+    async def _bump(name, key=None):
+        version["n"] += 1
+        return version["n"]
+
+    db = SimpleNamespace(products=_Products([
+        {"sku": "SOFU-BKFT", "id": "bkft-db", "name": "Breakfast (DB)", "price": 12, "status": "active"},
+        {"sku": "SOFU-NEW", "id": "new", "name": "New", "price": 5, "status": "active"},
+        {"sku": "SOFU-DRAFT", "id": "draft", "name": "Draft", "price": 5, "status": "draft"},
+    ]))
+    monkeypatch.setattr(pc, "db", db)
+    monkeypatch.setattr(cache_versions, "bump", _bump)
+    monkeypatch.setattr(pr, "PRODUCTS", _CODE)
+    monkeypatch.setattr(cache_versions, "current", _current)
+    monkeypatch.setattr(pc, "_gate", cache_versions.VersionGate(pc.CACHE_NAME))
+    monkeypatch.setattr(pc, "_snapshot", None)
+    return db, version
+
+
+def _request(if_none_match=None):
+    headers = {"if-none-match": if_none_match} if if_none_match else {}
+    return SimpleNamespace(headers=headers)
+
+
+def test_merge_built_once(fake_db):
+    db, _ = fake_db
+
+    async def _go():
+        first = await pc.current()
+        second = await pc.current()
+        return first, second
+
+    first, second = asyncio.run(_go())
+    assert first is second
+    assert db.products.queries == 1
+    products = json.loads(first.body)["products"]
+    assert [p["sku"] for p in products] == ["SOFU-BKFT", "SOFU-LNCH", "SOFU-NEW"]
+    assert products[0]["name"] == "Breakfast (DB)"
+    assert first.total == 3
+
+
+def test_etag_and_not_modified(fake_db):
+    async def _go():
+        full = await pr.get_product_catalog(_request())
+        etag = full.headers["etag"]
+        again = await pr.get_product_catalog(_request(f'"stale", W/{etag}'))
+        other = await pr.get_product_catalog(_request('"stale"'))
+        return full, etag, again, other
+
+    full, etag, again, other = asyncio.run(_go())
+    assert full.status_code == 200
+    assert full.media_type == "application/json"
+    assert json.loads(full.body)["total"] == 3
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert again.status_code == 304 and again.body == b""
+    assert again.headers["etag"] == etag
+    assert other.status_code == 200
+    assert pc.not_modified("*", etag)
+    assert not pc.not_modified(None, etag)
+
+
+def test_invalidate_rebuilds_and_bumps(fake_db):
+    db, version = fake_db
+
+    async def _go():
+        before = await pc.current()
+        db.products.docs[1]["price"] = 7
+        await pc.invalidate()
+        after = await pc.current()
+        return before, after
+
+    before, after = asyncio.run(_go())
+    assert db.products.queries == 2
+    assert version["n"] == 1
+    assert before.etag != after.etag
+    assert json.loads(after.body)["products"][2]["effective_price"] == 7
+
+
+def test_promo_boundary_expires_snapshot(fake_db):
+    snap = asyncio.run(pc.build("2030-01-31"))
+    lunch = json.loads(snap.body)["products"][1]
+    assert lunch["effective_price"] == 10
+    assert snap.valid_through == "2030-01-31"
+    assert not pc._expired(snap, "2030-01-31")
+    assert pc._expired(snap, "2030-02-01")
+
+    after = asyncio.run(pc.build("2030-02-01"))
+    assert json.loads(after.body)["products"][1]["effective_price"] == 15
+    assert after.valid_through is None
+    assert not pc._expired(after, "2099-01-01")
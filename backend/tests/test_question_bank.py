@@ -0,0 +1,137 @@
+"""Unit tests for the in-process trivia question bank (question_bank).
+
+Verifies:
+  1. One load indexes questions by game_type / age_group / series.
+  2. Demo mode returns the first shared questions by qid; copies are handed
+     out so request-level mutation never leaks into the bank.
+  3. Distractor options come from the precomputed answer pool: four distinct
+     options including the correct answer.
+  4. invalidate() reloads on the next request.
+  5. A failed load leaves the bank stale, so the next request retries.
+
+Runs without Mongo: db.trivia_questions.find and cache_versions are faked.
+"""
+import asyncio
+import random
+
+import pytest
+
+import cache_versions
+import question_bank as qb
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._it = iter(list(docs))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Questions:
+    def __init__(self, docs):
+        self.docs = docs
+        self.loads = 0
+        self.fail = False
+
+    def find(self, query=None, projection=None):
+        self.loads += 1
+        if self.fail:
+            raise RuntimeError("mongo down")
+        return _Cursor(self.docs)
+
+
+class _DB:
+    def __init__(self, docs):
+        self.trivia_questions = _Questions(docs)
+
+
+def _q(qid, node, game_type, answer, age="adult", options=None):
+    return {"qid": qid, "lesson_node": node, "game_type": game_type, "age_group": age,
+            "correct_answer": answer, "options": options}
+
+
+@pytest.fixture
+def bank(monkeypatch):
+    version = {"n": 0}
+
+    async def _current(name):
+        return version["n"]
+
+    async def _bump(name, key=None):
+        version["n"] += 1
+        return version["n"]
+
+    db = _DB([
+        _q(3, "", "tricky_trivia", "Moses"),
+        _q(1, "", "tricky_trivia", "Noah"),
+        _q(2, "Q1-Covenant", "tricky_trivia", "Abraham"),
+        _q(4, "Q2-Prayer", "tricky_trivia", "Esther", age="youth"),
+        _q(5, "Q2-Prayer", "trivia_testament", "Solomon"),
+        _q(6, "Q3-Faith", "tricky_trivia", "Rahab"),
+    ])
+    monkeypatch.setattr(qb, "db", db)
+    monkeypatch.setattr(cache_versions, "bump", _bump)
+    monkeypatch.setattr(cache_versions, "current", _current)
+    monkeypatch.setattr(qb, "_gate", cache_versions.VersionGate(qb.CACHE_NAME))
+    monkeypatch.setattr(qb, "_by_bucket", {})
+    monkeypatch.setattr(qb, "_answer_pools", {})
+    asyncio.run(qb.ensure_loaded())
+    return db
+
+
+def test_buckets_by_game_type_age_and_series(bank):
+    got = qb.questions_for("tricky_trivia", None, {"breakfast"})
+    assert sorted(q["qid"] for q in got) == [4, 6]
+    got = qb.questions_for("tricky_trivia", "adult", {"breakfast", "holiday_4c"})
+    assert sorted(q["qid"] for q in got) == [2, 6]
+    assert len(qb.questions_for(None, None, {"shared", "breakfast", "holiday_4c"})) == 6
+
+
+def test_demo_is_first_shared_by_qid_and_copies(bank):
+    demo = qb.demo_questions("tricky_trivia", None, 1)
+    assert [q["qid"] for q in demo] == [1]
+    demo[0]["options"] = ["mutated"]
+    assert qb.demo_questions("tricky_trivia", None, 1)[0]["options"] is None
+
+
+def test_distractors_from_answer_pool(bank):
+    pool = qb.answer_pool("tricky_trivia", None, {"shared", "breakfast"})
+    assert sorted(pool) == ["Esther", "Moses", "Noah", "Rahab"]
+    assert qb.answer_pool("tricky_trivia", None, {"breakfast", "shared"}) is pool
+    opts = qb.distractor_options("Noah", pool, random.Random(7))
+    assert len(opts) == 4 and len(set(opts)) == 4 and "Noah" in opts
+    fallback = qb.distractor_options("X", [], random.Random(7))
+    assert sorted(fallback) == sorted(["X", *qb._FALLBACK_OPTIONS])
+
+
+def test_invalidate_reloads(bank):
+    async def _go():
+        bank.trivia_questions.docs = bank.trivia_questions.docs[:1]
+        await qb.invalidate()
+        await qb.ensure_loaded()
+
+    asyncio.run(_go())
+    assert bank.trivia_questions.loads == 2
+    assert [q["qid"] for q in qb.questions_for(None, None, {"shared", "breakfast"})] == [3]
+
+
+def test_failed_reload_is_retried(bank):
+    async def _go():
+        bank.trivia_questions.docs = bank.trivia_questions.docs[:1]
+        await qb.invalidate()
+        bank.trivia_questions.fail = True
+        with pytest.raises(RuntimeError):
+            await qb.ensure_loaded()
+        bank.trivia_questions.fail = False
+        await qb.ensure_loaded()
+
+    asyncio.run(_go())
+    assert bank.trivia_questions.loads == 3
+    assert [q["qid"] for q in qb.questions_for(None, None, {"shared", "breakfast"})] == [3]
@@ -0,0 +1,102 @@
+"""Unit tests for the async Object Storage client (storage_service.a*).
+
+Verifies:
+  1. A 403 rotates the storage key once and the retried call succeeds.
+  2. ahead_object falls back to a 1-byte range GET when HEAD is unsupported.
+  3. 404s are surfaced via is_not_found so download routes can return 404.
+  4. A streamed download holds its concurrency permit until it is closed.
+
+Runs without network by swapping the shared pool for an httpx MockTransport.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+import storage_service as ss
+
+
+def _install_mock(monkeypatch, handler):
+    monkeypatch.setattr(ss, "EMERGENT_KEY", "test-key")
+    monkeypatch.setattr(ss, "_storage_key", None)
+    ss._get_async_client()
+    monkeypatch.setattr(ss, "_async_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+def _run(coro):
+    async def _wrapped():
+        try:
+            return await coro
+        finally:
+            await ss.aclose()
+    return asyncio.run(_wrapped())
+
+
+def test_key_refreshed_once_on_403(monkeypatch):
+    keys = iter(["stale", "fresh"])
+    seen = []
+
+    def handler(req):
+        if req.url.path.endswith("/init"):
+            return httpx.Response(200, json={"storage_key": next(keys)})
+        seen.append(req.headers["X-Storage-Key"])
+        if req.headers["X-Storage-Key"] == "stale":
+            return httpx.Response(403)
+        return httpx.Response(200, content=b"%PDF", headers={"Content-Type": "application/pdf"})
+
+    _install_mock(monkeypatch, handler)
+    data, ctype = _run(ss.aget_object("soul-food/uploads/a.pdf"))
+    assert (data, ctype) == (b"%PDF", "application/pdf")
+    assert seen == ["stale", "fresh"]
+
+
+def test_head_falls_back_to_range_get(monkeypatch):
+    def handler(req):
+        if req.url.path.endswith("/init"):
+            return httpx.Response(200, json={"storage_key": "k"})
+        if req.method == "HEAD":
+            return httpx.Response(405)
+        assert req.headers.get("Range") == "bytes=0-0"
+        return httpx.Response(206, content=b"%")
+
+    _install_mock(monkeypatch, handler)
+    assert _run(ss.ahead_object("soul-food/uploads/a.pdf")) is True
+
+
+def test_missing_object_is_not_found(monkeypatch):
+    def handler(req):
+        if req.url.path.endswith("/init"):
+            return httpx.Response(200, json={"storage_key": "k"})
+        return httpx.Response(404)
+
+    _install_mock(monkeypatch, handler)
+    assert _run(ss.ahead_object("soul-food/uploads/gone.pdf")) is False
+    _install_mock(monkeypatch, handler)
+    with pytest.raises(httpx.HTTPStatusError) as exc:
+        _run(ss.aget_object("soul-food/uploads/gone.pdf"))
+    assert ss.is_not_found(exc.value)
+
+
+def test_stream_holds_permit_until_closed(monkeypatch):
+    def handler(req):
+        if req.url.path.endswith("/init"):
+            return httpx.Response(200, json={"storage_key": "k"})
+        return httpx.Response(200, content=b"x" * 10)
+
+    _install_mock(monkeypatch, handler)
+    monkeypatch.setattr(ss, "_async_sem", asyncio.Semaphore(1))
+
+    async def _go():
+        first = await ss.astream_object("soul-food/uploads/a.pdf")
+        second = asyncio.ensure_future(ss.astream_object("soul-food/uploads/b.pdf"))
+        await asyncio.sleep(0.05)
+        blocked = not second.done()
+        body = b"".join([c async for c in first.aiter_bytes()])
+        await first.aclose()
+        resp = await asyncio.wait_for(second, timeout=1)
+        await resp.aclose()
+        return blocked, body, ss._async_sem.locked()
+
+    blocked, body, locked = _run(_go())
+    assert blocked and body == b"x" * 10
+    assert locked is False
@@ -0,0 +1,186 @@
+"""Unit tests for the Stripe webhook event ledger (stripe_events).
+
+Verifies:
+  1. record() is idempotent on the event id; unhandled types are ignored.
+  2. A worker runs the registered handler once and marks the event done;
+     failures back off and give up after MAX_ATTEMPTS.
+  3. Events for an order whose lock is held go back to the queue without
+     spending an attempt.
+  4. The event and order-lock leases are renewed while a slow handler runs.
+
+Runs without Mongo: the collections are faked.
+"""
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import stripe_events as se
+
+
+def _cond(value, cond):
+    if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+        return all(
+            (op == "$lt" and value is not None and value < v)
+            or (op == "$lte" and value is not None and value <= v)
+            for op, v in cond.items()
+        )
+    return value == cond
+
+
+def _matches(doc, flt):
+    for k, v in flt.items():
+        if k == "$or":
+            if not any(_matches(doc, c) for c in v):
+                return False
+        elif not _cond(doc.get(k), v):
+            return False
+    return True
+
+
+def _apply(doc, update):
+    doc.update(update.get("$set", {}))
+    for k, v in update.get("$inc", {}).items():
+        doc[k] = doc.get(k, 0) + v
+    for k in update.get("$unset", {}):
+        doc.pop(k, None)
+
+
+class _Coll:
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("dup")
+        self.docs[doc["_id"]] = dict(doc)
+
+    async def find_one(self, flt, projection=None, **kwargs):
+        return next((dict(d) for d in self.docs.values() if _matches(d, flt)), None)
+
+    async def find_one_and_update(self, flt, update, sort=None, return_document=None):
+        for d in sorted(self.docs.values(), key=lambda d: d.get("received_at")):
+            if _matches(d, flt):
+                _apply(d, update)
+                return dict(d)
+        return None
+
+    async def update_one(self, flt, update, upsert=False):
+        for d in self.docs.values():
+            if _matches(d, flt):
+                _apply(d, update)
+                return
+        if upsert:
+            doc = {"_id": flt["_id"]}
+            _apply(doc, update)
+            await self.insert_one(doc)
+
+    async def delete_one(self, flt):
+        for key, d in list(self.docs.items()):
+            if _matches(d, flt):
+                del self.docs[key]
+                return
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = SimpleNamespace(stripe_events=_Coll(), stripe_event_locks=_Coll())
+    monkeypatch.setattr(se, "db", db)
+    monkeypatch.setattr(se, "_handlers", {})
+    return db
+
+
+def test_record_is_idempotent(fake_db):
+    se.handler("checkout.session.completed")(lambda event: None)
+
+    async def _go():
+        first = await se.record("evt_1", "checkout.session.completed", session_id="cs_1")
+        again = await se.record("evt_1", "checkout.session.completed", session_id="cs_1")
+        other = await se.record("evt_2", "customer.created")
+        return first, again, other
+
+    first, again, other = asyncio.run(_go())
+    assert first["queued"] and not first["duplicate"]
+    assert again["duplicate"] and not again["queued"] and again["status"] == se.PENDING
+    assert not other["queued"] and other["status"] == se.IGNORED
+    assert len(fake_db.stripe_events.docs) == 2
+
+
+def test_worker_processes_once_and_retries(fake_db, monkeypatch):
+    calls = []
+
+    @se.handler("checkout.session.completed")
+    async def _ok(event):
+        calls.append(event["session_id"])
+
+    @se.handler("checkout.session.expired")
+    async def _boom(event):
+        raise RuntimeError("stripe down")
+
+    monkeypatch.setattr(se, "MAX_ATTEMPTS", 2)
+
+    async def _go():
+        await se.record("evt_ok", "checkout.session.completed", session_id="cs_1")
+        await se.record("evt_bad", "checkout.session.expired", session_id="cs_2")
+        while await se.process_once("w1"):
+            pass
+        bad = fake_db.stripe_events.docs["evt_bad"]
+        bad["next_attempt_at"] -= timedelta(hours=2)  # due again
+        await se.process_once("w1")
+
+    asyncio.run(_go())
+    assert calls == ["cs_1"]
+    ok, bad = fake_db.stripe_events.docs["evt_ok"], fake_db.stripe_events.docs["evt_bad"]
+    assert ok["status"] == se.DONE and ok["attempts"] == 1 and "lease_until" not in ok
+    assert bad["status"] == se.DEAD and bad["attempts"] == 2 and bad["last_error"] == "stripe down"
+    assert fake_db.stripe_event_locks.docs == {}
+
+
+def test_busy_order_is_requeued(fake_db):
+    calls = []
+
+    @se.handler("checkout.session.completed")
+    async def _ok(event):
+        calls.append(event["_id"])
+
+    async def _go():
+        await se.record("evt_1", "checkout.session.completed", session_id="cs_1")
+        async with se.order_lock("cs_1", owner="status-poll") as held:
+            assert held
+            async with se.order_lock("cs_1") as second:
+                assert not second
+            assert await se.process_once("w1")
+        return dict(fake_db.stripe_events.docs["evt_1"])
+
+    requeued = asyncio.run(_go())
+    assert calls == []
+    assert requeued["status"] == se.PENDING and requeued["attempts"] == 0
+    assert requeued["next_attempt_at"] > requeued["received_at"]
+    assert fake_db.stripe_event_locks.docs == {}
+
+
+def test_leases_are_renewed_while_handler_runs(fake_db, monkeypatch):
+    monkeypatch.setattr(se, "LEASE_SECONDS", 0.3)
+    seen = []
+
+    def _leases():
+        return (fake_db.stripe_events.docs["evt_1"]["lease_until"],
+                fake_db.stripe_event_locks.docs["cs_1"]["lease_until"])
+
+    @se.handler("checkout.session.completed")
+    async def _slow(event):
+        seen.append(_leases())
+        await asyncio.sleep(0.25)
+        seen.append(_leases())
+
+    async def _go():
+        await se.record("evt_1", "checkout.session.completed", session_id="cs_1")
+        assert await se.process_once("w1")
+
+    asyncio.run(_go())
+    (event_before, lock_before), (event_after, lock_after) = seen
+    assert event_after > event_before and lock_after > lock_before
+    assert fake_db.stripe_events.docs["evt_1"]["status"] == se.DONE
+    assert fake_db.stripe_event_locks.docs == {}
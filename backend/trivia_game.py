@@ -6,16 +6,14 @@ from datetime import datetime, timezone, timedelta
 import random
 import secrets
 import uuid
-import os
-
-from motor.motor_asyncio import AsyncIOMotorClient
 
 router = APIRouter(prefix="/trivia", tags=["trivia"])
 
 # MongoDB connection for trivia
-MONGO_URL = os.environ.get('MONGO_URL')
-_trivia_client = AsyncIOMotorClient(MONGO_URL)
-_trivia_db = _trivia_client[os.environ['DB_NAME']]
+from database import db as _trivia_db  # noqa: E402 — shared pool
+import entitlements  # noqa: E402
+import principal  # noqa: E402
+import question_bank  # noqa: E402
 
 # Game Access Tiers
 ACCESS_TIERS = {
@@ -490,145 +488,34 @@ async def get_user_stats(user_id: str):
 # CONTENT-SPECIFIC ENTITLEMENT SYSTEM
 # =============================================================================
 
-import re
 import random as _rand
 
 DEMO_QUESTION_CAP = 10
 
-# Map lesson_node prefix → series key
-SERIES_MAP = {
-    "Q1": "holiday_4c",
-    "Q2": "breakfast",
-    "Q3": "breakfast",  # Q3 content is future/extended Break*fast
-}
-
-
-def _classify_product(name: str) -> dict:
-    """Parse a product name/id into series + edition."""
-    nl = name.lower()
-    series = set()
-    edition = None
-
-    if any(k in nl for k in ["holiday", "4c", "covenant", "cradle", "cross", "comforter"]):
-        series.add("holiday_4c")
-    if any(k in nl for k in ["break*fast", "breakfast", "bkft", "nibble", "snack"]):
-        series.add("breakfast")
-    if "bundle" in nl:
-        series.add("holiday_4c")
-        series.add("breakfast")
-    if "game pass" in nl or "game night" in nl or "mix-up" in nl or "grinch" in nl:
-        series.add("holiday_4c")
-        series.add("breakfast")
-
-    if any(k in nl for k in ["adult", "- ae", "(ae)", " ae "]):
-        edition = "adult"
-    elif any(k in nl for k in ["youth", "- ye", "(ye)", " ye "]):
-        edition = "youth"
-
-    return {"series": series, "edition": edition}
-
 
 async def _get_user_entitlements(user_id: str, user_email: str) -> dict:
     """Determine which content series + editions a user has unlocked."""
-    if not user_id and not user_email:
+    if not user_id:
         return {"series": set(), "editions": set(), "has_audio": False, "has_instructor": False}
 
-    or_clauses = []
-    if user_id:
-        or_clauses.append({"claimed_by_user_id": user_id})
-    if user_email:
-        or_clauses.append({"customer_email": {"$regex": f"^{re.escape(user_email)}$", "$options": "i"}})
-
-    txs = await _trivia_db.payment_transactions.find(
-        {"$or": or_clauses, "payment_status": {"$in": ["paid", "completed"]}},
-        {"_id": 0, "items": 1},
-    ).to_list(100)
-
-    unlocked_series = set()
-    unlocked_editions = set()
-    has_audio = False
-    has_instructor = False
-
-    for tx in txs:
-        for item in tx.get("items", []):
-            name = item.get("name", "") or item.get("product_id", "")
-            classified = _classify_product(name)
-            unlocked_series.update(classified["series"])
-            if classified["edition"]:
-                unlocked_editions.add(classified["edition"])
-            nl = name.lower()
-            if "full workbook" in nl or "subscription" in nl or "all access" in nl:
-                has_audio = True
-            if "instructor" in nl or "ie " in nl or " ie" in nl:
-                has_instructor = True
-
-    # Also check redeemed submitted_codes with status=processed
-    codes = await _trivia_db.submitted_codes.find(
-        {"user_id": user_id, "status": "processed"},
-        {"_id": 0, "code": 1},
-    ).to_list(50)
-    for code_doc in codes:
-        c = _classify_product(code_doc.get("code", ""))
-        unlocked_series.update(c["series"])
-        if c["edition"]:
-            unlocked_editions.add(c["edition"])
-
+    ent = await entitlements.get_for_user(user_id, user_email)
     return {
-        "series": unlocked_series,
-        "editions": unlocked_editions,
-        "has_audio": has_audio,
-        "has_instructor": has_instructor,
+        "series": set(ent.get("series") or []),
+        "editions": set(ent.get("editions") or []),
+        "has_audio": bool(ent.get("has_audio")),
+        "has_instructor": bool(ent.get("has_instructor")),
     }
 
 
-def _question_series(q: dict) -> str:
-    """Return the series key for a question based on lesson_node."""
-    node = (q.get("lesson_node") or "").strip()
-    if not node:
-        return "shared"
-    for prefix, series in SERIES_MAP.items():
-        if node.startswith(prefix):
-            return series
-    return "shared"
-
-
-def _generate_distractors(correct: str, pool: list) -> list:
-    """Generate plausible MCQ options for a question that lacks them."""
-    # Collect unique correct_answers from other questions as distractors
-    candidates = list({q.get("correct_answer", "") for q in pool if q.get("correct_answer", "") != correct and q.get("correct_answer")})
-    _rand.shuffle(candidates)
-    distractors = candidates[:3]
-    # If not enough distractors, add generic ones
-    fallbacks = ["None of these", "Not mentioned in Scripture", "All of the above"]
-    while len(distractors) < 3:
-        fb = fallbacks.pop(0) if fallbacks else f"Option {len(distractors) + 1}"
-        if fb != correct:
-            distractors.append(fb)
-    options = distractors + [correct]
-    _rand.shuffle(options)
-    return options
-
-
 @router.get("/entitlements/me")
-async def get_my_entitlements(request: Request):
+async def get_my_entitlements(request: Request, user: Optional[dict] = Depends(principal.optional_principal)):
     """Return the caller's unlocked content series and editions."""
     user_id, user_email, role = None, None, None
 
-    auth_header = request.headers.get("Authorization", "")
-    if auth_header.startswith("Bearer "):
-        token_str = auth_header.split(" ", 1)[1]
-        try:
-            from jose import jwt
-            payload = jwt.decode(token_str, os.environ.get("JWT_SECRET_KEY"), algorithms=["HS256"])
-            uid = payload.get("sub")
-            if uid:
-                user = await _trivia_db.users.find_one({"id": uid}, {"_id": 0, "id": 1, "email": 1, "role": 1})
-                if user:
-                    user_id = user.get("id")
-                    user_email = user.get("email")
-                    role = user.get("role")
-        except Exception:
-            pass
+    if user:
+        user_id = user.get("id")
+        user_email = user.get("email")
+        role = user.get("role")
 
     if not user_id:
         return {"series": [], "editions": [], "has_audio": False, "has_instructor": False, "access_level": "demo"}
@@ -657,6 +544,7 @@ async def get_questions_for_game(
     request: Request,
     game_type: Optional[str] = None,
     age_group: Optional[str] = None,
+    user: Optional[dict] = Depends(principal.optional_principal),
 ):
     """Return questions gated by content-specific entitlement.
     - Free users → demo cap (10 questions from shared pool).
@@ -667,21 +555,10 @@ async def get_questions_for_game(
     unlocked_series = set()
     access_level = "demo"
 
-    auth_header = request.headers.get("Authorization", "")
-    if auth_header.startswith("Bearer "):
-        token_str = auth_header.split(" ", 1)[1]
-        try:
-            from jose import jwt
-            payload = jwt.decode(token_str, os.environ.get("JWT_SECRET_KEY"), algorithms=["HS256"])
-            uid = payload.get("sub")
-            if uid:
-                user = await _trivia_db.users.find_one({"id": uid}, {"_id": 0, "id": 1, "email": 1, "role": 1})
-                if user:
-                    user_id = user.get("id")
-                    user_email = user.get("email")
-                    role = user.get("role")
-        except Exception:
-            pass
+    if user:
+        user_id = user.get("id")
+        user_email = user.get("email")
+        role = user.get("role")
 
     if role in ("admin", "instructor"):
         access_level = "full"
@@ -693,23 +570,15 @@ async def get_questions_for_game(
             unlocked_series.add("shared")  # shared pool available to any purchaser
             access_level = "full"
 
-    # Build base query
-    query = {}
-    if game_type:
-        query["game_type"] = game_type
-    if age_group:
-        query["age_group"] = age_group
-
-    all_questions = await _trivia_db.trivia_questions.find(query, {"_id": 0}).to_list(1000)
+    # Served from the in-process question bank, indexed by game_type/age_group/series
+    await question_bank.ensure_loaded()
 
     if access_level == "demo":
         # Demo: capped set from shared pool only
-        shared = [q for q in all_questions if _question_series(q) == "shared"]
-        shared.sort(key=lambda q: q.get("qid", 0))
-        filtered = shared[:DEMO_QUESTION_CAP]
+        filtered = question_bank.demo_questions(game_type, age_group, DEMO_QUESTION_CAP)
     else:
         # Full: only questions matching unlocked series
-        filtered = [q for q in all_questions if _question_series(q) in unlocked_series]
+        filtered = question_bank.questions_for(game_type, age_group, unlocked_series)
 
     _rand.shuffle(filtered)
 
@@ -731,10 +600,14 @@ async def get_questions_for_game(
         mcq_only = [q for q in filtered if q.get("options") and len(q["options"]) >= 3]
         # Supplement: for questions without options, generate plausible distractors
         no_opts = [q for q in filtered if not q.get("options") or len(q.get("options", [])) < 3]
-        for q in no_opts:
-            # Create basic distractors from the correct answer
-            ans = q.get("correct_answer", "")
-            q["options"] = _generate_distractors(ans, filtered)
+        if no_opts:
+            # Distractors come from the other correct answers in the same pool
+            if access_level == "demo":
+                answers = list(dict.fromkeys(q["correct_answer"] for q in filtered if q.get("correct_answer")))
+            else:
+                answers = question_bank.answer_pool(game_type, age_group, unlocked_series)
+            for q in no_opts:
+                q["options"] = question_bank.distractor_options(q.get("correct_answer", ""), answers, _rand)
         filtered = mcq_only + no_opts
         _rand.shuffle(filtered)
 
@@ -0,0 +1,92 @@
+"""
+Shared plumbing for the Mongo-backed work queues.
+=================================================
+``email_outbox`` and ``stripe_events`` both keep their jobs in a collection:
+workers claim due documents under a lease (``lease_until``), retry failures
+with exponential backoff and park a job as ``dead`` after its last attempt.
+Each module owns its document shape and claim query; the parts that were the
+same in both live here:
+
+  * ``backoff_seconds``  retry delay, doubling per attempt up to a cap
+  * ``poll_loop``        process until idle, then sleep until woken or polled
+  * ``renew_leases``     keep ``lease_until`` moving while a long job runs, so
+                         another worker doesn't reclaim it mid-run
+  * ``status_stats``     counts by status plus the oldest pending job's age
+"""
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Tuple
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def backoff_seconds(attempts: int, base: float, cap: float) -> float:
+    """Delay before retry number ``attempts`` (1-based)."""
+    return min(base * 2 ** max(attempts - 1, 0), cap)
+
+
+async def poll_loop(tag: str, process_once: Callable[[], Awaitable[object]],
+                    wakeup: asyncio.Event, poll_seconds: float) -> None:
+    """Run ``process_once()`` while it reports work; when idle, wait for
+    ``wakeup`` (set by enqueuers) or ``poll_seconds``. Runs forever."""
+    while True:
+        wakeup.clear()
+        try:
+            handled = await process_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[{tag}] worker error: {e}")
+            handled = False
+        if handled:
+            continue
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+@asynccontextmanager
+async def renew_leases(tag: str, lease_seconds: float, targets: Iterable[Tuple[object, dict]]) -> AsyncIterator[None]:
+    """While the body runs, push ``lease_until`` on each ``(collection,
+    filter)`` target ``lease_seconds`` ahead, every third of a lease. The
+    filter should pin the holder (owner / claimed_by) so a lease that was
+    lost is never renewed."""
+    targets = list(targets)
+
+    async def _beat() -> None:
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            until = now() + timedelta(seconds=lease_seconds)
+            for collection, flt in targets:
+                try:
+                    await collection.update_one(flt, {"$set": {"lease_until": until}})
+                except Exception as e:
+                    print(f"[{tag}] lease renewal failed for {flt}: {e}")
+
+    task = asyncio.create_task(_beat())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+async def status_stats(collection, statuses: Iterable[str], pending: str, age_field: str) -> dict:
+    """Job counts by status, plus the oldest ``pending`` job's age (by ``age_field``)."""
+    counts = {s: 0 for s in statuses}
+    async for row in collection.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["n"]
+    oldest = await collection.find_one({"status": pending}, {"_id": 0, age_field: 1},
+                                       sort=[(age_field, 1)])
+    age = None
+    if oldest and isinstance(oldest.get(age_field), datetime):
+        started = oldest[age_field]
+        if started.tzinfo is None:
+            started = started.replace(tzinfo=timezone.utc)
+        age = (now() - started).total_seconds()
+    return {"counts": counts, "oldest_pending_seconds": age}
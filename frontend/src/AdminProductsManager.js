@@ -98,7 +98,7 @@ const AdminProductsManager = () => {
 
     // Side-load attachment health (small payload, fire-and-forget)
     try {
-      const r = await fetch(`${API_URL}/api/admin/products/attachment-health`, { headers: authHeaders() });
+      const r = await fetch(`${API_URL}/api/admin/products/attachment-health?incremental=true`, { headers: authHeaders() });
       if (r.ok) {
         const data = await r.json();
         const map = {};